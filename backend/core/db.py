@@ -61,3 +61,9 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+# Prazo por requisição nas consultas (MAX_EXECUTION_TIME); ver core/deadline.py
+from core.deadline import instalar_no_engine  # noqa: E402
+
+instalar_no_engine(engine)
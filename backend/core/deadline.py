@@ -0,0 +1,189 @@
+"""
+Prazo (deadline) por requisição, propagado até as consultas SQL.
+
+Uma chamada pesada (/sla/reset-and-recalculate, /metrics/performance) podia
+segurar uma conexão do pool por minutos e deixar o tráfego interativo sem
+conexão. Agora:
+
+- O middleware (main.py) define o prazo da requisição conforme a classe da
+  rota: "interativo", "relatorio", "upload" ou "lote"
+  (DEADLINE_<CLASSE>_SEGUNDOS). Rotas não listadas em CLASSES_ROTA são
+  interativas: uploads multipart e rotinas administrativas longas precisam
+  estar na lista
+- Todo SELECT executado dentro da requisição recebe o hint do MySQL
+  /*+ MAX_EXECUTION_TIME(ms) */ com o tempo restante; o servidor aborta a
+  consulta (erro 3024) quando o prazo acaba
+- Laços longos dos serviços de SLA chamam verificar_prazo() entre lotes
+  para parar cooperativamente
+- Prazo estourado vira 503 com Retry-After e é contado por classe/rota
+  (GET /api/metrics/deadlines)
+
+Fora de uma requisição (jobs, threads de background) não há prazo e
+verificar_prazo() não faz nada.
+"""
+
+from __future__ import annotations
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CLASSE_INTERATIVO = "interativo"
+CLASSE_RELATORIO = "relatorio"
+CLASSE_UPLOAD = "upload"
+CLASSE_LOTE = "lote"
+
+PRAZOS_SEGUNDOS = {
+    CLASSE_INTERATIVO: float(os.getenv("DEADLINE_INTERATIVO_SEGUNDOS", "15")),
+    CLASSE_RELATORIO: float(os.getenv("DEADLINE_RELATORIO_SEGUNDOS", "45")),
+    CLASSE_UPLOAD: float(os.getenv("DEADLINE_UPLOAD_SEGUNDOS", "120")),
+    CLASSE_LOTE: float(os.getenv("DEADLINE_LOTE_SEGUNDOS", "300")),
+}
+RETRY_AFTER_SEGUNDOS = int(os.getenv("DEADLINE_RETRY_AFTER_SEGUNDOS", "30"))
+
+# Classes por rota (caminho sem o prefixo /api); a primeira que casar vale
+CLASSES_ROTA: list[tuple[re.Pattern, str]] = [
+    (re.compile(r"^/sla/(reset-and-recalculate|recalcular|sync|cache/reset-all)"), CLASSE_LOTE),
+    (re.compile(r"^/metrics/debug/recalculate-sla"), CLASSE_LOTE),
+    (re.compile(r"^/jobs/[^/]+/executar"), CLASSE_LOTE),
+    (re.compile(r"^/eventos/consumidores/[^/]+/(replay|reconstruir)"), CLASSE_LOTE),
+    (re.compile(r"^/usuarios/normalize-setores$"), CLASSE_LOTE),
+    (re.compile(r"^/problemas/sincronizar/sla$"), CLASSE_LOTE),
+    # Uploads multipart: o corpo chega (e é gravado) dentro do prazo
+    (re.compile(r"^/chamados/(with-attachments|\d+/ticket)$"), CLASSE_UPLOAD),
+    (re.compile(r"^/alerts$"), CLASSE_UPLOAD),
+    (re.compile(r"^/login-media/upload$"), CLASSE_UPLOAD),
+    (re.compile(r"^/(metrics|sla|powerbi)(/|$)"), CLASSE_RELATORIO),
+]
+
+# Código do MySQL para "maximum statement execution time exceeded"
+_MYSQL_MAX_EXECUTION_TIME_EXCEEDED = 3024
+_SELECT = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+
+
+class DeadlineExceeded(Exception):
+    """O prazo da requisição acabou"""
+
+
+class PrazoRequisicao:
+    """Prazo da requisição corrente (objeto mutável: visível também nas threads do threadpool)"""
+
+    def __init__(self, classe: str, rota: str, segundos: float):
+        self.classe = classe
+        self.rota = rota
+        self.segundos = segundos
+        self.limite = time.monotonic() + segundos
+        self.estourado = False
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+
+_prazo_atual: ContextVar[PrazoRequisicao | None] = ContextVar("prazo_requisicao", default=None)
+
+
+def classe_da_rota(caminho: str) -> str:
+    if caminho.startswith("/api/"):
+        caminho = caminho[4:]
+    for padrao, classe in CLASSES_ROTA:
+        if padrao.match(caminho):
+            return classe
+    return CLASSE_INTERATIVO
+
+
+def iniciar_prazo(caminho: str):
+    """Define o prazo da requisição; retorna (prazo, token) para encerrar_prazo"""
+    classe = classe_da_rota(caminho)
+    prazo = PrazoRequisicao(classe, caminho, PRAZOS_SEGUNDOS[classe])
+    return prazo, _prazo_atual.set(prazo)
+
+
+def encerrar_prazo(token) -> None:
+    _prazo_atual.reset(token)
+
+
+@contextmanager
+def sem_prazo():
+    """Suspende o prazo da requisição no bloco (ex.: enfileirar o resto do trabalho após estourar)"""
+    token = _prazo_atual.set(None)
+    try:
+        yield
+    finally:
+        _prazo_atual.reset(token)
+
+
+def prazo_atual() -> PrazoRequisicao | None:
+    return _prazo_atual.get()
+
+
+def restante() -> float | None:
+    """Segundos restantes do prazo da requisição (None fora de requisição)"""
+    prazo = _prazo_atual.get()
+    return prazo.restante() if prazo else None
+
+
+def verificar_prazo() -> None:
+    """Checagem cooperativa para laços longos: levanta DeadlineExceeded se o prazo acabou"""
+    prazo = _prazo_atual.get()
+    if prazo is not None and prazo.restante() <= 0:
+        prazo.estourado = True
+        raise DeadlineExceeded(f"Prazo de {prazo.segundos:.0f}s da rota {prazo.rota} excedido")
+
+
+class DeadlineStats:
+    """Prazos estourados por classe e por rota (por worker)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_classe: dict[str, int] = {}
+        self._por_rota: dict[str, int] = {}
+
+    def registrar(self, prazo: PrazoRequisicao) -> None:
+        with self._lock:
+            self._por_classe[prazo.classe] = self._por_classe.get(prazo.classe, 0) + 1
+            self._por_rota[prazo.rota] = self._por_rota.get(prazo.rota, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "prazos_segundos": dict(PRAZOS_SEGUNDOS),
+                "estourados_por_classe": dict(self._por_classe),
+                "estourados_por_rota": dict(self._por_rota),
+            }
+
+
+stats = DeadlineStats()
+
+
+def instalar_no_engine(engine: Engine) -> None:
+    """Aplica o prazo da requisição às consultas do engine (hint MAX_EXECUTION_TIME no MySQL)"""
+    mysql = engine.dialect.name == "mysql"
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _aplicar_prazo(conn, cursor, statement, parameters, context, executemany):
+        prazo = _prazo_atual.get()
+        if prazo is None:
+            return statement, parameters
+        restante_ms = int(prazo.restante() * 1000)
+        if restante_ms <= 0:
+            prazo.estourado = True
+            raise DeadlineExceeded(f"Prazo de {prazo.segundos:.0f}s da rota {prazo.rota} excedido")
+        # MAX_EXECUTION_TIME só vale para SELECT somente leitura
+        if mysql and _SELECT.match(statement):
+            statement = _SELECT.sub(f"SELECT /*+ MAX_EXECUTION_TIME({restante_ms}) */", statement, count=1)
+        return statement, parameters
+
+    @event.listens_for(engine, "handle_error")
+    def _marcar_timeout(contexto):
+        prazo = _prazo_atual.get()
+        if prazo is None:
+            return
+        orig = getattr(contexto, "original_exception", None)
+        codigo = orig.args[0] if orig is not None and getattr(orig, "args", None) else None
+        if codigo == _MYSQL_MAX_EXECUTION_TIME_EXCEEDED or isinstance(orig, DeadlineExceeded):
+            prazo.estourado = True
@@ -1,12 +1,13 @@
 from __future__ import annotations
 import os
-import time
 import json
 import threading
 from typing import List, Optional, Tuple, Dict, Any
-from urllib import request, parse, error
+from urllib import request, error
 import base64
 
+from core.token_broker import get_token_broker, TokenBrokerError
+
 # Try to import backend/env.py as module to support key=value configs
 try:
     import env as _env  # type: ignore
@@ -22,7 +23,7 @@ USER_ID = (_env.USER_ID if _env and getattr(_env, "USER_ID", None) else os.geten
 EMAIL_TI = (_env.EMAIL_TI if _env and getattr(_env, "EMAIL_TI", None) else os.getenv("EMAIL_TI"))
 EMAIL_SISTEMA = (_env.EMAIL_SISTEMA if _env and getattr(_env, "EMAIL_SISTEMA", None) else os.getenv("EMAIL_SISTEMA"))
 
-_graph_token: Optional[Tuple[str, float]] = None  # (token, expiry_epoch)
+GRAPH_TOKEN = "graph"
 
 
 def _have_graph_config() -> bool:
@@ -30,40 +31,24 @@ def _have_graph_config() -> bool:
 
 
 def _get_graph_token() -> Optional[str]:
-    global _graph_token
+    """Token do Graph pelo broker compartilhado (single-flight, renovação proativa)"""
     if not _have_graph_config():
         return None
-    now = time.time()
-    if _graph_token and now < _graph_token[1] - 30:
-        return _graph_token[0]
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    data = parse.urlencode({
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "grant_type": "client_credentials",
-        "scope": "https://graph.microsoft.com/.default",
-    }).encode("utf-8")
-    req = request.Request(token_url, data=data, method="POST")
-    req.add_header("Content-Type", "application/x-www-form-urlencoded")
     try:
-        with request.urlopen(req, timeout=15) as resp:
-            payload = json.loads(resp.read().decode("utf-8"))
-            token = payload.get("access_token")
-            expires_in = int(payload.get("expires_in", 3600))
-            if token:
-                _graph_token = (token, now + expires_in)
-                return token
-    except error.HTTPError as e:
-        try:
-            msg = e.read().decode("utf-8")
-            print(f"[EMAIL] Graph token error: {e.code} {msg}")
-        except Exception:
-            print(f"[EMAIL] Graph token HTTPError: {e}")
+        return get_token_broker().obter(GRAPH_TOKEN)
+    except TokenBrokerError as e:
+        print(f"[EMAIL] Graph token error: {e}")
     except Exception as e:
         print(f"[EMAIL] Graph token exception: {e}")
     return None
 
 
+if _have_graph_config():
+    get_token_broker().registrar(
+        GRAPH_TOKEN, TENANT_ID, CLIENT_ID, CLIENT_SECRET, "https://graph.microsoft.com/.default"
+    )
+
+
 def _post_graph(path: str, payload: dict) -> bool:
     token = _get_graph_token()
     if not token:
@@ -88,3 +88,28 @@ def emit_refresh_sync(user_id: int):
         print(f"[SIO] emit_refresh_sync error for user_id={user_id}: {e}")
         import traceback
         traceback.print_exc()
+
+
+# Event loop of the ASGI app, bound at startup so that plain background threads
+# (job scheduler, SLA deadline timer, unit-of-work hooks) can emit events.
+_event_loop: asyncio.AbstractEventLoop | None = None
+
+
+def bind_event_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """Register the running app loop (call from an async startup handler)."""
+    global _event_loop
+    _event_loop = loop
+
+
+def emit_threadsafe(event: str, data, room=None, timeout: float = 5.0) -> bool:
+    """Emit from any non-async thread; returns False if the loop is unavailable."""
+    loop = _event_loop
+    if loop is None or loop.is_closed():
+        return False
+    future = asyncio.run_coroutine_threadsafe(sio.emit(event, data, room=room), loop)
+    try:
+        future.result(timeout=timeout)
+        return True
+    except Exception as e:
+        print(f"[SIO] emit_threadsafe error ({event}): {e}")
+        return False
@@ -0,0 +1,334 @@
+"""
+Hash e verificação de senha fora das threads da API.
+
+check_password_hash/generate_password_hash (werkzeug) são KDFs lentas de
+propósito. Rodando nas threads do anyio, um pico de logins (início do
+expediente) ocupava o pool de threads e atrasava todos os outros endpoints
+síncronos. Agora:
+
+- Os hashes rodam num pool de processos próprio (SENHA_PROCESSOS), fora do
+  GIL e fora do pool de threads da API
+- No máximo SENHA_MAX_CONCORRENTES hashes em andamento e SENHA_MAX_FILA
+  esperando por worker da API; além disso a chamada falha na hora com
+  SenhaOcupadaError (503 + Retry-After), sem prender mais threads
+- Login (caminho quente) é assíncrono: verificar_senha_async() aguarda a
+  vaga e o processo (asyncio.wrap_future) sem ocupar nenhuma thread do anyio.
+  As versões síncronas ficam para os endpoints raros (criar usuário, trocar
+  senha...). Os dois caminhos disputam as mesmas SENHA_MAX_CONCORRENTES vagas
+- Limite de tentativas por identificador (SENHA_TENTATIVAS_POR_MINUTO, por
+  worker): LimiteTentativasError (429 + Retry-After), antes de ir ao banco
+- precisa_rehash(): hashes com método/custo diferente de SENHA_HASH_METODO
+  são regravados no próximo login bem-sucedido
+
+Benchmark: python -m ti.scripts.benchmark_login
+"""
+
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+METODO = os.getenv("SENHA_HASH_METODO", "scrypt:32768:8:1")
+PROCESSOS = int(os.getenv("SENHA_PROCESSOS", "2"))
+MAX_CONCORRENTES = int(os.getenv("SENHA_MAX_CONCORRENTES", str(PROCESSOS * 2)))
+MAX_FILA = int(os.getenv("SENHA_MAX_FILA", "16"))
+ESPERA_MAX_SEGUNDOS = float(os.getenv("SENHA_ESPERA_MAX_SEGUNDOS", "10"))
+TENTATIVAS_POR_MINUTO = int(os.getenv("SENHA_TENTATIVAS_POR_MINUTO", "10"))
+JANELA_SEGUNDOS = 60
+MAX_IDENTIFICADORES = 10000
+
+
+class SenhaOcupadaError(Exception):
+    """Pool de hash saturado: a chamada foi recusada em vez de esperar"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Muitas autenticações em andamento. Tente novamente em instantes.")
+        self.retry_after = retry_after
+
+
+class LimiteTentativasError(Exception):
+    """Tentativas demais para o mesmo identificador na janela"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Muitas tentativas de login. Tente novamente em {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class _Vagas:
+    """
+    Semáforo contado compartilhado entre threads (adquirir) e o event loop
+    (adquirir_async). Vaga liberada vai primeiro para quem espera no event
+    loop (entregue direto ao future) e, sem ninguém lá, para as threads.
+    """
+
+    def __init__(self, total: int):
+        self._livres = total
+        self._cond = threading.Condition()
+        self._fila_async: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def adquirir(self, timeout: float) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._livres > 0, timeout):
+                return False
+            self._livres -= 1
+            return True
+
+    async def adquirir_async(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._livres > 0 and not self._fila_async:
+                self._livres -= 1
+                return True
+            futuro = loop.create_future()
+            entrada = (loop, futuro)
+            self._fila_async.append(entrada)
+        try:
+            await asyncio.wait_for(futuro, timeout)
+            return True
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._cond:
+                if entrada in self._fila_async:
+                    self._fila_async.remove(entrada)
+            raise
+        with self._cond:
+            if entrada in self._fila_async:
+                self._fila_async.remove(entrada)
+        # Se a vaga já tinha sido entregue, _entregar devolve (futuro cancelado)
+        return False
+
+    def liberar(self) -> None:
+        with self._cond:
+            while self._fila_async:
+                loop, futuro = self._fila_async.popleft()
+                if futuro.done():
+                    continue
+                try:
+                    loop.call_soon_threadsafe(self._entregar, futuro)
+                    return
+                except RuntimeError:
+                    # Loop já encerrado
+                    continue
+            self._livres += 1
+            self._cond.notify()
+
+    def _entregar(self, futuro: asyncio.Future) -> None:
+        if futuro.done():
+            # Quem esperava desistiu (timeout/cancelamento) entre a entrega e agora
+            self.liberar()
+        else:
+            futuro.set_result(True)
+
+
+class _PoolSenhas:
+    def __init__(self):
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        # Vagas de hash do worker, compartilhadas pelos caminhos síncrono e assíncrono
+        self._vagas = _Vagas(MAX_CONCORRENTES)
+        self._esperando = 0
+        self._metodo_canonico: str | None = None
+        self.stats = {
+            "hashes": 0,
+            "verificacoes": 0,
+            "rehashes": 0,
+            "recusados_pool_cheio": 0,
+            "recusados_limite_tentativas": 0,
+            "pool_reiniciado": 0,
+            "espera_total_ms": 0.0,
+            "hash_total_ms": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: não herda threads/conexões do worker da API
+                self._executor = ProcessPoolExecutor(
+                    max_workers=PROCESSOS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _entrar_fila(self) -> None:
+        with self._lock:
+            if self._esperando >= MAX_FILA + MAX_CONCORRENTES:
+                self.stats["recusados_pool_cheio"] += 1
+                raise SenhaOcupadaError()
+            self._esperando += 1
+
+    def _sair_fila(self) -> None:
+        with self._lock:
+            self._esperando -= 1
+
+    def _contabilizar(self, inicio: float, inicio_hash: float) -> None:
+        with self._lock:
+            self.stats["espera_total_ms"] += (inicio_hash - inicio) * 1000
+            self.stats["hash_total_ms"] += (time.perf_counter() - inicio_hash) * 1000
+
+    def _reiniciar_executor(self) -> None:
+        # Processo filho morreu (OOM, kill): recria o pool
+        with self._lock:
+            self._executor = None
+            self.stats["pool_reiniciado"] += 1
+
+    def _executar(self, fn, *args):
+        self._entrar_fila()
+        inicio = time.perf_counter()
+        try:
+            if not self._vagas.adquirir(ESPERA_MAX_SEGUNDOS):
+                with self._lock:
+                    self.stats["recusados_pool_cheio"] += 1
+                raise SenhaOcupadaError()
+            try:
+                inicio_hash = time.perf_counter()
+                try:
+                    resultado = self._get_executor().submit(fn, *args).result()
+                except BrokenProcessPool:
+                    # Tenta uma vez com o pool recriado
+                    self._reiniciar_executor()
+                    resultado = self._get_executor().submit(fn, *args).result()
+                self._contabilizar(inicio, inicio_hash)
+                return resultado
+            finally:
+                self._vagas.liberar()
+        finally:
+            self._sair_fila()
+
+    async def _executar_async(self, fn, *args):
+        """Como _executar(), mas aguarda vaga e processo sem bloquear thread nenhuma"""
+        self._entrar_fila()
+        inicio = time.perf_counter()
+        try:
+            if not await self._vagas.adquirir_async(ESPERA_MAX_SEGUNDOS):
+                with self._lock:
+                    self.stats["recusados_pool_cheio"] += 1
+                raise SenhaOcupadaError()
+            try:
+                inicio_hash = time.perf_counter()
+                try:
+                    resultado = await asyncio.wrap_future(self._get_executor().submit(fn, *args))
+                except BrokenProcessPool:
+                    self._reiniciar_executor()
+                    resultado = await asyncio.wrap_future(self._get_executor().submit(fn, *args))
+                self._contabilizar(inicio, inicio_hash)
+                return resultado
+            finally:
+                self._vagas.liberar()
+        finally:
+            self._sair_fila()
+
+    def gerar_hash(self, senha: str) -> str:
+        resultado = self._executar(generate_password_hash, senha, METODO)
+        self.stats["hashes"] += 1
+        return resultado
+
+    def verificar(self, senha_hash: str | None, senha: str) -> bool:
+        if not senha_hash:
+            return False
+        resultado = self._executar(check_password_hash, senha_hash, senha)
+        self.stats["verificacoes"] += 1
+        return resultado
+
+    async def gerar_hash_async(self, senha: str) -> str:
+        resultado = await self._executar_async(generate_password_hash, senha, METODO)
+        self.stats["hashes"] += 1
+        return resultado
+
+    async def verificar_async(self, senha_hash: str | None, senha: str) -> bool:
+        if not senha_hash:
+            return False
+        resultado = await self._executar_async(check_password_hash, senha_hash, senha)
+        self.stats["verificacoes"] += 1
+        return resultado
+
+    def metodo_canonico(self) -> str:
+        """Prefixo gravado pelo werkzeug para METODO (ex: "pbkdf2" → "pbkdf2:sha256:600000")"""
+        if self._metodo_canonico is None:
+            self._metodo_canonico = generate_password_hash("", METODO).split("$", 1)[0]
+        return self._metodo_canonico
+
+    def precisa_rehash(self, senha_hash: str | None) -> bool:
+        return bool(senha_hash) and senha_hash.split("$", 1)[0] != self.metodo_canonico()
+
+    def parar(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def status(self) -> dict:
+        with self._lock:
+            esperando = self._esperando
+        processados = self.stats["hashes"] + self.stats["verificacoes"]
+        return {
+            **self.stats,
+            "metodo": METODO,
+            "processos": PROCESSOS,
+            "max_concorrentes": MAX_CONCORRENTES,
+            "max_fila": MAX_FILA,
+            "em_andamento_ou_fila": esperando,
+            "espera_media_ms": round(self.stats["espera_total_ms"] / processados, 1) if processados else None,
+            "hash_medio_ms": round(self.stats["hash_total_ms"] / processados, 1) if processados else None,
+        }
+
+
+class _LimiteTentativas:
+    """Janela deslizante de tentativas por identificador (e-mail/usuário)"""
+
+    def __init__(self):
+        self._tentativas: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, identificador: str) -> None:
+        if TENTATIVAS_POR_MINUTO <= 0:
+            return
+        chave = (identificador or "").strip().lower()
+        agora = time.monotonic()
+        with self._lock:
+            if len(self._tentativas) > MAX_IDENTIFICADORES:
+                self._tentativas = {
+                    k: v for k, v in self._tentativas.items() if v and agora - v[-1] < JANELA_SEGUNDOS
+                }
+            janela = self._tentativas.setdefault(chave, deque())
+            while janela and agora - janela[0] >= JANELA_SEGUNDOS:
+                janela.popleft()
+            if len(janela) >= TENTATIVAS_POR_MINUTO:
+                pool.stats["recusados_limite_tentativas"] += 1
+                raise LimiteTentativasError(max(1, int(JANELA_SEGUNDOS - (agora - janela[0]) + 0.999)))
+            janela.append(agora)
+
+
+pool = _PoolSenhas()
+limite_tentativas = _LimiteTentativas()
+
+
+def gerar_hash_senha(senha: str) -> str:
+    return pool.gerar_hash(senha)
+
+
+def verificar_senha(senha_hash: str | None, senha: str) -> bool:
+    return pool.verificar(senha_hash, senha)
+
+
+async def gerar_hash_senha_async(senha: str) -> str:
+    return await pool.gerar_hash_async(senha)
+
+
+async def verificar_senha_async(senha_hash: str | None, senha: str) -> bool:
+    return await pool.verificar_async(senha_hash, senha)
+
+
+def precisa_rehash(senha_hash: str | None) -> bool:
+    return pool.precisa_rehash(senha_hash)
+
+
+def registrar_tentativa(identificador: str) -> None:
+    limite_tentativas.registrar(identificador)
@@ -0,0 +1,327 @@
+"""
+Broker de tokens OAuth (client credentials) compartilhado por Graph e Power BI.
+
+Antes, core/email_msgraph guardava o token do Graph em uma global sem lock e
+ti/api/powerbi.py tinha seu próprio TokenCache: no vencimento, cada thread
+de send_async (e cada requisição do Power BI) pedia um token novo a
+login.microsoftonline.com ao mesmo tempo. Agora:
+
+- Single-flight: uma única renovação por fonte em andamento; threads
+  (obter) e corrotinas (obter_async) esperam o mesmo Future
+- Renovação proativa a ~80% da validade (TOKEN_RENOVAR_FRACAO, com jitter
+  por worker), em segundo plano: quem pede o token continua recebendo o
+  atual, ainda válido, sem esperar
+- Persistência em disco (TOKEN_CACHE_DIR, um arquivo por fonte, 0600): um
+  worker reiniciado reaproveita o token vigente, e um worker que vai renovar
+  adota antes um token mais novo gravado por outro worker
+- Métricas por fonte (hits, esperas, renovações, adoções do disco, falhas)
+  em GET /api/metrics/tokens; o token nunca é exposto
+
+Uso:
+    broker = get_token_broker()
+    broker.registrar("graph", tenant_id, client_id, client_secret, "https://graph.microsoft.com/.default")
+    token = broker.obter("graph")              # código síncrono
+    token = await broker.obter_async("graph")  # código assíncrono
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RENOVAR_FRACAO = float(os.getenv("TOKEN_RENOVAR_FRACAO", "0.8"))
+# Espalha a renovação proativa entre workers (± fração da validade)
+RENOVAR_JITTER = float(os.getenv("TOKEN_RENOVAR_JITTER", "0.05"))
+# Token a menos disso do vencimento não é mais entregue
+MARGEM_SEGUNDOS = 30
+TIMEOUT_SEGUNDOS = float(os.getenv("TOKEN_TIMEOUT_SEGUNDOS", "15"))
+VERIFICAR_INTERVALO_SEGUNDOS = 30
+# Sobrescrevível para apontar para o mock local (ti/scripts/powerbi_mock_server.py)
+LOGIN_URL = os.getenv("AZURE_LOGIN_URL", "https://login.microsoftonline.com").rstrip("/")
+CACHE_DIR = os.getenv("TOKEN_CACHE_DIR", os.path.join(tempfile.gettempdir(), "evoque_oauth"))
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="token-broker")
+
+
+class TokenBrokerError(Exception):
+    """Falha ao obter token do provedor"""
+
+
+class FonteToken:
+    """Credenciais de uma fonte (tenant + app + escopo) e o token vigente"""
+
+    def __init__(self, nome: str, tenant_id: str, client_id: str, client_secret: str, scope: str):
+        self.nome = nome
+        self.token_url = f"{LOGIN_URL}/{tenant_id}/oauth2/v2.0/token"
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.token: str | None = None
+        self.emitido_em = 0.0
+        self.expira_em = 0.0
+        self.fracao = RENOVAR_FRACAO + random.uniform(-RENOVAR_JITTER, RENOVAR_JITTER)
+        self.em_andamento: Future | None = None
+        self.stats = {
+            "hits": 0,
+            "esperas": 0,
+            "renovacoes": 0,
+            "renovacoes_proativas": 0,
+            "adotados_do_disco": 0,
+            "falhas": 0,
+        }
+
+    def valido(self, agora: float) -> bool:
+        return bool(self.token) and agora < self.expira_em - MARGEM_SEGUNDOS
+
+    def renovar_em(self) -> float:
+        return self.emitido_em + (self.expira_em - self.emitido_em) * self.fracao
+
+
+class TokenBroker:
+    """Tokens OAuth por fonte, com single-flight, renovação proativa e persistência"""
+
+    def __init__(self):
+        self._fontes: dict[str, FonteToken] = {}
+        self._lock = threading.Lock()
+        self.running = False
+        self.thread: threading.Thread | None = None
+
+    # ------------------------------------------------------------------
+    # Registro e ciclo de vida
+    # ------------------------------------------------------------------
+
+    def registrar(self, nome: str, tenant_id: str, client_id: str, client_secret: str, scope: str) -> FonteToken:
+        """Registra a fonte (idempotente) e carrega o token persistido, se ainda válido"""
+        with self._lock:
+            fonte = self._fontes.get(nome)
+            if fonte is not None:
+                return fonte
+            fonte = FonteToken(nome, tenant_id, client_id, client_secret, scope)
+            self._fontes[nome] = fonte
+
+        persistido = self._ler_disco(fonte)
+        if persistido and persistido["expira_em"] - MARGEM_SEGUNDOS > time.time():
+            with self._lock:
+                fonte.token = persistido["token"]
+                fonte.emitido_em = persistido["emitido_em"]
+                fonte.expira_em = persistido["expira_em"]
+                fonte.stats["adotados_do_disco"] += 1
+            print(f"[TOKEN] ♻️ Token de '{nome}' carregado do disco (expira em {int(fonte.expira_em - time.time())}s)")
+        return fonte
+
+    def start(self) -> None:
+        """Inicia a renovação proativa em segundo plano (tokens ociosos também são renovados)"""
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._loop, daemon=True, name="TokenBrokerThread")
+            self.thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            self.running = False
+
+    def _loop(self) -> None:
+        while self.running:
+            try:
+                agora = time.time()
+                with self._lock:
+                    for fonte in self._fontes.values():
+                        if fonte.valido(agora) and agora >= fonte.renovar_em():
+                            self._disparar(fonte, proativa=True)
+            except Exception as e:
+                logger.error(f"[TOKEN] Erro no loop de renovação: {e}", exc_info=True)
+            time.sleep(VERIFICAR_INTERVALO_SEGUNDOS)
+
+    # ------------------------------------------------------------------
+    # Obtenção
+    # ------------------------------------------------------------------
+
+    def _fonte(self, nome: str) -> FonteToken:
+        fonte = self._fontes.get(nome)
+        if fonte is None:
+            raise TokenBrokerError(f"Fonte de token '{nome}' não registrada")
+        return fonte
+
+    def obter(self, nome: str) -> str:
+        """Token vigente da fonte (bloqueia apenas se não houver token válido)"""
+        resultado = self._token_ou_futuro(self._fonte(nome))
+        if isinstance(resultado, str):
+            return resultado
+        try:
+            return resultado.result(timeout=TIMEOUT_SEGUNDOS + 5)
+        except FutureTimeout:
+            raise TokenBrokerError(f"Tempo esgotado aguardando token de '{nome}'")
+
+    async def obter_async(self, nome: str) -> str:
+        """Versão assíncrona de obter(): espera a renovação sem ocupar o event loop"""
+        resultado = self._token_ou_futuro(self._fonte(nome))
+        if isinstance(resultado, str):
+            return resultado
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(resultado), TIMEOUT_SEGUNDOS + 5)
+        except asyncio.TimeoutError:
+            raise TokenBrokerError(f"Tempo esgotado aguardando token de '{nome}'")
+
+    def _token_ou_futuro(self, fonte: FonteToken) -> str | Future:
+        agora = time.time()
+        with self._lock:
+            if fonte.valido(agora):
+                fonte.stats["hits"] += 1
+                if agora >= fonte.renovar_em():
+                    self._disparar(fonte, proativa=True)
+                return fonte.token
+            if fonte.em_andamento is not None:
+                fonte.stats["esperas"] += 1
+                return fonte.em_andamento
+            return self._disparar(fonte, proativa=False)
+
+    def _disparar(self, fonte: FonteToken, proativa: bool) -> Future:
+        """Inicia a renovação se nenhuma estiver em andamento (chamar com self._lock)"""
+        if fonte.em_andamento is None:
+            fonte.em_andamento = _executor.submit(self._renovar, fonte, proativa)
+        return fonte.em_andamento
+
+    def _renovar(self, fonte: FonteToken, proativa: bool) -> str:
+        try:
+            # Outro worker pode ter acabado de renovar: adota o token dele
+            persistido = self._ler_disco(fonte)
+            agora = time.time()
+            if (
+                persistido
+                and persistido["expira_em"] > fonte.expira_em
+                and agora < persistido["emitido_em"] + (persistido["expira_em"] - persistido["emitido_em"]) * fonte.fracao
+            ):
+                with self._lock:
+                    fonte.token = persistido["token"]
+                    fonte.emitido_em = persistido["emitido_em"]
+                    fonte.expira_em = persistido["expira_em"]
+                    fonte.stats["adotados_do_disco"] += 1
+                return persistido["token"]
+
+            try:
+                response = httpx.post(
+                    fonte.token_url,
+                    data={
+                        "grant_type": "client_credentials",
+                        "client_id": fonte.client_id,
+                        "client_secret": fonte.client_secret,
+                        "scope": fonte.scope,
+                    },
+                    timeout=TIMEOUT_SEGUNDOS,
+                )
+            except httpx.RequestError as e:
+                raise TokenBrokerError(f"Erro de rede: {e}")
+
+            if response.status_code != 200:
+                raise TokenBrokerError(f"{response.status_code} {response.text}")
+
+            payload = response.json()
+            token = payload.get("access_token")
+            if not token:
+                raise TokenBrokerError("Resposta sem access_token")
+            expires_in = int(payload.get("expires_in", 3600))
+
+            with self._lock:
+                fonte.token = token
+                fonte.emitido_em = agora
+                fonte.expira_em = agora + expires_in
+                fonte.stats["renovacoes_proativas" if proativa else "renovacoes"] += 1
+            self._gravar_disco(fonte)
+            print(f"[TOKEN] ✅ Novo token de '{fonte.nome}' (válido por {expires_in}s{', renovação proativa' if proativa else ''})")
+            return token
+        except Exception as e:
+            with self._lock:
+                fonte.stats["falhas"] += 1
+            print(f"[TOKEN] ❌ Erro ao obter token de '{fonte.nome}': {e}")
+            if isinstance(e, TokenBrokerError):
+                raise
+            raise TokenBrokerError(str(e))
+        finally:
+            with self._lock:
+                fonte.em_andamento = None
+
+    # ------------------------------------------------------------------
+    # Persistência
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _caminho(fonte: FonteToken) -> str:
+        return os.path.join(CACHE_DIR, f"{fonte.nome}.json")
+
+    def _ler_disco(self, fonte: FonteToken) -> dict | None:
+        try:
+            with open(self._caminho(fonte), "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            # Credenciais trocadas no .env invalidam o token persistido
+            if dados.get("client_id") != fonte.client_id or dados.get("scope") != fonte.scope:
+                return None
+            return dados
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[TOKEN] Erro ao ler token persistido de '{fonte.nome}': {e}")
+            return None
+
+    def _gravar_disco(self, fonte: FonteToken) -> None:
+        try:
+            os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+            fd, temporario = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{fonte.nome}.")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({
+                    "token": fonte.token,
+                    "emitido_em": fonte.emitido_em,
+                    "expira_em": fonte.expira_em,
+                    "client_id": fonte.client_id,
+                    "scope": fonte.scope,
+                }, f)
+            os.replace(temporario, self._caminho(fonte))
+        except Exception as e:
+            logger.warning(f"[TOKEN] Erro ao persistir token de '{fonte.nome}': {e}")
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    def status(self) -> dict:
+        agora = time.time()
+        with self._lock:
+            return {
+                "renovacao_proativa_ativa": self.running,
+                "fontes": {
+                    fonte.nome: {
+                        **fonte.stats,
+                        "valido": fonte.valido(agora),
+                        "expira_em_segundos": int(fonte.expira_em - agora) if fonte.token else None,
+                        "renovar_em_segundos": int(fonte.renovar_em() - agora) if fonte.token else None,
+                        "renovacao_em_andamento": fonte.em_andamento is not None,
+                    }
+                    for fonte in self._fontes.values()
+                },
+            }
+
+
+# Instância global singleton (uma por worker)
+_token_broker_instance: TokenBroker | None = None
+_instance_lock = threading.Lock()
+
+
+def get_token_broker() -> TokenBroker:
+    """Obtém a instância global do broker de tokens"""
+    global _token_broker_instance
+    if _token_broker_instance is None:
+        with _instance_lock:
+            if _token_broker_instance is None:
+                _token_broker_instance = TokenBroker()
+    return _token_broker_instance
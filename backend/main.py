@@ -1,14 +1,15 @@
 from __future__ import annotations
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
-from fastapi.responses import StreamingResponse, Response, FileResponse
+from fastapi.responses import StreamingResponse, Response, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
 from io import BytesIO
-from ti.api import chamados_router, unidades_router, problemas_router, notifications_router, alerts_router, email_debug_router, sla_router, powerbi_router, metrics_router
+from ti.api import chamados_router, unidades_router, problemas_router, notifications_router, alerts_router, email_debug_router, sla_router, powerbi_router, metrics_router, jobs_router, domain_events_router
 from ti.api.usuarios import router as usuarios_router
 from ti.api.dashboard_permissions import router as dashboard_permissions_router
 from core.realtime import mount_socketio
+from core import deadline
 import json
 from typing import Any, List, Dict
 import uuid
@@ -34,6 +35,14 @@ try:
 except Exception as e:
     print(f"⚠️  Erro ao criar tabela metrics_cache_db: {e}")
 
+# Tabela de gerações das tags de cache (invalidação por incremento de geração)
+try:
+    from ti.scripts.create_cache_tag_table import create_cache_tag_table
+    create_cache_tag_table()
+    print("✅ Tabela cache_tag_geracao criada com sucesso")
+except Exception as e:
+    print(f"⚠️  Erro ao criar tabela cache_tag_geracao: {e}")
+
 # Executar migração do historico_status na inicialização
 try:
     from ti.scripts.migrate_historico_status import migrate_historico_status
@@ -42,14 +51,153 @@ try:
 except Exception as e:
     print(f"⚠️  Erro ao migrar historico_status: {e}")
 
-# Inicializar scheduler de recalculação automática de SLA
+# Chave única em historico_sla.chamado_id (necessária para o upsert em lote)
+try:
+    from ti.scripts.add_historico_sla_unique_key import add_historico_sla_unique_key
+    print(f"✅ historico_sla: {add_historico_sla_unique_key()}")
+except Exception as e:
+    print(f"⚠️  Erro ao criar chave única em historico_sla: {e}")
+
+# Colunas de prazo de SLA em chamado (prazo_resposta_em / prazo_resolucao_em)
+try:
+    from ti.scripts.add_sla_deadline_columns import add_sla_deadline_columns, backfill_sla_deadlines
+    if add_sla_deadline_columns():
+        print(f"✅ Prazos de SLA calculados para {backfill_sla_deadlines()} chamados")
+except Exception as e:
+    print(f"⚠️  Erro ao criar colunas de prazo de SLA: {e}")
+
+# Durações de SLA congeladas em chamado (tempo_primeira_resposta_horas, tempo_resolucao_horas, ...)
+try:
+    from ti.scripts.add_sla_duration_columns import add_sla_duration_columns, backfill_sla_durations
+    if add_sla_duration_columns():
+        print(f"✅ Durações de SLA gravadas para {backfill_sla_durations()} chamados")
+except Exception as e:
+    print(f"⚠️  Erro ao criar colunas de duração de SLA: {e}")
+
+# Criar tabela de histórico de jobs agendados
+try:
+    from ti.scripts.create_job_run_table import create_job_run_table
+    create_job_run_table()
+    print("✅ Tabela job_run criada com sucesso")
+except Exception as e:
+    print(f"⚠️  Erro ao criar tabela job_run: {e}")
+
+# Tabelas normalizadas de setores e subcategorias de BI do usuário (+ backfill do JSON)
+try:
+    from ti.scripts.create_user_vinculo_tables import create_user_vinculo_tables, backfill_user_vinculos
+    create_user_vinculo_tables()
+    total_vinculos = backfill_user_vinculos()
+    print(f"✅ Tabelas user_setor/user_bi_subcategory prontas ({total_vinculos} usuários preenchidos)")
+except Exception as e:
+    print(f"⚠️  Erro ao criar tabelas user_setor/user_bi_subcategory: {e}")
+
+# Outbox de eventos de domínio (domain_event / domain_event_offset) e consumidores
+try:
+    from ti.scripts.create_domain_event_tables import create_domain_event_tables
+    from ti.services.domain_events import get_event_dispatcher
+    from ti.services.domain_event_consumers import registrar_consumidores, registrar_jobs_eventos
+    from ti.services.job_scheduler import get_job_scheduler
+    create_domain_event_tables()
+    registrar_consumidores(get_event_dispatcher())
+    registrar_jobs_eventos(get_job_scheduler())
+    print("✅ Tabelas de eventos de domínio criadas com sucesso")
+except Exception as e:
+    print(f"⚠️  Erro ao criar tabelas de eventos de domínio: {e}")
+
+# Fila de jobs sob demanda (operações administrativas pesadas de SLA)
+try:
+    from ti.services.job_queue import get_job_queue
+    from ti.services.sla_admin_jobs import registrar_tarefas_sla
+    registrar_tarefas_sla(get_job_queue())
+    print("✅ Tarefas da fila de jobs registradas")
+except Exception as e:
+    print(f"⚠️  Erro ao registrar tarefas da fila de jobs: {e}")
+
+# Inicializar agendador de jobs (apenas o worker líder executa os jobs agendados)
 try:
     from ti.services.sla_scheduler import init_scheduler
     init_scheduler()
-    print("✅ Scheduler de SLA iniciado com sucesso")
+    print("✅ Agendador de jobs iniciado com sucesso")
 except Exception as e:
     print(f"⚠️  Erro ao inicializar scheduler de SLA: {e}")
 
+# Loop asyncio da aplicação: threads de background emitem eventos Socket.IO por ele
+@_http.on_event("startup")
+async def _registrar_loop_realtime():
+    import asyncio
+    from core.realtime import bind_event_loop
+    bind_event_loop(asyncio.get_running_loop())
+
+
+# Temporizador de prazos de SLA
+@_http.on_event("startup")
+async def _iniciar_timer_prazos_sla():
+    try:
+        from ti.services.sla_deadline_timer import get_deadline_timer
+        get_deadline_timer().start()
+        print("✅ Temporizador de prazos de SLA iniciado")
+    except Exception as e:
+        print(f"⚠️  Erro ao iniciar temporizador de prazos de SLA: {e}")
+
+
+@_http.on_event("shutdown")
+async def _parar_timer_prazos_sla():
+    from ti.services.sla_deadline_timer import get_deadline_timer
+    get_deadline_timer().stop()
+
+
+# Dispatcher de eventos de domínio (entrega o outbox aos consumidores)
+@_http.on_event("startup")
+async def _iniciar_dispatcher_eventos():
+    try:
+        from ti.services.domain_events import get_event_dispatcher
+        get_event_dispatcher().start()
+        print("✅ Dispatcher de eventos de domínio iniciado")
+    except Exception as e:
+        print(f"⚠️  Erro ao iniciar dispatcher de eventos de domínio: {e}")
+
+
+@_http.on_event("shutdown")
+async def _parar_dispatcher_eventos():
+    from ti.services.domain_events import get_event_dispatcher
+    get_event_dispatcher().stop()
+
+
+# Renovação proativa dos tokens OAuth (Graph e Power BI)
+@_http.on_event("startup")
+async def _iniciar_token_broker():
+    from core.token_broker import get_token_broker
+    get_token_broker().start()
+
+
+@_http.on_event("shutdown")
+async def _parar_token_broker():
+    from core.token_broker import get_token_broker
+    get_token_broker().stop()
+
+
+@_http.on_event("startup")
+async def _iniciar_caches_powerbi():
+    from ti.services.powerbi_client import embed_token_cache
+    from ti.services.powerbi_metadados import metadados_cache
+    embed_token_cache.iniciar()
+    metadados_cache.iniciar()
+
+
+@_http.on_event("shutdown")
+async def _fechar_cliente_powerbi():
+    from ti.services.powerbi_client import embed_token_cache, fechar_powerbi_client
+    from ti.services.powerbi_metadados import metadados_cache
+    embed_token_cache.parar()
+    metadados_cache.parar()
+    await fechar_powerbi_client()
+
+
+@_http.on_event("shutdown")
+async def _parar_pool_senhas():
+    from core.senhas import pool
+    pool.parar()
+
 # Pré-carregar cache do banco na startup
 try:
     from ti.services.sla_cache import SLACacheManager
@@ -70,6 +218,34 @@ _uploads = _base_dir / "uploads"
 _uploads.mkdir(parents=True, exist_ok=True)
 _http.mount("/uploads", StaticFiles(directory=str(_uploads), html=False), name="uploads")
 
+@_http.middleware("http")
+async def _prazo_da_requisicao(request: Request, call_next):
+    """Prazo por classe de rota (core/deadline.py); prazo estourado vira 503 com Retry-After"""
+    prazo, token = deadline.iniciar_prazo(request.url.path)
+    try:
+        try:
+            response = await call_next(request)
+        except Exception:
+            if not prazo.estourado:
+                raise
+            response = None
+        # Os endpoints costumam converter a falha em HTTPException(500); o prazo decide
+        if prazo.estourado and (response is None or response.status_code >= 500):
+            # Conta pelo molde da rota (/chamados/{id}), não pelo caminho com ids
+            rota = request.scope.get("route")
+            if rota is not None:
+                prazo.rota = getattr(rota, "path", prazo.rota)
+            deadline.stats.registrar(prazo)
+            print(f"[DEADLINE] ⚠️ {request.method} {prazo.rota} excedeu {prazo.segundos:.0f}s ({prazo.classe})")
+            return JSONResponse(
+                status_code=503,
+                content={"detail": f"Tempo limite de {prazo.segundos:.0f}s excedido. Tente novamente em instantes."},
+                headers={"Retry-After": str(deadline.RETRY_AFTER_SEGUNDOS)},
+            )
+        return response
+    finally:
+        deadline.encerrar_prazo(token)
+
 _http.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -362,6 +538,8 @@ _http.include_router(email_debug_router, prefix="/api")
 _http.include_router(sla_router, prefix="/api")
 _http.include_router(powerbi_router, prefix="/api")
 _http.include_router(metrics_router, prefix="/api")
+_http.include_router(jobs_router, prefix="/api")
+_http.include_router(domain_events_router, prefix="/api")
 _http.include_router(dashboard_permissions_router, prefix="")
 
 # Compatibility mount without prefix, in case the server is run without proxy
@@ -375,6 +553,8 @@ _http.include_router(email_debug_router)
 _http.include_router(sla_router)
 _http.include_router(powerbi_router)
 _http.include_router(metrics_router)
+_http.include_router(jobs_router)
+_http.include_router(domain_events_router)
 _http.include_router(dashboard_permissions_router)
 
 # Wrap with Socket.IO ASGI app (exports as 'app')
@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, B
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from core.db import get_db, engine
+from core.senhas import SenhaOcupadaError, verificar_senha
 from ti.schemas.chamado import (
     ChamadoCreate,
     ChamadoOut,
@@ -11,93 +12,152 @@ from ti.schemas.chamado import (
     ALLOWED_STATUSES,
 )
 from ti.services.chamados import criar_chamado as service_criar
-from ti.services.sla import SLACalculator
-from ti.services.sla_cache import SLACacheManager
+from ti.services.sla import SLACalculator, BusinessCalendar
+from ti.services.sla_deadlines import SLADeadlines
+from ti.services.sla_duracoes import SLADuracoes
 from ti.models.sla_config import HistoricoSLA
-from core.realtime import sio
-from werkzeug.security import check_password_hash
+from ti.services.sla_historico import HistoricoSLAWriter
+from ti.services.unit_of_work import UnitOfWork
+from ti.services.domain_event_consumers import (
+    CHAMADO_CRIADO,
+    CHAMADO_STATUS_ALTERADO,
+    CHAMADO_EXCLUIDO,
+    CHAMADO_TICKET_ENVIADO,
+)
+from ti.services.historico_chamado import historico_cache
 from ..models.notification import Notification
 import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
 from core.utils import now_brazil_naive
 from ..models import Chamado, User, TicketAnexo, ChamadoAnexo, HistoricoTicket, HistoricoStatus, HistoricoAnexo
 from ti.schemas.attachment import AnexoOut
 from ti.schemas.ticket import HistoricoItem, HistoricoResponse
 from sqlalchemy import inspect, text
-from core.email_msgraph import send_async, send_chamado_abertura, send_chamado_status
 
 from fastapi.responses import Response
 
 router = APIRouter(prefix="/chamados", tags=["TI - Chamados"])
 
 
-def _sincronizar_sla(db: Session, chamado: Chamado, status_anterior: str | None = None) -> None:
+def _aplicar_sla(db: Session, chamado: Chamado, status_anterior: str | None = None) -> None:
     """
-    Função auxiliar para sincronizar um chamado com a tabela de histórico de SLA.
-    Deve ser chamada sempre que um chamado é criado ou atualizado.
-    TAMBÉM invalida o cache automaticamente e atualiza métricas incrementalmente.
+    Grava o estado de SLA derivado do chamado na transação corrente (sem commit):
+    snapshot em historico_sla, prazos absolutos e durações congeladas.
+    Os históricos de status do chamado já devem ter sido gravados (flush).
     """
-    try:
-        try:
-            HistoricoSLA.__table__.create(bind=engine, checkfirst=True)
-        except Exception:
-            pass
-
-        sla_status = SLACalculator.get_sla_status(db, chamado)
-
-        # Extrai métricas de resposta e resolução
-        resposta_metric = sla_status.get("resposta_metric")
-        resolucao_metric = sla_status.get("resolucao_metric")
-
-        tempo_resposta_horas = resposta_metric.get("tempo_decorrido_horas") if resposta_metric else None
-        limite_sla_resposta_horas = resposta_metric.get("tempo_limite_horas") if resposta_metric else None
-        tempo_resolucao_horas = resolucao_metric.get("tempo_decorrido_horas") if resolucao_metric else None
-        limite_sla_horas = resolucao_metric.get("tempo_limite_horas") if resolucao_metric else None
-
-        # Procura por histórico existente
-        existing = db.query(HistoricoSLA).filter(
-            HistoricoSLA.chamado_id == chamado.id
-        ).order_by(HistoricoSLA.criado_em.desc()).first()
-
-        if existing:
-            # Atualiza o último histórico com novos cálculos
-            existing.status_novo = chamado.status
-            existing.status_anterior = status_anterior or existing.status_anterior
-            existing.tempo_resposta_horas = tempo_resposta_horas
-            existing.limite_sla_resposta_horas = limite_sla_resposta_horas
-            existing.tempo_resolucao_horas = tempo_resolucao_horas
-            existing.limite_sla_horas = limite_sla_horas
-            existing.status_sla = sla_status.get("status_geral")
-            db.add(existing)
-        else:
-            # Cria novo histórico
-            historico = HistoricoSLA(
-                chamado_id=chamado.id,
-                usuario_id=None,
-                acao="criacao" if not status_anterior else "atualizacao",
-                status_anterior=status_anterior,
-                status_novo=chamado.status,
-                tempo_resposta_horas=tempo_resposta_horas,
-                limite_sla_resposta_horas=limite_sla_resposta_horas,
-                tempo_resolucao_horas=tempo_resolucao_horas,
-                limite_sla_horas=limite_sla_horas,
-                status_sla=sla_status.get("status_geral"),
-                criado_em=chamado.data_abertura or now_brazil_naive(),
-            )
-            db.add(historico)
-
-        db.commit()
-
-        # INVALIDA��ÃO DE CACHE: Quando um chamado é atualizado, invalida caches relacionados
-        SLACacheManager.invalidate_by_chamado(db, chamado.id)
+    sla_configs = SLACalculator.load_active_configs(db)
+    calendario = BusinessCalendar.load(db)
+    historicos_cache = SLACalculator.load_historicos_by_chamado(db, [chamado.id])
+
+    sla_status = SLACalculator.get_sla_status(db, chamado, sla_configs, historicos_cache, calendario)
+
+    # Prazos absolutos de SLA gravados no chamado (consultas de vencidos indexadas)
+    SLADeadlines.atualizar_chamado(
+        db, chamado, sla_configs, calendario, historicos_cache[chamado.id]
+    )
+    # Durações congeladas (primeira resposta / encerramento)
+    SLADuracoes.atualizar_chamado(db, chamado, calendario, historicos_cache[chamado.id])
+
+    # Upsert do snapshot de SLA (chave única em chamado_id)
+    HistoricoSLAWriter.upsert_many(db, [
+        HistoricoSLAWriter.montar_registro(
+            chamado,
+            sla_status,
+            acao="criacao" if not status_anterior else "atualizacao",
+            criado_em=chamado.data_abertura or now_brazil_naive(),
+            status_anterior=status_anterior,
+        )
+    ])
+
+
+_TABELAS_STATUS_VERIFICADAS = False
+
+
+def _garantir_tabelas_status() -> None:
+    """Cria (uma vez por processo) as tabelas escritas na mudança de status"""
+    global _TABELAS_STATUS_VERIFICADAS
+    if _TABELAS_STATUS_VERIFICADAS:
+        return
+    for model in (Notification, HistoricoTicket, HistoricoStatus, HistoricoSLA):
+        model.__table__.create(bind=engine, checkfirst=True)
+    _TABELAS_STATUS_VERIFICADAS = True
+
+
+def _notificacao_payload(n: Notification) -> dict:
+    return {
+        "id": n.id,
+        "tipo": n.tipo,
+        "titulo": n.titulo,
+        "mensagem": n.mensagem,
+        "recurso": n.recurso,
+        "recurso_id": n.recurso_id,
+        "acao": n.acao,
+        "dados": n.dados,
+        "lido": n.lido,
+        "criado_em": n.criado_em.isoformat() if n.criado_em else None,
+    }
 
-        # ATUALIZAÇÃO INCREMENTAL DE MÉTRICAS: Recalcula apenas o chamado afetado
-        from ti.services.cache_manager_incremental import IncrementalMetricsCache
-        IncrementalMetricsCache.update_for_chamado(db, chamado.id)
 
+def _registrar_criacao(db: Session, uow: UnitOfWork, ch: Chamado, com_anexos: bool = False) -> None:
+    """
+    Escritas derivadas da abertura do chamado na transação da UnitOfWork:
+    SLA (em savepoint), notificação e evento chamado.criado
+    """
+    try:
+        with db.begin_nested():
+            _aplicar_sla(db, ch)
     except Exception as e:
-        db.rollback()
-        print(f"[SLA SYNC] Erro ao sincronizar SLA do chamado {chamado.id}: {e}")
-        pass
+        print(f"[SLA SYNC] Erro ao sincronizar SLA do chamado {ch.id}: {e}")
+
+    n = Notification(
+        tipo="chamado",
+        titulo=f"Novo chamado {ch.codigo}",
+        mensagem=f"{ch.solicitante} abriu um chamado de {ch.problema} na unidade {ch.unidade}",
+        recurso="chamado",
+        recurso_id=ch.id,
+        acao="criado",
+        dados=json.dumps({
+            "id": ch.id,
+            "codigo": ch.codigo,
+            "protocolo": ch.protocolo,
+            "status": ch.status,
+        }, ensure_ascii=False),
+    )
+    db.add(n)
+    db.flush()
+
+    uow.publicar(CHAMADO_CRIADO, "chamado", ch.id, {
+        "codigo": ch.codigo,
+        "protocolo": ch.protocolo,
+        "status": ch.status,
+        "notificacao_id": n.id,
+        "com_anexos": com_anexos,
+    })
+
+
+def _anexos_email_payload(db: Session, chamado_id: int) -> list[dict]:
+    """Anexos da abertura no formato do Graph (contentBytes em base64)"""
+    import base64
+    attachments_payload = []
+    attach_rows = db.execute(
+        text("SELECT id, nome_original, tipo_mime FROM chamado_anexo WHERE chamado_id=:i"), {"i": chamado_id}
+    ).fetchall()
+    for ar in attach_rows:
+        try:
+            aid = int(ar[0])
+            nome = ar[1] or f"anexo_{aid}"
+            mime = ar[2] or "application/octet-stream"
+            res = db.execute(text(_select_download_query("chamado_anexo")), {"i": aid}).fetchone()
+            if res and res[4]:
+                attachments_payload.append({
+                    "name": nome,
+                    "contentType": mime,
+                    "contentBytes": base64.b64encode(res[4]).decode("ascii"),
+                })
+        except Exception:
+            continue
+    return attachments_payload
 
 
 def _normalize_status(s: str) -> str:
@@ -154,85 +214,58 @@ def _table_exists(table_name: str) -> bool:
 
 
 @router.get("", response_model=list[ChamadoOut])
-def listar_chamados(db: Session = Depends(get_db)):
+def listar_chamados(incluir_sla: bool = False, db: Session = Depends(get_db)):
+    """
+    Lista os chamados ativos.
+
+    Com ?incluir_sla=true cada item traz o status de SLA no campo "sla",
+    calculado em lote (SLACalculator.get_sla_status_many).
+    """
     try:
         try:
             Chamado.__table__.create(bind=engine, checkfirst=True)
         except Exception:
             pass
         try:
-            return db.query(Chamado).filter(Chamado.deletado_em.is_(None)).order_by(Chamado.id.desc()).all()
+            chamados = db.query(Chamado).filter(Chamado.deletado_em.is_(None)).order_by(Chamado.id.desc()).all()
         except Exception:
             return []
+
+        if not incluir_sla:
+            return chamados
+
+        statuses = SLACalculator.get_sla_status_many(db, chamados)
+        return [
+            ChamadoOut.model_validate(ch).model_copy(update={"sla": statuses.get(ch.id)})
+            for ch in chamados
+        ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar chamados: {e}")
 
 
 @router.post("", response_model=ChamadoOut)
 def criar_chamado(payload: ChamadoCreate, db: Session = Depends(get_db)):
+    """
+    Cria o chamado, o SLA derivado, a notificação e o evento chamado.criado
+    em uma única transação. Contador de hoje, cache, Socket.IO e e-mail ficam
+    com os consumidores de eventos (ver domain_event_consumers).
+    """
     try:
         try:
             Chamado.__table__.create(bind=engine, checkfirst=True)
         except Exception:
             pass
-        ch = service_criar(db, payload)
-
-        # Sincroniza o chamado com a tabela de SLA
-        _sincronizar_sla(db, ch)
-
-        # ATUALIZAÇÃO REAL-TIME: Incrementa contador de "chamados hoje"
-        from ti.services.cache_manager_incremental import ChamadosTodayCounter
-        chamados_hoje = ChamadosTodayCounter.increment(db)
-
-        try:
-            Notification.__table__.create(bind=engine, checkfirst=True)
-            dados = json.dumps({
-                "id": ch.id,
-                "codigo": ch.codigo,
-                "protocolo": ch.protocolo,
-                "status": ch.status,
-            }, ensure_ascii=False)
-            n = Notification(
-                tipo="chamado",
-                titulo=f"Novo chamado {ch.codigo}",
-                mensagem=f"{ch.solicitante} abriu um chamado de {ch.problema} na unidade {ch.unidade}",
-                recurso="chamado",
-                recurso_id=ch.id,
-                acao="criado",
-                dados=dados,
-            )
-            db.add(n)
-            db.commit()
-            db.refresh(n)
-            import anyio
-            anyio.from_thread.run(sio.emit, "chamado:created", {"id": ch.id})
-            anyio.from_thread.run(sio.emit, "notification:new", {
-                "id": n.id,
-                "tipo": n.tipo,
-                "titulo": n.titulo,
-                "mensagem": n.mensagem,
-                "recurso": n.recurso,
-                "recurso_id": n.recurso_id,
-                "acao": n.acao,
-                "dados": n.dados,
-                "lido": n.lido,
-                "criado_em": n.criado_em.isoformat() if n.criado_em else None,
-            })
-            # EMITE ATUALIZAÇÃO DE MÉTRICAS EM TEMPO REAL
-            from ti.services.cache_manager_incremental import IncrementalMetricsCache
-            metricas = IncrementalMetricsCache.get_metrics(db)
-            anyio.from_thread.run(sio.emit, "metrics:updated", {
-                "chamados_hoje": chamados_hoje,
-                "sla_metrics": metricas,
-                "timestamp": now_brazil_naive().isoformat(),
-            })
-        except Exception as e:
-            print(f"[WebSocket] Erro ao emitir eventos: {e}")
-            pass
         try:
-            send_async(send_chamado_abertura, ch)
+            _garantir_tabelas_status()
         except Exception:
             pass
+
+        uow = UnitOfWork(db, "chamado.criar")
+        with uow:
+            ch = service_criar(db, payload, commit=False)
+            _registrar_criacao(db, uow, ch)
+
+        db.refresh(ch)
         return ch
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -240,12 +273,22 @@ def criar_chamado(payload: ChamadoCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erro ao criar chamado: {e}")
 
 
+# Colunas por tabela (reflexão do schema uma vez por processo)
+_COLUNAS: dict[str, set[str]] = {}
+
+
 def _cols(table: str) -> set[str]:
+    cols = _COLUNAS.get(table)
+    if cols is not None:
+        return cols
     try:
         insp = inspect(engine)
-        return {c.get("name") for c in insp.get_columns(table)}
+        cols = {c.get("name") for c in insp.get_columns(table)}
     except Exception:
         return set()
+    if cols:
+        _COLUNAS[table] = cols
+    return cols
 
 
 def _ensure_column(table: str, column: str, ddl: str) -> None:
@@ -253,6 +296,7 @@ def _ensure_column(table: str, column: str, ddl: str) -> None:
         if column not in _cols(table):
             with engine.connect() as conn:
                 conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+            _COLUNAS.pop(table, None)
     except Exception:
         pass
 
@@ -337,19 +381,23 @@ def criar_chamado_com_anexos(
             visita=visita,
             descricao=descricao,
         )
-        ch = service_criar(db, payload)
+        try:
+            _garantir_tabelas_status()
+        except Exception:
+            pass
+
+        user_id = None
+        if files and autor_email:
+            try:
+                user = db.query(User).filter(User.email == autor_email).first()
+                user_id = user.id if user else None
+            except Exception:
+                user_id = None
 
-        # Sincroniza o chamado com a tabela de SLA
-        _sincronizar_sla(db, ch)
+        uow = UnitOfWork(db, "chamado.criar")
+        with uow:
+            ch = service_criar(db, payload, commit=False)
 
-        if files:
-            user_id = None
-            if autor_email:
-                try:
-                    user = db.query(User).filter(User.email == autor_email).first()
-                    user_id = user.id if user else None
-                except Exception:
-                    user_id = None
             import hashlib
             saved = 0
             for f in files:
@@ -382,47 +430,16 @@ def criar_chamado_com_anexos(
                         saved += 1
                 except Exception:
                     continue
-            db.commit()
             if files and saved == 0:
                 raise HTTPException(status_code=500, detail="Falha ao salvar anexos da abertura")
-            # Try to gather saved attachments and send them with the opening email
-            try:
-                attach_rows = db.execute(text("SELECT id, nome_original, tipo_mime FROM chamado_anexo WHERE chamado_id=:i"), {"i": ch.id}).fetchall()
-                attachments_payload = []
-                import base64
-                for ar in attach_rows:
-                    try:
-                        aid = int(ar[0])
-                        nome = ar[1] or f"anexo_{aid}"
-                        mime = ar[2] or "application/octet-stream"
-                        res = db.execute(text(_select_download_query("chamado_anexo")), {"i": aid}).fetchone()
-                        if res and res[4]:
-                            content = res[4]
-                            b64 = base64.b64encode(content).decode("ascii")
-                            attachments_payload.append({
-                                "name": nome,
-                                "contentType": mime,
-                                "contentBytes": b64,
-                            })
-                    except Exception:
-                        continue
-                # send async email with attachments
-                try:
-                    if attachments_payload:
-                        send_async(send_chamado_abertura, ch, attachments_payload)
-                    else:
-                        send_async(send_chamado_abertura, ch)
-                except Exception:
-                    pass
-            except Exception:
-                pass
-        else:
-            # No files: still send the opening email
-            try:
-                send_async(send_chamado_abertura, ch)
-            except Exception:
-                pass
+
+            # O e-mail de abertura (consumidor "email") leva os anexos salvos
+            _registrar_criacao(db, uow, ch, com_anexos=saved > 0)
+
+        db.refresh(ch)
         return ch
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao criar chamado com anexos: {e}")
 
@@ -455,58 +472,69 @@ def enviar_ticket(
                 user_id = user.id if user else None
             except Exception:
                 user_id = None
-        # registrar histórico via ORM
-        h = HistoricoTicket(
-            chamado_id=chamado_id,
-            usuario_id=user_id or None,
-            assunto=assunto,
-            mensagem=mensagem,
-            destinatarios=destinatarios,
-            data_envio=now_brazil_naive(),
-        )
-        db.add(h)
-        db.commit()
-        db.refresh(h)
-        h_id = h.id
-        # salvar anexos em tickets_anexos com metadados e caminho
-        if files:
-            import hashlib
-            saved = 0
-            for f in files:
-                try:
-                    safe_name = (f.filename or "arquivo")
-                    content = f.file.read()
-                    ext = safe_name.rsplit(".", 1)[-1].lower() if "." in safe_name else None
-                    sha = hashlib.sha256(content).hexdigest()
-                    now = now_brazil_naive()
-                    rid = _insert_attachment(db, "ticket_anexos", {
-                        "chamado_id": chamado_id,
-                        "nome_original": safe_name,
-                        "nome_arquivo": safe_name,
-                        "arquivo_nome": safe_name,
-                        "caminho_arquivo": "pending",
-                        "arquivo_caminho": "pending",
-                        "tamanho_bytes": len(content),
-                        "tipo_mime": f.content_type or None,
-                        "extensao": ext or None,
-                        "hash_arquivo": sha,
-                        "data_upload": now,
-                        "criado_em": now,
-                        "usuario_upload_id": user_id,
-                        "descricao": None,
-                        "ativo": True,
-                        "origem": "ticket",
-                        "conteudo": content,
-                    })
-                    if rid:
-                        _update_path(db, "ticket_anexos", rid, f"api/chamados/anexos/ticket/{rid}")
-                        saved += 1
-                except Exception:
-                    continue
-            db.commit()
-            if files and saved == 0:
-                raise HTTPException(status_code=500, detail="Falha ao salvar anexos do ticket")
+        uow = UnitOfWork(db, "chamado.ticket")
+        try:
+            with uow:
+                # registrar histórico via ORM
+                h = HistoricoTicket(
+                    chamado_id=chamado_id,
+                    usuario_id=user_id or None,
+                    assunto=assunto,
+                    mensagem=mensagem,
+                    destinatarios=destinatarios,
+                    data_envio=now_brazil_naive(),
+                )
+                db.add(h)
+                db.flush()
+                h_id = h.id
+                # salvar anexos em tickets_anexos com metadados e caminho
+                import hashlib
+                saved = 0
+                for f in files:
+                    try:
+                        safe_name = (f.filename or "arquivo")
+                        content = f.file.read()
+                        ext = safe_name.rsplit(".", 1)[-1].lower() if "." in safe_name else None
+                        sha = hashlib.sha256(content).hexdigest()
+                        now = now_brazil_naive()
+                        rid = _insert_attachment(db, "ticket_anexos", {
+                            "chamado_id": chamado_id,
+                            "nome_original": safe_name,
+                            "nome_arquivo": safe_name,
+                            "arquivo_nome": safe_name,
+                            "caminho_arquivo": "pending",
+                            "arquivo_caminho": "pending",
+                            "tamanho_bytes": len(content),
+                            "tipo_mime": f.content_type or None,
+                            "extensao": ext or None,
+                            "hash_arquivo": sha,
+                            "data_upload": now,
+                            "criado_em": now,
+                            "usuario_upload_id": user_id,
+                            "descricao": None,
+                            "ativo": True,
+                            "origem": "ticket",
+                            "conteudo": content,
+                        })
+                        if rid:
+                            _update_path(db, "ticket_anexos", rid, f"api/chamados/anexos/ticket/{rid}")
+                            saved += 1
+                    except Exception:
+                        continue
+                if files and saved == 0:
+                    raise HTTPException(status_code=500, detail="Falha ao salvar anexos do ticket")
+
+                # Histórico, anexos e evento entram no mesmo commit
+                uow.publicar(CHAMADO_TICKET_ENVIADO, "chamado", chamado_id, {
+                    "historico_id": h_id,
+                    "anexos": saved,
+                })
+        finally:
+            # Linha do tempo do chamado: este worker descarta agora, os demais pelo evento
+            historico_cache.invalidar(chamado_id)
         return {"ok": True, "historico_id": h_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar ticket: {e}")
 
@@ -535,32 +563,66 @@ def baixar_anexo_ticket(anexo_id: int, db: Session = Depends(get_db)):
     return Response(content=res[4], media_type=mime, headers=headers)
 
 
-@router.get("/{chamado_id}/historico", response_model=HistoricoResponse)
-def obter_historico(chamado_id: int, db: Session = Depends(get_db)):
+def _anexos_do_chamado(db: Session, chamado_id: int) -> tuple[list, list]:
+    """
+    Anexos da abertura (chamado_anexo) e dos tickets (ticket_anexos) numa
+    consulta UNION ALL, ordenados por data_upload. Se uma das tabelas não
+    existir, consulta cada uma separadamente.
+    """
+    tabelas = (("chamado", "chamado_anexo"), ("ticket", "ticket_anexos"))
+    partes = [
+        _select_anexo_query(tabela).replace("SELECT ", f"SELECT '{origem}' AS origem, ", 1)
+        + " WHERE chamado_id=:i"
+        for origem, tabela in tabelas
+    ]
     try:
-        items: list[HistoricoItem] = []
-        ch = db.query(Chamado).filter(
-            (Chamado.id == chamado_id) & (Chamado.deletado_em.is_(None))
-        ).first()
-        if not ch:
-            raise HTTPException(status_code=404, detail="Chamado não encontrado")
-        # anexos enviados na abertura (chamado_anexo) e descrição do chamado
-        sql_an = _select_anexo_query("chamado_anexo") + " WHERE chamado_id=:i ORDER BY data_upload ASC"
-        rows = db.execute(text(sql_an), {"i": chamado_id}).fetchall()
-        anexos_abertura = None
+        rows = db.execute(
+            text(" UNION ALL ".join(partes) + " ORDER BY data_upload ASC"), {"i": chamado_id}
+        ).fetchall()
+    except Exception:
+        rows = []
+        for sql in partes:
+            try:
+                rows.extend(db.execute(text(sql), {"i": chamado_id}).fetchall())
+            except Exception:
+                continue
+        rows.sort(key=lambda r: r[6] or datetime.min)
+
+    abertura, tickets = [], []
+    for r in rows:
+        (abertura if r[0] == "chamado" else tickets).append(r[1:])
+    return abertura, tickets
+
+
+def _anexo_out(r) -> AnexoOut:
+    return AnexoOut(
+        id=r[0], nome_original=r[1], caminho_arquivo=r[2],
+        mime_type=r[3], tamanho_bytes=r[4], data_upload=r[5],
+    )
+
+
+def _montar_historico(db: Session, ch: Chamado) -> tuple[HistoricoResponse, bool]:
+    """
+    Linha do tempo do chamado com um número fixo de consultas: anexos
+    (UNION ALL), historico_status (ou notificações, se vazio) e
+    historicos_tickets. Os anexos de cada ticket são os enviados até 3
+    minutos antes/depois dele, agrupados em memória.
+
+    Retorna (linha do tempo, completa); a parcial não deve ir para o cache.
+    """
+    items: list[HistoricoItem] = []
+    completa = True
+    try:
+        anexos_abertura, anexos_tickets = _anexos_do_chamado(db, ch.id)
         first_dt = ch.data_abertura or now_brazil_naive()
-        if rows:
-            first_dt = rows[0][5] or first_dt
-            class _CA:
-                def __init__(self, r):
-                    self.id, self.nome_original, self.caminho_arquivo, self.mime_type, self.tamanho_bytes, self.data_upload = r
-            anexos_abertura = [AnexoOut.model_validate(_CA(r)) for r in rows]
+        if anexos_abertura:
+            first_dt = anexos_abertura[0][5] or first_dt
         # Item 1: Aberto em
         items.append(HistoricoItem(
             t=first_dt,
             tipo="abertura",
             label="Aberto em",
-            anexos=anexos_abertura,
+            anexos=[_anexo_out(r) for r in anexos_abertura] or None,
         ))
         # Item 2: Descrição (se houver)
         if ch.descricao:
@@ -571,13 +633,14 @@ def obter_historico(chamado_id: int, db: Session = Depends(get_db)):
                 anexos=None,
             ))
         try:
-            Notification.__table__.create(bind=engine, checkfirst=True)
-            HistoricoStatus.__table__.create(bind=engine, checkfirst=True)
+            _garantir_tabelas_status()
             # Priorize historico_status for status events
-            hs_rows = db.query(HistoricoStatus).filter(HistoricoStatus.chamado_id == chamado_id).order_by(HistoricoStatus.criado_em.asc()).all()
+            hs_rows = db.query(HistoricoStatus).filter(
+                HistoricoStatus.chamado_id == ch.id
+            ).order_by(HistoricoStatus.data_inicio.asc(), HistoricoStatus.id.asc()).all()
             for r in hs_rows:
                 items.append(HistoricoItem(
-                    t=r.criado_em or now_brazil_naive(),
+                    t=r.data_inicio or r.created_at or now_brazil_naive(),
                     tipo="status",
                     label=f"{r.status_anterior or 'Aberto'} → {r.status_novo}",
                     anexos=None,
@@ -586,181 +649,158 @@ def obter_historico(chamado_id: int, db: Session = Depends(get_db)):
             if not hs_rows:
                 notas = db.query(Notification).filter(
                     Notification.recurso == "chamado",
-                    Notification.recurso_id == chamado_id,
+                    Notification.recurso_id == ch.id,
+                    Notification.acao == "status",
                 ).order_by(Notification.criado_em.asc()).all()
                 for n in notas:
-                    if n.acao == "status":
-                        items.append(HistoricoItem(
-                            t=n.criado_em or now_brazil_naive(),
-                            tipo="status",
-                            label=n.mensagem or "Status atualizado",
-                            anexos=None,
-                        ))
-        except Exception:
-            pass
+                    items.append(HistoricoItem(
+                        t=n.criado_em or now_brazil_naive(),
+                        tipo="status",
+                        label=n.mensagem or "Status atualizado",
+                        anexos=None,
+                    ))
+        except Exception as e:
+            completa = False
+            print(f"[HISTORICO] Erro ao carregar status do chamado {ch.id}: {e}")
         # histórico (historico_tickets via ORM) - ignora se tabela não existir
         try:
-            hs = db.query(HistoricoTicket).filter(HistoricoTicket.chamado_id == chamado_id).order_by(HistoricoTicket.data_envio.asc()).all()
+            hs = db.query(HistoricoTicket).filter(
+                HistoricoTicket.chamado_id == ch.id
+            ).order_by(HistoricoTicket.data_envio.asc()).all()
         except Exception:
+            completa = False
             hs = []
+        datas_anexos = [r[5] for r in anexos_tickets if r[5]]
+        com_data = [r for r in anexos_tickets if r[5]]
         for h in hs:
-            anexos_ticket = []
-            try:
-                from datetime import timedelta
-                start = (h.data_envio or now_brazil_naive()) - timedelta(minutes=3)
-                end = (h.data_envio or now_brazil_naive()) + timedelta(minutes=3)
-                sql_ta = _select_anexo_query("ticket_anexos") + " WHERE chamado_id=:i"
-                tas = db.execute(text(sql_ta), {"i": chamado_id}).fetchall()
-                for ta in tas:
-                    dt = ta[5]
-                    if dt and start <= dt <= end:
-                        class _A:
-                            id, nome_original, caminho_arquivo, mime_type, tamanho_bytes, data_upload = ta
-                        anexos_ticket.append(_A())
-            except Exception:
-                pass
+            envio = h.data_envio or now_brazil_naive()
+            inicio = bisect_left(datas_anexos, envio - timedelta(minutes=3))
+            fim = bisect_right(datas_anexos, envio + timedelta(minutes=3))
+            anexos_ticket = [_anexo_out(r) for r in com_data[inicio:fim]]
             items.append(HistoricoItem(
-                t=h.data_envio or now_brazil_naive(),
+                t=envio,
                 tipo="ticket",
                 label=f"{h.assunto}",
-                anexos=[AnexoOut.model_validate(a) for a in anexos_ticket] if anexos_ticket else None,
+                anexos=anexos_ticket or None,
             ))
-        items_sorted = sorted(items, key=lambda x: x.t)
-        return HistoricoResponse(items=items_sorted)
-    except HTTPException:
-        raise
-    except Exception:
+    except Exception as e:
         # Retorna o que foi possível montar para não quebrar o painel
-        try:
-            items_sorted = sorted(items, key=lambda x: x.t)
-            return HistoricoResponse(items=items_sorted)
-        except Exception:
-            return HistoricoResponse(items=[])
+        completa = False
+        print(f"[HISTORICO] Linha do tempo parcial do chamado {ch.id}: {e}")
+    return HistoricoResponse(items=sorted(items, key=lambda x: x.t)), completa
+
+
+@router.get("/{chamado_id}/historico", response_model=HistoricoResponse)
+def obter_historico(chamado_id: int, db: Session = Depends(get_db)):
+    """
+    Linha do tempo do chamado (abertura, status, tickets e anexos), em cache
+    por chamado neste worker e invalidada só pelos eventos do próprio chamado
+    (ver ti/services/historico_chamado.py).
+    """
+    historico, versao = historico_cache.obter(chamado_id)
+    if historico is not None:
+        return historico
+    try:
+        ch = db.query(Chamado).filter(
+            (Chamado.id == chamado_id) & (Chamado.deletado_em.is_(None))
+        ).first()
+    except Exception:
+        return HistoricoResponse(items=[])
+    if not ch:
+        raise HTTPException(status_code=404, detail="Chamado não encontrado")
+    historico, completa = _montar_historico(db, ch)
+    if completa:
+        historico_cache.guardar(chamado_id, historico, versao)
+    return historico
 
 
 @router.patch("/{chamado_id}/status", response_model=ChamadoOut)
 def atualizar_status(chamado_id: int, payload: ChamadoStatusUpdate, db: Session = Depends(get_db)):
+    """
+    Muda o status do chamado em uma única transação (status, historico_status,
+    notificação, SLA derivado e evento chamado.status_alterado). Cache,
+    métricas, contador, Socket.IO e e-mail ficam com os consumidores de
+    eventos, fora do caminho da requisição (ver domain_event_consumers).
+    """
     try:
         novo = _normalize_status(payload.status)
         if novo not in ALLOWED_STATUSES:
             raise HTTPException(status_code=400, detail="Status inválido")
+        try:
+            _garantir_tabelas_status()
+        except Exception:
+            pass
         ch = db.query(Chamado).filter(
             (Chamado.id == chamado_id) & (Chamado.deletado_em.is_(None))
         ).first()
         if not ch:
             raise HTTPException(status_code=404, detail="Chamado não encontrado")
         prev = ch.status or "Aberto"
-        ch.status = novo
-        if prev == "Aberto" and novo != "Aberto" and ch.data_primeira_resposta is None:
-            ch.data_primeira_resposta = now_brazil_naive()
-        if novo == "Concluído":
-            ch.data_conclusao = now_brazil_naive()
-        db.add(ch)
-        db.commit()  # garante persistência do status antes dos logs
-        db.refresh(ch)
+        agora = now_brazil_naive()
 
-        # DECREMENTAR CONTADOR DE HOJE SE CANCELADO
-        if novo == "Cancelado" and prev != "Cancelado":
-            from ti.services.cache_manager_incremental import ChamadosTodayCounter
-            ChamadosTodayCounter.decrement(db, 1)
+        uow = UnitOfWork(db, "chamado.atualizar_status")
+        with uow:
+            ch.status = novo
+            if prev == "Aberto" and novo != "Aberto" and ch.data_primeira_resposta is None:
+                ch.data_primeira_resposta = agora
+            if novo == "Concluído":
+                ch.data_conclusao = agora
+            db.add(ch)
 
-        try:
-            # Sincroniza automaticamente com tabela de SLA
-            _sincronizar_sla(db, ch, status_anterior=prev)
-        except Exception as e:
-            print(f"[SYNC SLA ERROR] {e}")
-            db.rollback()
+            # FECHAR HISTÓRICO ANTERIOR: Se o último status não tem data_fim, preencher
+            ultimo_historico = db.query(HistoricoStatus).filter(
+                HistoricoStatus.chamado_id == ch.id
+            ).order_by(HistoricoStatus.data_inicio.desc()).first()
+            if ultimo_historico and not ultimo_historico.data_fim:
+                ultimo_historico.data_fim = agora
+                db.add(ultimo_historico)
 
-        try:
-            Notification.__table__.create(bind=engine, checkfirst=True)
-            HistoricoTicket.__table__.create(bind=engine, checkfirst=True)
-            HistoricoStatus.__table__.create(bind=engine, checkfirst=True)
+            # registrar em historico_status (única fonte de verdade)
+            db.add(HistoricoStatus(
+                chamado_id=ch.id,
+                usuario_id=None,
+                status=novo,
+                data_inicio=agora,
+                descricao=f"Migrado: {prev} → {novo}",
+                created_at=agora,
+                updated_at=agora,
+            ))
 
-            # FECHAR HISTÓRICO ANTERIOR: Se o último status não tem data_fim, preencher
-            agora = now_brazil_naive()
-            try:
-                ultimo_historico = db.query(HistoricoStatus).filter(
-                    HistoricoStatus.chamado_id == ch.id
-                ).order_by(HistoricoStatus.data_inicio.desc()).first()
-
-                if ultimo_historico and not ultimo_historico.data_fim:
-                    ultimo_historico.data_fim = agora
-                    db.add(ultimo_historico)
-                    db.commit()
-            except Exception as e:
-                print(f"[HISTORICO - Fechar anterior ERROR] {e}")
-                import traceback
-                traceback.print_exc()
-                db.rollback()
-
-            dados = json.dumps({
-                "id": ch.id,
-                "codigo": ch.codigo,
-                "protocolo": ch.protocolo,
-                "status": ch.status,
-                "status_anterior": prev,
-            }, ensure_ascii=False)
             n = Notification(
                 tipo="chamado",
                 titulo=f"Status atualizado: {ch.codigo}",
-                mensagem=f"{prev} → {ch.status}",
+                mensagem=f"{prev} → {novo}",
                 recurso="chamado",
                 recurso_id=ch.id,
                 acao="status",
-                dados=dados,
+                dados=json.dumps({
+                    "id": ch.id,
+                    "codigo": ch.codigo,
+                    "protocolo": ch.protocolo,
+                    "status": novo,
+                    "status_anterior": prev,
+                }, ensure_ascii=False),
             )
             db.add(n)
-            # registrar em historico_status (única fonte de verdade)
+            # Históricos visíveis para o cálculo de SLA abaixo
+            db.flush()
+
+            # SLA derivado (snapshot, prazos, durações) em savepoint: uma falha aqui
+            # não impede a mudança de status (o recálculo diário corrige o snapshot)
             try:
-                hs = HistoricoStatus(
-                    chamado_id=ch.id,
-                    usuario_id=None,
-                    status=ch.status,
-                    data_inicio=agora,
-                    descricao=f"Migrado: {prev} → {ch.status}",
-                    created_at=agora,
-                    updated_at=agora,
-                )
-                print(f"[HISTORICO STATUS] Criando novo: chamado_id={ch.id}, status={ch.status}, data_inicio={agora}")
-                db.add(hs)
-                db.commit()
-                print(f"[HISTORICO STATUS] Sucesso ao salvar registro")
+                with db.begin_nested():
+                    _aplicar_sla(db, ch, status_anterior=prev)
             except Exception as e:
-                print(f"[HISTORICO STATUS - Novo registro ERROR] {e}")
-                import traceback
-                traceback.print_exc()
-                db.rollback()
-            db.refresh(n)
-
-            import anyio
-            anyio.from_thread.run(sio.emit, "chamado:status", {"id": ch.id, "status": ch.status})
-            anyio.from_thread.run(sio.emit, "notification:new", {
-                "id": n.id,
-                "tipo": n.tipo,
-                "titulo": n.titulo,
-                "mensagem": n.mensagem,
-                "recurso": n.recurso,
-                "recurso_id": n.recurso_id,
-                "acao": n.acao,
-                "dados": n.dados,
-                "lido": n.lido,
-                "criado_em": n.criado_em.isoformat() if n.criado_em else None,
-            })
+                print(f"[SYNC SLA ERROR] {e}")
 
-            # EMITE ATUALIZAÇÃO DE MÉTRICAS EM TEMPO REAL (quando status muda)
-            from ti.services.cache_manager_incremental import IncrementalMetricsCache
-            metricas = IncrementalMetricsCache.get_metrics(db)
-            anyio.from_thread.run(sio.emit, "metrics:updated", {
-                "sla_metrics": metricas,
-                "timestamp": now_brazil_naive().isoformat(),
+            uow.publicar(CHAMADO_STATUS_ALTERADO, "chamado", ch.id, {
+                "status": novo,
+                "status_anterior": prev,
+                "notificacao_id": n.id,
             })
-        except Exception:
-            db.rollback()
-            pass
-        try:
-            send_async(send_chamado_status, ch, prev)
-        except Exception:
-            pass
+        historico_cache.invalidar(ch.id)
+
+        db.refresh(ch)
         return ch
     except HTTPException:
         raise
@@ -775,8 +815,7 @@ def deletar_chamado(chamado_id: int, payload: ChamadoDeleteRequest = Body(...),
         user = db.query(User).filter(User.email == payload.email).first()
         if not user:
             raise HTTPException(status_code=401, detail="Usuário não encontrado")
-        from werkzeug.security import check_password_hash as _chk
-        if not _chk(user.senha_hash, payload.senha):
+        if not verificar_senha(user.senha_hash, payload.senha):
             raise HTTPException(status_code=401, detail="Senha inválida")
 
         # Buscar o chamado
@@ -796,40 +835,16 @@ def deletar_chamado(chamado_id: int, payload: ChamadoDeleteRequest = Body(...),
             'status': ch.status,
         }
 
-        # Soft delete: marcar como deletado
-        agora = now_brazil_naive()
-        ch.deletado_em = agora
-        db.add(ch)
-        db.commit()
-        db.refresh(ch)
-
-        print(f"[SOFT DELETE] Chamado {chamado_id} marcado como deletado")
-
-        # Decrementar contador se o chamado não estava cancelado
-        if chamado_info['status'] != "Cancelado":
-            try:
-                from ti.services.cache_manager_incremental import ChamadosTodayCounter
-                ChamadosTodayCounter.decrement(db, 1)
-                print(f"[SOFT DELETE] Contador decrementado")
-            except Exception as e:
-                print(f"[SOFT DELETE] Erro ao decrementar contador: {e}")
-
-        # Invalidar cache de SLA relacionado ao chamado
-        try:
-            from ti.services.sla_cache import SLACacheManager
-            SLACacheManager.invalidate_by_chamado(db, chamado_id)
-            print(f"[SOFT DELETE] Cache de SLA invalidado")
-        except Exception as e:
-            print(f"[SOFT DELETE] Erro ao invalidar cache: {e}")
-
-        # Criar notificação de exclusão
+        # Soft delete, notificação e evento chamado.excluido na mesma transação;
+        # contador, cache, temporizador de prazos e Socket.IO ficam com os consumidores
         try:
             Notification.__table__.create(bind=engine, checkfirst=True)
-            dados = json.dumps({
-                "id": chamado_info['id'],
-                "codigo": chamado_info['codigo'],
-                "protocolo": chamado_info['protocolo'],
-            }, ensure_ascii=False)
+        except Exception:
+            pass
+        uow = UnitOfWork(db, "chamado.excluir")
+        with uow:
+            ch.deletado_em = now_brazil_naive()
+            db.add(ch)
 
             n = Notification(
                 tipo="chamado",
@@ -838,44 +853,24 @@ def deletar_chamado(chamado_id: int, payload: ChamadoDeleteRequest = Body(...),
                 recurso="chamado",
                 recurso_id=chamado_id,
                 acao="excluido",
-                dados=dados,
+                dados=json.dumps({
+                    "id": chamado_info['id'],
+                    "codigo": chamado_info['codigo'],
+                    "protocolo": chamado_info['protocolo'],
+                }, ensure_ascii=False),
             )
             db.add(n)
-            db.commit()
-            db.refresh(n)
+            db.flush()
 
-            # Emitir eventos WebSocket
-            import anyio
-            anyio.from_thread.run(sio.emit, "chamado:deleted", {
-                "id": chamado_id,
+            uow.publicar(CHAMADO_EXCLUIDO, "chamado", chamado_id, {
                 "codigo": chamado_info['codigo'],
                 "protocolo": chamado_info['protocolo'],
-            })
-            anyio.from_thread.run(sio.emit, "notification:new", {
-                "id": n.id,
-                "tipo": n.tipo,
-                "titulo": n.titulo,
-                "mensagem": n.mensagem,
-                "recurso": n.recurso,
-                "recurso_id": n.recurso_id,
-                "acao": n.acao,
-                "dados": n.dados,
-                "lido": n.lido,
-                "criado_em": n.criado_em.isoformat() if n.criado_em else None,
-            })
-
-            # Emitir atualização de métricas
-            from ti.services.cache_manager_incremental import IncrementalMetricsCache
-            metricas = IncrementalMetricsCache.get_metrics(db)
-            anyio.from_thread.run(sio.emit, "metrics:updated", {
-                "sla_metrics": metricas,
-                "timestamp": now_brazil_naive().isoformat(),
+                "status": chamado_info['status'],
+                "notificacao_id": n.id,
             })
 
-            print(f"[SOFT DELETE] Notificação e eventos WebSocket emitidos")
-        except Exception as e:
-            print(f"[SOFT DELETE] Erro ao criar notificação/WebSocket: {e}")
-            # Não falhar a operação por causa disso
+        historico_cache.invalidar(chamado_id)
+        print(f"[SOFT DELETE] Chamado {chamado_id} marcado como deletado")
 
         return {
             "ok": True,
@@ -887,6 +882,8 @@ def deletar_chamado(chamado_id: int, payload: ChamadoDeleteRequest = Body(...),
             }
         }
 
+    except SenhaOcupadaError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except HTTPException:
         raise
     except Exception as e:
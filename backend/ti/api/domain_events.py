@@ -0,0 +1,69 @@
+from __future__ import annotations
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from core.db import get_db
+from ti.models.domain_event import DomainEvent
+from ti.services.domain_events import DomainEvents, get_event_dispatcher
+
+router = APIRouter(prefix="/eventos", tags=["TI - Eventos"])
+
+
+@router.get("")
+def listar_eventos(
+    agregado: str | None = None,
+    agregado_id: int | None = None,
+    desde_id: int | None = None,
+    limite: int = 50,
+    db: Session = Depends(get_db),
+):
+    """Eventos de domínio mais recentes (filtráveis por agregado)"""
+    try:
+        limite = max(1, min(limite, 500))
+        query = db.query(DomainEvent)
+        if agregado:
+            query = query.filter(DomainEvent.agregado == agregado)
+        if agregado_id is not None:
+            query = query.filter(DomainEvent.agregado_id == agregado_id)
+        if desde_id is not None:
+            query = query.filter(DomainEvent.id > desde_id)
+        eventos = query.order_by(DomainEvent.id.desc()).limit(limite).all()
+        return [DomainEvents.to_dict(e) for e in eventos]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar eventos: {e}")
+
+
+@router.get("/consumidores")
+def listar_consumidores(db: Session = Depends(get_db)):
+    """
+    Consumidores registrados com offset, atraso (eventos pendentes) e último
+    erro. Os contadores em "worker" são do worker que atendeu a requisição.
+    """
+    try:
+        return get_event_dispatcher().status(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao obter status dos consumidores: {e}")
+
+
+@router.post("/consumidores/{nome}/replay")
+def replay_consumidor(nome: str, desde_id: int = 0):
+    """Reprocessa os eventos com id > desde_id no consumidor"""
+    try:
+        return get_event_dispatcher().replay(nome, desde_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Consumidor não encontrado")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/consumidores/{nome}/reconstruir")
+def reconstruir_consumidor(nome: str):
+    """
+    Descarta o estado derivado do consumidor (ex: caches) e o reconstrói
+    reprocessando todo o stream de eventos retido
+    """
+    try:
+        return get_event_dispatcher().reconstruir(nome)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Consumidor não encontrado")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
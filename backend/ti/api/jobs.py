@@ -0,0 +1,70 @@
+from __future__ import annotations
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from core.db import get_db
+from ti.models.job_run import JobRun
+from ti.services.job_scheduler import JobScheduler, get_job_scheduler
+from ti.services.job_queue import get_job_queue
+
+router = APIRouter(prefix="/jobs", tags=["TI - Jobs"])
+
+
+@router.get("")
+def listar_jobs(db: Session = Depends(get_db)):
+    """
+    Lista os jobs registrados, a próxima execução prevista e a última execução.
+    Informa também se este worker é o líder do agendador.
+    """
+    try:
+        return get_job_scheduler().status(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar jobs: {e}")
+
+
+@router.get("/fila")
+def status_fila():
+    """
+    Tarefas sob demanda registradas na fila e execuções pendentes/em
+    andamento neste worker. O progresso de cada execução fica em
+    /jobs/execucoes/{run_id} (e no evento Socket.IO "job:progress").
+    """
+    return get_job_queue().status()
+
+
+@router.get("/execucoes/{run_id}")
+def obter_execucao(run_id: int, db: Session = Depends(get_db)):
+    """Retorna uma execução específica (status, progresso, duração, resultado)"""
+    run = db.query(JobRun).filter(JobRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Execução não encontrada")
+    return JobScheduler.run_to_dict(run)
+
+
+@router.get("/{nome}/execucoes")
+def listar_execucoes(nome: str, limite: int = 20, db: Session = Depends(get_db)):
+    """Histórico das últimas execuções de um job"""
+    if get_job_scheduler().get_job(nome) is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    try:
+        limite = max(1, min(limite, 200))
+        runs = db.query(JobRun).filter(
+            JobRun.job_name == nome
+        ).order_by(JobRun.iniciado_em.desc()).limit(limite).all()
+        return [JobScheduler.run_to_dict(r) for r in runs]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar execuções: {e}")
+
+
+@router.post("/{nome}/executar")
+def executar_job(nome: str):
+    """
+    Dispara um job imediatamente, em segundo plano.
+    Retorna o id da execução para acompanhar em /jobs/execucoes/{run_id}.
+    """
+    try:
+        run_id = get_job_scheduler().trigger(nome)
+        return {"ok": True, "job": nome, "run_id": run_id}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -1,8 +1,16 @@
+import os
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from core.db import get_db
 from core.utils import now_brazil_naive
 from ti.services.metrics import MetricsCalculator
+from ti.services.metrics_fanout import (
+    MetricaPainel,
+    calcular_em_paralelo,
+    ultimos_valores,
+    ORCAMENTO_RAPIDO_MS,
+    ORCAMENTO_SLA_MS,
+)
 
 router = APIRouter(prefix="/api", tags=["metrics"])
 
@@ -46,11 +54,97 @@ def get_basic_metrics(db: Session = Depends(get_db)):
     return get_realtime_metrics(db)
 
 
+def _validar_tempo_resposta_mes(db: Session) -> tuple[str, int]:
+    tempo_resposta_mes, total_chamados_mes = MetricsCalculator.get_tempo_medio_resposta_mes(db)
+    if not isinstance(tempo_resposta_mes, str):
+        raise TypeError(f"tempo_resposta_mes deve ser string, recebido: {type(tempo_resposta_mes)}")
+    if not isinstance(total_chamados_mes, int):
+        raise TypeError(f"total_chamados_mes deve ser int, recebido: {type(total_chamados_mes)}")
+    return tempo_resposta_mes, total_chamados_mes
+
+
+def _validar_tempo_resposta_24h(db: Session) -> str:
+    tempo_resposta_24h = MetricsCalculator.get_tempo_medio_resposta_24h(db)
+    if not isinstance(tempo_resposta_24h, str):
+        raise TypeError(f"tempo_resposta_24h deve ser string, recebido: {type(tempo_resposta_24h)}")
+    return tempo_resposta_24h
+
+
+def _validar_sla_distribution(db: Session) -> dict:
+    sla_distribution = MetricsCalculator.get_sla_distribution(db)
+    if not isinstance(sla_distribution, dict):
+        raise TypeError(f"sla_distribution deve ser dict, recebido: {type(sla_distribution)}")
+
+    # Valida estrutura de sla_distribution
+    required_keys = {"dentro_sla", "fora_sla", "percentual_dentro", "percentual_fora", "total"}
+    if not required_keys.issubset(sla_distribution.keys()):
+        raise ValueError(f"sla_distribution falta chaves: {required_keys - set(sla_distribution.keys())}")
+    return sla_distribution
+
+
+def _validar_percentual(nome: str, calcular):
+    def _calcular(db: Session) -> int:
+        valor = calcular(db)
+        if not isinstance(valor, int):
+            raise TypeError(f"{nome} deve ser int, recebido: {type(valor)}")
+        if not (0 <= valor <= 100):
+            raise ValueError(f"{nome} deve estar entre 0-100, recebido: {valor}")
+        return valor
+    return _calcular
+
+
+def _metricas_sla() -> list[MetricaPainel]:
+    return [
+        MetricaPainel("tempo_resposta_mes", _validar_tempo_resposta_mes, ORCAMENTO_SLA_MS, ("—", 0)),
+        MetricaPainel("tempo_resposta_24h", _validar_tempo_resposta_24h, ORCAMENTO_SLA_MS, "—"),
+        MetricaPainel("sla_distribution", _validar_sla_distribution, ORCAMENTO_SLA_MS, {
+            "dentro_sla": 0, "fora_sla": 0, "percentual_dentro": 0, "percentual_fora": 0, "total": 0,
+        }),
+        MetricaPainel(
+            "sla_compliance_24h",
+            _validar_percentual("sla_compliance_24h", MetricsCalculator.get_sla_compliance_24h),
+            ORCAMENTO_SLA_MS,
+            0,
+        ),
+        MetricaPainel(
+            "sla_compliance_mes",
+            _validar_percentual("sla_compliance_mes", MetricsCalculator.get_sla_compliance_mes),
+            ORCAMENTO_SLA_MS,
+            0,
+        ),
+    ]
+
+
+def _resposta_sla(valores: dict) -> dict:
+    tempo_resposta_mes, total_chamados_mes = valores["tempo_resposta_mes"]
+    return {
+        "sla_compliance_24h": valores["sla_compliance_24h"],
+        "sla_compliance_mes": valores["sla_compliance_mes"],
+        "sla_distribution": valores["sla_distribution"],
+        "tempo_resposta_24h": valores["tempo_resposta_24h"],
+        "tempo_resposta_mes": tempo_resposta_mes,
+        "total_chamados_mes": total_chamados_mes,
+    }
+
+
+def _metadados_frescor(frescor: dict) -> dict:
+    return {
+        "parcial": any(f["status"] != "ok" for f in frescor.values()),
+        "frescor": frescor,
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
 @router.get("/metrics/dashboard/sla")
-def get_sla_metrics(db: Session = Depends(get_db)):
+def get_sla_metrics():
     """
     Retorna métricas de SLA (carrega SEPARADO - mais lento, mas com cache).
 
+    As métricas são calculadas em paralelo, cada uma com sessão e orçamento
+    de tempo próprios (ver ti.services.metrics_fanout). Se uma métrica não
+    terminar a tempo, volta o último valor calculado; "frescor" informa o
+    status ("ok" | "stale" | "padrao") e quando cada valor foi calculado.
+
     Retorna:
     - sla_compliance_24h: Percentual de SLA cumprido (ativos)
     - sla_compliance_mes: Percentual de SLA cumprido (todo o mês)
@@ -58,58 +152,11 @@ def get_sla_metrics(db: Session = Depends(get_db)):
     - tempo_resposta_24h: Tempo médio de primeira resposta 24h
     - tempo_resposta_mes: Tempo médio de primeira resposta mês
     - total_chamados_mes: Total de chamados deste mês
+    - parcial / frescor / timestamp: metadados de atualidade
     """
     try:
-        # Valida tipos esperados com exceções explícitas
-        tempo_resposta_mes, total_chamados_mes = MetricsCalculator.get_tempo_medio_resposta_mes(db)
-        if not isinstance(tempo_resposta_mes, str):
-            raise TypeError(f"tempo_resposta_mes deve ser string, recebido: {type(tempo_resposta_mes)}")
-        if not isinstance(total_chamados_mes, int):
-            raise TypeError(f"total_chamados_mes deve ser int, recebido: {type(total_chamados_mes)}")
-
-        tempo_resposta_24h = MetricsCalculator.get_tempo_medio_resposta_24h(db)
-        if not isinstance(tempo_resposta_24h, str):
-            raise TypeError(f"tempo_resposta_24h deve ser string, recebido: {type(tempo_resposta_24h)}")
-
-        sla_distribution = MetricsCalculator.get_sla_distribution(db)
-        if not isinstance(sla_distribution, dict):
-            raise TypeError(f"sla_distribution deve ser dict, recebido: {type(sla_distribution)}")
-
-        # Valida estrutura de sla_distribution
-        required_keys = {"dentro_sla", "fora_sla", "percentual_dentro", "percentual_fora", "total"}
-        if not required_keys.issubset(sla_distribution.keys()):
-            raise ValueError(f"sla_distribution falta chaves: {required_keys - set(sla_distribution.keys())}")
-
-        sla_24h = MetricsCalculator.get_sla_compliance_24h(db)
-        if not isinstance(sla_24h, int):
-            raise TypeError(f"sla_compliance_24h deve ser int, recebido: {type(sla_24h)}")
-        if not (0 <= sla_24h <= 100):
-            raise ValueError(f"sla_compliance_24h deve estar entre 0-100, recebido: {sla_24h}")
-
-        sla_mes = MetricsCalculator.get_sla_compliance_mes(db)
-        if not isinstance(sla_mes, int):
-            raise TypeError(f"sla_compliance_mes deve ser int, recebido: {type(sla_mes)}")
-        if not (0 <= sla_mes <= 100):
-            raise ValueError(f"sla_compliance_mes deve estar entre 0-100, recebido: {sla_mes}")
-
-        return {
-            "sla_compliance_24h": sla_24h,
-            "sla_compliance_mes": sla_mes,
-            "sla_distribution": sla_distribution,
-            "tempo_resposta_24h": tempo_resposta_24h,
-            "tempo_resposta_mes": tempo_resposta_mes,
-            "total_chamados_mes": total_chamados_mes,
-        }
-    except (TypeError, ValueError) as e:
-        # Logging de erro explícito - não mascara
-        print(f"[VALIDATION ERROR] Erro ao validar métricas SLA: {e}")
-        import traceback
-        traceback.print_exc()
-        from fastapi import HTTPException
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erro no cálculo de métricas SLA: {str(e)}"
-        )
+        valores, frescor = calcular_em_paralelo(_metricas_sla())
+        return {**_resposta_sla(valores), **_metadados_frescor(frescor)}
     except Exception as e:
         print(f"[ERROR] Erro inesperado ao calcular métricas SLA: {e}")
         import traceback
@@ -122,7 +169,7 @@ def get_sla_metrics(db: Session = Depends(get_db)):
 
 
 @router.get("/metrics/dashboard")
-def get_dashboard_metrics(db: Session = Depends(get_db)):
+def get_dashboard_metrics():
     """
     Endpoint consolidado: Retorna TODAS as métricas do dashboard administrativo.
 
@@ -131,6 +178,11 @@ def get_dashboard_metrics(db: Session = Depends(get_db)):
     - Métricas de SLA (com cache)
     - Métricas de performance
 
+    Cada métrica é calculada em paralelo, com sessão própria e orçamento de
+    tempo (contadores: METRICS_ORCAMENTO_RAPIDO_MS; SLA e performance:
+    METRICS_ORCAMENTO_SLA_MS). Um cálculo lento não atrasa os demais: a
+    resposta sai com o último valor conhecido dele, marcado em "frescor".
+
     Retorna:
     - chamados_hoje: Quantidade de chamados abertos hoje
     - comparacao_ontem: Comparação com ontem (hoje, ontem, percentual, direcao)
@@ -142,27 +194,36 @@ def get_dashboard_metrics(db: Session = Depends(get_db)):
     - sla_distribution: Distribuição dentro/fora SLA
     - abertos_agora: Quantidade de chamados ativos
     - tempo_resolucao_30dias: Tempo médio de resolução (30 dias)
+    - parcial: True se algum valor não é do cálculo desta requisição
+    - frescor: por métrica, {status: ok|stale|padrao, calculado_em, duracao_ms}
     - timestamp: Momento do cálculo
     """
     try:
-        # Obtém todas as métricas
-        realtime = get_realtime_metrics(db)
-        sla = get_sla_metrics(db)
-        performance = MetricsCalculator.get_performance_metrics(db)
+        metricas = [
+            MetricaPainel("chamados_hoje", MetricsCalculator.get_chamados_abertos_hoje, ORCAMENTO_RAPIDO_MS, 0),
+            MetricaPainel("comparacao_ontem", MetricsCalculator.get_comparacao_ontem, ORCAMENTO_RAPIDO_MS, {
+                "hoje": 0, "ontem": 0, "percentual": 0, "direcao": "up",
+            }),
+            MetricaPainel("abertos_agora", MetricsCalculator.get_abertos_agora, ORCAMENTO_RAPIDO_MS, 0),
+            MetricaPainel("performance", MetricsCalculator.get_performance_metrics, ORCAMENTO_SLA_MS, {
+                "tempo_resolucao_medio": "—",
+                "primeira_resposta_media": "—",
+                "taxa_reaberturas": "0%",
+                "chamados_backlog": 0,
+            }),
+            *_metricas_sla(),
+        ]
+        valores, frescor = calcular_em_paralelo(metricas)
+        performance = valores["performance"]
 
         return {
             # Realtime
-            "chamados_hoje": realtime["chamados_hoje"],
-            "comparacao_ontem": realtime["comparacao_ontem"],
-            "abertos_agora": realtime["abertos_agora"],
+            "chamados_hoje": valores["chamados_hoje"],
+            "comparacao_ontem": valores["comparacao_ontem"],
+            "abertos_agora": valores["abertos_agora"],
 
             # SLA
-            "sla_compliance_24h": sla["sla_compliance_24h"],
-            "sla_compliance_mes": sla["sla_compliance_mes"],
-            "sla_distribution": sla["sla_distribution"],
-            "tempo_resposta_24h": sla["tempo_resposta_24h"],
-            "tempo_resposta_mes": sla["tempo_resposta_mes"],
-            "total_chamados_mes": sla["total_chamados_mes"],
+            **_resposta_sla(valores),
 
             # Performance
             "tempo_resolucao_30dias": performance["tempo_resolucao_medio"],
@@ -171,7 +232,7 @@ def get_dashboard_metrics(db: Session = Depends(get_db)):
             "chamados_backlog": performance["chamados_backlog"],
 
             # Metadata
-            "timestamp": now_brazil_naive().isoformat(),
+            **_metadados_frescor(frescor),
         }
     except Exception as e:
         print(f"[ERROR] Erro ao calcular métricas do dashboard: {e}")
@@ -184,6 +245,16 @@ def get_dashboard_metrics(db: Session = Depends(get_db)):
         )
 
 
+@router.get("/metrics/dashboard/fanout")
+def get_dashboard_fanout_stats():
+    """
+    Estatísticas do cálculo paralelo do dashboard neste worker: quantas
+    vezes cada métrica respondeu ok/stale/padrao, timeouts, erros e o
+    horário do último valor calculado.
+    """
+    return ultimos_valores.snapshot()
+
+
 @router.get("/metrics/chamados-abertos")
 def get_chamados_abertos(db: Session = Depends(get_db)):
     """
@@ -342,6 +413,118 @@ def get_performance_metrics(db: Session = Depends(get_db)):
         }
 
 
+@router.get("/metrics/unit-of-work")
+def get_unit_of_work_metrics():
+    """
+    Latência das operações em UnitOfWork deste worker (janela recente):
+    transação no caminho da requisição, commit e hooks pós-commit (ms).
+    """
+    from ti.services.unit_of_work import stats, HOOK_WORKERS
+
+    return {
+        "worker_pid": os.getpid(),
+        "hook_workers": HOOK_WORKERS,
+        "operacoes": stats.snapshot(),
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
+@router.get("/metrics/deadlines")
+def get_deadline_metrics():
+    """
+    Prazos por classe de rota e requisições encerradas com 503 por prazo
+    estourado (por classe e por rota) neste worker. Ver core/deadline.py.
+    """
+    from core.deadline import stats, RETRY_AFTER_SEGUNDOS
+
+    return {
+        "worker_pid": os.getpid(),
+        "retry_after_segundos": RETRY_AFTER_SEGUNDOS,
+        **stats.snapshot(),
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
+@router.get("/metrics/tokens")
+def get_token_metrics():
+    """
+    Broker de tokens OAuth deste worker (core/token_broker.py): por fonte
+    (graph, powerbi), hits, esperas em renovação, renovações, adoções do
+    token persistido, falhas e tempo até expirar/renovar. O token não é exposto.
+    """
+    from core.token_broker import get_token_broker
+
+    return {
+        "worker_pid": os.getpid(),
+        **get_token_broker().status(),
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
+@router.get("/metrics/powerbi")
+def get_powerbi_metrics():
+    """
+    Proxy Power BI deste worker (ti/services/powerbi_client.py): HTTP/2 ativo,
+    hits/misses/esperas do cache de embed tokens, renovações antecipadas de
+    relatórios muito vistos e falhas. Os tokens não são expostos.
+    """
+    from ti.services.powerbi_client import embed_token_cache
+
+    return {
+        "worker_pid": os.getpid(),
+        **embed_token_cache.stats(),
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
+@router.get("/metrics/senhas")
+def get_password_hash_metrics():
+    """
+    Pool de hash de senha deste worker (core/senhas.py): hashes e verificações,
+    recusas por pool cheio ou por limite de tentativas, rehashes e tempos
+    médios de espera/hash.
+    """
+    from core.senhas import pool
+
+    return {
+        "worker_pid": os.getpid(),
+        **pool.status(),
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
+@router.get("/metrics/referencias")
+def get_reference_registry_metrics():
+    """
+    Registro de dados de referência deste worker (ti/services/referencias.py):
+    geração, ETag e horário de carga de unidades, problemas, configurações
+    de SLA, horários comerciais e feriados; hits, cargas e invalidações.
+    """
+    from ti.services.referencias import registro
+
+    return {
+        "worker_pid": os.getpid(),
+        **registro.status(),
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
+@router.get("/metrics/historico-chamados")
+def get_ticket_timeline_cache_metrics():
+    """
+    Cache da linha do tempo dos chamados deste worker
+    (ti/services/historico_chamado.py): hits, misses, invalidações por evento
+    e entradas descartadas por tamanho.
+    """
+    from ti.services.historico_chamado import historico_cache
+
+    return {
+        "worker_pid": os.getpid(),
+        **historico_cache.status(),
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
 @router.get("/metrics/debug/tempo-resposta")
 def debug_tempo_resposta(periodo: str = "mes", db: Session = Depends(get_db)):
     """
@@ -364,35 +547,23 @@ def debug_tempo_resposta(periodo: str = "mes", db: Session = Depends(get_db)):
         }
 
 
-@router.post("/metrics/debug/recalculate-sla")
-def debug_recalculate_sla(db: Session = Depends(get_db)):
+@router.post("/metrics/debug/recalculate-sla", status_code=202)
+def debug_recalculate_sla():
     """
     Debug: força recálculo de todas as métricas de SLA
     Útil para verificar se há problemas nos cálculos
-    """
-    try:
-        from ti.services.sla_cache import SLACacheManager
-        from core.utils import now_brazil_naive
 
-        # Invalida todos os caches
-        SLACacheManager.invalidate_all_sla(db)
-
-        # Recalcula
-        sla_24h = MetricsCalculator.get_sla_compliance_24h(db)
-        sla_mes = MetricsCalculator.get_sla_compliance_mes(db)
-        sla_dist = MetricsCalculator.get_sla_distribution(db)
+    Roda em segundo plano pela fila de jobs: as métricas recalculadas ficam
+    no resultado da execução (/jobs/execucoes/{run_id}).
+    """
+    from ti.services.job_queue import get_job_queue, resposta_enfileirada
+    from ti.services.sla_admin_jobs import TAREFA_METRICAS_SLA
 
-        return {
-            "status": "ok",
-            "sla_compliance_24h": sla_24h,
-            "sla_compliance_mes": sla_mes,
-            "sla_distribution": sla_dist,
-            "timestamp": now_brazil_naive().isoformat()
-        }
+    try:
+        run_id, deduplicado = get_job_queue().submit(TAREFA_METRICAS_SLA)
+        return resposta_enfileirada(TAREFA_METRICAS_SLA, run_id, deduplicado)
     except Exception as e:
-        print(f"Erro ao recalcular SLA: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Erro ao enfileirar recálculo de SLA: {e}")
         return {
             "status": "erro",
             "erro": str(e)
@@ -3,59 +3,23 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from core.db import get_db
+from core.token_broker import get_token_broker, TokenBrokerError
+from ti.services.powerbi_client import embed_token_cache, chamar_powerbi, PowerBIIndisponivel
+from ti.services.powerbi_metadados import metadados_cache
+from ti.services.dashboard_permissions import invalidar_indice
+from core.utils import now_brazil_naive
 from ti.models.powerbi_dashboard import PowerBIDashboard
 from ti.schemas.powerbi_dashboard import PowerBIDashboardOut, PowerBIDashboardCreate, PowerBIDashboardUpdate
 import httpx
 import os
 import asyncio
 import html
-import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 router = APIRouter(prefix="/powerbi", tags=["Power BI"])
 
-# ============================================
-# TOKEN CACHE (para evitar rate limiting)
-# ============================================
-class TokenCache:
-    def __init__(self):
-        self.token = None
-        self.expires_at = 0
-        self.lock = asyncio.Lock()
-
-    async def get_token(self, get_token_func):
-        """Get cached token or fetch new one"""
-        current_time = time.time()
-
-        # Se token ainda é válido (com 30s de margem), retorna o cached
-        if self.token and current_time < (self.expires_at - 30):
-            print(f"[POWERBI] ✅ Usando token em cache (expira em {int(self.expires_at - current_time)}s)")
-            return self.token
-
-        async with self.lock:
-            # Double-check dentro do lock
-            if self.token and current_time < (self.expires_at - 30):
-                return self.token
-
-            print(f"[POWERBI] 🔄 Obtendo novo token...")
-            token_data = await get_token_func()
-
-            self.token = token_data.get("access_token")
-            expires_in = token_data.get("expires_in", 3600)
-            self.expires_at = current_time + expires_in
-
-            print(f"[POWERBI] ✅ Novo token obtido (válido por {expires_in}s)")
-            return self.token
-
-    def clear(self):
-        """Clear cached token"""
-        self.token = None
-        self.expires_at = 0
-
-token_cache = TokenCache()
-
 # ============================================
 # POWER BI CONFIGURATION
 # ============================================
@@ -79,7 +43,17 @@ if not POWERBI_WORKSPACE_ID:
 
 AUTHORITY_URL = f"https://login.microsoftonline.com/{POWERBI_TENANT_ID}"
 TOKEN_ENDPOINT = f"{AUTHORITY_URL}/oauth2/v2.0/token"
-POWERBI_API_URL = "https://api.powerbi.com/v1.0/myorg"
+# Sobrescrevível para apontar para o mock local (ti/scripts/powerbi_mock_server.py)
+POWERBI_API_URL = os.getenv("POWERBI_API_URL", "https://api.powerbi.com/v1.0/myorg").rstrip("/")
+POWERBI_TOKEN = "powerbi"
+
+get_token_broker().registrar(
+    POWERBI_TOKEN,
+    POWERBI_TENANT_ID,
+    POWERBI_CLIENT_ID,
+    POWERBI_CLIENT_SECRET,
+    "https://analysis.windows.net/powerbi/api/.default",
+)
 
 print(f"[POWERBI] ===== CONFIGURAÇÃO CARREGADA =====")
 print(f"[POWERBI] CLIENT_ID: {POWERBI_CLIENT_ID[:20]}...")
@@ -93,45 +67,13 @@ print(f"[POWERBI] =====================================")
 # AUTHENTICATION
 # ============================================
 
-async def _fetch_service_principal_token_from_azure() -> dict:
-    """Fetch fresh token from Azure (internal use only)"""
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.post(
-                TOKEN_ENDPOINT,
-                data={
-                    "grant_type": "client_credentials",
-                    "client_id": POWERBI_CLIENT_ID,
-                    "client_secret": POWERBI_CLIENT_SECRET,
-                    "scope": "https://analysis.windows.net/powerbi/api/.default",
-                },
-            )
-
-            if response.status_code != 200:
-                error_text = response.text
-                print(f"[POWERBI] ❌ Erro de autenticação Azure: {error_text}")
-                raise HTTPException(status_code=400, detail=f"Azure auth error: {error_text}")
-
-            token_data = response.json()
-            access_token = token_data.get("access_token")
-
-            if not access_token:
-                raise HTTPException(status_code=400, detail="No access token received from Azure")
-
-            return token_data
-
-    except httpx.RequestError as e:
-        print(f"[POWERBI] ❌ Erro de rede ao obter token: {e}")
-        raise HTTPException(status_code=400, detail=f"Network error: {str(e)}")
-
-
 async def get_service_principal_token() -> str:
-    """Get cached access token using service principal credentials"""
+    """Access token do service principal pelo broker compartilhado (core/token_broker.py)"""
     try:
-        token = await token_cache.get_token(_fetch_service_principal_token_from_azure)
-        return token
-    except HTTPException:
-        raise
+        return await get_token_broker().obter_async(POWERBI_TOKEN)
+    except TokenBrokerError as e:
+        print(f"[POWERBI] ❌ Erro de autenticação Azure: {e}")
+        raise HTTPException(status_code=400, detail=f"Azure auth error: {e}")
     except Exception as e:
         print(f"[POWERBI] ❌ Erro ao obter token: {e}")
         raise HTTPException(status_code=500, detail=f"Token retrieval error: {str(e)}")
@@ -157,6 +99,144 @@ async def get_powerbi_token(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _gerar_embed_token(report_id: str, datasetId: str | None) -> dict:
+    """Gera um embed token novo na API do Power BI (chamado pelo embed_token_cache)"""
+    # 1. Obter token de autenticação
+    service_token = await get_service_principal_token()
+    headers = {
+        "Authorization": f"Bearer {service_token}",
+        "Content-Type": "application/json"
+    }
+
+    # 2. Payload para embed com Service Principal
+    payload = {
+        "accessLevel": "View"
+    }
+
+    # Adicionar dataset se fornecido
+    if datasetId:
+        payload["datasets"] = [{"id": datasetId}]
+
+    print(f"[POWERBI] [EMBED-TOKEN] Payload: {payload}")
+
+    # 3. Fazer request para a API CORRETA (com workspace_id)
+    token_url = f"{POWERBI_API_URL}/groups/{POWERBI_WORKSPACE_ID}/reports/{report_id}/GenerateToken"
+    print(f"[POWERBI] [EMBED-TOKEN] Token URL: {token_url}")
+
+    # 3a. Obter o embedUrl correto do relatório (CRÍTICO - é obrigatório)
+    embed_url_value = None
+    try:
+        report_response = await chamar_powerbi(
+            "report",
+            "GET",
+            f"{POWERBI_API_URL}/groups/{POWERBI_WORKSPACE_ID}/reports/{report_id}",
+            hedge=True,
+            headers=headers,
+        )
+
+        if report_response.status_code == 200:
+            report_data = report_response.json()
+            embed_url_value = report_data.get("embedUrl")
+
+            if embed_url_value and isinstance(embed_url_value, str):
+                if embed_url_value.startswith("https://app.powerbi.com"):
+                    print(f"[POWERBI] [EMBED-TOKEN] ✅ Embed URL válida obtida da API")
+                else:
+                    print(f"[POWERBI] [EMBED-TOKEN] ⚠️ embedUrl com hostname inesperado: {embed_url_value[:80]}")
+                    embed_url_value = None
+            else:
+                print(f"[POWERBI] [EMBED-TOKEN] ⚠️ embedUrl ausente ou inválida na resposta: {embed_url_value}")
+                embed_url_value = None
+        elif report_response.status_code == 401:
+            print(f"[POWERBI] [EMBED-TOKEN] ❌ 401 Unauthorized - Service Principal sem acesso")
+            raise HTTPException(
+                status_code=401,
+                detail="Service Principal não tem permissão para ler relatório"
+            )
+        elif report_response.status_code == 403:
+            print(f"[POWERBI] [EMBED-TOKEN] ❌ 403 Forbidden - Sem permissão")
+            raise HTTPException(
+                status_code=403,
+                detail="Service Principal não tem permissão para acessar este relatório"
+            )
+        elif report_response.status_code == 404:
+            print(f"[POWERBI] [EMBED-TOKEN] ❌ 404 Not Found - Relatório {report_id} não encontrado")
+            raise HTTPException(
+                status_code=404,
+                detail=f"Relatório {report_id} não encontrado no workspace"
+            )
+        else:
+            print(f"[POWERBI] [EMBED-TOKEN] ⚠️ Erro ao obter report: {report_response.status_code}")
+            print(f"[POWERBI] [EMBED-TOKEN] Response: {report_response.text[:200]}")
+
+    except httpx.TimeoutException as e:
+        print(f"[POWERBI] [EMBED-TOKEN] ⚠️ Timeout ao obter report details: {e}")
+        embed_url_value = None
+    except (HTTPException, PowerBIIndisponivel):
+        raise
+    except Exception as e:
+        print(f"[POWERBI] [EMBED-TOKEN] ⚠️ Erro ao obter embedUrl: {e}")
+        embed_url_value = None
+
+    # Se não conseguiu obter embedUrl, retornar erro
+    if not embed_url_value:
+        error_msg = f"Não conseguiu obter embedUrl para relatório {report_id}. Verifique se o Service Principal tem permissão de leitura no workspace."
+        print(f"[POWERBI] [EMBED-TOKEN] ❌ ERRO CRÍTICO: {error_msg}")
+        raise HTTPException(
+            status_code=500,
+            detail=error_msg
+        )
+
+    # 3b. Gerar o token (timeout por tentativa, retries com jitter e circuit breaker em chamar_powerbi)
+    response = await chamar_powerbi(
+        "generate_token",
+        "POST",
+        token_url,
+        hedge=True,
+        json=payload,
+        headers=headers,
+    )
+
+    print(f"[POWERBI] [EMBED-TOKEN] Status: {response.status_code}")
+    print(f"[POWERBI] [EMBED-TOKEN] Response: {response.text[:500]}")
+
+    if response.status_code != 200:
+        error_detail = response.text
+
+        if response.status_code == 403:
+            print(f"\n[POWERBI] [EMBED-TOKEN] ❌ ERRO 403 - DIAGNÓSTICO:")
+            print(f"  1. Service Principal est�� no workspace como Membro/Admin?")
+            print(f"     → Workspace ID: {POWERBI_WORKSPACE_ID}")
+            print(f"  2. Report ID está correto?")
+            print(f"     → Report ID: {report_id}")
+        elif response.status_code == 404:
+            print(f"\n[POWERBI] [EMBED-TOKEN] ❌ ERRO 404:")
+            print(f"  - Report {report_id} não encontrado no workspace {POWERBI_WORKSPACE_ID}")
+
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Power BI API error: {error_detail}"
+        )
+
+    # Extrair o token da resposta
+    token_data = response.json()
+    embed_token = token_data.get("token")
+
+    if not embed_token:
+        raise HTTPException(status_code=400, detail="No embed token received")
+
+    print(f"[POWERBI] [EMBED-TOKEN] ✅ Token gerado com sucesso!")
+    print(f"[POWERBI] [EMBED-TOKEN] ========================================\n")
+
+    return {
+        "token": embed_token,
+        "tokenId": token_data.get("tokenId"),
+        "expiration": token_data.get("expiration"),
+        "report_id": report_id,
+        "embedUrl": embed_url_value,
+    }
+
+
 @router.get("/embed-token/{report_id}")
 async def get_embed_token(
     report_id: str,
@@ -165,6 +245,9 @@ async def get_embed_token(
 ):
     """
     Generate an embed token for a specific Power BI report with Service Principal
+
+    O token fica em cache por (relatório, dataset, identidade RLS) até pouco
+    antes de expirar (ti/services/powerbi_client.py).
     """
     print(f"\n[POWERBI] [EMBED-TOKEN] ========================================")
     print(f"[POWERBI] [EMBED-TOKEN] Report ID: {report_id}")
@@ -173,149 +256,26 @@ async def get_embed_token(
     print(f"[POWERBI] [EMBED-TOKEN] Workspace ID: {POWERBI_WORKSPACE_ID}")
 
     try:
-        # 1. Obter token de autenticação
-        service_token = await get_service_principal_token()
-        headers = {
-            "Authorization": f"Bearer {service_token}",
-            "Content-Type": "application/json"
-        }
-
-        # 2. Payload para embed com Service Principal
-        payload = {
-            "accessLevel": "View"
-        }
-
-        # Adicionar dataset se fornecido
-        if datasetId:
-            payload["datasets"] = [{"id": datasetId}]
-
-        print(f"[POWERBI] [EMBED-TOKEN] Payload: {payload}")
-
-        # 3. Fazer request para a API CORRETA (com workspace_id)
-        token_url = f"{POWERBI_API_URL}/groups/{POWERBI_WORKSPACE_ID}/reports/{report_id}/GenerateToken"
-        print(f"[POWERBI] [EMBED-TOKEN] Token URL: {token_url}")
-
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            # 3a. Obter o embedUrl correto do relatório (CRÍTICO - é obrigatório)
-            embed_url_value = None
-            try:
-                report_response = await client.get(
-                    f"{POWERBI_API_URL}/groups/{POWERBI_WORKSPACE_ID}/reports/{report_id}",
-                    headers=headers,
-                    timeout=20.0,
-                )
-
-                if report_response.status_code == 200:
-                    report_data = report_response.json()
-                    embed_url_value = report_data.get("embedUrl")
-
-                    if embed_url_value and isinstance(embed_url_value, str):
-                        if embed_url_value.startswith("https://app.powerbi.com"):
-                            print(f"[POWERBI] [EMBED-TOKEN] ✅ Embed URL válida obtida da API")
-                        else:
-                            print(f"[POWERBI] [EMBED-TOKEN] ⚠️ embedUrl com hostname inesperado: {embed_url_value[:80]}")
-                            embed_url_value = None
-                    else:
-                        print(f"[POWERBI] [EMBED-TOKEN] ⚠️ embedUrl ausente ou inválida na resposta: {embed_url_value}")
-                        embed_url_value = None
-                elif report_response.status_code == 401:
-                    print(f"[POWERBI] [EMBED-TOKEN] ❌ 401 Unauthorized - Service Principal sem acesso")
-                    raise HTTPException(
-                        status_code=401,
-                        detail="Service Principal não tem permissão para ler relatório"
-                    )
-                elif report_response.status_code == 403:
-                    print(f"[POWERBI] [EMBED-TOKEN] ❌ 403 Forbidden - Sem permissão")
-                    raise HTTPException(
-                        status_code=403,
-                        detail="Service Principal não tem permissão para acessar este relatório"
-                    )
-                elif report_response.status_code == 404:
-                    print(f"[POWERBI] [EMBED-TOKEN] ❌ 404 Not Found - Relatório {report_id} não encontrado")
-                    raise HTTPException(
-                        status_code=404,
-                        detail=f"Relatório {report_id} não encontrado no workspace"
-                    )
-                else:
-                    print(f"[POWERBI] [EMBED-TOKEN] ⚠️ Erro ao obter report: {report_response.status_code}")
-                    print(f"[POWERBI] [EMBED-TOKEN] Response: {report_response.text[:200]}")
-
-            except httpx.TimeoutException as e:
-                print(f"[POWERBI] [EMBED-TOKEN] ⚠️ Timeout ao obter report details: {e}")
-                embed_url_value = None
-            except HTTPException:
-                raise
-            except Exception as e:
-                print(f"[POWERBI] [EMBED-TOKEN] ⚠️ Erro ao obter embedUrl: {e}")
-                embed_url_value = None
-
-            # Se não conseguiu obter embedUrl, retornar erro
-            if not embed_url_value:
-                error_msg = f"Não conseguiu obter embedUrl para relatório {report_id}. Verifique se o Service Principal tem permissão de leitura no workspace."
-                print(f"[POWERBI] [EMBED-TOKEN] ❌ ERRO CRÍTICO: {error_msg}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=error_msg
-                )
-
-            # 3b. Gerar o token (aumentado timeout para 60s porque api.powerbi.com pode ser lenta)
-            try:
-                response = await client.post(
-                    token_url,
-                    json=payload,
-                    headers=headers,
-                )
-            except httpx.ReadTimeout:
-                print(f"[POWERBI] [EMBED-TOKEN] ⚠️ Timeout na primeira tentativa, aguardando...")
-                # Retry uma vez após esperar um pouco
-                await asyncio.sleep(2)
-                response = await client.post(
-                    token_url,
-                    json=payload,
-                    headers=headers,
-                )
-
-            print(f"[POWERBI] [EMBED-TOKEN] Status: {response.status_code}")
-            print(f"[POWERBI] [EMBED-TOKEN] Response: {response.text[:500]}")
-
-            if response.status_code != 200:
-                error_detail = response.text
-
-                if response.status_code == 403:
-                    print(f"\n[POWERBI] [EMBED-TOKEN] ❌ ERRO 403 - DIAGNÓSTICO:")
-                    print(f"  1. Service Principal est�� no workspace como Membro/Admin?")
-                    print(f"     → Workspace ID: {POWERBI_WORKSPACE_ID}")
-                    print(f"  2. Report ID está correto?")
-                    print(f"     → Report ID: {report_id}")
-                elif response.status_code == 404:
-                    print(f"\n[POWERBI] [EMBED-TOKEN] ❌ ERRO 404:")
-                    print(f"  - Report {report_id} não encontrado no workspace {POWERBI_WORKSPACE_ID}")
-
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Power BI API error: {error_detail}"
-                )
-
-            # Extrair o token da resposta
-            token_data = response.json()
-            embed_token = token_data.get("token")
-
-            if not embed_token:
-                raise HTTPException(status_code=400, detail="No embed token received")
-
-            print(f"[POWERBI] [EMBED-TOKEN] ✅ Token gerado com sucesso!")
-            print(f"[POWERBI] [EMBED-TOKEN] ========================================\n")
-
-            return {
-                "token": embed_token,
-                "tokenId": token_data.get("tokenId"),
-                "expiration": token_data.get("expiration"),
-                "report_id": report_id,
-                "embedUrl": embed_url_value,
-            }
+        # Sem RLS hoje: o relatório é embutido com a identidade do service principal
+        dados, do_cache = await embed_token_cache.obter(
+            report_id,
+            datasetId,
+            None,
+            lambda: _gerar_embed_token(report_id, datasetId),
+        )
+        if do_cache:
+            print(f"[POWERBI] [EMBED-TOKEN] ✅ Token reaproveitado do cache (expira {dados.get('expiration')})")
+        return dados
 
     except HTTPException:
         raise
+    except PowerBIIndisponivel as e:
+        print(f"[POWERBI] [EMBED-TOKEN] ❌ {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Power BI indisponível no momento. Tente novamente em instantes.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except (httpx.ReadTimeout, httpx.TimeoutException):
         print(f"[POWERBI] [EMBED-TOKEN] ❌ Timeout ao conectar com Power BI API")
         raise HTTPException(
@@ -335,24 +295,33 @@ async def get_embed_token(
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 
+async def _listar_powerbi(endpoint: str, caminho: str):
+    """GET na API do Power BI (breaker/retries); status != 2xx vira httpx.HTTPStatusError"""
+    token = await get_service_principal_token()
+    response = await chamar_powerbi(
+        endpoint,
+        "GET",
+        f"{POWERBI_API_URL}{caminho}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def _metadados(chave: str, endpoint: str, caminho: str):
+    """Listagem pelo cache de metadados (ti/services/powerbi_metadados.py): (dados, meta)"""
+    return await metadados_cache.obter(chave, lambda: _listar_powerbi(endpoint, caminho))
+
+
 @router.get("/dashboards")
 async def get_powerbi_dashboards(db: Session = Depends(get_db)):
-    """Get list of Power BI dashboards"""
+    """Get list of Power BI dashboards (cache de metadados)"""
     try:
-        token = await get_service_principal_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{POWERBI_API_URL}/dashboards",
-                headers=headers,
-            )
-            
-            if response.status_code != 200:
-                print(f"[POWERBI] Dashboards error: {response.text}")
-                return {"value": []}
-            
-            return response.json()
+        data, cache = await _metadados("dashboards", "dashboards", "/dashboards")
+        return {**data, "cache": cache}
+    except httpx.HTTPStatusError as e:
+        print(f"[POWERBI] Dashboards error: {e.response.text}")
+        return {"value": []}
     except Exception as e:
         print(f"[POWERBI] Error fetching dashboards: {e}")
         return {"value": []}
@@ -360,27 +329,41 @@ async def get_powerbi_dashboards(db: Session = Depends(get_db)):
 
 @router.get("/reports")
 async def get_powerbi_reports(db: Session = Depends(get_db)):
-    """Get list of Power BI reports"""
+    """Get list of Power BI reports (cache de metadados)"""
     try:
-        token = await get_service_principal_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{POWERBI_API_URL}/reports",
-                headers=headers,
-            )
-
-            if response.status_code != 200:
-                print(f"[POWERBI] Reports error: {response.text}")
-                return {"value": []}
-
-            return response.json()
+        data, cache = await _metadados("reports", "reports", "/reports")
+        return {**data, "cache": cache}
+    except httpx.HTTPStatusError as e:
+        print(f"[POWERBI] Reports error: {e.response.text}")
+        return {"value": []}
     except Exception as e:
         print(f"[POWERBI] Error fetching reports: {e}")
         return {"value": []}
 
 
+@router.get("/cache")
+def get_powerbi_cache_status():
+    """Listagens do Power BI em cache neste worker, com atualizado_em/expira_em"""
+    return metadados_cache.status()
+
+
+@router.post("/cache/refresh")
+async def refresh_powerbi_cache(chave: str | None = Query(None)):
+    """
+    Força a atualização das listagens em cache (todas ou só a chave informada,
+    ex: "reports", "workspace:{id}:datasets"). Neste worker a atualização é
+    aguardada; nos demais, a geração compartilhada faz as listagens em cache
+    serem recarregadas na próxima leitura.
+    """
+    resultado = await metadados_cache.atualizar(chave)
+    if chave and not resultado:
+        raise HTTPException(status_code=404, detail=f"Chave '{chave}' não está em cache")
+    return {
+        "atualizadas": resultado,
+        "timestamp": now_brazil_naive().isoformat(),
+    }
+
+
 # ============================================
 # DATABASE DASHBOARDS ENDPOINTS
 # ============================================
@@ -490,6 +473,7 @@ async def create_db_dashboard(dashboard: PowerBIDashboardCreate, db: Session = D
         db.add(new_dashboard)
         db.commit()
         db.refresh(new_dashboard)
+        invalidar_indice(db)
 
         print(f"[POWERBI] [DB] Dashboard criado: {new_dashboard.title}")
         return new_dashboard
@@ -525,6 +509,7 @@ async def update_db_dashboard(
 
         db.commit()
         db.refresh(dashboard)
+        invalidar_indice(db)
 
         print(f"[POWERBI] [DB] Dashboard atualizado: {dashboard.title}")
         return dashboard
@@ -552,6 +537,7 @@ async def delete_db_dashboard(dashboard_id: str, db: Session = Depends(get_db)):
 
         dashboard.ativo = False
         db.commit()
+        invalidar_indice(db)
 
         print(f"[POWERBI] [DB] Dashboard desativado: {dashboard.title}")
         return {"message": f"Dashboard '{dashboard_id}' desativado com sucesso"}
@@ -597,47 +583,39 @@ def debug_powerbi_config():
 async def debug_workspaces():
     """List all accessible workspaces"""
     try:
-        token = await get_service_principal_token()
-        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            data, cache = await _metadados("workspaces", "groups", "/groups")
+        except httpx.HTTPStatusError as e:
+            print(f"[POWERBI] [DEBUG] Workspaces - Status: {e.response.status_code}")
+            return {
+                "status": f"❌ Erro {e.response.status_code}",
+                "error": e.response.text,
+                "diagnóstico": [
+                    "Service Principal não está habilitado no Power BI Admin?",
+                    "Falta permissões de API no Azure AD?",
+                    "Tenant settings bloqueando Service Principals?"
+                ]
+            }
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{POWERBI_API_URL}/groups",
-                headers=headers,
-            )
+        workspaces = data.get("value", [])
 
-            print(f"[POWERBI] [DEBUG] Workspaces - Status: {response.status_code}")
-
-            if response.status_code == 200:
-                data = response.json()
-                workspaces = data.get("value", [])
-                
-                return {
-                    "status": "✅ Service Principal tem acesso aos workspaces",
-                    "total_workspaces": len(workspaces),
-                    "configured_workspace_id": POWERBI_WORKSPACE_ID,
-                    "workspaces": [
-                        {
-                            "id": w.get("id"),
-                            "name": w.get("name"),
-                            "isOnDedicatedCapacity": w.get("isOnDedicatedCapacity", False),
-                            "type": w.get("type", "Workspace"),
-                            "📊 Link": f"https://app.powerbi.com/groups/{w.get('id')}/list"
-                        }
-                        for w in workspaces
-                    ]
-                }
-            else:
-                return {
-                    "status": f"❌ Erro {response.status_code}",
-                    "error": response.text,
-                    "diagnóstico": [
-                        "Service Principal não está habilitado no Power BI Admin?",
-                        "Falta permissões de API no Azure AD?",
-                        "Tenant settings bloqueando Service Principals?"
-                    ]
+        return {
+            "status": "✅ Service Principal tem acesso aos workspaces",
+            "total_workspaces": len(workspaces),
+            "configured_workspace_id": POWERBI_WORKSPACE_ID,
+            "workspaces": [
+                {
+                    "id": w.get("id"),
+                    "name": w.get("name"),
+                    "isOnDedicatedCapacity": w.get("isOnDedicatedCapacity", False),
+                    "type": w.get("type", "Workspace"),
+                    "📊 Link": f"https://app.powerbi.com/groups/{w.get('id')}/list"
                 }
-                
+                for w in workspaces
+            ],
+            "cache": cache,
+        }
+
     except Exception as e:
         import traceback
         return {
@@ -651,90 +629,86 @@ async def debug_workspaces():
 async def debug_workspace_access(workspace_id: str):
     """Check access to a specific workspace and list its contents"""
     try:
-        token = await get_service_principal_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
         results = {}
+        cache = {}
+
+        # As três listagens em paralelo (cada uma com sua entrada no cache)
+        workspace, reports, datasets = await asyncio.gather(
+            _metadados(f"workspace:{workspace_id}", "groups", f"/groups/{workspace_id}"),
+            _metadados(f"workspace:{workspace_id}:reports", "groups", f"/groups/{workspace_id}/reports"),
+            _metadados(f"workspace:{workspace_id}:datasets", "groups", f"/groups/{workspace_id}/datasets"),
+            return_exceptions=True,
+        )
+        for resultado in (workspace, reports, datasets):
+            if isinstance(resultado, Exception) and not isinstance(resultado, httpx.HTTPStatusError):
+                raise resultado
+
+        # 1. Informações do workspace
+        if isinstance(workspace, httpx.HTTPStatusError):
+            results["workspace_info"] = {
+                "error": f"Status {workspace.response.status_code}",
+                "detail": workspace.response.text
+            }
+        else:
+            results["workspace_info"], cache["workspace_info"] = workspace
+
+        # 2. Reports no workspace
+        if isinstance(reports, httpx.HTTPStatusError):
+            results["reports"] = {
+                "status": f"❌ Erro {reports.response.status_code}",
+                "error": reports.response.text
+            }
+        else:
+            data, cache["reports"] = reports
+            lista = data.get("value", [])
+            results["reports"] = {
+                "status": "✅ Acesso OK",
+                "count": len(lista),
+                "reports": [
+                    {
+                        "id": r.get("id"),
+                        "name": r.get("name"),
+                        "datasetId": r.get("datasetId"),
+                        "webUrl": r.get("webUrl"),
+                        "embedUrl": r.get("embedUrl"),
+                    }
+                    for r in lista
+                ]
+            }
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # 1. Informações do workspace
-            workspace_response = await client.get(
-                f"{POWERBI_API_URL}/groups/{workspace_id}",
-                headers=headers,
-            )
-            
-            if workspace_response.status_code == 200:
-                results["workspace_info"] = workspace_response.json()
-            else:
-                results["workspace_info"] = {
-                    "error": f"Status {workspace_response.status_code}",
-                    "detail": workspace_response.text
-                }
-
-            # 2. Reports no workspace
-            reports_response = await client.get(
-                f"{POWERBI_API_URL}/groups/{workspace_id}/reports",
-                headers=headers,
-            )
-            
-            if reports_response.status_code == 200:
-                reports = reports_response.json().get("value", [])
-                results["reports"] = {
-                    "status": "✅ Acesso OK",
-                    "count": len(reports),
-                    "reports": [
-                        {
-                            "id": r.get("id"),
-                            "name": r.get("name"),
-                            "datasetId": r.get("datasetId"),
-                            "webUrl": r.get("webUrl"),
-                            "embedUrl": r.get("embedUrl"),
-                        }
-                        for r in reports
-                    ]
-                }
-            else:
-                results["reports"] = {
-                    "status": f"❌ Erro {reports_response.status_code}",
-                    "error": reports_response.text
-                }
-
-            # 3. Datasets no workspace
-            datasets_response = await client.get(
-                f"{POWERBI_API_URL}/groups/{workspace_id}/datasets",
-                headers=headers,
-            )
-            
-            if datasets_response.status_code == 200:
-                datasets = datasets_response.json().get("value", [])
-                results["datasets"] = {
-                    "status": "✅ Acesso OK",
-                    "count": len(datasets),
-                    "datasets": [
-                        {
-                            "id": d.get("id"),
-                            "name": d.get("name"),
-                            "webUrl": d.get("webUrl"),
-                        }
-                        for d in datasets
-                    ]
-                }
-            else:
-                results["datasets"] = {
-                    "status": f"❌ Erro {datasets_response.status_code}",
-                    "error": datasets_response.text
-                }
+        # 3. Datasets no workspace
+        if isinstance(datasets, httpx.HTTPStatusError):
+            results["datasets"] = {
+                "status": f"❌ Erro {datasets.response.status_code}",
+                "error": datasets.response.text
+            }
+        else:
+            data, cache["datasets"] = datasets
+            lista = data.get("value", [])
+            results["datasets"] = {
+                "status": "✅ Acesso OK",
+                "count": len(lista),
+                "datasets": [
+                    {
+                        "id": d.get("id"),
+                        "name": d.get("name"),
+                        "webUrl": d.get("webUrl"),
+                    }
+                    for d in lista
+                ]
+            }
 
-            return {
-                "workspace_id": workspace_id,
-                "configured_workspace_id": POWERBI_WORKSPACE_ID,
-                "is_correct_workspace": workspace_id == POWERBI_WORKSPACE_ID,
-                "results": results,
-                "🔗 Links": {
-                    "workspace": f"https://app.powerbi.com/groups/{workspace_id}/list",
-                    "settings": f"https://app.powerbi.com/groups/{workspace_id}/settings/access",
-                }
+        return {
+            "workspace_id": workspace_id,
+            "configured_workspace_id": POWERBI_WORKSPACE_ID,
+            "is_correct_workspace": workspace_id == POWERBI_WORKSPACE_ID,
+            "results": results,
+            "cache": cache,
+            "🔗 Links": {
+                "workspace": f"https://app.powerbi.com/groups/{workspace_id}/list",
+                "settings": f"https://app.powerbi.com/groups/{workspace_id}/settings/access",
             }
+        }
 
     except Exception as e:
         import traceback
@@ -758,34 +732,26 @@ async def debug_configured_workspace_access():
 async def debug_datasets_access():
     """Check if service principal has access to datasets"""
     try:
-        token = await get_service_principal_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{POWERBI_API_URL}/datasets",
-                headers=headers,
-            )
-
-            if response.status_code == 200:
-                datasets = response.json().get("value", [])
-                return {
-                    "status": "✅ OK",
-                    "count": len(datasets),
-                    "datasets": [
-                        {
-                            "id": d.get("id"),
-                            "name": d.get("name"),
-                            "webUrl": d.get("webUrl"),
-                        }
-                        for d in datasets[:20]
-                    ]
-                }
-            else:
-                return {
-                    "status": f"❌ Erro {response.status_code}",
-                    "error": response.text
+        data, cache = await _metadados("datasets", "datasets", "/datasets")
+        datasets = data.get("value", [])
+        return {
+            "status": "✅ OK",
+            "count": len(datasets),
+            "datasets": [
+                {
+                    "id": d.get("id"),
+                    "name": d.get("name"),
+                    "webUrl": d.get("webUrl"),
                 }
+                for d in datasets[:20]
+            ],
+            "cache": cache,
+        }
+    except httpx.HTTPStatusError as e:
+        return {
+            "status": f"❌ Erro {e.response.status_code}",
+            "error": e.response.text
+        }
     except Exception as e:
         return {"status": "❌ Erro", "error": str(e)}
 
@@ -794,35 +760,27 @@ async def debug_datasets_access():
 async def debug_reports_access():
     """Check if service principal has access to reports"""
     try:
-        token = await get_service_principal_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{POWERBI_API_URL}/reports",
-                headers=headers,
-            )
-
-            if response.status_code == 200:
-                reports = response.json().get("value", [])
-                return {
-                    "status": "✅ OK",
-                    "count": len(reports),
-                    "reports": [
-                        {
-                            "id": r.get("id"),
-                            "name": r.get("name"),
-                            "datasetId": r.get("datasetId"),
-                            "webUrl": r.get("webUrl"),
-                        }
-                        for r in reports[:20]
-                    ]
-                }
-            else:
-                return {
-                    "status": f"❌ Erro {response.status_code}",
-                    "error": response.text
+        data, cache = await _metadados("reports", "reports", "/reports")
+        reports = data.get("value", [])
+        return {
+            "status": "✅ OK",
+            "count": len(reports),
+            "reports": [
+                {
+                    "id": r.get("id"),
+                    "name": r.get("name"),
+                    "datasetId": r.get("datasetId"),
+                    "webUrl": r.get("webUrl"),
                 }
+                for r in reports[:20]
+            ],
+            "cache": cache,
+        }
+    except httpx.HTTPStatusError as e:
+        return {
+            "status": f"❌ Erro {e.response.status_code}",
+            "error": e.response.text
+        }
     except Exception as e:
         return {"status": "❌ Erro", "error": str(e)}
 
@@ -830,36 +788,32 @@ async def debug_reports_access():
 @router.get("/debug/embed-url/{report_id}")
 async def debug_embed_url(report_id: str):
     """Debug endpoint: Check embedUrl format for a specific report"""
+    fallback_url = f"https://app.powerbi.com/reportEmbed?reportId={report_id}&groupId={POWERBI_WORKSPACE_ID}&w=2"
     try:
-        token = await get_service_principal_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{POWERBI_API_URL}/groups/{POWERBI_WORKSPACE_ID}/reports/{report_id}",
-                headers=headers,
-            )
+        report_data, cache = await _metadados(
+            f"report:{report_id}",
+            "report",
+            f"/groups/{POWERBI_WORKSPACE_ID}/reports/{report_id}",
+        )
+        embed_url = report_data.get("embedUrl", "NOT PROVIDED")
 
-            if response.status_code == 200:
-                report_data = response.json()
-                embed_url = report_data.get("embedUrl", "NOT PROVIDED")
-
-                return {
-                    "status": "✅ Found",
-                    "report_id": report_id,
-                    "embed_url": embed_url,
-                    "embed_url_valid": isinstance(embed_url, str) and embed_url.startswith("https://"),
-                    "has_groupId": "groupId=" in str(embed_url),
-                    "has_reportId": f"reportId={report_id}" in str(embed_url),
-                    "url_length": len(str(embed_url)),
-                    "fallback_url": f"https://app.powerbi.com/reportEmbed?reportId={report_id}&groupId={POWERBI_WORKSPACE_ID}&w=2"
-                }
-            else:
-                return {
-                    "status": f"❌ Error {response.status_code}",
-                    "error": response.text[:500],
-                    "fallback_url": f"https://app.powerbi.com/reportEmbed?reportId={report_id}&groupId={POWERBI_WORKSPACE_ID}&w=2"
-                }
+        return {
+            "status": "✅ Found",
+            "report_id": report_id,
+            "embed_url": embed_url,
+            "embed_url_valid": isinstance(embed_url, str) and embed_url.startswith("https://"),
+            "has_groupId": "groupId=" in str(embed_url),
+            "has_reportId": f"reportId={report_id}" in str(embed_url),
+            "url_length": len(str(embed_url)),
+            "fallback_url": fallback_url,
+            "cache": cache,
+        }
+    except httpx.HTTPStatusError as e:
+        return {
+            "status": f"❌ Error {e.response.status_code}",
+            "error": e.response.text[:500],
+            "fallback_url": fallback_url
+        }
     except Exception as e:
         import traceback
         return {
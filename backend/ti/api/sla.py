@@ -1,7 +1,6 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 from core.db import get_db, engine
 from ti.schemas.sla import (
     SLAConfigurationCreate,
@@ -14,26 +13,56 @@ from ti.schemas.sla import (
     SLAFeriadoOut,
     HistoricoSLAOut,
     SLAStatusResponse,
+    SLAStatusBatchRequest,
 )
 from ti.models.sla_config import SLAConfiguration, SLABusinessHours, SLAFeriado, HistoricoSLA
 from ti.models.chamado import Chamado
 from ti.services.sla import SLACalculator
 from ti.services.sla_cache import SLACacheManager
 from ti.services.sla_validator import SLAValidator
+from ti.services.referencias import registro, resposta_referencia, invalidar_sla
+from ti.services.job_queue import JobQueue, get_job_queue, resposta_enfileirada
+from ti.services.sla_admin_jobs import (
+    TAREFA_SYNC_TODOS,
+    TAREFA_RECALCULAR_PAINEL,
+    TAREFA_RESET,
+    TAREFA_P90,
+    TAREFA_P90_INCREMENTAL,
+)
 from core.utils import now_brazil_naive
 from datetime import timedelta
 
 router = APIRouter(prefix="/sla", tags=["TI - SLA"])
 
+SLA_STATUS_BATCH_MAX = 500
+
+
+def _atualizar_prazos_sla(db: Session, prioridade: str | None = None, invalidar_cache: bool = False) -> None:
+    """
+    Recalcula os prazos absolutos (prazo_resposta_em / prazo_resolucao_em) dos
+    chamados abertos após mudança de configuração de SLA, horário comercial ou feriado.
+    """
+    from ti.services.sla_deadlines import SLADeadlines
+
+    # Configurações/horários/feriados em memória: nova versão antes de recalcular
+    invalidar_sla(db)
+    if invalidar_cache:
+        try:
+            SLACacheManager.invalidate_all_sla(db)
+        except Exception as e:
+            print(f"[SLA] Erro ao invalidar cache: {e}")
+    SLADeadlines.recalcular_seguro(db, prioridade=prioridade)
+
 
 @router.get("/config", response_model=list[SLAConfigurationOut])
-def listar_sla_config(db: Session = Depends(get_db)):
+def listar_sla_config(request: Request, db: Session = Depends(get_db)):
     try:
-        try:
-            SLAConfiguration.__table__.create(bind=engine, checkfirst=True)
-        except Exception:
-            pass
-        return db.query(SLAConfiguration).order_by(SLAConfiguration.prioridade.asc()).all()
+        configs, etag = registro.obter(db, "sla_config")
+        return resposta_referencia(
+            request,
+            [SLAConfigurationOut.model_validate(c).model_dump(mode="json") for c in configs],
+            etag,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar configurações de SLA: {e}")
 
@@ -82,6 +111,7 @@ def criar_sla_config(payload: SLAConfigurationCreate, db: Session = Depends(get_
             # Atualiza referência no banco para refresh
             config = result.data
             db.refresh(config)
+            _atualizar_prazos_sla(db, prioridade=config.prioridade)
             return config
         else:
             raise HTTPException(status_code=500, detail=result.error)
@@ -136,6 +166,7 @@ def atualizar_sla_config(
         if result.success:
             config = result.data
             db.refresh(config)
+            _atualizar_prazos_sla(db, prioridade=config.prioridade)
             return config
         else:
             raise HTTPException(status_code=500, detail=result.error)
@@ -158,8 +189,10 @@ def deletar_sla_config(config_id: int, db: Session = Depends(get_db)):
         if not config:
             raise HTTPException(status_code=404, detail="Configuração de SLA não encontrada")
 
+        prioridade = config.prioridade
         db.delete(config)
         db.commit()
+        _atualizar_prazos_sla(db, prioridade=prioridade, invalidar_cache=True)
         return {"ok": True}
     except HTTPException:
         raise
@@ -168,13 +201,17 @@ def deletar_sla_config(config_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/business-hours", response_model=list[SLABusinessHoursOut])
-def listar_business_hours(db: Session = Depends(get_db)):
-    try:
-        try:
-            SLABusinessHours.__table__.create(bind=engine, checkfirst=True)
-        except Exception:
-            pass
-        return db.query(SLABusinessHours).order_by(SLABusinessHours.dia_semana.asc()).all()
+def listar_business_hours(request: Request, db: Session = Depends(get_db)):
+    try:
+        horarios, etag = registro.obter(db, "business_hours")
+        return resposta_referencia(
+            request,
+            [
+                SLABusinessHoursOut.model_validate(bh).model_dump(mode="json")
+                for bh in sorted(horarios, key=lambda bh: bh.dia_semana)
+            ],
+            etag,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar horários comerciais: {e}")
 
@@ -207,6 +244,7 @@ def criar_business_hours(payload: SLABusinessHoursCreate, db: Session = Depends(
         db.add(bh)
         db.commit()
         db.refresh(bh)
+        _atualizar_prazos_sla(db, invalidar_cache=True)
         return bh
     except HTTPException:
         raise
@@ -238,6 +276,7 @@ def atualizar_business_hours(
         db.add(bh)
         db.commit()
         db.refresh(bh)
+        _atualizar_prazos_sla(db, invalidar_cache=True)
         return bh
     except HTTPException:
         raise
@@ -259,6 +298,7 @@ def deletar_business_hours(bh_id: int, db: Session = Depends(get_db)):
 
         db.delete(bh)
         db.commit()
+        _atualizar_prazos_sla(db, invalidar_cache=True)
         return {"ok": True}
     except HTTPException:
         raise
@@ -289,6 +329,100 @@ def obter_sla_status_chamado(chamado_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erro ao obter status de SLA: {e}")
 
 
+@router.get("/timer/status")
+def status_timer_prazos():
+    """Estado do temporizador de prazos deste worker (eventos agendados, disparos)"""
+    from ti.services.sla_deadline_timer import get_deadline_timer
+
+    return get_deadline_timer().status()
+
+
+@router.get("/vencidos/contagem")
+def contar_chamados_vencidos(horas_proximo: float = 4, db: Session = Depends(get_db)):
+    """
+    Contagem de chamados vencidos e próximos a vencer (resposta e resolução).
+    Consulta por intervalo nos prazos gravados no chamado (indexados).
+    """
+    try:
+        from ti.services.sla_deadlines import SLADeadlines
+
+        return SLADeadlines.contagem(db, horas_proximo=horas_proximo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao contar chamados vencidos: {e}")
+
+
+@router.get("/vencidos")
+def listar_chamados_vencidos(
+    tipo: str = "resolucao",
+    proximos_horas: float | None = None,
+    limite: int = 100,
+    db: Session = Depends(get_db)
+):
+    """
+    Lista chamados com SLA vencido (tipo=resposta|resolucao).
+    Com ?proximos_horas=N lista os que vencem nas próximas N horas.
+    """
+    if tipo not in ("resposta", "resolucao"):
+        raise HTTPException(status_code=400, detail="tipo deve ser 'resposta' ou 'resolucao'")
+
+    try:
+        from ti.services.sla_deadlines import SLADeadlines
+
+        if proximos_horas is not None:
+            query = SLADeadlines.query_proximos_vencer(db, tipo, proximos_horas)
+        else:
+            query = SLADeadlines.query_vencidos(db, tipo)
+
+        coluna = Chamado.prazo_resposta_em if tipo == "resposta" else Chamado.prazo_resolucao_em
+        chamados = query.order_by(coluna.asc()).limit(max(1, min(limite, 500))).all()
+
+        return [
+            {
+                "id": ch.id,
+                "codigo": ch.codigo,
+                "status": ch.status,
+                "prioridade": ch.prioridade,
+                "data_abertura": ch.data_abertura.isoformat() if ch.data_abertura else None,
+                "prazo_resposta_em": ch.prazo_resposta_em.isoformat() if ch.prazo_resposta_em else None,
+                "prazo_resolucao_em": ch.prazo_resolucao_em.isoformat() if ch.prazo_resolucao_em else None,
+            }
+            for ch in chamados
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar chamados vencidos: {e}")
+
+
+@router.post("/status/batch", response_model=dict)
+def obter_sla_status_batch(payload: SLAStatusBatchRequest, db: Session = Depends(get_db)):
+    """
+    Status de SLA de vários chamados em uma única chamada.
+
+    Configurações, horários comerciais e históricos são carregados uma vez
+    para todo o lote. Retorna os status indexados pelo id do chamado.
+    """
+    ids = list(dict.fromkeys(payload.chamado_ids))
+    if len(ids) > SLA_STATUS_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {SLA_STATUS_BATCH_MAX} chamados por requisição"
+        )
+
+    try:
+        chamados = db.query(Chamado).filter(
+            Chamado.id.in_(ids),
+            Chamado.deletado_em.is_(None)
+        ).all() if ids else []
+
+        statuses = SLACalculator.get_sla_status_many(db, chamados)
+
+        return {
+            "statuses": {str(chamado_id): status for chamado_id, status in statuses.items()},
+            "nao_encontrados": [chamado_id for chamado_id in ids if chamado_id not in statuses],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao obter status de SLA: {e}")
+
+
 @router.get("/historico/{chamado_id}", response_model=list[HistoricoSLAOut])
 def obter_historico_sla(chamado_id: int, db: Session = Depends(get_db)):
     try:
@@ -306,200 +440,40 @@ def obter_historico_sla(chamado_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erro ao obter histórico de SLA: {e}")
 
 
-@router.post("/sync/todos-chamados")
-def sincronizar_todos_chamados(db: Session = Depends(get_db)):
+@router.post("/sync/todos-chamados", status_code=202)
+def sincronizar_todos_chamados():
     """
-    Sincroniza todos os chamados existentes com a tabela de hist��rico de SLA.
+    Sincroniza todos os chamados existentes com a tabela de histórico de SLA.
     Operação atômica: ou sincroniza tudo ou não sincroniza nada.
-    """
-    from ti.services.sla_transaction_manager import SLATransactionManager
 
+    Roda em segundo plano pela fila de jobs: responde 202 com o id da
+    execução (progresso e resultado em /jobs/execucoes/{run_id}).
+    """
     try:
-        try:
-            HistoricoSLA.__table__.create(bind=engine, checkfirst=True)
-            Chamado.__table__.create(bind=engine, checkfirst=True)
-        except Exception:
-            pass
-
-        def _sincronizar_impl(db_session: Session) -> dict:
-            """Implementa��ão da sincronização"""
-            stats = {
-                "total_chamados": 0,
-                "sincronizados": 0,
-                "atualizados": 0,
-                "erros": 0,
-            }
-
-            chamados = db_session.query(Chamado).all()
-            stats["total_chamados"] = len(chamados)
-
-            for chamado in chamados:
-                # Verifica se já existe histórico para este chamado
-                existing = db_session.query(HistoricoSLA).filter(
-                    HistoricoSLA.chamado_id == chamado.id
-                ).first()
-
-                sla_status = SLACalculator.get_sla_status(db_session, chamado)
-
-                # Extrai métricas de resposta e resolução
-                resposta_metric = sla_status.get("resposta_metric")
-                resolucao_metric = sla_status.get("resolucao_metric")
-
-                tempo_resposta_horas = resposta_metric.get("tempo_decorrido_horas") if resposta_metric else None
-                limite_sla_resposta_horas = resposta_metric.get("tempo_limite_horas") if resposta_metric else None
-                tempo_resolucao_horas = resolucao_metric.get("tempo_decorrido_horas") if resolucao_metric else None
-                limite_sla_horas = resolucao_metric.get("tempo_limite_horas") if resolucao_metric else None
-
-                if existing:
-                    # Atualiza registro existente
-                    existing.status_novo = chamado.status
-                    existing.tempo_resposta_horas = tempo_resposta_horas
-                    existing.limite_sla_resposta_horas = limite_sla_resposta_horas
-                    existing.tempo_resolucao_horas = tempo_resolucao_horas
-                    existing.limite_sla_horas = limite_sla_horas
-                    existing.status_sla = sla_status.get("status_geral")
-                    db_session.add(existing)
-                    stats["atualizados"] += 1
-                else:
-                    # Cria novo registro
-                    historico = HistoricoSLA(
-                        chamado_id=chamado.id,
-                        usuario_id=None,
-                        acao="sincronizacao",
-                        status_anterior=None,
-                        status_novo=chamado.status,
-                        tempo_resposta_horas=tempo_resposta_horas,
-                        limite_sla_resposta_horas=limite_sla_resposta_horas,
-                        tempo_resolucao_horas=tempo_resolucao_horas,
-                        limite_sla_horas=limite_sla_horas,
-                        status_sla=sla_status.get("status_geral"),
-                        criado_em=chamado.data_abertura or now_brazil_naive(),
-                    )
-                    db_session.add(historico)
-                    stats["sincronizados"] += 1
-
-            return stats
-
-        # Executa com transação atômica
-        result = SLATransactionManager.execute_with_lock(
-            db,
-            "historico_sla",
-            _sincronizar_impl
-        )
-
-        if result.success:
-            return result.data
-        else:
-            raise HTTPException(status_code=500, detail=result.error)
-
-    except HTTPException:
-        raise
+        run_id, deduplicado = get_job_queue().submit(TAREFA_SYNC_TODOS)
+        return resposta_enfileirada(TAREFA_SYNC_TODOS, run_id, deduplicado)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao sincronizar chamados: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar sincronização de chamados: {e}")
 
 
-@router.post("/recalcular/painel")
-def recalcular_sla_painel(db: Session = Depends(get_db)):
+@router.post("/recalcular/painel", status_code=202)
+def recalcular_sla_painel():
     """
     Recalcula todos os SLAs quando o painel administrativo é acessado.
     Operação atômica: ou recalcula tudo ou não recalcula nada.
-    """
-    from ti.services.sla_transaction_manager import SLATransactionManager
 
+    Roda em segundo plano pela fila de jobs; aberturas simultâneas do painel
+    recebem o id da mesma execução (deduplicado=true).
+    """
     try:
-        try:
-            HistoricoSLA.__table__.create(bind=engine, checkfirst=True)
-            Chamado.__table__.create(bind=engine, checkfirst=True)
-        except Exception:
-            pass
-
-        def _recalcular_impl(db_session: Session) -> dict:
-            """Implementação do recálculo"""
-            stats = {
-                "total_recalculados": 0,
-                "em_dia": 0,
-                "vencidos": 0,
-                "em_andamento": 0,
-                "congelados": 0,
-                "erros": 0,
-            }
-
-            chamados = db_session.query(Chamado).filter(
-                and_(
-                    Chamado.status != "Cancelado",
-                    Chamado.status != "Concluído"
-                )
-            ).all()
-
-            for chamado in chamados:
-                sla_status = SLACalculator.get_sla_status(db_session, chamado)
-
-                # Extrai métricas de resposta e resolução
-                resposta_metric = sla_status.get("resposta_metric")
-                resolucao_metric = sla_status.get("resolucao_metric")
-
-                tempo_resposta_horas = resposta_metric.get("tempo_decorrido_horas") if resposta_metric else None
-                limite_sla_resposta_horas = resposta_metric.get("tempo_limite_horas") if resposta_metric else None
-                tempo_resolucao_horas = resolucao_metric.get("tempo_decorrido_horas") if resolucao_metric else None
-                limite_sla_horas = resolucao_metric.get("tempo_limite_horas") if resolucao_metric else None
-
-                # Atualiza ou cria histórico com cálculo atual
-                existing = db_session.query(HistoricoSLA).filter(
-                    HistoricoSLA.chamado_id == chamado.id
-                ).order_by(HistoricoSLA.criado_em.desc()).first()
-
-                if existing:
-                    existing.tempo_resposta_horas = tempo_resposta_horas
-                    existing.limite_sla_resposta_horas = limite_sla_resposta_horas
-                    existing.tempo_resolucao_horas = tempo_resolucao_horas
-                    existing.limite_sla_horas = limite_sla_horas
-                    existing.status_sla = sla_status.get("status_geral")
-                    db_session.add(existing)
-                else:
-                    historico = HistoricoSLA(
-                        chamado_id=chamado.id,
-                        usuario_id=None,
-                        acao="recalculo_painel",
-                        status_novo=chamado.status,
-                        tempo_resposta_horas=tempo_resposta_horas,
-                        limite_sla_resposta_horas=limite_sla_resposta_horas,
-                        tempo_resolucao_horas=tempo_resolucao_horas,
-                        limite_sla_horas=limite_sla_horas,
-                        status_sla=sla_status.get("status_geral"),
-                        criado_em=now_brazil_naive(),
-                    )
-                    db_session.add(historico)
-
-                stats["total_recalculados"] += 1
-
-                status_sla = sla_status.get("status_geral", "sem_sla")
-                if status_sla in ["cumprido", "dentro_prazo"]:
-                    stats["em_dia"] += 1
-                elif status_sla in ["violado", "vencido_ativo"]:
-                    stats["vencidos"] += 1
-                elif status_sla == "proximo_vencer":
-                    stats["em_andamento"] += 1
-                elif status_sla == "pausado":
-                    stats["congelados"] += 1
-
-            return stats
-
-        # Executa com transação atômica
-        result = SLATransactionManager.execute_with_lock(
-            db,
-            "historico_sla",
-            _recalcular_impl
-        )
-
-        if result.success:
-            return result.data
-        else:
-            raise HTTPException(status_code=500, detail=result.error)
-
-    except HTTPException:
-        raise
+        run_id, deduplicado = get_job_queue().submit(TAREFA_RECALCULAR_PAINEL)
+        return resposta_enfileirada(TAREFA_RECALCULAR_PAINEL, run_id, deduplicado)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao recalcular SLAs: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar recálculo de SLAs: {e}")
 
 
 @router.post("/cache/invalidate-chamado/{chamado_id}")
@@ -523,6 +497,7 @@ def invalidar_todos_caches(db: Session = Depends(get_db)):
     """
     try:
         SLACacheManager.invalidate_all_sla(db)
+        invalidar_sla(db)
         return {"ok": True, "message": "Todos os caches de SLA foram invalidados"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao invalidar cache: {e}")
@@ -573,6 +548,10 @@ def preaquecer_cache(db: Session = Depends(get_db)):
 def obter_stats_cache(db: Session = Depends(get_db)):
     """
     Retorna estatísticas do sistema de cache.
+
+    "stampede" traz, por tipo de chave e para o worker que atendeu, hits,
+    misses, valores stale servidos, requisições que esperaram o cálculo de
+    outra thread (single-flight) e refreshes em segundo plano.
     """
     try:
         stats = SLACacheManager.get_stats(db)
@@ -582,7 +561,8 @@ def obter_stats_cache(db: Session = Depends(get_db)):
             "error": str(e),
             "memory_entries": 0,
             "database_entries": 0,
-            "expired_in_db": 0
+            "expired_in_db": 0,
+            "stampede": SLACacheManager.get_stampede_stats(),
         }
 
 
@@ -615,6 +595,7 @@ def resetar_todo_cache(db: Session = Depends(get_db)):
         db.commit()
 
         SLACacheManager.invalidate_all_sla(db)
+        invalidar_sla(db)
 
         return {
             "ok": True,
@@ -625,8 +606,8 @@ def resetar_todo_cache(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Erro ao resetar cache: {e}")
 
 
-@router.post("/reset-and-recalculate")
-def resetar_sla_completo(db: Session = Depends(get_db)):
+@router.post("/reset-and-recalculate", status_code=202)
+def resetar_sla_completo():
     """
     Reseta COMPLETAMENTE o SLA:
     1. Limpa todo o cache de métricas (memória + banco)
@@ -635,55 +616,19 @@ def resetar_sla_completo(db: Session = Depends(get_db)):
     4. Próximos cálculos ignorarão dados anteriores ao reset
 
     Apenas chamados APÓS este reset serão considerados nos próximos cálculos P90.
+    Roda em segundo plano pela fila de jobs (202 com o id da execução).
     """
     try:
-        from ti.models.metrics_cache import MetricsCacheDB
-
-        agora = now_brazil_naive()
-
-        print(f"\n[SLA RESET] Iniciando reset completo do sistema SLA")
-
-        # 1. Invalida TUDO em memória primeiro
-        print(f"[SLA RESET] Invalidando cache em memória...")
-        SLACacheManager.invalidate_all_sla(db)
-
-        # 2. Limpa TUDO do banco de dados
-        print(f"[SLA RESET] Limpando banco de dados...")
-        db.query(MetricsCacheDB).delete()
-
-        # 3. Registra o reset em todas as configurações de SLA
-        print(f"[SLA RESET] Registrando data de reset nas configurações...")
-        configs = db.query(SLAConfiguration).all()
-        for config in configs:
-            config.ultimo_reset_em = agora
-            config.atualizado_em = agora
-            print(f"  - {config.prioridade}: reset em {agora.isoformat()}")
-            db.add(config)
-
-        # 4. Commit de tudo atomicamente
-        db.commit()
-
-        print(f"[SLA RESET] ✅ Reset concluído com sucesso!")
-
-        return {
-            "ok": True,
-            "message": "Sistema de SLA foi completamente resetado",
-            "reset_em": agora.isoformat(),
-            "proximos_calculos": "Apenas chamados posteriores a este reset serão considerados",
-            "configuracoes_atualizadas": len(configs),
-            "cache_limpo": True,
-            "memoria_limpa": True
-        }
+        run_id, deduplicado = get_job_queue().submit(TAREFA_RESET)
+        return resposta_enfileirada(TAREFA_RESET, run_id, deduplicado)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        print(f"[SLA RESET] ❌ Erro ao resetar SLA: {e}")
-        import traceback
-        traceback.print_exc()
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Erro ao resetar SLA: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar reset de SLA: {e}")
 
 
-@router.post("/recalcular/p90")
-def recalcular_sla_p90(db: Session = Depends(get_db)):
+@router.post("/recalcular/p90", status_code=202)
+def recalcular_sla_p90(dry_run: bool = False):
     """
     Recalcula SLA baseado em P90 (90º percentil) dos últimos 30 dias.
 
@@ -693,21 +638,23 @@ def recalcular_sla_p90(db: Session = Depends(get_db)):
     3. Calcula tempo de resolução (até concluído/cancelado)
     4. Calcula P90 para ambos
     5. Atualiza configurações de SLA com os novos tempos
+
+    Com ?dry_run=true apenas retorna as configurações propostas, sem gravar.
+    Roda em segundo plano pela fila de jobs: as configurações calculadas ficam
+    no resultado da execução (/jobs/execucoes/{run_id}).
     """
     try:
-        from ti.services.sla_p90_calculator import SLAP90Calculator
-
-        resultado = SLAP90Calculator.recalcular_sla_por_prioridade(db)
-
-        return resultado
+        params = {"dry_run": True} if dry_run else None
+        run_id, deduplicado = get_job_queue().submit(TAREFA_P90, params)
+        return resposta_enfileirada(JobQueue.chave(TAREFA_P90, params), run_id, deduplicado)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Erro ao recalcular SLA com P90: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar recálculo de SLA com P90: {e}")
 
 
-@router.post("/recalcular/p90-incremental")
-def recalcular_sla_p90_incremental(db: Session = Depends(get_db)):
+@router.post("/recalcular/p90-incremental", status_code=202)
+def recalcular_sla_p90_incremental():
     """
     Recalcula SLA baseado em P90 de forma INCREMENTAL.
 
@@ -719,17 +666,15 @@ def recalcular_sla_p90_incremental(db: Session = Depends(get_db)):
     5. Armazena novamente no cache
 
     Muito mais eficiente que recalcular tudo do zero!
+    Roda em segundo plano pela fila de jobs (202 com o id da execução).
     """
     try:
-        from ti.services.sla_p90_incremental import SLAP90Incremental
-
-        resultado = SLAP90Incremental.recalcular_incremental(db)
-
-        return resultado
+        run_id, deduplicado = get_job_queue().submit(TAREFA_P90_INCREMENTAL)
+        return resposta_enfileirada(TAREFA_P90_INCREMENTAL, run_id, deduplicado)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Erro ao recalcular SLA com P90 incremental: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar recálculo de SLA com P90 incremental: {e}")
 
 
 @router.get("/validate/config/{config_id}")
@@ -796,14 +741,15 @@ def validar_dados_chamado(chamado_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/feriados", response_model=list[SLAFeriadoOut])
-def listar_feriados(db: Session = Depends(get_db)):
-    """Lista todos os feriados cadastrados"""
-    try:
-        try:
-            SLAFeriado.__table__.create(bind=engine, checkfirst=True)
-        except Exception:
-            pass
-        return db.query(SLAFeriado).order_by(SLAFeriado.data.asc()).all()
+def listar_feriados(request: Request, db: Session = Depends(get_db)):
+    """Lista todos os feriados cadastrados (registro em memória, com ETag)"""
+    try:
+        feriados, etag = registro.obter(db, "feriados")
+        return resposta_referencia(
+            request,
+            [SLAFeriadoOut.model_validate(f).model_dump(mode="json") for f in feriados],
+            etag,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar feriados: {e}")
 
@@ -837,6 +783,7 @@ def criar_feriado(payload: SLAFeriadoCreate, db: Session = Depends(get_db)):
         db.add(feriado)
         db.commit()
         db.refresh(feriado)
+        _atualizar_prazos_sla(db, invalidar_cache=True)
         return feriado
     except HTTPException:
         raise
@@ -872,6 +819,7 @@ def atualizar_feriado(
         db.add(feriado)
         db.commit()
         db.refresh(feriado)
+        _atualizar_prazos_sla(db, invalidar_cache=True)
         return feriado
     except HTTPException:
         raise
@@ -894,6 +842,7 @@ def deletar_feriado(feriado_id: int, db: Session = Depends(get_db)):
 
         db.delete(feriado)
         db.commit()
+        _atualizar_prazos_sla(db, invalidar_cache=True)
         return {"ok": True}
     except HTTPException:
         raise
@@ -928,97 +877,69 @@ def obter_tempo_medio_resolucao(db: Session = Depends(get_db)):
     Calcula baseado em horas de negócio, descontando períodos em 'Em análise'.
     """
     try:
-        from datetime import datetime, timedelta
-        from sqlalchemy import and_
+        from sqlalchemy import and_, func
         from ti.models.chamado import Chamado
-        from ti.services.sla import SLACalculator
 
         agora = now_brazil_naive()
         ontem = agora - timedelta(hours=24)
         mes_inicio = agora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-        # Últimas 24h
-        chamados_24h = db.query(Chamado).filter(
-            and_(
-                Chamado.data_conclusao.isnot(None),
-                Chamado.data_conclusao >= ontem,
-                Chamado.data_abertura.isnot(None),
-            )
-        ).all()
-
-        tempos_24h = []
-        for chamado in chamados_24h:
-            try:
-                tempo = SLACalculator.calculate_business_hours_excluding_paused(
-                    chamado.id,
-                    chamado.data_abertura,
-                    chamado.data_conclusao,
-                    db
-                )
-                if 0 < tempo < 168:  # Sanidade: 0 a 7 dias
-                    tempos_24h.append(tempo)
-            except Exception:
-                pass
-
-        tempo_medio_24h = sum(tempos_24h) / len(tempos_24h) if tempos_24h else 0
-
-        # Mês atual
-        chamados_mes = db.query(Chamado).filter(
-            and_(
-                Chamado.data_conclusao.isnot(None),
-                Chamado.data_conclusao >= mes_inicio,
-                Chamado.data_abertura.isnot(None),
-            )
-        ).all()
-
-        tempos_mes = []
-        for chamado in chamados_mes:
-            try:
-                tempo = SLACalculator.calculate_business_hours_excluding_paused(
-                    chamado.id,
-                    chamado.data_abertura,
-                    chamado.data_conclusao,
-                    db
+        def _media(inicio, maximo_horas):
+            # Durações congeladas no encerramento (ver ti.services.sla_duracoes)
+            media, total = db.query(
+                func.avg(Chamado.tempo_resolucao_horas),
+                func.count(Chamado.id),
+            ).filter(
+                and_(
+                    Chamado.data_conclusao.isnot(None),
+                    Chamado.data_conclusao >= inicio,
+                    Chamado.data_abertura.isnot(None),
+                    Chamado.tempo_resolucao_horas > 0,
+                    Chamado.tempo_resolucao_horas < maximo_horas,
                 )
-                if 0 < tempo < 720:  # Sanidade: 0 a 30 dias
-                    tempos_mes.append(tempo)
-            except Exception:
-                pass
+            ).one()
+            return float(media or 0), total
+
+        # Últimas 24h (sanidade: 0 a 7 dias)
+        tempo_medio_24h, total_24h = _media(ontem, 168)
 
-        tempo_medio_mes = sum(tempos_mes) / len(tempos_mes) if tempos_mes else 0
+        # Mês atual (sanidade: 0 a 30 dias)
+        tempo_medio_mes, total_mes = _media(mes_inicio, 720)
 
         return {
             "tempo_medio_resolucao_24h": round(tempo_medio_24h, 2),
             "tempo_medio_resolucao_mes": round(tempo_medio_mes, 2),
-            "chamados_24h": len(tempos_24h),
-            "chamados_mes": len(tempos_mes),
+            "chamados_24h": total_24h,
+            "chamados_mes": total_mes,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter tempo médio de resolução: {e}")
 
 
 @router.post("/scheduler/recalcular-agora")
-def recalcular_sla_agora(db: Session = Depends(get_db)):
+def recalcular_sla_agora():
     """
     Força a recalculação imediata de SLA de todos os chamados.
     Útil para testes ou sincronização manual.
+
+    A recalculação roda em segundo plano (em lotes, retomável); o retorno traz
+    o id da execução para acompanhar o progresso em /jobs/execucoes/{run_id}.
     """
     try:
-        from ti.scripts.recalculate_sla_complete import SLARecalculator
+        from ti.services.job_scheduler import get_job_scheduler
+        from ti.services.sla_scheduler import JOB_RECALCULO_SLA
 
-        recalculator = SLARecalculator(db)
-        stats = recalculator.recalculate_all(verbose=False)
-        db.commit()
+        run_id = get_job_scheduler().trigger(JOB_RECALCULO_SLA)
 
         return {
             "ok": True,
-            "recalculados": stats["recalculados"],
-            "com_erro": stats["com_erro"],
-            "tempo_medio_resposta_horas": round(stats["tempo_medio_resposta_horas"], 2),
-            "tempo_medio_resolucao_horas": round(stats["tempo_medio_resolucao_horas"], 2),
+            "job": JOB_RECALCULO_SLA,
+            "run_id": run_id,
+            "status_url": f"/api/jobs/execucoes/{run_id}",
         }
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao recalcular SLA: {e}")
 
 
@@ -1029,122 +950,9 @@ def analisar_p90_recomendado(db: Session = Depends(get_db)):
     Mostra quanto a conformidade melhoraria se usar P90 + 15% ao invés do SLA fixo.
     """
     try:
-        from datetime import datetime, timedelta
-
-        agora = now_brazil_naive()
-        data_inicio = agora - timedelta(days=30)
-
-        configs = db.query(SLAConfiguration).filter(
-            SLAConfiguration.ativo == True
-        ).order_by(SLAConfiguration.prioridade.asc()).all()
-
-        analise = {
-            "data_analise": agora.isoformat(),
-            "periodo": f"{data_inicio.isoformat()} a {agora.isoformat()}",
-            "prioridades": {}
-        }
-
-        for config in configs:
-            prioridade = config.prioridade
-
-            print(f"\n[P90 ANALYSIS] Analisando prioridade: {prioridade}")
-            print(f"  - SLA configurado: {config.tempo_resolucao_horas}h")
-
-            # Busca APENAS chamados concluídos/cancelados dessa prioridade
-            # Se houve reset, apenas chamados posteriores ao reset
-            query_filters = [
-                Chamado.prioridade == prioridade,
-                Chamado.data_abertura >= data_inicio,
-                Chamado.data_abertura <= agora,
-                Chamado.deletado_em.is_(None),
-                Chamado.status.in_(["Concluído", "Cancelado"]),
-                or_(Chamado.data_conclusao.isnot(None), Chamado.cancelado_em.isnot(None))
-            ]
-
-            # Se houve reset, ignora chamados abertos antes do reset
-            if config.ultimo_reset_em:
-                print(f"  - Filtrando apenas chamados posteriores ao reset ({config.ultimo_reset_em})")
-                query_filters.append(Chamado.data_abertura >= config.ultimo_reset_em)
-
-            chamados = db.query(Chamado).filter(and_(*query_filters)).all()
-
-            print(f"  - Chamados encontrados: {len(chamados)}")
-
-            if len(chamados) < 2:
-                print(f"  - ⚠️ Chamados insuficientes, pulando...")
-                continue
-
-            # Calcula tempos de resolução
-            tempos = []
-            for chamado in chamados:
-                try:
-                    if chamado.data_abertura:
-                        data_fim = chamado.data_conclusao or chamado.cancelado_em
-                        if data_fim:
-                            from ti.services.sla import SLACalculator
-                            tempo = SLACalculator.calculate_business_hours_excluding_paused(
-                                chamado.id,
-                                chamado.data_abertura,
-                                data_fim,
-                                db
-                            )
-                            # Sanidade: 0-720 horas (30 dias)
-                            if 0 < tempo < 720:
-                                tempos.append(tempo)
-                except Exception as e:
-                    print(f"    Erro ao processar chamado {chamado.id}: {e}")
-                    pass
-
-            print(f"  - Tempos válidos: {len(tempos)}")
-
-            if len(tempos) < 2:
-                print(f"  - ⚠️ Tempos insuficientes, pulando...")
-                continue
-
-            # Calcula P90
-            tempos_sorted = sorted(tempos)
-            p90_index = int(0.9 * (len(tempos_sorted) - 1))
-            if p90_index >= len(tempos_sorted):
-                p90_index = len(tempos_sorted) - 1
-
-            p90 = tempos_sorted[p90_index]
-            margem = 1.15
-            p90_com_margem = p90 * margem
-            media = sum(tempos) / len(tempos)
-            minimo = min(tempos)
-            maximo = max(tempos)
-
-            print(f"  - Mínimo: {minimo:.1f}h")
-            print(f"  - Média: {media:.1f}h")
-            print(f"  - P90: {p90:.1f}h")
-            print(f"  - Máximo: {maximo:.1f}h")
-
-            # Calcula conformidade com SLA atual
-            dentro_atual = sum(1 for t in tempos if t <= config.tempo_resolucao_horas)
-            conformidade_atual = int((dentro_atual / len(tempos)) * 100)
-
-            # Calcula conformidade com P90
-            dentro_p90 = sum(1 for t in tempos if t <= p90_com_margem)
-            conformidade_p90 = int((dentro_p90 / len(tempos)) * 100)
-
-            print(f"  - Conformidade SLA atual ({config.tempo_resolucao_horas}h): {conformidade_atual}%")
-            print(f"  - Conformidade P90 ({int(p90_com_margem)}h): {conformidade_p90}%")
-            print(f"  - Melhoria: +{conformidade_p90 - conformidade_atual}%")
-
-            analise["prioridades"][prioridade] = {
-                "sla_atual": int(config.tempo_resolucao_horas),
-                "conformidade_atual": conformidade_atual,
-                "chamados_analisados": len(tempos),
-                "tempo_minimo": round(minimo, 2),
-                "tempo_medio": round(media, 2),
-                "tempo_maximo": round(maximo, 2),
-                "p90": round(p90, 2),
-                "p90_recomendado": int(p90_com_margem),
-                "conformidade_com_p90": conformidade_p90,
-                "melhoria": conformidade_p90 - conformidade_atual
-            }
+        from ti.services.sla_p90_calculator import SLAP90Calculator
 
-        return analise
+        return SLAP90Calculator.analisar_p90(db)
     except Exception as e:
         import traceback
         traceback.print_exc()
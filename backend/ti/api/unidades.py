@@ -1,97 +1,18 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from core.db import get_db, engine
 from ti.schemas.unidade import UnidadeCreate, UnidadeOut
+from ti.services.referencias import registro, resposta_referencia
 
 router = APIRouter(prefix="/unidades", tags=["TI - Unidades"])
 
 @router.get("", response_model=list[UnidadeOut])
-def listar_unidades(db: Session = Depends(get_db)):
-    from ..models import Unidade, Chamado
+def listar_unidades(request: Request, db: Session = Depends(get_db)):
+    """Unidades do registro em memória (ti/services/referencias.py), com ETag"""
     try:
-        try:
-            Unidade.__table__.create(bind=engine, checkfirst=True)
-        except Exception:
-            pass
-
-        # Tenta esquemas legados/plurais com e sem coluna cidade
-        queries = [
-            "SELECT id, nome, cidade FROM unidade ORDER BY nome",
-            "SELECT id, nome FROM unidade ORDER BY nome",
-            "SELECT id, unidade AS nome, cidade FROM unidade ORDER BY nome",
-            "SELECT id, unidade AS nome FROM unidade ORDER BY nome",
-            "SELECT id, nome, cidade FROM unidades ORDER BY nome",
-            "SELECT id, nome FROM unidades ORDER BY nome",
-            "SELECT id, unidade AS nome, cidade FROM unidades ORDER BY nome",
-            "SELECT id, unidade AS nome FROM unidades ORDER BY nome",
-        ]
-
-        for sql in queries:
-            try:
-                res = db.execute(text(sql))
-                fetched = res.fetchall()
-                if fetched and len(fetched) > 0:
-                    print(f"✅ Unidades query succeeded: {sql[:80]}")
-                    out = []
-                    for r in fetched:
-                        if len(r) >= 3:
-                            out.append({
-                                "id": r[0] or 0,
-                                "nome": str(r[1]).strip() if r[1] else "Sem nome",
-                                "cidade": str(r[2]).strip() if r[2] else ""
-                            })
-                        else:
-                            out.append({
-                                "id": r[0] or 0,
-                                "nome": str(r[1]).strip() if r[1] else "Sem nome",
-                                "cidade": ""
-                            })
-                    return out
-            except Exception as e:
-                print(f"⚠️  Query failed: {sql[:80]} - Error: {e}")
-                continue
-
-        print("⚠️  No results from unidade/unidades tables, trying ORM...")
-
-        # ORM padrão (caso exista classe/tabela com cidade)
-        try:
-            rows_orm = db.query(Unidade).order_by(Unidade.nome.asc()).all()
-            if rows_orm:
-                print(f"✅ Found {len(rows_orm)} unidades in ORM")
-                return [
-                    {
-                        "id": r.id,
-                        "nome": r.nome,
-                        "cidade": getattr(r, "cidade", "") or ""
-                    }
-                    for r in rows_orm
-                ]
-        except Exception as e:
-            print(f"⚠️  ORM query failed: {e}")
-            pass
-
-        # Fallback: derivar de chamados existentes
-        print("⚠️  Using fallback: extracting unidades from existing chamados...")
-        try:
-            distinct = [r[0] for r in db.query(Chamado.unidade).distinct().all() if r[0]]
-            if distinct:
-                print(f"✅ Extracted {len(distinct)} unique unidades from chamados")
-                return [
-                    {
-                        "id": idx,
-                        "nome": str(nome).strip(),
-                        "cidade": ""
-                    }
-                    for idx, nome in enumerate(sorted(distinct), 1)
-                ]
-        except Exception as e:
-            print(f"⚠️  Could not extract from chamados: {e}")
-
-        print("❌ No unidades found anywhere")
-        return []
-
+        unidades, etag = registro.obter(db, "unidades")
+        return resposta_referencia(request, unidades, etag)
     except Exception as e:
         print(f"❌ Error in listar_unidades: {e}")
         import traceback
@@ -1,7 +1,9 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from core.db import get_db, engine
+from core.senhas import LimiteTentativasError, SenhaOcupadaError
 from ti.schemas.user import UserCreate, UserCreatedOut, UserAvailability, UserOut
 from ti.services.users import (
     criar_usuario as service_criar,
@@ -11,37 +13,22 @@ from ti.services.users import (
     regenerate_password,
     set_block_status,
     delete_user,
-    list_blocked_users,
+    listar_usuarios_cache,
+    usuarios_por_setor,
+    usuarios_por_bi_subcategory,
+    invalidar_listagem,
 )
 
 router = APIRouter(prefix="/usuarios", tags=["TI - Usuarios"])
 
 @router.get("", response_model=list[UserOut])
-def listar_usuarios(db: Session = Depends(get_db)):
+def listar_usuarios(request: Request, db: Session = Depends(get_db)):
+    """
+    Lista todos os usuários (uma consulta com user_setor/user_bi_subcategory),
+    em cache por versão e com ETag: If-None-Match igual responde 304.
+    """
     try:
         from ..models import User
-        import json
-        # helper to compute setores list
-        def compute_setores(u) -> list[str]:
-            try:
-                if getattr(u, "_setores", None):
-                    raw = json.loads(getattr(u, "_setores"))
-                    return [str(x).encode('utf-8', 'ignore').decode('utf-8') if x is not None else "" for x in raw]
-                if getattr(u, "setor", None):
-                    return [str(getattr(u, "setor"))]
-            except Exception:
-                pass
-            return []
-
-        # helper to compute bi_subcategories list
-        def compute_bi_subcategories(u) -> list[str] | None:
-            try:
-                if getattr(u, "_bi_subcategories", None):
-                    raw = json.loads(getattr(u, "_bi_subcategories"))
-                    return [str(x) if x is not None else "" for x in raw]
-            except Exception:
-                pass
-            return None
 
         # cria tabela se não existir
         try:
@@ -51,29 +38,13 @@ def listar_usuarios(db: Session = Depends(get_db)):
 
         # pega todos os usuários
         try:
-            users = db.query(User).order_by(User.id.desc()).all()
-            rows = []
-            for u in users:
-                if u.bloqueado is None:
-                    u.bloqueado = False
-                setores_list = compute_setores(u)
-                bi_subcategories_list = compute_bi_subcategories(u)
-                rows.append({
-                    "id": u.id,
-                    "nome": u.nome,
-                    "sobrenome": u.sobrenome,
-                    "usuario": u.usuario,
-                    "email": u.email,
-                    "nivel_acesso": u.nivel_acesso,
-                    "setor": setores_list[0] if setores_list else None,
-                    "setores": setores_list,
-                    "bi_subcategories": bi_subcategories_list,
-                    "bloqueado": bool(u.bloqueado),
-                    "session_revoked_at": u.session_revoked_at.isoformat() if getattr(u, 'session_revoked_at', None) else None,
-                })
-            return rows
-        except Exception:
-            pass
+            rows, etag = listar_usuarios_cache(db)
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+            if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+                return Response(status_code=304, headers=headers)
+            return JSONResponse(content=rows, headers=headers)
+        except Exception as e:
+            print(f"[API] listar_usuarios: falha na listagem normalizada: {e}")
 
         # fallback tabela legada "usuarios"
         from sqlalchemy import text
@@ -113,6 +84,8 @@ def criar_usuario(payload: UserCreate, db: Session = Depends(get_db)):
         except Exception:
             pass
         return service_criar(db, payload)
+    except SenhaOcupadaError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -136,51 +109,34 @@ def generate_password_endpoint(length: int = 6):
 @router.get("/blocked", response_model=list[UserOut])
 def listar_bloqueados(db: Session = Depends(get_db)):
     try:
-        import json
-        from ..models import User
-        users = list_blocked_users(db)
-        rows = []
-        for u in users:
-            try:
-                if u.bloqueado is None:
-                    u.bloqueado = True
-            except Exception:
-                pass
-            try:
-                if getattr(u, "_setores", None):
-                    raw = json.loads(getattr(u, "_setores"))
-                    setores_list = [str(x) for x in raw if x is not None]
-                elif getattr(u, "setor", None):
-                    setores_list = [str(getattr(u, "setor"))]
-                else:
-                    setores_list = []
-            except Exception:
-                setores_list = [str(getattr(u, "setor"))] if getattr(u, "setor", None) else []
-            try:
-                bi_subcategories_list = None
-                if getattr(u, "_bi_subcategories", None):
-                    raw = json.loads(getattr(u, "_bi_subcategories"))
-                    bi_subcategories_list = [str(x) if x is not None else "" for x in raw]
-            except Exception:
-                bi_subcategories_list = None
-            rows.append({
-                "id": u.id,
-                "nome": u.nome,
-                "sobrenome": u.sobrenome,
-                "usuario": u.usuario,
-                "email": u.email,
-                "nivel_acesso": u.nivel_acesso,
-                "setor": setores_list[0] if setores_list else None,
-                "setores": setores_list,
-                "bi_subcategories": bi_subcategories_list,
-                "bloqueado": bool(u.bloqueado),
-                "session_revoked_at": u.session_revoked_at.isoformat() if getattr(u, 'session_revoked_at', None) else None,
-            })
-        return rows
+        rows, _ = listar_usuarios_cache(db)
+        return [row for row in rows if row["bloqueado"]]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar bloqueados: {e}")
 
 
+@router.get("/por-setor/{setor}", response_model=list[UserOut])
+def listar_por_setor(setor: str, db: Session = Depends(get_db)):
+    """Usuários de um setor (consulta indexada em user_setor)"""
+    try:
+        ids = {u.id for u in usuarios_por_setor(db, setor)}
+        rows, _ = listar_usuarios_cache(db)
+        return [row for row in rows if row["id"] in ids]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar usuários do setor: {e}")
+
+
+@router.get("/por-bi-subcategory/{subcategory}", response_model=list[UserOut])
+def listar_por_bi_subcategory(subcategory: str, db: Session = Depends(get_db)):
+    """Usuários com acesso a uma subcategoria de BI (consulta indexada em user_bi_subcategory)"""
+    try:
+        ids = {u.id for u in usuarios_por_bi_subcategory(db, subcategory)}
+        rows, _ = listar_usuarios_cache(db)
+        return [row for row in rows if row["id"] in ids]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar usuários da subcategoria: {e}")
+
+
 @router.put("/{user_id}", response_model=UserOut)
 def atualizar_usuario(user_id: int, payload: dict, db: Session = Depends(get_db)):
     try:
@@ -357,6 +313,8 @@ def gerar_nova_senha(user_id: int, length: int = 6, db: Session = Depends(get_db
     try:
         pwd = regenerate_password(db, user_id, length)
         return {"senha": pwd}
+    except SenhaOcupadaError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -381,6 +339,7 @@ def force_logout(user_id: int, db: Session = Depends(get_db)):
         user.session_revoked_at = ts
         db.commit()
         db.refresh(user)
+        invalidar_listagem(db)
         print(f"[API] committed session_revoked_at for user {user.id}")
         try:
             # verify value directly from DB using raw SQL to ensure commit persisted
@@ -570,15 +529,19 @@ def msal_login(payload: dict, db: Session = Depends(get_db)):
 
 
 @router.post("/login")
-def login(payload: dict, db: Session = Depends(get_db)):
+async def login(payload: dict, db: Session = Depends(get_db)):
     try:
         identifier = payload.get("identifier") or payload.get("email") or payload.get("usuario")
         senha = payload.get("senha") or payload.get("password")
         if not identifier or not senha:
             raise HTTPException(status_code=400, detail="Informe identifier e senha")
-        from ti.services.users import authenticate_user
-        user = authenticate_user(db, identifier, senha)
+        from ti.services.users import authenticate_user_async
+        user = await authenticate_user_async(db, identifier, senha)
         return user
+    except LimiteTentativasError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except SenhaOcupadaError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
     except PermissionError as e:
@@ -618,6 +581,8 @@ def change_password(user_id: int, payload: dict, db: Session = Depends(get_db)):
         from ti.services.users import change_user_password
         change_user_password(db, user_id, senha, require_change=False)
         return {"ok": True}
+    except SenhaOcupadaError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except HTTPException:
@@ -696,6 +661,8 @@ def reset_password_by_email(payload: dict, db: Session = Depends(get_db)):
             "usuario_id": user.id,
             "message": f"Senha resetada para {email}"
         }
+    except SenhaOcupadaError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except HTTPException:
         raise
     except Exception as e:
@@ -1,11 +1,15 @@
 from __future__ import annotations
 from datetime import date, datetime
-from sqlalchemy import Integer, String, Date, DateTime, Text, ForeignKey
+from sqlalchemy import Integer, String, Date, DateTime, Float, Text, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from core.db import Base
 
 class Chamado(Base):
     __tablename__ = "chamado"
+    __table_args__ = (
+        Index("idx_chamado_prazo_resposta", "prazo_resposta_em"),
+        Index("idx_chamado_prazo_resolucao", "prazo_resolucao_em"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     codigo: Mapped[str] = mapped_column(String(20), unique=True, nullable=False)
@@ -35,6 +39,16 @@ class Chamado(Base):
     usuario_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("user.id"), nullable=True)
     deletado_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
+    # Prazos absolutos de SLA (ver ti.services.sla_deadlines)
+    prazo_resposta_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    prazo_resolucao_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    # Durações em horas de negócio congeladas no encerramento (ver ti.services.sla_duracoes)
+    tempo_primeira_resposta_horas: Mapped[float | None] = mapped_column(Float, nullable=True)
+    tempo_resolucao_horas: Mapped[float | None] = mapped_column(Float, nullable=True)
+    tempo_pausado_horas: Mapped[float | None] = mapped_column(Float, nullable=True)
+    tempos_congelados_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
     anexos: Mapped[list["ChamadoAnexo"]] = relationship("ChamadoAnexo", cascade="all, delete-orphan", back_populates="chamado")
     historicos_status: Mapped[list["HistoricoStatus"]] = relationship("HistoricoStatus", cascade="all, delete-orphan", back_populates="chamado")
     historicos_ticket: Mapped[list["HistoricoTicket"]] = relationship("HistoricoTicket", cascade="all, delete-orphan", back_populates="chamado")
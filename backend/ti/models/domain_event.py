@@ -0,0 +1,36 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import Integer, String, DateTime, Text, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from core.db import Base
+from core.utils import now_brazil_naive
+
+
+class DomainEvent(Base):
+    """Outbox de eventos de domínio, gravado na mesma transação da mudança (ti.services.domain_events)"""
+
+    __tablename__ = "domain_event"
+    __table_args__ = (
+        Index("idx_domain_event_agregado", "agregado", "agregado_id"),
+        Index("idx_domain_event_criado_em", "criado_em"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    tipo: Mapped[str] = mapped_column(String(60), nullable=False)  # ex: chamado.criado, chamado.status_alterado
+    agregado: Mapped[str] = mapped_column(String(30), nullable=False)  # ex: chamado
+    agregado_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    dados: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON
+    criado_em: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=now_brazil_naive)
+
+
+class DomainEventOffset(Base):
+    """Posição de leitura (último evento processado) de cada consumidor de eventos"""
+
+    __tablename__ = "domain_event_offset"
+
+    consumidor: Mapped[str] = mapped_column(String(60), primary_key=True)
+    ultimo_evento_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    eventos_processados: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    atualizado_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    erro: Mapped[str | None] = mapped_column(Text, nullable=True)
+    erro_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
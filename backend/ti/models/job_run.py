@@ -0,0 +1,28 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import Integer, String, DateTime, Text, Float, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from core.db import Base
+
+
+class JobRun(Base):
+    """Histórico de execuções dos jobs agendados (ti.services.job_scheduler) e da fila (ti.services.job_queue)"""
+
+    __tablename__ = "job_run"
+    __table_args__ = (
+        Index("idx_job_run_job_iniciado", "job_name", "iniciado_em"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)  # pendente | executando | sucesso | erro | ignorado
+    gatilho: Mapped[str] = mapped_column(String(20), nullable=False)  # agendado | recuperacao | manual | fila
+    agendado_para: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    iniciado_em: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    finalizado_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    duracao_segundos: Mapped[float | None] = mapped_column(Float, nullable=True)
+    linhas_processadas: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    linhas_total: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    worker: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    resultado: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON
+    erro: Mapped[str | None] = mapped_column(Text, nullable=True)
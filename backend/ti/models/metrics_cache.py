@@ -13,3 +13,17 @@ class MetricsCacheDB(Base):
     cache_value: Mapped[str] = mapped_column(Text, nullable=False)
     calculated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+
+
+class CacheTagGeracao(Base):
+    """
+    Geração atual de cada tag de cache (ti.services.sla_cache). As chaves
+    físicas em metrics_cache_db carregam a geração; invalidar uma tag é
+    incrementar este contador.
+    """
+
+    __tablename__ = "cache_tag_geracao"
+
+    tag: Mapped[str] = mapped_column(String(50), primary_key=True)
+    geracao: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    atualizado_em: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from datetime import datetime
-from sqlalchemy import Integer, String, Float, Time, Boolean, DateTime, Text
+from sqlalchemy import Integer, String, Float, Time, Boolean, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from core.db import Base
 
@@ -45,6 +45,10 @@ class SLAFeriado(Base):
 
 class HistoricoSLA(Base):
     __tablename__ = "historico_sla"
+    __table_args__ = (
+        # Um registro (snapshot atual do SLA) por chamado: permite upsert em lote
+        UniqueConstraint("chamado_id", name="uq_historico_sla_chamado"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     chamado_id: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -0,0 +1,33 @@
+from __future__ import annotations
+from sqlalchemy import Integer, String, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from core.db import Base
+
+
+class UserSetor(Base):
+    """
+    Setores do usuário (normalização de user._setores, mantido em escrita dupla).
+    posicao 0 é o setor principal (user.setor).
+    """
+
+    __tablename__ = "user_setor"
+    __table_args__ = (
+        Index("idx_user_setor_setor", "setor"),
+    )
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    setor: Mapped[str] = mapped_column(String(255), primary_key=True)
+    posicao: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class UserBISubcategory(Base):
+    """Subcategorias de BI (dashboard_id) liberadas ao usuário (normalização de user._bi_subcategories)"""
+
+    __tablename__ = "user_bi_subcategory"
+    __table_args__ = (
+        Index("idx_user_bi_subcategory_subcategory", "subcategory"),
+    )
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    subcategory: Mapped[str] = mapped_column(String(100), primary_key=True)
+    posicao: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -32,6 +32,7 @@ class ChamadoOut(BaseModel):
     data_abertura: datetime | None
     status: str
     prioridade: str
+    sla: dict | None = None
 
     class Config:
         from_attributes = True
@@ -259,3 +259,7 @@ class SLAFeriadoOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class SLAStatusBatchRequest(BaseModel):
+    chamado_ids: list[int] = Field(..., description="IDs dos chamados (máximo 500 por requisição)")
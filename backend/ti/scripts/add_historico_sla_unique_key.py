@@ -0,0 +1,55 @@
+"""
+Migração: chave única em historico_sla.chamado_id.
+
+historico_sla guarda o snapshot atual do SLA de cada chamado. Sem chave única,
+as rotinas de sincronização faziam SELECT + UPDATE/INSERT por chamado e
+podiam gerar duplicatas em execuções concorrentes.
+
+A migração:
+1. Remove duplicatas, mantendo o registro mais recente (maior id) de cada chamado
+2. Cria o índice único uq_historico_sla_chamado (chamado_id)
+
+Com a chave, as gravações passam a usar INSERT ... ON DUPLICATE KEY UPDATE em lote.
+
+Uso:
+    python -m ti.scripts.add_historico_sla_unique_key
+"""
+
+from sqlalchemy import text, inspect
+from core.db import engine
+from ti.models.sla_config import HistoricoSLA
+
+INDEX_NAME = "uq_historico_sla_chamado"
+
+
+def add_historico_sla_unique_key() -> dict:
+    insp = inspect(engine)
+    table_name = HistoricoSLA.__tablename__
+
+    if not insp.has_table(table_name):
+        HistoricoSLA.__table__.create(bind=engine, checkfirst=True)
+        return {"ok": True, "action": "created", "table": table_name}
+
+    existentes = {idx["name"] for idx in insp.get_indexes(table_name)}
+    existentes.update(uc["name"] for uc in insp.get_unique_constraints(table_name))
+    if INDEX_NAME in existentes:
+        return {"ok": True, "action": "exists", "index": INDEX_NAME}
+
+    with engine.begin() as conn:
+        removidos = conn.execute(text(
+            """
+            DELETE h1 FROM historico_sla h1
+            JOIN historico_sla h2
+              ON h1.chamado_id = h2.chamado_id
+             AND h1.id < h2.id
+            """
+        )).rowcount
+        conn.execute(text(
+            f"ALTER TABLE historico_sla ADD UNIQUE INDEX {INDEX_NAME} (chamado_id)"
+        ))
+
+    return {"ok": True, "action": "added", "index": INDEX_NAME, "duplicatas_removidas": removidos}
+
+
+if __name__ == "__main__":
+    print(add_historico_sla_unique_key())
@@ -0,0 +1,59 @@
+"""
+Script para adicionar as colunas de prazo de SLA à tabela 'chamado'
+(prazo_resposta_em, prazo_resolucao_em), seus índices, e preencher os
+prazos dos chamados existentes.
+Executa: python -m ti.scripts.add_sla_deadline_columns
+"""
+from sqlalchemy import text, inspect
+from core.db import engine, SessionLocal
+
+COLUMNS = [
+    ("prazo_resposta_em", "idx_chamado_prazo_resposta"),
+    ("prazo_resolucao_em", "idx_chamado_prazo_resolucao"),
+]
+
+
+def add_sla_deadline_columns() -> bool:
+    """
+    Adiciona colunas e índices de prazo em 'chamado'.
+    Retorna True se alguma coluna foi criada (prazos precisam de backfill).
+    """
+    insp = inspect(engine)
+    if not insp.has_table("chamado"):
+        return False
+
+    existing_columns = {col["name"] for col in insp.get_columns("chamado")}
+    existing_indices = {idx["name"] for idx in insp.get_indexes("chamado")}
+    created = False
+
+    with engine.connect() as connection:
+        for column, index_name in COLUMNS:
+            if column not in existing_columns:
+                connection.execute(text(f"ALTER TABLE chamado ADD COLUMN {column} DATETIME NULL"))
+                connection.commit()
+                created = True
+                print(f"✅ Coluna '{column}' adicionada com sucesso!")
+
+            if index_name not in existing_indices:
+                connection.execute(text(f"CREATE INDEX {index_name} ON chamado ({column})"))
+                connection.commit()
+                print(f"✅ Índice '{index_name}' criado em 'chamado'")
+
+    return created
+
+
+def backfill_sla_deadlines(apenas_abertos: bool = False) -> int:
+    """Calcula e grava os prazos de SLA dos chamados existentes"""
+    from ti.services.sla_deadlines import SLADeadlines
+
+    db = SessionLocal()
+    try:
+        return SLADeadlines.recalcular(db, apenas_abertos=apenas_abertos)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    add_sla_deadline_columns()
+    total = backfill_sla_deadlines()
+    print(f"✅ Prazos de SLA calculados para {total} chamados")
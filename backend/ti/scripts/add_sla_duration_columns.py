@@ -0,0 +1,55 @@
+"""
+Script para adicionar as colunas de duração de SLA congeladas à tabela
+'chamado' (tempo_primeira_resposta_horas, tempo_resolucao_horas,
+tempo_pausado_horas, tempos_congelados_em) e preencher os chamados existentes.
+Executa: python -m ti.scripts.add_sla_duration_columns
+"""
+from sqlalchemy import text, inspect
+from core.db import engine, SessionLocal
+
+COLUMNS = [
+    ("tempo_primeira_resposta_horas", "DOUBLE NULL"),
+    ("tempo_resolucao_horas", "DOUBLE NULL"),
+    ("tempo_pausado_horas", "DOUBLE NULL"),
+    ("tempos_congelados_em", "DATETIME NULL"),
+]
+
+
+def add_sla_duration_columns() -> bool:
+    """
+    Adiciona as colunas de duração em 'chamado'.
+    Retorna True se alguma coluna foi criada (durações precisam de backfill).
+    """
+    insp = inspect(engine)
+    if not insp.has_table("chamado"):
+        return False
+
+    existing_columns = {col["name"] for col in insp.get_columns("chamado")}
+    created = False
+
+    with engine.connect() as connection:
+        for column, definition in COLUMNS:
+            if column not in existing_columns:
+                connection.execute(text(f"ALTER TABLE chamado ADD COLUMN {column} {definition}"))
+                connection.commit()
+                created = True
+                print(f"✅ Coluna '{column}' adicionada com sucesso!")
+
+    return created
+
+
+def backfill_sla_durations() -> int:
+    """Calcula e grava as durações dos chamados ainda não preenchidos"""
+    from ti.services.sla_duracoes import SLADuracoes
+
+    db = SessionLocal()
+    try:
+        return SLADuracoes.backfill(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    add_sla_duration_columns()
+    total = backfill_sla_durations()
+    print(f"✅ Durações de SLA gravadas para {total} chamados")
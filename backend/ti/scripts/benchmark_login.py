@@ -0,0 +1,138 @@
+"""
+Mede a vazão de logins (POST /api/usuarios/login) e o impacto de um pico de
+logins na latência dos demais endpoints.
+
+Fases: (1) mede a latência da sonda (endpoint síncrono leve) sem carga;
+(2) dispara N logins com C conexões simultâneas enquanto a sonda continua
+medindo; imprime logins/s, p50/p95 dos logins, recusas 429/503 e p50/p95 da
+sonda antes e durante o pico. Compare antes/depois de ajustar SENHA_PROCESSOS,
+SENHA_MAX_CONCORRENTES e SENHA_HASH_METODO; GET /api/metrics/senhas mostra
+o mesmo pico do lado do servidor.
+
+Executa: python -m ti.scripts.benchmark_login --usuario teste --senha xxx [--n 300]
+         [--concorrencia 50] [--url http://localhost:8000] [--sonda /api/usuarios/generate-password]
+
+Atenção: o limite por identificador (SENHA_TENTATIVAS_POR_MINUTO) recusa
+logins repetidos do mesmo usuário; para medir vazão suba o servidor com
+SENHA_TENTATIVAS_POR_MINUTO=0. Use um usuário de teste.
+
+Medição de referência (--n 200, 1 vCPU, 1 worker uvicorn, SQLite local no
+lugar do MySQL, scrypt:32768:8:1, padrões de SENHA_*; sonda p95 sem carga
+4-10 ms):
+
+    20 simultâneos            logins/s   login p50   sonda p95 no pico
+    hash na thread da API        6,0     3283 ms        196 ms
+    pool de processos            6,0     3180 ms         15 ms
+    pool + login assíncrono      7,2     2623 ms         14 ms
+
+    60 simultâneos            logins/s   recusas 503   sonda p95 no pico
+    hash na thread da API        6,7          0           3914 ms
+    pool de processos            4,9        174            198 ms
+    pool + login assíncrono      4,9        174            182 ms
+
+Com 60 simultâneos o pool recusa o excedente (fila cheia) em vez de prender
+as threads; o que sobra na sonda é disputa pela única CPU com os processos
+de hash, não falta de threads.
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+
+def _percentil(valores: list[float], q: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+def _resumo(nome: str, tempos_ms: list[float]) -> None:
+    if not tempos_ms:
+        print(f"{nome}: sem amostras")
+        return
+    print(
+        f"{nome}: n={len(tempos_ms)} média={statistics.mean(tempos_ms):.1f} ms "
+        f"p50={_percentil(tempos_ms, 0.50):.1f} ms p95={_percentil(tempos_ms, 0.95):.1f} ms "
+        f"máx={max(tempos_ms):.1f} ms"
+    )
+
+
+def _sondar(client: httpx.Client, url: str, parar: threading.Event, tempos_ms: list[float]) -> None:
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        try:
+            client.get(url)
+            tempos_ms.append((time.perf_counter() - inicio) * 1000)
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--usuario", required=True, help="e-mail ou usuário de teste")
+    parser.add_argument("--senha", required=True)
+    parser.add_argument("--n", type=int, default=300, help="quantidade de logins")
+    parser.add_argument("--concorrencia", type=int, default=50, help="logins simultâneos")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL base do backend")
+    parser.add_argument("--sonda", default="/api/usuarios/generate-password", help="endpoint leve medido em paralelo")
+    parser.add_argument("--baseline-segundos", type=float, default=3.0)
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    url_login = f"{base}/api/usuarios/login"
+    url_sonda = f"{base}{args.sonda}"
+
+    with httpx.Client(timeout=60, limits=httpx.Limits(max_connections=args.concorrencia + 5)) as client:
+        # 1. Sonda sem carga
+        sonda_base: list[float] = []
+        parar = threading.Event()
+        t = threading.Thread(target=_sondar, args=(client, url_sonda, parar, sonda_base), daemon=True)
+        t.start()
+        time.sleep(args.baseline_segundos)
+        parar.set()
+        t.join()
+
+        # 2. Pico de logins com a sonda em paralelo
+        sonda_pico: list[float] = []
+        parar = threading.Event()
+        t = threading.Thread(target=_sondar, args=(client, url_sonda, parar, sonda_pico), daemon=True)
+        t.start()
+
+        tempos_ms: list[float] = []
+        codigos: dict[int, int] = {}
+        lock = threading.Lock()
+
+        def _login(_):
+            inicio = time.perf_counter()
+            resp = client.post(url_login, json={"identifier": args.usuario, "senha": args.senha})
+            duracao = (time.perf_counter() - inicio) * 1000
+            with lock:
+                codigos[resp.status_code] = codigos.get(resp.status_code, 0) + 1
+                if resp.status_code == 200:
+                    tempos_ms.append(duracao)
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+            list(executor.map(_login, range(args.n)))
+        total_s = time.perf_counter() - inicio
+        parar.set()
+        t.join()
+
+    ok = codigos.get(200, 0)
+    print(f"Logins: {args.n} em {total_s:.2f}s com {args.concorrencia} simultâneos")
+    print(f"Vazão: {ok / total_s:.1f} logins/s bem-sucedidos ({args.n / total_s:.1f} req/s)")
+    print(f"Status: {dict(sorted(codigos.items()))} (429 = limite por identificador, 503 = pool de hash cheio)")
+    _resumo("Login", tempos_ms)
+    _resumo("Sonda sem carga", sonda_base)
+    _resumo("Sonda durante o pico", sonda_pico)
+    if sonda_base and sonda_pico:
+        print(f"Impacto na sonda (p95): {_percentil(sonda_pico, 0.95) / _percentil(sonda_base, 0.95):.1f}x")
+    return 0 if ok == args.n else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
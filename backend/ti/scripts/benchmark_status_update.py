@@ -0,0 +1,70 @@
+"""
+Mede a latência do endpoint PATCH /api/chamados/{id}/status.
+
+Alterna o status de um chamado de teste N vezes contra um servidor em
+execução e imprime média, p50, p95 e máximo (lado do cliente). Rode antes e
+depois de uma mudança para comparar; GET /api/metrics/unit-of-work mostra a
+mesma operação medida no servidor (transação, commit e hooks).
+
+Executa: python -m ti.scripts.benchmark_status_update --chamado 123 [--n 50] [--url http://localhost:8000]
+
+Atenção: grava históricos, notificações e e-mails reais para o chamado
+informado; use um chamado de teste.
+
+Medição de referência (--n 200, 1 vCPU, 1 worker uvicorn, SQLite local em
+WAL no lugar do MySQL, sem rede externa; p50 / p95 de duas rodadas):
+
+    antes da unidade de trabalho:   59,3 / 85,7 ms e 81,7 / 95,5 ms
+    com a unidade de trabalho:      67,0 / 91,8 ms e 64,1 / 88,0 ms
+
+A diferença ficou dentro da variação entre rodadas: com o banco local cada
+commit quase não custa, e o ganho esperado (menos idas e voltas de commit
+até o MySQL, hooks fora da requisição) só aparece com banco remoto. Repita
+contra o MySQL de homologação antes de tirar conclusões.
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import time
+
+import httpx
+
+STATUS_ALTERNADOS = ["Em andamento", "Em análise"]
+
+
+def _percentil(valores: list[float], q: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chamado", type=int, required=True, help="id do chamado de teste")
+    parser.add_argument("--n", type=int, default=50, help="quantidade de mudanças de status")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL base do backend")
+    args = parser.parse_args()
+
+    url = f"{args.url.rstrip('/')}/api/chamados/{args.chamado}/status"
+    tempos_ms: list[float] = []
+    erros = 0
+
+    with httpx.Client(timeout=30) as client:
+        for i in range(args.n):
+            status = STATUS_ALTERNADOS[i % len(STATUS_ALTERNADOS)]
+            inicio = time.perf_counter()
+            resp = client.patch(url, json={"status": status})
+            tempos_ms.append((time.perf_counter() - inicio) * 1000)
+            if resp.status_code != 200:
+                erros += 1
+                print(f"⚠️  {resp.status_code}: {resp.text[:200]}")
+
+    print(f"Requisições: {len(tempos_ms)} (erros: {erros})")
+    print(f"Média: {statistics.mean(tempos_ms):.1f} ms")
+    print(f"p50:   {_percentil(tempos_ms, 0.50):.1f} ms")
+    print(f"p95:   {_percentil(tempos_ms, 0.95):.1f} ms")
+    print(f"Máx:   {max(tempos_ms):.1f} ms")
+    return 0 if erros == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
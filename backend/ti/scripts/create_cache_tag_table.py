@@ -0,0 +1,15 @@
+from sqlalchemy import inspect
+from core.db import engine
+from ti.models.metrics_cache import CacheTagGeracao
+
+
+def create_cache_tag_table():
+    insp = inspect(engine)
+    table_name = CacheTagGeracao.__tablename__
+    exists = insp.has_table(table_name)
+    CacheTagGeracao.__table__.create(bind=engine, checkfirst=True)
+    print({"ok": True, "action": "exists" if exists else "created", "table": table_name})
+
+
+if __name__ == "__main__":
+    create_cache_tag_table()
@@ -0,0 +1,16 @@
+from sqlalchemy import inspect
+from core.db import engine
+from ti.models.domain_event import DomainEvent, DomainEventOffset
+
+
+def create_domain_event_tables():
+    insp = inspect(engine)
+    for model in (DomainEvent, DomainEventOffset):
+        table_name = model.__tablename__
+        exists = insp.has_table(table_name)
+        model.__table__.create(bind=engine, checkfirst=True)
+        print({"ok": True, "action": "exists" if exists else "created", "table": table_name})
+
+
+if __name__ == "__main__":
+    create_domain_event_tables()
@@ -0,0 +1,15 @@
+from sqlalchemy import inspect
+from core.db import engine
+from ti.models.job_run import JobRun
+
+
+def create_job_run_table():
+    insp = inspect(engine)
+    table_name = JobRun.__tablename__
+    exists = insp.has_table(table_name)
+    JobRun.__table__.create(bind=engine, checkfirst=True)
+    print({"ok": True, "action": "exists" if exists else "created", "table": table_name})
+
+
+if __name__ == "__main__":
+    create_job_run_table()
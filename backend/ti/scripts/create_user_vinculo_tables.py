@@ -0,0 +1,56 @@
+"""
+Cria as tabelas user_setor e user_bi_subcategory e preenche a partir das
+colunas JSON user._setores / user._bi_subcategories.
+
+Período de escrita dupla: ti/services/users.py continua gravando o JSON e
+grava também as tabelas; as leituras (listagem de usuários, busca por setor
+ou subcategoria) já usam as tabelas. O backfill só toca usuários que têm
+JSON e ainda não têm linhas, então pode rodar a cada inicialização.
+Executa: python -m ti.scripts.create_user_vinculo_tables
+"""
+from sqlalchemy import inspect, exists, and_, or_
+from core.db import engine, SessionLocal
+from ti.models.user import User
+from ti.models.user_vinculos import UserSetor, UserBISubcategory
+
+
+def create_user_vinculo_tables():
+    insp = inspect(engine)
+    for model in (UserSetor, UserBISubcategory):
+        table_name = model.__tablename__
+        table_exists = insp.has_table(table_name)
+        model.__table__.create(bind=engine, checkfirst=True)
+        print({"ok": True, "action": "exists" if table_exists else "created", "table": table_name})
+
+
+def backfill_user_vinculos() -> int:
+    """Grava as linhas de quem tem setores/subcategorias (JSON ou user.setor) e nenhuma linha nas tabelas"""
+    from ti.services.users import gravar_vinculos
+
+    db = SessionLocal()
+    try:
+        sem_setor = and_(
+            or_(User._setores.isnot(None), User.setor.isnot(None)),
+            ~exists().where(UserSetor.user_id == User.id),
+        )
+        sem_bi = and_(
+            User._bi_subcategories.isnot(None),
+            ~exists().where(UserBISubcategory.user_id == User.id),
+        )
+        users = db.query(User).filter(or_(sem_setor, sem_bi)).all()
+        for user in users:
+            gravar_vinculos(db, user)
+        if users:
+            db.commit()
+        return len(users)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    create_user_vinculo_tables()
+    total = backfill_user_vinculos()
+    print(f"✅ Vínculos de setor/BI gravados para {total} usuários")
@@ -0,0 +1,145 @@
+"""
+Servidor local que imita o login do Azure AD e a API REST do Power BI.
+
+Simula latência e falhas para exercitar o circuit breaker, os retries, o
+hedging e o fallback de embed token de ti/services/powerbi_client.py sem
+depender do Power BI real. Aponte o backend para ele com:
+
+    AZURE_LOGIN_URL=http://localhost:8765
+    POWERBI_API_URL=http://localhost:8765/v1.0/myorg
+
+Executa: python -m ti.scripts.powerbi_mock_server [--porta 8765] [--latencia-ms 200]
+         [--jitter-ms 100] [--taxa-falha 0.1] [--taxa-lenta 0.05] [--lenta-ms 20000]
+
+O comportamento pode ser trocado com o servidor rodando (ex: simular uma
+queda e a volta do serviço):
+
+    curl -X POST localhost:8765/_mock/config -H 'Content-Type: application/json' -d '{"taxa_falha": 1}'
+    curl localhost:8765/_mock/stats
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Power BI mock")
+
+config = {
+    "latencia_ms": 200,
+    "jitter_ms": 100,
+    "taxa_falha": 0.0,
+    "taxa_lenta": 0.0,
+    "lenta_ms": 20000,
+    "status_falha": 503,
+    "validade_embed_minutos": 60,
+}
+stats = {"requisicoes": 0, "falhas": 0, "lentas": 0, "tokens_emitidos": 0}
+
+
+async def _simular() -> JSONResponse | None:
+    """Aplica latência (normal ou lenta) e, pela taxa configurada, devolve uma falha"""
+    stats["requisicoes"] += 1
+    atraso = config["latencia_ms"] + random.uniform(0, config["jitter_ms"])
+    if random.random() < config["taxa_lenta"]:
+        stats["lentas"] += 1
+        atraso = config["lenta_ms"]
+    await asyncio.sleep(atraso / 1000)
+
+    if random.random() < config["taxa_falha"]:
+        stats["falhas"] += 1
+        return JSONResponse(
+            status_code=config["status_falha"],
+            content={"error": {"code": "ServiceUnavailable", "message": "Falha simulada pelo mock"}},
+            headers={"Retry-After": "1"},
+        )
+    return None
+
+
+@app.post("/{tenant_id}/oauth2/v2.0/token")
+async def token(tenant_id: str):
+    falha = await _simular()
+    if falha:
+        return falha
+    return {"token_type": "Bearer", "expires_in": 3599, "access_token": f"mock-{uuid.uuid4()}"}
+
+
+@app.get("/v1.0/myorg/groups/{workspace_id}/reports/{report_id}")
+async def report(workspace_id: str, report_id: str):
+    falha = await _simular()
+    if falha:
+        return falha
+    return {
+        "id": report_id,
+        "name": f"Relatório {report_id[:8]}",
+        "datasetId": str(uuid.uuid5(uuid.NAMESPACE_OID, report_id)),
+        "embedUrl": f"https://app.powerbi.com/reportEmbed?reportId={report_id}&groupId={workspace_id}",
+    }
+
+
+@app.post("/v1.0/myorg/groups/{workspace_id}/reports/{report_id}/GenerateToken")
+async def generate_token(workspace_id: str, report_id: str):
+    falha = await _simular()
+    if falha:
+        return falha
+    stats["tokens_emitidos"] += 1
+    expiracao = datetime.now(timezone.utc) + timedelta(minutes=config["validade_embed_minutos"])
+    return {
+        "token": f"embed-{uuid.uuid4()}",
+        "tokenId": str(uuid.uuid4()),
+        "expiration": expiracao.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+@app.get("/v1.0/myorg/{colecao}")
+async def listar(colecao: str):
+    falha = await _simular()
+    if falha:
+        return falha
+    return {"value": []}
+
+
+@app.post("/_mock/config")
+async def alterar_config(request: Request):
+    novos = await request.json()
+    for chave, valor in novos.items():
+        if chave in config:
+            config[chave] = valor
+    return config
+
+
+@app.get("/_mock/stats")
+async def ver_stats():
+    return {"config": config, **stats}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=config["latencia_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=config["jitter_ms"])
+    parser.add_argument("--taxa-falha", type=float, default=config["taxa_falha"], help="0 a 1")
+    parser.add_argument("--taxa-lenta", type=float, default=config["taxa_lenta"], help="0 a 1")
+    parser.add_argument("--lenta-ms", type=float, default=config["lenta_ms"])
+    parser.add_argument("--status-falha", type=int, default=config["status_falha"])
+    args = parser.parse_args()
+
+    config.update(
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        taxa_falha=args.taxa_falha,
+        taxa_lenta=args.taxa_lenta,
+        lenta_ms=args.lenta_ms,
+        status_falha=args.status_falha,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.porta)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
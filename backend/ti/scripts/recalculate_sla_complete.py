@@ -8,26 +8,169 @@ Este script:
 3. Computa estatísticas agregadas (tempo médio de resposta/resolução)
 4. Pode ser executado periodicamente (recomendado: diariamente às 00:00)
 
+Processamento:
+- Chamados divididos em lotes por id (SLA_RECALC_CHUNK_SIZE, padrão 500)
+- Cada lote pré-carrega configurações, calendário comercial, chamados,
+  históricos de status e históricos de SLA em poucas queries
+- Lotes processados em paralelo em um pool de processos (SLA_RECALC_WORKERS)
+- Checkpoint em metrics_cache_db após cada lote concluído: se o processo for
+  interrompido, a próxima execução retoma do último lote gravado
+
 Uso:
     python -m ti.scripts.recalculate_sla_complete
 """
 
+import os
 import sys
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 
 sys.path.insert(0, "/app/backend")
 
 from core.db import SessionLocal, engine
 from ti.models.chamado import Chamado
-from ti.models.sla_config import HistoricoSLA, SLAConfiguration
+from ti.models.sla_config import SLAConfiguration
 from ti.models.historico_status import HistoricoStatus
-from ti.services.sla import SLACalculator
+from ti.models.metrics_cache import MetricsCacheDB
+from ti.services.sla import SLACalculator, BusinessCalendar
 from ti.services.sla_cache import SLACacheManager
+from ti.services.sla_historico import HistoricoSLAWriter
 from core.utils import now_brazil_naive
 
 
+CHECKPOINT_KEY = "sla_recalculo_checkpoint"
+# Checkpoints mais antigos que isso são descartados (dados já mudaram demais)
+CHECKPOINT_VALIDADE_HORAS = 24
+# Máximo de erros detalhados guardados nas estatísticas
+MAX_DETALHES_ERRO = 100
+
+
+def _novo_parcial() -> dict:
+    return {
+        "recalculados": 0,
+        "com_erro": 0,
+        "chamados_dentro_sla_resposta": 0,
+        "chamados_dentro_sla_resolucao": 0,
+        "soma_resposta": 0.0,
+        "qtd_resposta": 0,
+        "soma_resolucao": 0.0,
+        "qtd_resolucao": 0,
+        "detalhes": [],
+    }
+
+
+def _acumular(total: dict, parcial: dict) -> None:
+    for chave, valor in parcial.items():
+        if chave == "detalhes":
+            espaco = MAX_DETALHES_ERRO - len(total["detalhes"])
+            if espaco > 0:
+                total["detalhes"].extend(valor[:espaco])
+        else:
+            total[chave] += valor
+
+
+def _processar_lote(db: Session, chamado_ids: list[int]) -> dict:
+    """
+    Recalcula o SLA de um lote de chamados e grava o histórico de SLA.
+
+    Todos os dados do lote são pré-carregados (configurações, calendário,
+    chamados e históricos de status) e o histórico de SLA é gravado com um
+    único upsert, de forma que o número de queries não depende do tamanho do lote.
+    """
+    parcial = _novo_parcial()
+
+    sla_configs = {
+        config.prioridade: config
+        for config in db.query(SLAConfiguration).filter(
+            SLAConfiguration.ativo == True
+        ).all()
+    }
+    calendario = BusinessCalendar.load(db)
+
+    chamados = db.query(Chamado).filter(
+        Chamado.id.in_(chamado_ids)
+    ).order_by(Chamado.id.asc()).all()
+    historicos_cache = SLACalculator.load_historicos_by_chamado(db, chamado_ids)
+
+    registros = []
+
+    for chamado in chamados:
+        try:
+            # Calcula SLA atual
+            sla_status = SLACalculator.get_sla_status(
+                db, chamado,
+                sla_configs=sla_configs,
+                historicos_cache=historicos_cache,
+                calendario=calendario,
+            )
+
+            if sla_status.get("status_geral") == "sem_sla":
+                continue
+
+            # Extrai métricas
+            resposta_metric = sla_status.get("resposta_metric", {})
+            resolucao_metric = sla_status.get("resolucao_metric", {})
+
+            tempo_resposta = resposta_metric.get("tempo_decorrido_horas", 0.0)
+            tempo_resolucao = resolucao_metric.get("tempo_decorrido_horas", 0.0)
+
+            # Coleta para média (apenas fechados para tempo de resposta/resolução definitivos)
+            if chamado.status in ["Concluido", "Concluído", "Cancelado"]:
+                if tempo_resposta > 0:
+                    parcial["soma_resposta"] += tempo_resposta
+                    parcial["qtd_resposta"] += 1
+                if tempo_resolucao > 0:
+                    parcial["soma_resolucao"] += tempo_resolucao
+                    parcial["qtd_resolucao"] += 1
+
+            # Verifica se estão dentro do SLA
+            sla_config = sla_configs.get(chamado.prioridade)
+            if sla_config:
+                if tempo_resposta <= sla_config.tempo_resposta_horas:
+                    parcial["chamados_dentro_sla_resposta"] += 1
+                if tempo_resolucao <= sla_config.tempo_resolucao_horas:
+                    parcial["chamados_dentro_sla_resolucao"] += 1
+
+            # Atualiza ou cria histórico de SLA (gravado em lote no fim)
+            registros.append(HistoricoSLAWriter.montar_registro(
+                chamado,
+                sla_status,
+                acao="recalculo_automatico",
+                criado_em=chamado.data_abertura or now_brazil_naive(),
+            ))
+
+            parcial["recalculados"] += 1
+
+        except Exception as e:
+            parcial["com_erro"] += 1
+            parcial["detalhes"].append({
+                "chamado_id": chamado.id,
+                "codigo": getattr(chamado, "codigo", "?"),
+                "erro": str(e),
+            })
+
+    HistoricoSLAWriter.upsert_many(db, registros)
+    db.commit()
+    return parcial
+
+
+def _processar_lote_em_processo(chamado_ids: list[int]) -> dict:
+    """Ponto de entrada do pool de processos: cada lote usa sua própria sessão"""
+    db = SessionLocal()
+    try:
+        return _processar_lote(db, chamado_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
 class SLARecalculator:
     """Recalcula SLA de forma robusta e eficiente"""
 
@@ -41,96 +184,136 @@ class SLARecalculator:
             "tempo_medio_resolucao_horas": 0.0,
             "chamados_dentro_sla_resposta": 0,
             "chamados_dentro_sla_resolucao": 0,
+            "retomado_do_id": None,
             "detalhes": [],
         }
 
-    def recalculate_all(self, verbose: bool = True) -> dict:
-        """Recalcula SLA de todos os chamados"""
+    def recalculate_all(
+        self,
+        verbose: bool = True,
+        ctx=None,
+        chunk_size: int | None = None,
+        workers: int | None = None,
+        retomar: bool = True,
+    ) -> dict:
+        """
+        Recalcula SLA de todos os chamados, em lotes.
+
+        ctx: JobContext opcional (ti.services.job_scheduler) para registrar progresso
+        chunk_size: chamados por lote
+        workers: processos paralelos (1 = processa no processo atual)
+        retomar: continua a partir do checkpoint de uma execução interrompida
+        """
+        chunk_size = chunk_size or int(os.getenv("SLA_RECALC_CHUNK_SIZE", "500"))
+        if workers is None:
+            workers = int(os.getenv("SLA_RECALC_WORKERS", str(min(4, os.cpu_count() or 1))))
+
         if verbose:
             print("\n" + "=" * 80)
             print("RECALCULANDO SLA DE TODOS OS CHAMADOS")
             print("=" * 80 + "\n")
 
         try:
-            # Carrega configurações de SLA uma vez (otimização)
-            sla_configs = {
-                config.prioridade: config
-                for config in self.db.query(SLAConfiguration).filter(
-                    SLAConfiguration.ativo == True
-                ).all()
-            }
-
-            if not sla_configs:
+            # Sem configuração de SLA não há o que recalcular
+            total_configs = self.db.query(func.count(SLAConfiguration.id)).filter(
+                SLAConfiguration.ativo == True
+            ).scalar() or 0
+
+            if not total_configs:
                 if verbose:
                     print("⚠️  AVISO: Nenhuma configuração de SLA encontrada!")
                 return self.stats
 
-            # Carrega todos os chamados
-            chamados = self.db.query(Chamado).all()
-            self.stats["total_chamados"] = len(chamados)
-
-            if verbose:
-                print(f"📊 Total de chamados para recalcular: {len(chamados)}")
-                print(f"⚙️  Configurações de SLA encontradas: {len(sla_configs)}")
-                print("-" * 80 + "\n")
-
-            # Coleta tempos para calcular média
-            tempos_resposta = []
-            tempos_resolucao = []
+            checkpoint = self._carregar_checkpoint() if retomar else None
+            ultimo_id = checkpoint["ultimo_id"] if checkpoint else 0
+            acumulado = checkpoint["parcial"] if checkpoint else _novo_parcial()
+            if checkpoint:
+                self.stats["retomado_do_id"] = ultimo_id
 
-            # Processa cada chamado
-            for idx, chamado in enumerate(chamados, 1):
-                try:
-                    # Mostra progresso a cada 10 chamados
-                    if verbose and idx % 10 == 0:
-                        print(f"⏳ Processando: {idx}/{len(chamados)}...")
+            total = self.db.query(func.count(Chamado.id)).scalar() or 0
+            self.stats["total_chamados"] = total
 
-                    # Calcula SLA atual
-                    sla_status = SLACalculator.get_sla_status(self.db, chamado)
+            ids = [
+                row[0] for row in self.db.query(Chamado.id).filter(
+                    Chamado.id > ultimo_id
+                ).order_by(Chamado.id.asc()).all()
+            ]
+            lotes = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+            processados = total - len(ids)
 
-                    if sla_status.get("status_geral") == "sem_sla":
-                        continue
+            if verbose:
+                print(f"📊 Total de chamados para recalcular: {len(ids)} de {total}")
+                if checkpoint:
+                    print(f"↩️  Retomando do checkpoint (após chamado #{ultimo_id})")
+                print(f"⚙️  Configurações de SLA encontradas: {total_configs}")
+                print(f"🧩 {len(lotes)} lotes de até {chunk_size} chamados, {workers} processo(s)")
+                print("-" * 80 + "\n")
 
-                    # Extrai métricas
-                    resposta_metric = sla_status.get("resposta_metric", {})
-                    resolucao_metric = sla_status.get("resolucao_metric", {})
+            if ctx is not None:
+                ctx.progresso(processados, total, forcar=True)
 
-                    tempo_resposta = resposta_metric.get("tempo_decorrido_horas", 0.0)
-                    tempo_resolucao = resolucao_metric.get("tempo_decorrido_horas", 0.0)
+            houve_falha = False
 
-                    # Coleta para média (apenas fechados para tempo de resposta/resolução definitivos)
-                    if chamado.status in ["Concluido", "Concluído", "Cancelado"]:
-                        if tempo_resposta > 0:
-                            tempos_resposta.append(tempo_resposta)
-                        if tempo_resolucao > 0:
-                            tempos_resolucao.append(tempo_resolucao)
+            def concluir_lote(indice: int, parcial: dict | None, erro: Exception | None = None):
+                nonlocal processados, houve_falha
+                lote = lotes[indice]
+                processados += len(lote)
 
-                    # Verifica se estão dentro do SLA
-                    sla_config = sla_configs.get(chamado.prioridade)
-                    if sla_config:
-                        if tempo_resposta <= sla_config.tempo_resposta_horas:
-                            self.stats["chamados_dentro_sla_resposta"] += 1
-                        if tempo_resolucao <= sla_config.tempo_resolucao_horas:
-                            self.stats["chamados_dentro_sla_resolucao"] += 1
+                if erro is not None:
+                    houve_falha = True
+                    parcial = _novo_parcial()
+                    parcial["com_erro"] = len(lote)
+                    parcial["detalhes"].append({
+                        "lote": f"{lote[0]}-{lote[-1]}",
+                        "erro": str(erro),
+                    })
 
-                    # Atualiza ou cria histórico de SLA
-                    self._update_sla_history(chamado, sla_status, sla_configs)
+                _acumular(acumulado, parcial)
 
-                    self.stats["recalculados"] += 1
+                # O checkpoint só avança enquanto todos os lotes anteriores deram certo,
+                # para que uma nova execução refaça o lote que falhou
+                if not houve_falha:
+                    self._salvar_checkpoint(lote[-1], acumulado)
 
+                if verbose:
+                    print(f"⏳ Processando: {processados}/{total}...")
+                if ctx is not None:
+                    ctx.progresso(processados, total)
+
+            pendentes = list(range(len(lotes)))
+            prontos: dict[int, tuple[dict | None, Exception | None]] = {}
+
+            if workers > 1 and len(lotes) > 1:
+                pendentes, prontos = self._processar_em_paralelo(lotes, workers, concluir_lote, verbose)
+
+            # Processamento sequencial (workers=1, lote único ou pool indisponível).
+            # Lotes que o pool concluiu fora de ordem antes de falhar entram aqui,
+            # na sua vez, sem serem refeitos
+            for indice in pendentes:
+                if indice in prontos:
+                    parcial, erro = prontos.pop(indice)
+                    concluir_lote(indice, parcial, erro)
+                    continue
+                try:
+                    parcial = _processar_lote(self.db, lotes[indice])
+                    concluir_lote(indice, parcial)
                 except Exception as e:
-                    self.stats["com_erro"] += 1
-                    self.stats["detalhes"].append({
-                        "chamado_id": chamado.id,
-                        "codigo": getattr(chamado, "codigo", "?"),
-                        "erro": str(e),
-                    })
+                    self.db.rollback()
+                    concluir_lote(indice, None, e)
+
+            # Consolida estatísticas
+            for chave in ("recalculados", "com_erro", "chamados_dentro_sla_resposta", "chamados_dentro_sla_resolucao"):
+                self.stats[chave] = acumulado[chave]
+            self.stats["detalhes"] = acumulado["detalhes"]
 
             # Calcula médias
-            if tempos_resposta:
-                self.stats["tempo_medio_resposta_horas"] = sum(tempos_resposta) / len(tempos_resposta)
-            if tempos_resolucao:
-                self.stats["tempo_medio_resolucao_horas"] = sum(tempos_resolucao) / len(tempos_resolucao)
+            if acumulado["qtd_resposta"]:
+                self.stats["tempo_medio_resposta_horas"] = acumulado["soma_resposta"] / acumulado["qtd_resposta"]
+            if acumulado["qtd_resolucao"]:
+                self.stats["tempo_medio_resolucao_horas"] = acumulado["soma_resolucao"] / acumulado["qtd_resolucao"]
+
+            if not houve_falha:
+                self._remover_checkpoint()
 
             # Invalida cache de métricas
             SLACacheManager.invalidate_all_sla(self.db)
@@ -146,47 +329,96 @@ class SLARecalculator:
             traceback.print_exc()
             return self.stats
 
-    def _update_sla_history(self, chamado: Chamado, sla_status: dict, sla_configs: dict):
-        """Atualiza ou cria registro de histórico de SLA"""
-        try:
-            # Busca histórico existente
-            existing = self.db.query(HistoricoSLA).filter(
-                HistoricoSLA.chamado_id == chamado.id
-            ).order_by(HistoricoSLA.criado_em.desc()).first()
+    def _processar_em_paralelo(
+        self, lotes: list[list[int]], workers: int, concluir_lote, verbose: bool
+    ) -> tuple[list[int], dict[int, tuple[dict | None, Exception | None]]]:
+        """
+        Processa os lotes em um pool de processos.
 
-            resposta_metric = sla_status.get("resposta_metric", {})
-            resolucao_metric = sla_status.get("resolucao_metric", {})
+        Os resultados são consolidados na ordem dos lotes para que o checkpoint
+        represente sempre um prefixo contínuo de chamados.
+        Se o pool falhar, retorna (índices ainda não consolidados, resultados
+        já prontos entre eles) para o processamento sequencial seguir em ordem.
+        """
+        concluidos: dict[int, tuple[dict | None, Exception | None]] = {}
+        proximo = 0
 
-            tempo_resposta = resposta_metric.get("tempo_decorrido_horas", 0.0)
-            tempo_resolucao = resolucao_metric.get("tempo_decorrido_horas", 0.0)
+        try:
+            # "spawn": o processo pai tem threads (uvicorn, agendador), fork não é seguro
+            contexto = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+                futures = {
+                    executor.submit(_processar_lote_em_processo, lote): indice
+                    for indice, lote in enumerate(lotes)
+                }
+                for future in as_completed(futures):
+                    indice = futures[future]
+                    try:
+                        concluidos[indice] = (future.result(), None)
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        concluidos[indice] = (None, e)
+
+                    while proximo in concluidos:
+                        parcial, erro = concluidos.pop(proximo)
+                        concluir_lote(proximo, parcial, erro)
+                        proximo += 1
+
+        except (BrokenProcessPool, OSError, NotImplementedError) as e:
+            print(f"⚠️  Pool de processos indisponível ({e}), continuando sequencialmente")
+
+        return list(range(proximo, len(lotes))), concluidos
+
+    def _carregar_checkpoint(self) -> dict | None:
+        try:
+            registro = self.db.query(MetricsCacheDB).filter(
+                MetricsCacheDB.cache_key == CHECKPOINT_KEY
+            ).first()
+            if not registro:
+                return None
+            if registro.expires_at and registro.expires_at < now_brazil_naive():
+                return None
+            dados = json.loads(registro.cache_value)
+            parcial = _novo_parcial()
+            parcial.update(dados.get("parcial", {}))
+            return {"ultimo_id": int(dados["ultimo_id"]), "parcial": parcial}
+        except Exception as e:
+            print(f"⚠️  Checkpoint de recálculo inválido, ignorando: {e}")
+            return None
 
-            if existing:
-                # Atualiza registro existente
-                existing.tempo_resposta_horas = tempo_resposta
-                existing.tempo_resolucao_horas = tempo_resolucao
-                existing.status_novo = chamado.status
-                existing.status_sla = sla_status.get("status_geral")
-                existing.atualizado_em = now_brazil_naive()
-                self.db.add(existing)
+    def _salvar_checkpoint(self, ultimo_id: int, acumulado: dict) -> None:
+        try:
+            agora = now_brazil_naive()
+            valor = json.dumps({"ultimo_id": ultimo_id, "parcial": acumulado})
+            registro = self.db.query(MetricsCacheDB).filter(
+                MetricsCacheDB.cache_key == CHECKPOINT_KEY
+            ).first()
+            if registro:
+                registro.cache_value = valor
+                registro.calculated_at = agora
+                registro.expires_at = agora + timedelta(hours=CHECKPOINT_VALIDADE_HORAS)
             else:
-                # Cria novo registro
-                historico = HistoricoSLA(
-                    chamado_id=chamado.id,
-                    usuario_id=None,
-                    acao="recalculo_automatico",
-                    status_novo=chamado.status,
-                    tempo_resposta_horas=tempo_resposta,
-                    tempo_resolucao_horas=tempo_resolucao,
-                    status_sla=sla_status.get("status_geral"),
-                    criado_em=chamado.data_abertura or now_brazil_naive(),
-                )
-                self.db.add(historico)
-
-            self.db.flush()
+                self.db.add(MetricsCacheDB(
+                    cache_key=CHECKPOINT_KEY,
+                    cache_value=valor,
+                    calculated_at=agora,
+                    expires_at=agora + timedelta(hours=CHECKPOINT_VALIDADE_HORAS),
+                ))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            print(f"⚠️  Erro ao salvar checkpoint de recálculo: {e}")
 
+    def _remover_checkpoint(self) -> None:
+        try:
+            self.db.query(MetricsCacheDB).filter(
+                MetricsCacheDB.cache_key == CHECKPOINT_KEY
+            ).delete(synchronize_session=False)
+            self.db.commit()
         except Exception as e:
-            print(f"⚠️  Erro ao atualizar histórico do chamado {chamado.id}: {e}")
-            raise
+            self.db.rollback()
+            print(f"⚠️  Erro ao remover checkpoint de recálculo: {e}")
 
     def _print_stats(self):
         """Imprime estatísticas da recalculação"""
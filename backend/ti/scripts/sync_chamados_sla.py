@@ -13,6 +13,7 @@ from core.db import SessionLocal, engine
 from ti.models.chamado import Chamado
 from ti.models.sla_config import HistoricoSLA, SLAConfiguration, SLABusinessHours
 from ti.services.sla import SLACalculator
+from ti.services.sla_historico import HistoricoSLAWriter
 from core.utils import now_brazil_naive
 
 
@@ -131,76 +132,70 @@ def sync_chamados_to_sla(db: Session) -> dict:
             print("ℹ️  Nenhum chamado encontrado para sincronizar.")
             return stats
 
-        for chamado in chamados:
-            try:
-                # Verifica se já existe histórico para este chamado
-                existing = db.query(HistoricoSLA).filter(
-                    HistoricoSLA.chamado_id == chamado.id
-                ).first()
+        for lote in HistoricoSLAWriter.lotes(chamados):
+            # Quem já tem histórico neste lote: uma query
+            existentes = HistoricoSLAWriter.chamados_com_historico(db, [c.id for c in lote])
+            registros = []
+            detalhes_lote = []
 
-                if existing:
+            for chamado in lote:
+                if chamado.id in existentes:
                     stats["ja_sincronizados"] += 1
                     continue
-
-                # Calcula o status de SLA atual
-                sla_status = SLACalculator.get_sla_status(db, chamado)
-
-                # Se não há configuração de SLA, registra e pula
-                if sla_status.get("status_geral") == "sem_sla":
-                    stats["sem_configuracao"] += 1
-                    stats["detalhes"].append({
+                try:
+                    # Calcula o status de SLA atual
+                    sla_status = SLACalculator.get_sla_status(db, chamado)
+
+                    # Se não há configuração de SLA, registra e pula
+                    if sla_status.get("status_geral") == "sem_sla":
+                        stats["sem_configuracao"] += 1
+                        stats["detalhes"].append({
+                            "chamado_id": chamado.id,
+                            "codigo": chamado.codigo,
+                            "status": "sem_configuracao",
+                            "prioridade": chamado.prioridade,
+                            "mensagem": f"Chamado {chamado.codigo} com prioridade '{chamado.prioridade}' não tem SLA configurada"
+                        })
+                        continue
+
+                    # Registro histórico inicial (gravado em lote abaixo)
+                    registro = HistoricoSLAWriter.montar_registro(
+                        chamado,
+                        sla_status,
+                        acao="sincronizacao_inicial",
+                        criado_em=chamado.data_abertura or now_brazil_naive(),
+                    )
+                    registros.append(registro)
+                    detalhes_lote.append({
                         "chamado_id": chamado.id,
                         "codigo": chamado.codigo,
-                        "status": "sem_configuracao",
+                        "status": "sincronizado",
                         "prioridade": chamado.prioridade,
-                        "mensagem": f"Chamado {chamado.codigo} com prioridade '{chamado.prioridade}' não tem SLA configurada"
+                        "tempo_resolucao": round(registro["tempo_resolucao_horas"] or 0, 2),
                     })
-                    continue
-
-                # Extrai métricas de resposta e resolução
-                resposta_metric = sla_status.get("resposta_metric")
-                resolucao_metric = sla_status.get("resolucao_metric")
-
-                tempo_resposta_horas = resposta_metric.get("tempo_decorrido_horas") if resposta_metric else None
-                limite_sla_resposta_horas = resposta_metric.get("tempo_limite_horas") if resposta_metric else None
-                tempo_resolucao_horas = resolucao_metric.get("tempo_decorrido_horas") if resolucao_metric else None
-                limite_sla_horas = resolucao_metric.get("tempo_limite_horas") if resolucao_metric else None
-
-                # Cria o registro histórico inicial
-                historico = HistoricoSLA(
-                    chamado_id=chamado.id,
-                    usuario_id=None,
-                    acao="sincronizacao_inicial",
-                    status_anterior=None,
-                    status_novo=chamado.status,
-                    tempo_resposta_horas=tempo_resposta_horas,
-                    limite_sla_resposta_horas=limite_sla_resposta_horas,
-                    tempo_resolucao_horas=tempo_resolucao_horas,
-                    limite_sla_horas=limite_sla_horas,
-                    status_sla=sla_status.get("status_geral"),
-                    criado_em=chamado.data_abertura or now_brazil_naive(),
-                )
-                db.add(historico)
-                db.commit()
 
-                stats["sincronizados"] += 1
-                stats["detalhes"].append({
-                    "chamado_id": chamado.id,
-                    "codigo": chamado.codigo,
-                    "status": "sincronizado",
-                    "prioridade": chamado.prioridade,
-                    "tempo_resolucao": round(tempo_resolucao_horas or 0, 2),
-                })
+                except Exception as e:
+                    stats["erros"] += 1
+                    stats["detalhes"].append({
+                        "chamado_id": chamado.id,
+                        "codigo": getattr(chamado, "codigo", "?"),
+                        "status": "erro",
+                        "erro": str(e),
+                    })
 
+            if not registros:
+                continue
+            try:
+                HistoricoSLAWriter.upsert_many(db, registros)
+                db.commit()
+                stats["sincronizados"] += len(registros)
+                stats["detalhes"].extend(detalhes_lote)
             except Exception as e:
-                stats["erros"] += 1
-                stats["detalhes"].append({
-                    "chamado_id": chamado.id,
-                    "codigo": getattr(chamado, "codigo", "?"),
-                    "status": "erro",
-                    "erro": str(e),
-                })
                 db.rollback()
+                stats["erros"] += len(registros)
+                stats["detalhes"].extend(
+                    {**detalhe, "status": "erro", "erro": str(e)} for detalhe in detalhes_lote
+                )
 
         return stats
 
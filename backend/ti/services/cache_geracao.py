@@ -0,0 +1,102 @@
+"""
+Gerações de tag compartilhadas entre workers (tabela cache_tag_geracao).
+
+Cada tag ("sla", "usuarios", "dashboard_permissions", "powerbi_metadados",
+referências de SLA...) tem um contador no banco. Invalidar é incrementar o
+contador (um UPDATE de uma linha); quem guarda algo em memória por tag
+compara a geração com a que tinha e recarrega quando ela muda.
+
+- geracao(db, tag) lê o contador no máximo a cada
+  SLA_CACHE_GERACAO_TTL_SEGUNDOS por worker (invalidações feitas por outro
+  worker aparecem em no máximo esse intervalo)
+- incrementar(db, tag) invalida a tag em todos os workers e devolve a nova
+  geração (já visível neste worker)
+- esquecer(tag) faz este worker reler a geração na próxima leitura
+
+Uso:
+    from ti.services import cache_geracao
+
+    versao = cache_geracao.geracao(db, "usuarios")
+    cache_geracao.incrementar(db, "usuarios")
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from core.utils import now_brazil_naive
+
+# Por quanto tempo a geração lida do banco vale neste worker
+GERACAO_TTL_SEGUNDOS = float(os.getenv("SLA_CACHE_GERACAO_TTL_SEGUNDOS", "2"))
+
+# Geração conhecida de cada tag: tag -> (geracao, lida_em monotônico)
+_geracoes: dict[str, tuple[int, float]] = {}
+_lock = threading.Lock()
+
+
+def geracao(db: Session, tag: str, forcar: bool = False) -> int:
+    """Geração atual da tag (lida do banco no máximo a cada GERACAO_TTL_SEGUNDOS)"""
+    agora = time.monotonic()
+    with _lock:
+        conhecida = _geracoes.get(tag)
+    if conhecida and not forcar and agora - conhecida[1] < GERACAO_TTL_SEGUNDOS:
+        return conhecida[0]
+
+    try:
+        from ti.models.metrics_cache import CacheTagGeracao
+        valor = db.query(CacheTagGeracao.geracao).filter(CacheTagGeracao.tag == tag).scalar()
+        atual = int(valor or 0)
+    except Exception as e:
+        print(f"[CACHE] Erro ao ler geração da tag {tag}: {e}")
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        return conhecida[0] if conhecida else 0
+
+    with _lock:
+        _geracoes[tag] = (atual, agora)
+    return atual
+
+
+def incrementar(db: Session, tag: str) -> int:
+    """
+    Invalida a tag em todos os workers incrementando a sua geração
+    (um UPDATE de uma linha); retorna a nova geração
+    """
+    try:
+        from ti.models.metrics_cache import CacheTagGeracao
+        agora = now_brazil_naive()
+        atualizadas = db.query(CacheTagGeracao).filter(CacheTagGeracao.tag == tag).update(
+            {"geracao": CacheTagGeracao.geracao + 1, "atualizado_em": agora},
+            synchronize_session=False,
+        )
+        if not atualizadas:
+            db.add(CacheTagGeracao(tag=tag, geracao=1, atualizado_em=agora))
+        try:
+            db.commit()
+        except Exception:
+            # Outro worker criou a linha ao mesmo tempo
+            db.rollback()
+            db.query(CacheTagGeracao).filter(CacheTagGeracao.tag == tag).update(
+                {"geracao": CacheTagGeracao.geracao + 1, "atualizado_em": agora},
+                synchronize_session=False,
+            )
+            db.commit()
+    except Exception as e:
+        print(f"[CACHE] Erro ao invalidar tag {tag}: {e}")
+        try:
+            db.rollback()
+        except Exception:
+            pass
+
+    return geracao(db, tag, forcar=True)
+
+
+def esquecer(tag: str) -> None:
+    """Descarta a geração conhecida neste worker (a próxima leitura vai ao banco)"""
+    with _lock:
+        _geracoes.pop(tag, None)
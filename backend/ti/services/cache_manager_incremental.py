@@ -160,6 +160,11 @@ class ChamadosTodayCounter:
                 pass
             return ChamadosTodayCounter._recalculate(db)
     
+    @staticmethod
+    def recalcular(db: Session) -> int:
+        """Recalcula o contador de hoje a partir do banco (idempotente)"""
+        return ChamadosTodayCounter._recalculate(db)
+
     @staticmethod
     def _recalculate(db: Session) -> int:
         """Recalcula contador de hoje a partir do banco de dados"""
@@ -169,7 +174,8 @@ class ChamadosTodayCounter:
             count = db.query(Chamado).filter(
                 and_(
                     Chamado.data_abertura >= hoje,
-                    Chamado.status != "Cancelado"
+                    Chamado.status != "Cancelado",
+                    Chamado.deletado_em.is_(None),
                 )
             ).count()
 
@@ -226,6 +232,12 @@ class IncrementalMetricsCache:
     - Reset automático no dia 1º do próximo mês às 00:00
     """
     
+    @staticmethod
+    def _chave(db: Session, key: str) -> str:
+        """Chave física na geração atual da tag "sla_incremental" (ver SLACacheManager)"""
+        from ti.services.sla_cache import SLACacheManager
+        return SLACacheManager.chave_fisica_atual(db, key)
+
     @staticmethod
     def get_cache_key_month() -> str:
         """Gera chave de cache para o mês atual"""
@@ -252,7 +264,7 @@ class IncrementalMetricsCache:
     def get_metrics(db: Session) -> Dict[str, Any]:
         """Obtém métricas mensais do cache"""
         try:
-            cache_key = IncrementalMetricsCache.get_cache_key_month()
+            cache_key = IncrementalMetricsCache._chave(db, IncrementalMetricsCache.get_cache_key_month())
             
             cached = db.query(MetricsCacheDB).filter(
                 MetricsCacheDB.cache_key == cache_key
@@ -320,7 +332,7 @@ class IncrementalMetricsCache:
             
             # Remove contagem anterior do chamado (se existe)
             historico_anterior = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == f"chamado_sla_status:{chamado_id}"
+                MetricsCacheDB.cache_key == IncrementalMetricsCache._chave(db, f"chamado_sla_status:{chamado_id}")
             ).first()
             
             estava_dentro = True
@@ -365,6 +377,14 @@ class IncrementalMetricsCache:
         except Exception as e:
             print(f"[CACHE] Erro ao atualizar métricas para chamado {chamado_id}: {e}")
     
+    @staticmethod
+    def reset_month(db: Session) -> None:
+        """Descarta as métricas do mês em cache (próximo get_metrics recalcula do zero)"""
+        db.query(MetricsCacheDB).filter(
+            MetricsCacheDB.cache_key == IncrementalMetricsCache._chave(db, IncrementalMetricsCache.get_cache_key_month())
+        ).delete(synchronize_session=False)
+        db.commit()
+
     @staticmethod
     def _calculate_month(db: Session) -> Dict[str, Any]:
         """Calcula métricas mensais do zero"""
@@ -408,7 +428,7 @@ class IncrementalMetricsCache:
         """Salva métricas no cache com expiração até fim do mês"""
         try:
             from sqlalchemy import insert
-            cache_key = IncrementalMetricsCache.get_cache_key_month()
+            cache_key = IncrementalMetricsCache._chave(db, IncrementalMetricsCache.get_cache_key_month())
             expire_time = IncrementalMetricsCache.get_expire_time_for_month()
 
             agora = now_brazil_naive()
@@ -454,7 +474,7 @@ class IncrementalMetricsCache:
         """Salva status de SLA do chamado para referência incremental"""
         try:
             from sqlalchemy import insert
-            cache_key = f"chamado_sla_status:{chamado_id}"
+            cache_key = IncrementalMetricsCache._chave(db, f"chamado_sla_status:{chamado_id}")
 
             expire_time = IncrementalMetricsCache.get_expire_time_for_month()
             agora = now_brazil_naive()
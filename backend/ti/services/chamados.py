@@ -55,7 +55,8 @@ def _next_protocolo(db: Session) -> str:
     return fallback
 
 
-def criar_chamado(db: Session, payload: ChamadoCreate) -> Chamado:
+def criar_chamado(db: Session, payload: ChamadoCreate, commit: bool = True) -> Chamado:
+    """Cria o chamado; commit=False apenas faz flush (transação do chamador)"""
     try:
         Chamado.__table__.create(bind=engine, checkfirst=True)
     except Exception:
@@ -90,6 +91,9 @@ def criar_chamado(db: Session, payload: ChamadoCreate) -> Chamado:
         prioridade="Normal",
     )
     db.add(novo)
+    if not commit:
+        db.flush()
+        return novo
     db.commit()
     db.refresh(novo)
     return novo
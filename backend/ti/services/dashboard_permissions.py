@@ -5,20 +5,38 @@ Suporta controle granular por:
 - Roles (Administrador, Gestor, Funcionário, etc.)
 - Usuários específicos
 - Acesso público
+
+A checagem de acesso usa um índice compilado em memória (IndicePermissoes):
+dashboard → usuários/roles/público e os mapas reversos usuário → dashboards
+e role → dashboards. "Dashboards do usuário" vira uma união de conjuntos, sem
+consultar o banco. Toda mutação de permissão (ou de dashboard, em
+ti/api/powerbi.py) chama invalidar_indice(), que incrementa a versão
+"dashboard_permissions" em cache_tag_geracao; os outros workers percebem a
+nova versão em até cache_geracao.GERACAO_TTL_SEGUNDOS e recompilam.
 """
 
 import json
+import threading
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from ..models.powerbi_dashboard import PowerBIDashboard
+from . import cache_geracao
+
+TAG_PERMISSOES = "dashboard_permissions"
 
 
-def _normalize_permissions(permissoes: dict | None) -> dict:
+def _normalize_permissions(permissoes: dict | str | None) -> dict:
     """
     Normaliza estrutura de permissões.
     Formato padrão: {"roles": [...], "users": [...], "public": false}
     """
+    if isinstance(permissoes, str):
+        # Gravado com json.dumps numa coluna JSON: chega como string
+        try:
+            permissoes = json.loads(permissoes)
+        except ValueError:
+            permissoes = None
     if not permissoes:
         return {"roles": [], "users": [], "public": False}
     
@@ -67,6 +85,7 @@ def set_dashboard_permissions(db: Session, dashboard_id: str, permissoes: dict)
         
         db.commit()
         db.refresh(dashboard)
+        invalidar_indice(db)
         
         return {
             "dashboard_id": dashboard.dashboard_id,
@@ -96,6 +115,7 @@ def add_role_permission(db: Session, dashboard_id: str, role: str) -> dict:
             dashboard.permissoes_atualizadas_em = datetime.utcnow()
             db.commit()
             db.refresh(dashboard)
+            invalidar_indice(db)
         
         return {"message": f"Role '{role}' adicionada", "permissoes": perms}
     except Exception as e:
@@ -121,6 +141,7 @@ def remove_role_permission(db: Session, dashboard_id: str, role: str) -> dict:
             dashboard.permissoes_atualizadas_em = datetime.utcnow()
             db.commit()
             db.refresh(dashboard)
+            invalidar_indice(db)
         
         return {"message": f"Role '{role}' removida", "permissoes": perms}
     except Exception as e:
@@ -146,6 +167,7 @@ def add_user_permission(db: Session, dashboard_id: str, user_id: int) -> dict:
             dashboard.permissoes_atualizadas_em = datetime.utcnow()
             db.commit()
             db.refresh(dashboard)
+            invalidar_indice(db)
         
         return {"message": f"Usuário {user_id} adicionado", "permissoes": perms}
     except Exception as e:
@@ -171,6 +193,7 @@ def remove_user_permission(db: Session, dashboard_id: str, user_id: int) -> dict
             dashboard.permissoes_atualizadas_em = datetime.utcnow()
             db.commit()
             db.refresh(dashboard)
+            invalidar_indice(db)
         
         return {"message": f"Usuário {user_id} removido", "permissoes": perms}
     except Exception as e:
@@ -195,6 +218,7 @@ def set_public_access(db: Session, dashboard_id: str, is_public: bool) -> dict:
         
         db.commit()
         db.refresh(dashboard)
+        invalidar_indice(db)
         
         status = "público" if is_public else "privado"
         return {"message": f"Dashboard marcado como {status}", "permissoes": perms}
@@ -203,6 +227,104 @@ def set_public_access(db: Session, dashboard_id: str, is_public: bool) -> dict:
         raise ValueError(f"Erro ao atualizar acesso público: {str(e)}")
 
 
+# ------------------------------------------------------------------
+# Índice compilado de permissões
+# ------------------------------------------------------------------
+
+def _role_key(role) -> str:
+    return str(role).strip().lower()
+
+
+class IndicePermissoes:
+    """Permissões de todos os dashboards ativos, compiladas numa versão"""
+
+    def __init__(self, versao: int, dashboards: list[PowerBIDashboard]):
+        self.versao = versao
+        self.compilado_em = datetime.utcnow()
+        # Ordem do banco (id): mantém a ordem da listagem anterior
+        self.info: dict[str, dict] = {}
+        self.posicao: dict[str, int] = {}
+        self.usuarios: dict[str, set[int]] = {}
+        self.roles: dict[str, set[str]] = {}
+        self.publicos: set[str] = set()
+        self.por_usuario: dict[int, set[str]] = {}
+        self.por_role: dict[str, set[str]] = {}
+
+        for posicao, dashboard in enumerate(dashboards):
+            dashboard_id = dashboard.dashboard_id
+            perms = _normalize_permissions(dashboard.permissoes)
+            self.info[dashboard_id] = {
+                "id": dashboard.id,
+                "dashboard_id": dashboard_id,
+                "title": dashboard.title,
+                "category": dashboard.category,
+                "category_name": dashboard.category_name,
+            }
+            self.posicao[dashboard_id] = posicao
+            self.usuarios[dashboard_id] = set(perms["users"])
+            self.roles[dashboard_id] = {_role_key(r) for r in perms["roles"]}
+            if perms["public"]:
+                self.publicos.add(dashboard_id)
+            for user_id in self.usuarios[dashboard_id]:
+                self.por_usuario.setdefault(user_id, set()).add(dashboard_id)
+            for role in self.roles[dashboard_id]:
+                self.por_role.setdefault(role, set()).add(dashboard_id)
+
+    def pode_acessar(self, dashboard_id: str, user_id: int, user_roles: list[str]) -> bool:
+        if dashboard_id not in self.info:
+            return False
+        if dashboard_id in self.publicos or user_id in self.usuarios[dashboard_id]:
+            return True
+        return any(_role_key(r) in self.roles[dashboard_id] for r in user_roles or [])
+
+    def dashboards_do_usuario(self, user_id: int, user_roles: list[str]) -> list[dict]:
+        """União: públicos ∪ do usuário ∪ de cada role (O(roles), sem consultar o banco)"""
+        ids = self.publicos | self.por_usuario.get(user_id, set())
+        for role in user_roles or []:
+            ids = ids | self.por_role.get(_role_key(role), set())
+        return [dict(self.info[d]) for d in sorted(ids, key=self.posicao.__getitem__)]
+
+    def status(self) -> dict:
+        return {
+            "versao": self.versao,
+            "compilado_em": self.compilado_em.isoformat(),
+            "dashboards": len(self.info),
+            "publicos": len(self.publicos),
+            "usuarios_com_acesso_direto": len(self.por_usuario),
+            "roles": len(self.por_role),
+        }
+
+
+_indice: IndicePermissoes | None = None
+_indice_lock = threading.Lock()
+
+
+def get_indice(db: Session) -> IndicePermissoes:
+    """Índice da versão atual; recompila (uma consulta) se outro worker/mutação mudou a versão"""
+    global _indice
+    versao = cache_geracao.geracao(db, TAG_PERMISSOES)
+    indice = _indice
+    if indice is not None and indice.versao == versao:
+        return indice
+
+    with _indice_lock:
+        if _indice is None or _indice.versao != versao:
+            dashboards = db.query(PowerBIDashboard).filter(
+                PowerBIDashboard.ativo == True
+            ).order_by(PowerBIDashboard.id).all()
+            _indice = IndicePermissoes(versao, dashboards)
+            print(f"[PERMISSOES] Índice de dashboards compilado (versão {versao}, {len(dashboards)} dashboards)")
+        return _indice
+
+
+def invalidar_indice(db: Session) -> None:
+    """Nova versão do índice (todos os workers recompilam na próxima consulta)"""
+    global _indice
+    cache_geracao.incrementar(db, TAG_PERMISSOES)
+    with _indice_lock:
+        _indice = None
+
+
 def can_user_access(db: Session, dashboard_id: str, user_id: int, user_roles: list[str]) -> bool:
     """
     Verifica se um usuário tem permissão para acessar um dashboard.
@@ -213,34 +335,7 @@ def can_user_access(db: Session, dashboard_id: str, user_id: int, user_roles: li
     3. Alguma das user_roles está na lista de roles permitidas
     """
     try:
-        dashboard = db.query(PowerBIDashboard).filter(
-            PowerBIDashboard.dashboard_id == dashboard_id
-        ).first()
-        
-        if not dashboard:
-            return False
-        
-        if not dashboard.ativo:
-            return False
-        
-        perms = _normalize_permissions(dashboard.permissoes)
-        
-        # Acesso público
-        if perms.get("public"):
-            return True
-        
-        # Usuário específico
-        if user_id in perms.get("users", []):
-            return True
-        
-        # Role do usuário
-        if user_roles:
-            user_roles_normalized = [str(r).strip().lower() for r in user_roles]
-            perms_roles = [str(r).strip().lower() for r in perms.get("roles", [])]
-            if any(role in perms_roles for role in user_roles_normalized):
-                return True
-        
-        return False
+        return get_indice(db).pode_acessar(dashboard_id, user_id, user_roles)
     except Exception as e:
         print(f"Erro ao verificar permissão: {str(e)}")
         return False
@@ -249,23 +344,7 @@ def can_user_access(db: Session, dashboard_id: str, user_id: int, user_roles: li
 def get_all_dashboards_for_user(db: Session, user_id: int, user_roles: list[str]) -> list[dict]:
     """Retorna todos os dashboards que um usuário pode acessar."""
     try:
-        dashboards = db.query(PowerBIDashboard).filter(
-            PowerBIDashboard.ativo == True
-        ).all()
-        
-        accessible = []
-        for dashboard in dashboards:
-            if can_user_access(db, dashboard.dashboard_id, user_id, user_roles):
-                perms = _normalize_permissions(dashboard.permissoes)
-                accessible.append({
-                    "id": dashboard.id,
-                    "dashboard_id": dashboard.dashboard_id,
-                    "title": dashboard.title,
-                    "category": dashboard.category,
-                    "category_name": dashboard.category_name,
-                })
-        
-        return accessible
+        return get_indice(db).dashboards_do_usuario(user_id, user_roles)
     except Exception as e:
         print(f"Erro ao listar dashboards: {str(e)}")
         return []
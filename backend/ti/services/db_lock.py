@@ -0,0 +1,94 @@
+"""
+Locks nomeados do MySQL (GET_LOCK / RELEASE_LOCK).
+
+O lock pertence à conexão que o adquiriu, por isso cada MySQLNamedLock usa
+uma conexão dedicada do pool (fora da sessão ORM): o lock continua válido
+mesmo depois de commits na sessão, e é liberado automaticamente pelo MySQL
+se o processo morrer e a conexão cair.
+
+Uso:
+    lock = MySQLNamedLock("meu_lock")
+    if lock.adquirir(timeout_segundos=10):
+        try:
+            ...
+        finally:
+            lock.liberar()
+"""
+
+from __future__ import annotations
+import logging
+
+from sqlalchemy import text
+
+from core.db import engine
+
+logger = logging.getLogger(__name__)
+
+
+class MySQLNamedLock:
+    """Lock nomeado do MySQL (GET_LOCK) preso a uma conexão dedicada"""
+
+    def __init__(self, nome: str):
+        # Nomes de lock do MySQL são limitados a 64 caracteres
+        self.nome = nome[:64]
+        self._conn = None
+
+    @staticmethod
+    def _suportado() -> bool:
+        return engine.dialect.name == "mysql"
+
+    def adquirir(self, timeout_segundos: int = 0) -> bool:
+        if not self._suportado():
+            # Sem MySQL (ex: desenvolvimento local) não há outros workers a coordenar
+            return True
+        conn = None
+        try:
+            conn = engine.connect()
+            obtido = conn.execute(
+                text("SELECT GET_LOCK(:nome, :timeout)"),
+                {"nome": self.nome, "timeout": timeout_segundos},
+            ).scalar()
+            if obtido == 1:
+                self._conn = conn
+                return True
+        except Exception as e:
+            logger.warning(f"[LOCK] Erro ao adquirir lock '{self.nome}': {e}")
+        # Lock não obtido (ou erro): devolve a conexão ao pool
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return False
+
+    def ainda_detido(self) -> bool:
+        if not self._suportado():
+            return True
+        if self._conn is None:
+            return False
+        try:
+            dono = self._conn.execute(
+                text("SELECT IS_USED_LOCK(:nome) = CONNECTION_ID()"),
+                {"nome": self.nome},
+            ).scalar()
+            return dono == 1
+        except Exception:
+            self._descartar()
+            return False
+
+    def liberar(self) -> None:
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(text("SELECT RELEASE_LOCK(:nome)"), {"nome": self.nome})
+        except Exception:
+            pass
+        self._descartar()
+
+    def _descartar(self) -> None:
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
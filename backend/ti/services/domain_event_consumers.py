@@ -0,0 +1,274 @@
+"""
+Consumidores dos eventos de domínio do chamado.
+
+Tipos publicados (ver ti/api/chamados.py):
+- chamado.criado           {codigo, protocolo, status, notificacao_id, com_anexos}
+- chamado.status_alterado  {status, status_anterior, notificacao_id}
+- chamado.excluido         {codigo, protocolo, status, notificacao_id}
+- chamado.ticket_enviado   {historico_id, anexos} (só a linha do tempo do chamado)
+
+Cada consumidor recebe lotes e agrupa o trabalho por lote (ex: um único
+recálculo do contador de hoje e um único metrics:updated por lote, em vez
+de um por evento).
+"""
+
+from __future__ import annotations
+import logging
+import os
+
+from sqlalchemy.orm import Session
+
+from core.utils import now_brazil_naive
+from ti.models.chamado import Chamado
+from ti.models.domain_event import DomainEvent
+from ti.models.metrics_cache import MetricsCacheDB
+from ti.services.domain_events import (
+    DomainEvents,
+    EventConsumer,
+    EventDispatcher,
+    ESCOPO_CLUSTER,
+    ESCOPO_WORKER,
+)
+
+logger = logging.getLogger(__name__)
+
+CHAMADO_CRIADO = "chamado.criado"
+CHAMADO_STATUS_ALTERADO = "chamado.status_alterado"
+CHAMADO_EXCLUIDO = "chamado.excluido"
+CHAMADO_TICKET_ENVIADO = "chamado.ticket_enviado"
+
+TIPOS_CHAMADO = {CHAMADO_CRIADO, CHAMADO_STATUS_ALTERADO, CHAMADO_EXCLUIDO}
+
+
+def _chamado_ids(eventos: list[DomainEvent]) -> list[int]:
+    """Ids distintos de chamado do lote, na ordem do primeiro evento"""
+    vistos: dict[int, None] = {}
+    for evento in eventos:
+        if evento.agregado == "chamado" and evento.agregado_id is not None:
+            vistos.setdefault(evento.agregado_id, None)
+    return list(vistos)
+
+
+class CacheSLAConsumer(EventConsumer):
+    """Invalida o cache de SLA (banco) e atualiza as métricas incrementais do mês"""
+
+    nome = "cache_sla"
+    tipos = TIPOS_CHAMADO
+    escopo = ESCOPO_CLUSTER
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        from ti.services.sla_cache import SLACacheManager
+        from ti.services.cache_manager_incremental import IncrementalMetricsCache
+
+        for chamado_id in _chamado_ids(eventos):
+            SLACacheManager.invalidate_by_chamado(db, chamado_id)
+            IncrementalMetricsCache.update_for_chamado(db, chamado_id)
+
+    def reconstruir(self, db: Session) -> None:
+        from ti.services.sla_cache import SLACacheManager
+        from ti.services.cache_manager_incremental import IncrementalMetricsCache
+
+        SLACacheManager.invalidate_all_sla(db)
+        IncrementalMetricsCache.reset_month(db)
+
+
+class CacheSLAMemoriaConsumer(EventConsumer):
+    """Faz cada worker reler a geração do cache de SLA logo após a invalidação"""
+
+    nome = "cache_sla_memoria"
+    tipos = TIPOS_CHAMADO
+    escopo = ESCOPO_WORKER
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        from ti.services.sla_cache import SLACacheManager
+
+        for chamado_id in _chamado_ids(eventos):
+            SLACacheManager.invalidate_memory_by_chamado(chamado_id)
+
+
+class ContadorHojeConsumer(EventConsumer):
+    """
+    Contador de "chamados hoje". Recalculado a partir do banco uma vez por
+    lote: idempotente, então replay e entrega repetida não distorcem o valor
+    (incrementos/decrementos por evento não seriam).
+    """
+
+    nome = "contador_hoje"
+    tipos = TIPOS_CHAMADO
+    escopo = ESCOPO_CLUSTER
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        from ti.services.cache_manager_incremental import ChamadosTodayCounter
+        ChamadosTodayCounter.recalcular(db)
+
+    def reconstruir(self, db: Session) -> None:
+        from ti.services.cache_manager_incremental import ChamadosTodayCounter
+        db.query(MetricsCacheDB).filter(
+            MetricsCacheDB.cache_key == ChamadosTodayCounter.get_cache_key_today()
+        ).delete(synchronize_session=False)
+
+
+class EmailConsumer(EventConsumer):
+    """E-mails de abertura e de mudança de status (Microsoft Graph)"""
+
+    nome = "email"
+    tipos = {CHAMADO_CRIADO, CHAMADO_STATUS_ALTERADO}
+    escopo = ESCOPO_CLUSTER
+    tamanho_lote = 20
+    # Reenviar e-mails já entregues não é desejado
+    permite_replay = False
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        from core.email_msgraph import send_chamado_abertura, send_chamado_status
+
+        chamados = {
+            c.id: c
+            for c in db.query(Chamado).filter(Chamado.id.in_(_chamado_ids(eventos))).all()
+        }
+        for evento in eventos:
+            ch = chamados.get(evento.agregado_id)
+            if ch is None:
+                continue
+            dados = DomainEvents.dados(evento)
+            # Falha de envio não bloqueia o stream (mesmo comportamento do send_async)
+            try:
+                if evento.tipo == CHAMADO_CRIADO:
+                    anexos = None
+                    if dados.get("com_anexos"):
+                        from ti.api.chamados import _anexos_email_payload
+                        anexos = _anexos_email_payload(db, ch.id) or None
+                    send_chamado_abertura(ch, anexos)
+                else:
+                    send_chamado_status(ch, dados.get("status_anterior") or "Aberto")
+            except Exception as e:
+                logger.warning(f"[EVENTOS] E-mail do evento {evento.id} falhou: {e}")
+
+
+class SocketIOConsumer(EventConsumer):
+    """Eventos em tempo real para os clientes conectados a este worker"""
+
+    nome = "socketio"
+    tipos = TIPOS_CHAMADO
+    escopo = ESCOPO_WORKER
+    permite_replay = False
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        from core.realtime import emit_threadsafe
+        from ti.models.notification import Notification
+        from ti.api.chamados import _notificacao_payload
+        from ti.services.cache_manager_incremental import ChamadosTodayCounter, IncrementalMetricsCache
+
+        dados_por_evento = {e.id: DomainEvents.dados(e) for e in eventos}
+        notificacao_ids = [d["notificacao_id"] for d in dados_por_evento.values() if d.get("notificacao_id")]
+        notificacoes = {
+            n.id: n
+            for n in db.query(Notification).filter(Notification.id.in_(notificacao_ids)).all()
+        } if notificacao_ids else {}
+
+        for evento in eventos:
+            dados = dados_por_evento[evento.id]
+            if evento.tipo == CHAMADO_CRIADO:
+                emit_threadsafe("chamado:created", {"id": evento.agregado_id})
+            elif evento.tipo == CHAMADO_STATUS_ALTERADO:
+                emit_threadsafe("chamado:status", {"id": evento.agregado_id, "status": dados.get("status")})
+            elif evento.tipo == CHAMADO_EXCLUIDO:
+                emit_threadsafe("chamado:deleted", {
+                    "id": evento.agregado_id,
+                    "codigo": dados.get("codigo"),
+                    "protocolo": dados.get("protocolo"),
+                })
+            n = notificacoes.get(dados.get("notificacao_id"))
+            if n is not None:
+                emit_threadsafe("notification:new", _notificacao_payload(n))
+
+        # Uma única atualização de métricas por lote
+        emit_threadsafe("metrics:updated", {
+            "chamados_hoje": ChamadosTodayCounter.get_count(db),
+            "sla_metrics": IncrementalMetricsCache.get_metrics(db),
+            "timestamp": now_brazil_naive().isoformat(),
+        })
+
+
+class TimerPrazosConsumer(EventConsumer):
+    """Mantém o temporizador de prazos de SLA (sla_deadline_timer) deste worker"""
+
+    nome = "timer_prazos"
+    tipos = TIPOS_CHAMADO
+    escopo = ESCOPO_WORKER
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        from ti.services.sla_deadline_timer import get_deadline_timer
+
+        timer = get_deadline_timer()
+        ids = _chamado_ids(eventos)
+        chamados = {
+            c.id: c
+            for c in db.query(Chamado).filter(
+                Chamado.id.in_(ids), Chamado.deletado_em.is_(None)
+            ).all()
+        }
+        for chamado_id in ids:
+            ch = chamados.get(chamado_id)
+            if ch is None:
+                timer.remover_chamado(chamado_id)
+            else:
+                timer.agendar_chamado(ch)
+
+    def reconstruir(self, db: Session) -> None:
+        from ti.services.sla_deadline_timer import get_deadline_timer
+        get_deadline_timer().solicitar_recarga()
+
+
+class HistoricoChamadoConsumer(EventConsumer):
+    """Descarta a linha do tempo em cache (deste worker) dos chamados do lote"""
+
+    nome = "historico_chamado"
+    tipos = TIPOS_CHAMADO | {CHAMADO_TICKET_ENVIADO}
+    escopo = ESCOPO_WORKER
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        from ti.services.historico_chamado import historico_cache
+        historico_cache.invalidar(_chamado_ids(eventos))
+
+    def reconstruir(self, db: Session) -> None:
+        from ti.services.historico_chamado import historico_cache
+        historico_cache.limpar()
+
+
+def registrar_consumidores(dispatcher: EventDispatcher) -> None:
+    """Registra os consumidores padrão no dispatcher (antes de start())"""
+    for consumidor in (
+        CacheSLAConsumer(),
+        CacheSLAMemoriaConsumer(),
+        ContadorHojeConsumer(),
+        EmailConsumer(),
+        SocketIOConsumer(),
+        TimerPrazosConsumer(),
+        HistoricoChamadoConsumer(),
+    ):
+        dispatcher.register(consumidor)
+
+
+JOB_LIMPEZA_EVENTOS = "domain_event_limpeza"
+AGENDA_LIMPEZA_EVENTOS = "40 2 * * *"
+RETENCAO_DIAS = int(os.getenv("DOMAIN_EVENT_RETENCAO_DIAS", "180"))
+
+
+def limpar_eventos_job(db: Session, ctx) -> dict:
+    """Remove eventos além da retenção já consumidos por todos os consumidores do cluster"""
+    from ti.services.domain_events import get_event_dispatcher
+
+    removidos = get_event_dispatcher().limpar_antigos(db, RETENCAO_DIAS)
+    return {"linhas_processadas": removidos, "removidos": removidos}
+
+
+def registrar_jobs_eventos(scheduler) -> None:
+    """Registra a limpeza do outbox no agendador de jobs"""
+    scheduler.register(
+        JOB_LIMPEZA_EVENTOS,
+        AGENDA_LIMPEZA_EVENTOS,
+        limpar_eventos_job,
+        descricao=f"Remove eventos de domínio com mais de {RETENCAO_DIAS} dias",
+        jitter_segundos=60,
+        recuperar_atrasados=False,
+    )
@@ -0,0 +1,457 @@
+"""
+Outbox de eventos de domínio e dispatcher com consumidores plugáveis.
+
+Os efeitos colaterais do ciclo de vida do chamado (contadores, cache de
+SLA, métricas incrementais, Socket.IO, e-mail, alertas de prazo) eram
+executados direto em cada handler e se perdiam se o processo caísse no meio
+da requisição. Agora:
+
+- O handler grava um DomainEvent na MESMA transação da mudança
+  (DomainEvents.publicar / UnitOfWork.publicar): se o commit acontece, o
+  evento existe; se não, nada acontece
+- O EventDispatcher lê a tabela domain_event em ordem de id e entrega lotes
+  a cada consumidor registrado, guardando o offset (último id processado)
+  por consumidor. Entrega "pelo menos uma vez": o offset só avança depois
+  que o consumidor processou o lote
+- Consumidores de escopo "cluster" (cache, contador, e-mail) processam cada
+  evento uma vez no cluster: offset em domain_event_offset e lock nomeado
+  por consumidor. Consumidores de escopo "worker" (Socket.IO, temporizador
+  de prazos) rodam em todos os workers, com offset em memória, porque cada
+  worker atende os seus próprios clientes e mantém o seu próprio estado
+- replay(nome, desde_id) reprocessa eventos; reconstruir(nome) limpa o
+  estado derivado do consumidor e reprocessa o stream desde o início
+
+Ids de auto-incremento podem ser confirmados fora de ordem (a transação do
+id 10 confirma depois da do id 11). Para não pular eventos, o dispatcher
+para antes de uma lacuna e só a considera perdida (rollback) depois de
+DOMAIN_EVENT_LACUNA_SEGUNDOS contados a partir de quando este worker a
+observou pela primeira vez (não do criado_em do evento seguinte, que pode
+ser antigo quando a transação do id faltante é longa).
+
+Uso:
+    from ti.services.domain_events import DomainEvents
+
+    DomainEvents.publicar(db, "chamado.status_alterado", "chamado", ch.id, {"status": ...})
+    db.commit()
+"""
+
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from core.db import SessionLocal
+from core.utils import now_brazil_naive
+from ti.models.domain_event import DomainEvent, DomainEventOffset
+from ti.services.db_lock import MySQLNamedLock
+
+logger = logging.getLogger(__name__)
+
+ESCOPO_CLUSTER = "cluster"
+ESCOPO_WORKER = "worker"
+
+
+class DomainEvents:
+    """Publicação de eventos no outbox (sem commit: participa da transação do chamador)"""
+
+    @staticmethod
+    def publicar(
+        db: Session,
+        tipo: str,
+        agregado: str,
+        agregado_id: int | None,
+        dados: dict | None = None,
+    ) -> DomainEvent:
+        evento = DomainEvent(
+            tipo=tipo,
+            agregado=agregado,
+            agregado_id=agregado_id,
+            dados=json.dumps(dados or {}, ensure_ascii=False, default=str),
+            criado_em=now_brazil_naive(),
+        )
+        db.add(evento)
+        return evento
+
+    @staticmethod
+    def dados(evento: DomainEvent) -> dict:
+        try:
+            return json.loads(evento.dados) if evento.dados else {}
+        except Exception:
+            return {}
+
+    @staticmethod
+    def to_dict(evento: DomainEvent) -> dict:
+        return {
+            "id": evento.id,
+            "tipo": evento.tipo,
+            "agregado": evento.agregado,
+            "agregado_id": evento.agregado_id,
+            "dados": DomainEvents.dados(evento),
+            "criado_em": evento.criado_em.isoformat() if evento.criado_em else None,
+        }
+
+
+class EventConsumer:
+    """
+    Consumidor de eventos. Subclasses definem nome, tipos (None = todos),
+    escopo e implementam processar(); reconstruir() limpa o estado derivado
+    antes de um replay completo.
+    """
+
+    nome: str = ""
+    tipos: set[str] | None = None
+    escopo: str = ESCOPO_CLUSTER
+    tamanho_lote: int = 100
+    # Consumidores com efeitos externos (ex: e-mail) não devem ser reprocessados
+    permite_replay: bool = True
+
+    def aceita(self, evento: DomainEvent) -> bool:
+        return self.tipos is None or evento.tipo in self.tipos
+
+    def processar(self, db: Session, eventos: list[DomainEvent]) -> None:
+        raise NotImplementedError
+
+    def reconstruir(self, db: Session) -> None:
+        """Limpa o estado derivado (chamado antes de replay desde o início)"""
+
+
+class EventDispatcher:
+    """Entrega eventos do outbox aos consumidores registrados"""
+
+    POLL_SEGUNDOS = float(os.getenv("DOMAIN_EVENT_POLL_SEGUNDOS", "1"))
+    LACUNA_SEGUNDOS = int(os.getenv("DOMAIN_EVENT_LACUNA_SEGUNDOS", "10"))
+    BACKOFF_ERRO_SEGUNDOS = 30
+
+    def __init__(self):
+        self._consumidores: dict[str, EventConsumer] = {}
+        # Offsets conhecidos neste worker (fonte da verdade: banco p/ cluster, memória p/ worker)
+        self._offsets: dict[str, int] = {}
+        self._pausado_ate: dict[str, datetime] = {}
+        # Lacuna observada por consumidor: (primeiro id faltante, último id faltante, monotonic da observação)
+        self._lacunas: dict[str, tuple[int, int, float]] = {}
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self.running = False
+        self.thread: threading.Thread | None = None
+
+    # ------------------------------------------------------------------
+    # Registro e ciclo de vida
+    # ------------------------------------------------------------------
+
+    def register(self, consumidor: EventConsumer) -> None:
+        with self._lock:
+            self._consumidores[consumidor.nome] = consumidor
+            self._stats[consumidor.nome] = {
+                "eventos_processados": 0,
+                "lotes": 0,
+                "erros": 0,
+                "ultimo_erro": None,
+                "ultimo_lote_em": None,
+            }
+
+    def get_consumidor(self, nome: str) -> EventConsumer | None:
+        return self._consumidores.get(nome)
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+
+        db = SessionLocal()
+        try:
+            ultimo_id = self._ultimo_id(db)
+            for consumidor in self._consumidores.values():
+                if consumidor.escopo == ESCOPO_WORKER:
+                    # Eventos anteriores à startup já foram entregues pelos outros workers
+                    self._offsets[consumidor.nome] = ultimo_id
+                    continue
+                try:
+                    self._offsets[consumidor.nome] = self._carregar_offset(db, consumidor.nome, ultimo_id)
+                    db.commit()
+                except Exception:
+                    # Outro worker criou o offset ao mesmo tempo
+                    db.rollback()
+                    self._offsets[consumidor.nome] = self._carregar_offset(db, consumidor.nome, ultimo_id)
+        finally:
+            db.close()
+
+        self.thread = threading.Thread(target=self._loop, daemon=True, name="EventDispatcherThread")
+        self.thread.start()
+        logger.info(f"Event Dispatcher iniciado com {len(self._consumidores)} consumidores")
+
+    def stop(self) -> None:
+        self.running = False
+        self._acordar.set()
+
+    def notificar(self) -> None:
+        """Acorda o dispatcher após um commit com eventos (evita esperar o poll)"""
+        self._acordar.set()
+
+    # ------------------------------------------------------------------
+    # Offsets
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ultimo_id(db: Session) -> int:
+        return int(db.query(func.max(DomainEvent.id)).scalar() or 0)
+
+    @staticmethod
+    def _carregar_offset(db: Session, nome: str, inicial: int) -> int:
+        """Offset do consumidor; um consumidor novo começa do fim do stream"""
+        row = db.query(DomainEventOffset).filter(DomainEventOffset.consumidor == nome).first()
+        if row is None:
+            row = DomainEventOffset(consumidor=nome, ultimo_evento_id=inicial, atualizado_em=now_brazil_naive())
+            db.add(row)
+            db.flush()
+        return row.ultimo_evento_id
+
+    def _sincronizar_offsets(self, db: Session, nomes: list[str]) -> None:
+        """Relê do banco os offsets de consumidores de cluster (avançados por outros workers)"""
+        rows = db.query(DomainEventOffset.consumidor, DomainEventOffset.ultimo_evento_id).filter(
+            DomainEventOffset.consumidor.in_(nomes)
+        ).all()
+        for nome, ultimo_evento_id in rows:
+            self._offsets[nome] = ultimo_evento_id
+
+    # ------------------------------------------------------------------
+    # Loop
+    # ------------------------------------------------------------------
+
+    def _loop(self) -> None:
+        while self.running:
+            processou = False
+            db = SessionLocal()
+            try:
+                ultimo_id = self._ultimo_id(db)
+                # Só tenta o lock de quem continua atrasado no banco: sem isso,
+                # o worker que não detém o lock abriria uma conexão por
+                # consumidor a cada poll
+                atrasados = [
+                    c.nome for c in self._consumidores.values()
+                    if c.escopo == ESCOPO_CLUSTER and self._offsets.get(c.nome, 0) < ultimo_id
+                ]
+                if atrasados:
+                    self._sincronizar_offsets(db, atrasados)
+                db.commit()
+                for consumidor in list(self._consumidores.values()):
+                    if self._offsets.get(consumidor.nome, 0) >= ultimo_id:
+                        continue
+                    pausa = self._pausado_ate.get(consumidor.nome)
+                    if pausa and pausa > now_brazil_naive():
+                        continue
+                    processou |= self._executar(db, consumidor)
+            except Exception as e:
+                logger.warning(f"[EVENTOS] Erro no loop do dispatcher: {e}")
+            finally:
+                db.close()
+
+            if not processou:
+                self._acordar.wait(self.POLL_SEGUNDOS)
+                self._acordar.clear()
+
+    def _executar(self, db: Session, consumidor: EventConsumer) -> bool:
+        """Processa um lote do consumidor; retorna True se algum evento foi consumido"""
+        if consumidor.escopo == ESCOPO_WORKER:
+            return self._processar_lote(db, consumidor, self._offsets.get(consumidor.nome, 0), None)
+
+        lock = MySQLNamedLock(f"evoque_event_consumer:{consumidor.nome}")
+        if not lock.adquirir(0):
+            # Outro worker está processando este consumidor
+            return False
+        try:
+            row = db.query(DomainEventOffset).filter(
+                DomainEventOffset.consumidor == consumidor.nome
+            ).first()
+            if row is None:
+                self._carregar_offset(db, consumidor.nome, self._ultimo_id(db))
+                db.commit()
+                row = db.query(DomainEventOffset).filter(
+                    DomainEventOffset.consumidor == consumidor.nome
+                ).first()
+            return self._processar_lote(db, consumidor, row.ultimo_evento_id, row)
+        finally:
+            lock.liberar()
+
+    def _lote(self, db: Session, nome: str, offset: int, tamanho: int) -> list[DomainEvent]:
+        """Próximos eventos após o offset, parando antes de uma lacuna de ids ainda em espera"""
+        eventos = db.query(DomainEvent).filter(
+            DomainEvent.id > offset
+        ).order_by(DomainEvent.id.asc()).limit(tamanho).all()
+
+        esperado = offset + 1
+        for i, evento in enumerate(eventos):
+            if evento.id != esperado:
+                # Um id anterior pode ainda estar em transação aberta: espera contada
+                # desde a primeira vez que este worker viu a lacuna
+                agora = time.monotonic()
+                lacuna = self._lacunas.get(nome)
+                if lacuna is None or not (lacuna[0] <= esperado <= lacuna[1]):
+                    lacuna = (esperado, evento.id - 1, agora)
+                    self._lacunas[nome] = lacuna
+                if agora - lacuna[2] < self.LACUNA_SEGUNDOS:
+                    return eventos[:i]
+                logger.warning(
+                    f"[EVENTOS] {nome}: ids {esperado}-{evento.id - 1} ausentes há "
+                    f"{agora - lacuna[2]:.0f}s, considerados perdidos"
+                )
+                self._lacunas.pop(nome, None)
+            esperado = evento.id + 1
+        return eventos
+
+    def _processar_lote(
+        self,
+        db: Session,
+        consumidor: EventConsumer,
+        offset: int,
+        row: DomainEventOffset | None,
+    ) -> bool:
+        eventos = self._lote(db, consumidor.nome, offset, consumidor.tamanho_lote)
+        if not eventos:
+            return False
+
+        aceitos = [e for e in eventos if consumidor.aceita(e)]
+        novo_offset = eventos[-1].id
+        stats = self._stats[consumidor.nome]
+
+        try:
+            if aceitos:
+                consumidor.processar(db, aceitos)
+            if row is not None:
+                row.ultimo_evento_id = novo_offset
+                row.eventos_processados = (row.eventos_processados or 0) + len(aceitos)
+                row.atualizado_em = now_brazil_naive()
+                row.erro = None
+                db.add(row)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            stats["erros"] += 1
+            stats["ultimo_erro"] = str(e)
+            self._pausado_ate[consumidor.nome] = now_brazil_naive() + timedelta(seconds=self.BACKOFF_ERRO_SEGUNDOS)
+            logger.warning(f"[EVENTOS] Consumidor {consumidor.nome} falhou no lote após {offset}: {e}")
+            if row is not None:
+                try:
+                    db.query(DomainEventOffset).filter(
+                        DomainEventOffset.consumidor == consumidor.nome
+                    ).update({"erro": str(e)[:2000], "erro_em": now_brazil_naive()}, synchronize_session=False)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+            return False
+
+        self._offsets[consumidor.nome] = novo_offset
+        self._pausado_ate.pop(consumidor.nome, None)
+        stats["eventos_processados"] += len(aceitos)
+        stats["lotes"] += 1
+        stats["ultimo_lote_em"] = now_brazil_naive().isoformat()
+        return True
+
+    # ------------------------------------------------------------------
+    # Replay / reconstrução
+    # ------------------------------------------------------------------
+
+    def replay(self, nome: str, desde_id: int = 0) -> dict:
+        """Reposiciona o offset do consumidor para reprocessar eventos com id > desde_id"""
+        consumidor = self._consumidores.get(nome)
+        if consumidor is None:
+            raise KeyError(nome)
+        if not consumidor.permite_replay:
+            raise RuntimeError(f"Consumidor '{nome}' não permite replay")
+
+        desde_id = max(0, desde_id)
+        if consumidor.escopo == ESCOPO_CLUSTER:
+            db = SessionLocal()
+            lock = MySQLNamedLock(f"evoque_event_consumer:{nome}")
+            if not lock.adquirir(30):
+                db.close()
+                raise RuntimeError(f"Consumidor '{nome}' ocupado, tente novamente")
+            try:
+                self._carregar_offset(db, nome, 0)
+                db.query(DomainEventOffset).filter(DomainEventOffset.consumidor == nome).update(
+                    {"ultimo_evento_id": desde_id, "atualizado_em": now_brazil_naive(), "erro": None},
+                    synchronize_session=False,
+                )
+                db.commit()
+            finally:
+                lock.liberar()
+                db.close()
+
+        self._offsets[nome] = desde_id
+        self._pausado_ate.pop(nome, None)
+        self.notificar()
+        return {"consumidor": nome, "escopo": consumidor.escopo, "desde_id": desde_id}
+
+    def reconstruir(self, nome: str) -> dict:
+        """Limpa o estado derivado do consumidor e reprocessa todo o stream retido"""
+        consumidor = self._consumidores.get(nome)
+        if consumidor is None:
+            raise KeyError(nome)
+        if not consumidor.permite_replay:
+            raise RuntimeError(f"Consumidor '{nome}' não permite reconstrução")
+
+        db = SessionLocal()
+        try:
+            consumidor.reconstruir(db)
+            db.commit()
+        finally:
+            db.close()
+        return self.replay(nome, 0)
+
+    # ------------------------------------------------------------------
+    # Status / retenção
+    # ------------------------------------------------------------------
+
+    def status(self, db: Session) -> dict:
+        ultimo_id = self._ultimo_id(db)
+        offsets_db = {r.consumidor: r for r in db.query(DomainEventOffset).all()}
+        consumidores = []
+        for nome, consumidor in self._consumidores.items():
+            row = offsets_db.get(nome)
+            offset = row.ultimo_evento_id if (row and consumidor.escopo == ESCOPO_CLUSTER) else self._offsets.get(nome, 0)
+            consumidores.append({
+                "nome": nome,
+                "escopo": consumidor.escopo,
+                "tipos": sorted(consumidor.tipos) if consumidor.tipos else None,
+                "tamanho_lote": consumidor.tamanho_lote,
+                "permite_replay": consumidor.permite_replay,
+                "offset": offset,
+                "atraso_eventos": max(0, ultimo_id - offset),
+                "erro": row.erro if row and consumidor.escopo == ESCOPO_CLUSTER else None,
+                "pausado_ate": self._pausado_ate[nome].isoformat() if nome in self._pausado_ate else None,
+                "worker": dict(self._stats.get(nome, {})),
+            })
+        return {"ativo": self.running, "ultimo_evento_id": ultimo_id, "consumidores": consumidores}
+
+    def limpar_antigos(self, db: Session, dias: int) -> int:
+        """Remove eventos mais antigos que 'dias' já processados por todos os consumidores do cluster"""
+        limite = now_brazil_naive() - timedelta(days=dias)
+        nomes_cluster = [n for n, c in self._consumidores.items() if c.escopo == ESCOPO_CLUSTER]
+        menor_offset = db.query(func.min(DomainEventOffset.ultimo_evento_id)).filter(
+            DomainEventOffset.consumidor.in_(nomes_cluster)
+        ).scalar() if nomes_cluster else None
+        query = db.query(DomainEvent).filter(DomainEvent.criado_em < limite)
+        if menor_offset is not None:
+            query = query.filter(DomainEvent.id <= menor_offset)
+        removidos = query.delete(synchronize_session=False)
+        db.commit()
+        return removidos
+
+
+# Instância global singleton (uma por worker)
+_event_dispatcher_instance: EventDispatcher | None = None
+
+
+def get_event_dispatcher() -> EventDispatcher:
+    """Obtém a instância global do dispatcher de eventos"""
+    global _event_dispatcher_instance
+    if _event_dispatcher_instance is None:
+        _event_dispatcher_instance = EventDispatcher()
+    return _event_dispatcher_instance
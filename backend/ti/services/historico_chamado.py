@@ -0,0 +1,82 @@
+"""
+Cache em memória da linha do tempo de cada chamado (GET /chamados/{id}/historico).
+
+A linha do tempo é montada por poucas consultas em lote (ver
+ti/api/chamados.py::_montar_historico) e guardada por chamado neste worker.
+Só os eventos do próprio chamado a invalidam:
+
+- chamado.criado / chamado.status_alterado / chamado.excluido / chamado.ticket_enviado
+  → consumidor "historico_chamado" (escopo worker) descarta a entrada em
+  todos os workers
+- O worker que fez a escrita descarta na hora (não espera o dispatcher)
+
+HISTORICO_CACHE_TTL_SEGUNDOS limita a idade (escritas fora da API) e
+HISTORICO_CACHE_MAX_ENTRADAS o tamanho (descarta os menos acessados).
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+TTL_SEGUNDOS = int(os.getenv("HISTORICO_CACHE_TTL_SEGUNDOS", "900"))
+MAX_ENTRADAS = int(os.getenv("HISTORICO_CACHE_MAX_ENTRADAS", "500"))
+
+
+class HistoricoChamadoCache:
+    def __init__(self):
+        self._entradas: OrderedDict[int, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Incrementado a cada invalidação: montagem concorrente com uma
+        # escrita não grava a linha do tempo antiga por cima
+        self._versao = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidacoes": 0, "descartes": 0}
+
+    def obter(self, chamado_id: int) -> tuple[Any | None, int]:
+        """(linha do tempo ou None, versão a repassar para guardar())"""
+        with self._lock:
+            entrada = self._entradas.get(chamado_id)
+            if entrada is None or time.monotonic() - entrada[0] >= TTL_SEGUNDOS:
+                self._stats["misses"] += 1
+                return None, self._versao
+            self._entradas.move_to_end(chamado_id)
+            self._stats["hits"] += 1
+            return entrada[1], self._versao
+
+    def guardar(self, chamado_id: int, historico: Any, versao: int) -> None:
+        with self._lock:
+            if versao != self._versao:
+                return
+            self._entradas[chamado_id] = (time.monotonic(), historico)
+            self._entradas.move_to_end(chamado_id)
+            while len(self._entradas) > MAX_ENTRADAS:
+                self._entradas.popitem(last=False)
+                self._stats["descartes"] += 1
+
+    def invalidar(self, chamado_ids: list[int] | int) -> None:
+        if isinstance(chamado_ids, int):
+            chamado_ids = [chamado_ids]
+        with self._lock:
+            self._versao += 1
+            for chamado_id in chamado_ids:
+                if self._entradas.pop(chamado_id, None) is not None:
+                    self._stats["invalidacoes"] += 1
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._versao += 1
+            self._entradas.clear()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "entradas": len(self._entradas),
+                "max_entradas": MAX_ENTRADAS,
+                "ttl_segundos": TTL_SEGUNDOS,
+            }
+
+
+historico_cache = HistoricoChamadoCache()
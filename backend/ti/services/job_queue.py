@@ -0,0 +1,267 @@
+"""
+Fila de jobs sob demanda para operações administrativas pesadas.
+
+Endpoints como /sla/sync/todos-chamados e /sla/recalcular/painel faziam todo
+o trabalho dentro da requisição: o proxy reverso estourava o tempo e cada
+abertura do painel administrativo ocupava uma thread do worker. Agora:
+
+- submit() registra a execução em job_run (status "pendente", gatilho
+  "fila") e responde na hora com o id; o endpoint devolve 202
+- Execuções rodam em um pool limitado por worker (JOB_QUEUE_WORKERS)
+- Deduplicação: enviar uma tarefa idêntica (mesmo nome e parâmetros) que
+  já está pendente ou em execução devolve o id da execução existente. A
+  checagem usa um lock nomeado do MySQL, então vale entre workers
+- Progresso: ctx.progresso(processados, total) grava em job_run e emite
+  "job:progress" via Socket.IO; GET /jobs/execucoes/{run_id} traz o
+  percentual para quem acompanha por polling
+
+Uso:
+    fila = get_job_queue()
+    fila.register("sla.recalcular_painel", recalcular_painel_job, descricao="...")
+    run_id, deduplicado = fila.submit("sla.recalcular_painel")
+
+A função da tarefa recebe (db, ctx, **params) e pode retornar um dict com o
+resultado, gravado em job_run.resultado.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time as _time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable
+from urllib.parse import urlencode
+
+
+from core.db import SessionLocal
+from core.utils import now_brazil_naive
+from ti.models.job_run import JobRun
+from ti.services.db_lock import MySQLNamedLock
+from ti.services.job_scheduler import JobContext, JobScheduler, WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "2"))
+# Execuções pendentes/em execução mais antigas que isso não deduplicam
+# (worker que morreu deixa a linha para trás; o líder a marca como erro depois)
+DEDUPLICAR_MAX_MINUTOS = int(os.getenv("JOB_QUEUE_DEDUPLICAR_MAX_MINUTOS", "60"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_QUEUE_WORKERS, thread_name_prefix="job-queue")
+
+
+class TarefaDefinition:
+    """Tarefa sob demanda registrada na fila"""
+
+    def __init__(self, nome: str, funcao: Callable[..., Any], descricao: str = ""):
+        self.nome = nome
+        self.funcao = funcao
+        self.descricao = descricao
+
+    def to_dict(self) -> dict:
+        return {"nome": self.nome, "descricao": self.descricao}
+
+
+class QueueJobContext(JobContext):
+    """Contexto das tarefas da fila: cada gravação de progresso vira um evento Socket.IO"""
+
+    def _ao_gravar_progresso(self) -> None:
+        from core.realtime import emit_threadsafe
+
+        percentual = None
+        if self.linhas_total:
+            percentual = round(min(100.0, 100.0 * self.linhas_processadas / self.linhas_total), 1)
+        emit_threadsafe("job:progress", {
+            "run_id": self.run_id,
+            "job": self.job_name,
+            "status": "executando",
+            "linhas_processadas": self.linhas_processadas,
+            "linhas_total": self.linhas_total,
+            "percentual": percentual,
+        })
+
+
+class JobQueue:
+    """Fila de tarefas sob demanda com deduplicação e concorrência limitada"""
+
+    SUBMIT_LOCK_PREFIX = "evoque_fila:"
+
+    def __init__(self):
+        self._tarefas: dict[str, TarefaDefinition] = {}
+        self._lock = threading.Lock()
+        self._pendentes: set[int] = set()
+        self._executando: set[int] = set()
+
+    def register(self, nome: str, funcao: Callable[..., Any], descricao: str = "") -> TarefaDefinition:
+        tarefa = TarefaDefinition(nome, funcao, descricao)
+        with self._lock:
+            self._tarefas[nome] = tarefa
+        return tarefa
+
+    def get_tarefa(self, nome: str) -> TarefaDefinition | None:
+        return self._tarefas.get(nome)
+
+    @staticmethod
+    def chave(nome: str, params: dict | None = None) -> str:
+        """Identifica a execução para deduplicação (gravada em job_run.job_name)"""
+        if not params:
+            return nome
+        return f"{nome}?{urlencode(sorted(params.items()))}"
+
+    def submit(self, nome: str, params: dict | None = None) -> tuple[int, bool]:
+        """
+        Enfileira a tarefa. Retorna (run_id, deduplicado).
+
+        Lança KeyError se a tarefa não existe e RuntimeError se não foi
+        possível registrar a execução.
+        """
+        tarefa = self._tarefas.get(nome)
+        if tarefa is None:
+            raise KeyError(nome)
+        params = params or {}
+        chave = self.chave(nome, params)
+
+        lock = MySQLNamedLock(f"{self.SUBMIT_LOCK_PREFIX}{chave}")
+        if not lock.adquirir(5):
+            raise RuntimeError(f"Não foi possível enfileirar '{chave}' agora. Tente novamente em instantes.")
+
+        db = SessionLocal()
+        try:
+            existente = db.query(JobRun.id).filter(
+                JobRun.job_name == chave,
+                JobRun.status.in_(["pendente", "executando"]),
+                JobRun.iniciado_em >= now_brazil_naive() - timedelta(minutes=DEDUPLICAR_MAX_MINUTOS),
+            ).order_by(JobRun.id.desc()).first()
+            if existente is not None:
+                print(f"[FILA] ♻️ '{chave}' já está na fila (execução #{existente[0]})")
+                return existente[0], True
+
+            run = JobRun(
+                job_name=chave,
+                status="pendente",
+                gatilho="fila",
+                iniciado_em=now_brazil_naive(),
+                worker=WORKER_ID,
+            )
+            db.add(run)
+            db.commit()
+            run_id = run.id
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[FILA] Erro ao registrar execução de '{chave}': {e}", exc_info=True)
+            raise RuntimeError(f"Não foi possível registrar a execução de '{chave}'")
+        finally:
+            db.close()
+            lock.liberar()
+
+        with self._lock:
+            self._pendentes.add(run_id)
+        _executor.submit(self._executar, tarefa, chave, run_id, params)
+        print(f"[FILA] 📥 '{chave}' enfileirada (execução #{run_id})")
+        return run_id, False
+
+    def _marcar_inicio(self, run_id: int) -> None:
+        db = SessionLocal()
+        try:
+            db.query(JobRun).filter(JobRun.id == run_id).update(
+                {JobRun.status: "executando", JobRun.iniciado_em: now_brazil_naive()},
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[FILA] Erro ao marcar início da execução #{run_id}: {e}")
+        finally:
+            db.close()
+
+    def _executar(self, tarefa: TarefaDefinition, chave: str, run_id: int, params: dict) -> None:
+        job_lock = MySQLNamedLock(f"{JobScheduler.JOB_LOCK_PREFIX}{chave}")
+        ctx = QueueJobContext(run_id, chave)
+        inicio = _time.monotonic()
+        status = "sucesso"
+        erro = None
+        resultado: Any = None
+
+        with self._lock:
+            self._pendentes.discard(run_id)
+            self._executando.add(run_id)
+
+        try:
+            if not job_lock.adquirir(0):
+                status = "ignorado"
+                erro = "Tarefa idêntica já está em execução em outro worker"
+                print(f"[FILA] ⏭️ {chave}: {erro}")
+                return
+
+            self._marcar_inicio(run_id)
+            print(f"[FILA] 🔄 Iniciando '{chave}' (execução #{run_id})")
+            db = SessionLocal()
+            try:
+                resultado = tarefa.funcao(db, ctx, **params)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+        except Exception as e:
+            status = "erro"
+            erro = f"{e}\n{traceback.format_exc()}"
+            logger.error(f"[FILA] Erro na tarefa '{chave}': {e}", exc_info=True)
+        finally:
+            job_lock.liberar()
+            duracao = _time.monotonic() - inicio
+            JobScheduler.finalizar_run(run_id, status, duracao, ctx, resultado, erro)
+            with self._lock:
+                self._executando.discard(run_id)
+            self._emitir_fim(run_id, chave, status, erro)
+            if status == "sucesso":
+                print(f"[FILA] ✅ '{chave}' concluída em {duracao:.1f}s")
+
+    @staticmethod
+    def _emitir_fim(run_id: int, chave: str, status: str, erro: str | None) -> None:
+        from core.realtime import emit_threadsafe
+
+        emit_threadsafe("job:progress", {
+            "run_id": run_id,
+            "job": chave,
+            "status": status,
+            "percentual": 100.0 if status == "sucesso" else None,
+            "erro": erro.split("\n", 1)[0] if erro else None,
+        })
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "worker": WORKER_ID,
+                "workers_fila": JOB_QUEUE_WORKERS,
+                "tarefas": [t.to_dict() for t in self._tarefas.values()],
+                "pendentes_neste_worker": sorted(self._pendentes),
+                "executando_neste_worker": sorted(self._executando),
+            }
+
+
+def resposta_enfileirada(nome: str, run_id: int, deduplicado: bool) -> dict:
+    """Corpo padrão das respostas 202 dos endpoints que enfileiram tarefas"""
+    return {
+        "ok": True,
+        "job": nome,
+        "run_id": run_id,
+        "deduplicado": deduplicado,
+        "status_url": f"/api/jobs/execucoes/{run_id}",
+    }
+
+
+# Instância global singleton (uma por worker)
+_job_queue_instance: JobQueue | None = None
+
+
+def get_job_queue() -> JobQueue:
+    """Obtém a instância global da fila de jobs"""
+    global _job_queue_instance
+    if _job_queue_instance is None:
+        _job_queue_instance = JobQueue()
+    return _job_queue_instance
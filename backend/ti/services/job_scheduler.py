@@ -0,0 +1,566 @@
+"""
+Agendador de jobs com eleição de líder entre workers.
+
+Substitui o antigo SLAScheduler (uma thread por worker, todas recalculando
+o SLA ao mesmo tempo) por um único agendador ativo no cluster:
+
+- Eleição de líder via MySQL GET_LOCK em uma conexão dedicada: apenas o
+  worker que detém o lock dispara jobs agendados. Se o líder cair, a
+  conexão fecha, o lock é liberado e outro worker assume.
+- Registro nomeado de jobs com agenda estilo cron ("min hora dia mês dia_semana")
+- Histórico de execuções na tabela job_run (duração, linhas processadas, erro)
+- Jitter aleatório antes de cada execução agendada
+- Recuperação de execuções perdidas: se a última execução agendada ficou
+  para trás (ex: servidor desligado à meia-noite), roda uma vez ao assumir
+- Lock por job: uma execução manual em outro worker nunca roda em paralelo
+  com a mesma execução no líder
+
+Uso:
+    from ti.services.job_scheduler import get_job_scheduler
+
+    scheduler = get_job_scheduler()
+    scheduler.register("meu_job", "0 3 * * *", minha_funcao, descricao="...")
+    scheduler.start()
+
+A função do job recebe (db, ctx) e pode retornar um dict com o resultado.
+ctx.progresso(processados, total) grava o andamento em job_run.
+"""
+
+from __future__ import annotations
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time as _time
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from sqlalchemy.orm import Session
+
+from core.db import SessionLocal
+from core.utils import now_brazil_naive
+from ti.models.job_run import JobRun
+from ti.services.db_lock import MySQLNamedLock
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CronSchedule:
+    """
+    Agenda no formato cron de 5 campos: minuto hora dia-do-mês mês dia-da-semana.
+
+    Suporta "*", números, listas (1,15), intervalos (1-5) e passos (*/10, 8-18/2).
+    Dia da semana: 0 (ou 7) = domingo, como no cron.
+    """
+
+    _LIMITES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expressao: str):
+        campos = expressao.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expressão cron inválida (esperado 5 campos): '{expressao}'")
+
+        self.expressao = expressao
+        valores = [
+            self._parse_campo(campo, inicio, fim)
+            for campo, (inicio, fim) in zip(campos, self._LIMITES)
+        ]
+        self.minutos, self.horas, self.dias, self.meses, dias_semana = valores
+        self.dias_semana = {0 if d == 7 else d for d in dias_semana}
+        self._dia_livre = campos[2] == "*"
+        self._semana_livre = campos[4] == "*"
+
+    @staticmethod
+    def _parse_campo(campo: str, minimo: int, maximo: int) -> set[int]:
+        valores: set[int] = set()
+        for parte in campo.split(","):
+            passo = 1
+            if "/" in parte:
+                parte, passo_str = parte.split("/", 1)
+                passo = int(passo_str)
+                if passo <= 0:
+                    raise ValueError(f"Passo inválido no campo cron '{campo}'")
+
+            if parte == "*":
+                inicio, fim = minimo, maximo
+            elif "-" in parte:
+                a, b = parte.split("-", 1)
+                inicio, fim = int(a), int(b)
+            else:
+                inicio = int(parte)
+                fim = maximo if passo > 1 else inicio
+
+            if inicio < minimo or fim > maximo or inicio > fim:
+                raise ValueError(f"Valor fora do intervalo no campo cron '{campo}'")
+
+            valores.update(range(inicio, fim + 1, passo))
+        return valores
+
+    def _dia_corresponde(self, dia: datetime) -> bool:
+        if dia.month not in self.meses:
+            return False
+        dia_semana_cron = (dia.weekday() + 1) % 7
+        casa_dia = dia.day in self.dias
+        casa_semana = dia_semana_cron in self.dias_semana
+        # Regra do cron: se os dois campos são restritos, basta um deles casar
+        if not self._dia_livre and not self._semana_livre:
+            return casa_dia or casa_semana
+        return casa_dia and casa_semana
+
+    def proxima_execucao(self, apos: datetime) -> datetime:
+        """Primeiro horário agendado estritamente posterior a 'apos'"""
+        inicio = (apos + timedelta(minutes=1)).replace(second=0, microsecond=0)
+        horas = sorted(self.horas)
+        minutos = sorted(self.minutos)
+
+        dia = inicio.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._dia_corresponde(dia):
+                for hora in horas:
+                    if dia.date() == inicio.date() and hora < inicio.hour:
+                        continue
+                    for minuto in minutos:
+                        candidato = dia.replace(hour=hora, minute=minuto)
+                        if candidato >= inicio:
+                            return candidato
+            dia += timedelta(days=1)
+
+        raise ValueError(f"Expressão cron sem próxima execução: '{self.expressao}'")
+
+
+class JobDefinition:
+    """Job registrado no agendador"""
+
+    def __init__(
+        self,
+        nome: str,
+        agenda: str,
+        funcao: Callable[[Session, "JobContext"], Any],
+        descricao: str = "",
+        jitter_segundos: int = 30,
+        recuperar_atrasados: bool = True,
+    ):
+        self.nome = nome
+        self.agenda = CronSchedule(agenda)
+        self.funcao = funcao
+        self.descricao = descricao
+        self.jitter_segundos = jitter_segundos
+        self.recuperar_atrasados = recuperar_atrasados
+
+    def to_dict(self) -> dict:
+        return {
+            "nome": self.nome,
+            "agenda": self.agenda.expressao,
+            "descricao": self.descricao,
+            "jitter_segundos": self.jitter_segundos,
+            "recuperar_atrasados": self.recuperar_atrasados,
+        }
+
+
+class JobContext:
+    """Contexto entregue à função do job durante a execução"""
+
+    # Intervalo mínimo entre gravações de progresso em job_run
+    PROGRESSO_INTERVALO_SEGUNDOS = 2.0
+
+    def __init__(self, run_id: int, job_name: str):
+        self.run_id = run_id
+        self.job_name = job_name
+        self.linhas_processadas = 0
+        self.linhas_total: int | None = None
+        self._ultimo_progresso = 0.0
+
+    def progresso(self, processados: int, total: int | None = None, forcar: bool = False) -> None:
+        """Registra o andamento do job (gravado em job_run com sessão própria)"""
+        self.linhas_processadas = processados
+        if total is not None:
+            self.linhas_total = total
+
+        agora = _time.monotonic()
+        if not forcar and agora - self._ultimo_progresso < self.PROGRESSO_INTERVALO_SEGUNDOS:
+            return
+        self._ultimo_progresso = agora
+
+        db = SessionLocal()
+        try:
+            db.query(JobRun).filter(JobRun.id == self.run_id).update(
+                {
+                    JobRun.linhas_processadas: self.linhas_processadas,
+                    JobRun.linhas_total: self.linhas_total,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[JOBS] Erro ao gravar progresso do job {self.job_name}: {e}")
+        finally:
+            db.close()
+        self._ao_gravar_progresso()
+
+    def _ao_gravar_progresso(self) -> None:
+        """Gancho chamado após cada gravação de progresso (ex: evento Socket.IO na fila de jobs)"""
+
+
+class JobScheduler:
+    """Agendador de jobs com eleição de líder"""
+
+    LEADER_LOCK_NAME = "evoque_job_scheduler_leader"
+    JOB_LOCK_PREFIX = "evoque_job:"
+
+    # Intervalo do loop principal (verifica liderança e jobs vencidos)
+    TICK_SEGUNDOS = 30
+
+    # Execuções presas em "executando" há mais que isso são marcadas como erro
+    EXECUCAO_ORFA_HORAS = 12
+
+    def __init__(self):
+        self._jobs: dict[str, JobDefinition] = {}
+        self._proximas: dict[str, datetime] = {}
+        self._em_execucao: set[str] = set()
+        self._lock = threading.Lock()
+        self._leader_lock = MySQLNamedLock(self.LEADER_LOCK_NAME)
+        self.is_leader = False
+        self.running = False
+        self.thread: threading.Thread | None = None
+
+    # ------------------------------------------------------------------
+    # Registro
+    # ------------------------------------------------------------------
+
+    def register(
+        self,
+        nome: str,
+        agenda: str,
+        funcao: Callable[[Session, JobContext], Any],
+        descricao: str = "",
+        jitter_segundos: int = 30,
+        recuperar_atrasados: bool = True,
+    ) -> JobDefinition:
+        job = JobDefinition(nome, agenda, funcao, descricao, jitter_segundos, recuperar_atrasados)
+        with self._lock:
+            self._jobs[nome] = job
+            self._proximas.pop(nome, None)
+        return job
+
+    def get_job(self, nome: str) -> JobDefinition | None:
+        return self._jobs.get(nome)
+
+    def list_jobs(self) -> list[JobDefinition]:
+        return list(self._jobs.values())
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                logger.warning("Job Scheduler já está em execução")
+                return
+            self.running = True
+            self.thread = threading.Thread(
+                target=self._loop,
+                daemon=True,
+                name="JobSchedulerThread",
+            )
+            self.thread.start()
+        logger.info(f"Job Scheduler iniciado no worker {WORKER_ID}")
+
+    def stop(self) -> None:
+        with self._lock:
+            self.running = False
+        self._leader_lock.liberar()
+        self.is_leader = False
+        logger.info("Job Scheduler parado")
+
+    def _loop(self) -> None:
+        # Espalha a primeira tentativa de liderança entre os workers
+        _time.sleep(random.uniform(0, 5))
+
+        while self.running:
+            try:
+                self._verificar_lideranca()
+                if self.is_leader:
+                    self._disparar_vencidos()
+            except Exception as e:
+                logger.error(f"Erro no loop do Job Scheduler: {e}", exc_info=True)
+            _time.sleep(self.TICK_SEGUNDOS)
+
+    def _verificar_lideranca(self) -> None:
+        if self.is_leader:
+            if self._leader_lock.ainda_detido():
+                return
+            logger.warning(f"[JOBS] Worker {WORKER_ID} perdeu a liderança")
+            self.is_leader = False
+            self._proximas.clear()
+
+        if self._leader_lock.adquirir(0):
+            self.is_leader = True
+            print(f"[JOBS] 👑 Worker {WORKER_ID} assumiu a liderança do agendador")
+            self._ao_assumir_lideranca()
+
+    def _ao_assumir_lideranca(self) -> None:
+        """Carrega a última execução agendada de cada job (base para recuperação)"""
+        db = SessionLocal()
+        try:
+            agora = now_brazil_naive()
+
+            db.query(JobRun).filter(
+                JobRun.status.in_(["pendente", "executando"]),
+                JobRun.iniciado_em < agora - timedelta(hours=self.EXECUCAO_ORFA_HORAS),
+            ).update(
+                {JobRun.status: "erro", JobRun.erro: "Execução interrompida (worker encerrado)"},
+                synchronize_session=False,
+            )
+            db.commit()
+
+            for job in self.list_jobs():
+                ultima = db.query(JobRun).filter(
+                    JobRun.job_name == job.nome,
+                    JobRun.gatilho != "manual",
+                ).order_by(JobRun.iniciado_em.desc()).first()
+
+                if ultima and job.recuperar_atrasados:
+                    base = ultima.agendado_para or ultima.iniciado_em
+                    proxima = job.agenda.proxima_execucao(base)
+                else:
+                    proxima = job.agenda.proxima_execucao(agora)
+
+                self._proximas[job.nome] = proxima
+                if proxima <= agora:
+                    print(f"[JOBS] Job '{job.nome}' perdeu a execução de {proxima}, será recuperado")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[JOBS] Erro ao carregar histórico de jobs: {e}", exc_info=True)
+        finally:
+            db.close()
+
+    def _disparar_vencidos(self) -> None:
+        agora = now_brazil_naive()
+        for job in self.list_jobs():
+            proxima = self._proximas.get(job.nome)
+            if proxima is None:
+                self._proximas[job.nome] = job.agenda.proxima_execucao(agora)
+                continue
+            if proxima > agora or job.nome in self._em_execucao:
+                continue
+
+            # Recuperação: roda uma única vez, mesmo que vários horários tenham sido perdidos
+            atrasado = agora - proxima > timedelta(seconds=self.TICK_SEGUNDOS * 2)
+            gatilho = "recuperacao" if atrasado else "agendado"
+            self._proximas[job.nome] = job.agenda.proxima_execucao(agora)
+
+            run_id = self._criar_run(job.nome, gatilho, proxima)
+            if run_id is None:
+                continue
+            self._iniciar_thread(job, run_id, jitter=(gatilho == "agendado"))
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    def trigger(self, nome: str) -> int:
+        """
+        Dispara um job manualmente (em thread própria, em qualquer worker).
+
+        Retorna o id da execução em job_run.
+        Lança KeyError se o job não existe e RuntimeError se já está rodando neste worker.
+        """
+        job = self._jobs.get(nome)
+        if job is None:
+            raise KeyError(nome)
+        if nome in self._em_execucao:
+            raise RuntimeError(f"Job '{nome}' já está em execução")
+
+        run_id = self._criar_run(nome, "manual", None)
+        if run_id is None:
+            raise RuntimeError(f"Não foi possível registrar a execução do job '{nome}'")
+        self._iniciar_thread(job, run_id, jitter=False)
+        return run_id
+
+    def _criar_run(self, nome: str, gatilho: str, agendado_para: datetime | None) -> int | None:
+        db = SessionLocal()
+        try:
+            run = JobRun(
+                job_name=nome,
+                status="executando",
+                gatilho=gatilho,
+                agendado_para=agendado_para,
+                iniciado_em=now_brazil_naive(),
+                worker=WORKER_ID,
+            )
+            db.add(run)
+            db.commit()
+            return run.id
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[JOBS] Erro ao registrar execução de '{nome}': {e}", exc_info=True)
+            return None
+        finally:
+            db.close()
+
+    def _iniciar_thread(self, job: JobDefinition, run_id: int, jitter: bool) -> None:
+        with self._lock:
+            self._em_execucao.add(job.nome)
+        thread = threading.Thread(
+            target=self._executar,
+            args=(job, run_id, jitter),
+            daemon=True,
+            name=f"Job-{job.nome}-{run_id}",
+        )
+        thread.start()
+
+    def _executar(self, job: JobDefinition, run_id: int, jitter: bool) -> None:
+        job_lock = MySQLNamedLock(f"{self.JOB_LOCK_PREFIX}{job.nome}")
+        ctx = JobContext(run_id, job.nome)
+        inicio = _time.monotonic()
+        status = "sucesso"
+        erro = None
+        resultado: Any = None
+
+        try:
+            if jitter and job.jitter_segundos > 0:
+                _time.sleep(random.uniform(0, job.jitter_segundos))
+
+            if not job_lock.adquirir(0):
+                status = "ignorado"
+                erro = "Job já está em execução em outro worker"
+                print(f"[JOBS] ⏭️ {job.nome}: {erro}")
+                return
+
+            print(f"[JOBS] 🔄 Iniciando job '{job.nome}' (execução #{run_id})")
+            db = SessionLocal()
+            try:
+                resultado = job.funcao(db, ctx)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+        except Exception as e:
+            status = "erro"
+            erro = f"{e}\n{traceback.format_exc()}"
+            logger.error(f"[JOBS] Erro no job '{job.nome}': {e}", exc_info=True)
+        finally:
+            job_lock.liberar()
+            duracao = _time.monotonic() - inicio
+            self.finalizar_run(run_id, status, duracao, ctx, resultado, erro)
+            with self._lock:
+                self._em_execucao.discard(job.nome)
+            if status == "sucesso":
+                print(f"[JOBS] ✅ Job '{job.nome}' concluído em {duracao:.1f}s")
+
+    @staticmethod
+    def finalizar_run(
+        run_id: int,
+        status: str,
+        duracao: float,
+        ctx: JobContext,
+        resultado: Any,
+        erro: str | None,
+    ) -> None:
+        linhas = ctx.linhas_processadas
+        if isinstance(resultado, dict) and resultado.get("linhas_processadas") is not None:
+            linhas = int(resultado["linhas_processadas"])
+
+        db = SessionLocal()
+        try:
+            db.query(JobRun).filter(JobRun.id == run_id).update(
+                {
+                    JobRun.status: status,
+                    JobRun.finalizado_em: now_brazil_naive(),
+                    JobRun.duracao_segundos: round(duracao, 3),
+                    JobRun.linhas_processadas: linhas,
+                    JobRun.linhas_total: ctx.linhas_total,
+                    JobRun.resultado: json.dumps(resultado, default=str) if resultado is not None else None,
+                    JobRun.erro: erro,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[JOBS] Erro ao finalizar execução #{run_id}: {e}", exc_info=True)
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def percentual(run: JobRun) -> float | None:
+        """Andamento da execução em % (None sem total conhecido)"""
+        if run.status == "sucesso":
+            return 100.0
+        if not run.linhas_total:
+            return 0.0 if run.status == "pendente" else None
+        return round(min(100.0, 100.0 * (run.linhas_processadas or 0) / run.linhas_total), 1)
+
+    @staticmethod
+    def run_to_dict(run: JobRun) -> dict:
+        resultado = None
+        if run.resultado:
+            try:
+                resultado = json.loads(run.resultado)
+            except Exception:
+                resultado = run.resultado
+        return {
+            "id": run.id,
+            "job_name": run.job_name,
+            "status": run.status,
+            "gatilho": run.gatilho,
+            "agendado_para": run.agendado_para.isoformat() if run.agendado_para else None,
+            "iniciado_em": run.iniciado_em.isoformat() if run.iniciado_em else None,
+            "finalizado_em": run.finalizado_em.isoformat() if run.finalizado_em else None,
+            "duracao_segundos": run.duracao_segundos,
+            "linhas_processadas": run.linhas_processadas,
+            "linhas_total": run.linhas_total,
+            "percentual": JobScheduler.percentual(run),
+            "worker": run.worker,
+            "resultado": resultado,
+            "erro": run.erro,
+        }
+
+    def status(self, db: Session) -> dict:
+        agora = now_brazil_naive()
+        jobs = []
+        for job in self.list_jobs():
+            ultima = db.query(JobRun).filter(
+                JobRun.job_name == job.nome
+            ).order_by(JobRun.iniciado_em.desc()).first()
+
+            info = job.to_dict()
+            info["proxima_execucao"] = (
+                self._proximas.get(job.nome) or job.agenda.proxima_execucao(agora)
+            ).isoformat()
+            info["em_execucao_neste_worker"] = job.nome in self._em_execucao
+            info["ultima_execucao"] = self.run_to_dict(ultima) if ultima else None
+            jobs.append(info)
+
+        return {
+            "worker": WORKER_ID,
+            "lider": self.is_leader,
+            "ativo": self.running,
+            "jobs": jobs,
+        }
+
+
+# Instância global singleton (uma por worker; só o líder dispara jobs agendados)
+_job_scheduler_instance: JobScheduler | None = None
+
+
+def get_job_scheduler() -> JobScheduler:
+    """Obtém a instância global do agendador de jobs"""
+    global _job_scheduler_instance
+    if _job_scheduler_instance is None:
+        _job_scheduler_instance = JobScheduler()
+    return _job_scheduler_instance
@@ -169,18 +169,12 @@ class MetricsCalculator:
         """Calcula percentual de SLA cumprido (baseado em chamados ativos) - usa fonte unificada"""
         from ti.services.sla_metrics_unified import UnifiedSLAMetricsCalculator
 
-        # Tenta cache primeiro
-        cached = SLACacheManager.get(db, "sla_compliance_24h")
-        if cached is not None:
-            print(f"[CACHE HIT] SLA Compliance 24h: {cached}%")
-            return cached
-
-        print("[CACHE MISS] SLA Compliance 24h calculando...")
-        result_dict = UnifiedSLAMetricsCalculator.get_sla_compliance_24h(db)
-        result = result_dict["percentual"]
-        print(f"[CACHE SET] SLA Compliance 24h: {result}%")
-        SLACacheManager.set(db, "sla_compliance_24h", result)
-        return result
+        # Cache com single-flight / stale-while-revalidate (ver SLACacheManager.get_or_compute)
+        return SLACacheManager.get_or_compute(
+            db,
+            "sla_compliance_24h",
+            lambda calc_db: UnifiedSLAMetricsCalculator.get_sla_compliance_24h(calc_db)["percentual"],
+        )
 
     @staticmethod
     def _calculate_sla_compliance_24h(db: Session) -> int:
@@ -271,18 +265,12 @@ class MetricsCalculator:
         """Calcula percentual de SLA cumprido para todos os chamados do mês - usa fonte unificada"""
         from ti.services.sla_metrics_unified import UnifiedSLAMetricsCalculator
 
-        # Tenta cache primeiro
-        cached = SLACacheManager.get(db, "sla_compliance_mes")
-        if cached is not None:
-            print(f"[CACHE HIT] SLA Compliance Mês: {cached}%")
-            return cached
-
-        print("[CACHE MISS] SLA Compliance Mês calculando...")
-        result_dict = UnifiedSLAMetricsCalculator.get_sla_compliance_month(db)
-        result = result_dict["percentual"]
-        print(f"[CACHE SET] SLA Compliance Mês: {result}%")
-        SLACacheManager.set(db, "sla_compliance_mes", result)
-        return result
+        # Cache com single-flight / stale-while-revalidate (ver SLACacheManager.get_or_compute)
+        return SLACacheManager.get_or_compute(
+            db,
+            "sla_compliance_mes",
+            lambda calc_db: UnifiedSLAMetricsCalculator.get_sla_compliance_month(calc_db)["percentual"],
+        )
 
     @staticmethod
     def _calculate_sla_compliance_mes(db: Session) -> int:
@@ -424,31 +412,23 @@ class MetricsCalculator:
 
     @staticmethod
     def get_tempo_resolucao_media_30dias(db: Session) -> str:
-        """Calcula tempo médio de resolução dos últimos 30 dias"""
+        """Calcula tempo médio de resolução dos últimos 30 dias (horas de negócio, sem "Em análise")"""
         agora = now_brazil_naive()
         trinta_dias_atras = agora - timedelta(days=30)
         
-        chamados = db.query(Chamado).filter(
+        # Durações congeladas no encerramento (ver ti.services.sla_duracoes)
+        media_horas = db.query(func.avg(Chamado.tempo_resolucao_horas)).filter(
             and_(
                 Chamado.data_abertura >= trinta_dias_atras,
                 Chamado.data_conclusao.isnot(None),
+                Chamado.tempo_resolucao_horas.isnot(None),
             )
-        ).all()
-        
-        if not chamados:
-            return "—"
-        
-        tempos = []
-        for chamado in chamados:
-            if chamado.data_conclusao and chamado.data_abertura:
-                delta = chamado.data_conclusao - chamado.data_abertura
-                horas = delta.total_seconds() / 3600
-                tempos.append(horas)
-        
-        if not tempos:
+        ).scalar()
+
+        if media_horas is None:
             return "—"
-        
-        media_horas = sum(tempos) / len(tempos)
+
+        media_horas = float(media_horas)
         
         horas = int(media_horas)
         minutos = int((media_horas - horas) * 60)
@@ -519,36 +499,29 @@ class MetricsCalculator:
         """Retorna distribuição de SLA (dentro/fora) - usa fonte unificada"""
         from ti.services.sla_metrics_unified import UnifiedSLAMetricsCalculator
 
-        # Tenta cache primeiro
-        cached = SLACacheManager.get(db, "sla_distribution")
-        if cached is not None:
-            print(f"[CACHE HIT] SLA Distribution: {cached}")
-            # Valida e extrai se estiver wrapped em {'value': ...}
-            if isinstance(cached, dict) and 'value' in cached and len(cached) == 1:
-                cached = cached['value']
-            return cached
-
-        print("[CACHE MISS] SLA Distribution calculando...")
-
-        agora = now_brazil_naive()
-        mes_inicio = agora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        def _calcular(calc_db: Session) -> dict:
+            agora = now_brazil_naive()
+            mes_inicio = agora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-        result = UnifiedSLAMetricsCalculator.calculate_sla_distribution_period(
-            db, mes_inicio, agora
-        )
+            result = UnifiedSLAMetricsCalculator.calculate_sla_distribution_period(
+                calc_db, mes_inicio, agora
+            )
 
-        # Formata resultado para compatibilidade
-        formatted_result = {
-            "dentro_sla": result["dentro_sla"],
-            "fora_sla": result["fora_sla"],
-            "percentual_dentro": result["percentual_dentro"],
-            "percentual_fora": result["percentual_fora"],
-            "total": result["total"]
-        }
+            # Formata resultado para compatibilidade
+            return {
+                "dentro_sla": result["dentro_sla"],
+                "fora_sla": result["fora_sla"],
+                "percentual_dentro": result["percentual_dentro"],
+                "percentual_fora": result["percentual_fora"],
+                "total": result["total"]
+            }
 
-        print(f"[CACHE SET] SLA Distribution: {formatted_result}")
-        SLACacheManager.set(db, "sla_distribution", formatted_result)
-        return formatted_result
+        # Cache com single-flight / stale-while-revalidate (ver SLACacheManager.get_or_compute)
+        cached = SLACacheManager.get_or_compute(db, "sla_distribution", _calcular)
+        # Valida e extrai se estiver wrapped em {'value': ...}
+        if isinstance(cached, dict) and 'value' in cached and len(cached) == 1:
+            cached = cached['value']
+        return cached
 
     @staticmethod
     def _calculate_sla_distribution(db: Session) -> dict:
@@ -656,53 +629,36 @@ class MetricsCalculator:
     def get_performance_metrics(db: Session) -> dict:
         """Retorna métricas de performance (últimos 30 dias) - CORRIGIDO"""
         try:
-            from ti.services.sla import SLACalculator
-
             agora = now_brazil_naive()
             trinta_dias_atras = agora - timedelta(days=30)
 
-            # Busca chamados dos últimos 30 dias
-            chamados_30dias = db.query(Chamado).filter(
-                and_(
-                    Chamado.data_abertura >= trinta_dias_atras,
-                    Chamado.status != "Cancelado"
-                )
-            ).all()
+            # Chamados dos últimos 30 dias
+            filtro_30dias = and_(
+                Chamado.data_abertura >= trinta_dias_atras,
+                Chamado.status != "Cancelado"
+            )
 
             # ===== TEMPO MÉDIO DE RESOLUÇÃO (horas de negócio SEM "Em análise") =====
-            tempos_resolucao = []
-            for chamado in chamados_30dias:
-                if chamado.data_conclusao and chamado.data_abertura:
-                    # Usa horas de NEGÓCIO DESCONTANDO "Em análise"
-                    horas = SLACalculator.calculate_business_hours_excluding_paused(
-                        chamado.id,
-                        chamado.data_abertura,
-                        chamado.data_conclusao,
-                        db
-                    )
-                    tempos_resolucao.append(horas)
-
-            tempo_resolucao_medio = sum(tempos_resolucao) / len(tempos_resolucao) if tempos_resolucao else 0
+            # Durações congeladas no encerramento (ver ti.services.sla_duracoes)
+            tempo_resolucao_medio = db.query(func.avg(Chamado.tempo_resolucao_horas)).filter(
+                filtro_30dias,
+                Chamado.data_conclusao.isnot(None),
+                Chamado.tempo_resolucao_horas.isnot(None),
+            ).scalar()
+            tempo_resolucao_medio = float(tempo_resolucao_medio or 0)
             horas = int(tempo_resolucao_medio)
             minutos = int((tempo_resolucao_medio - horas) * 60)
             tempo_resolucao_str = f"{horas}h {minutos}m" if minutos > 0 else f"{horas}h" if horas > 0 else "—"
 
             # ===== TEMPO MÉDIO DE PRIMEIRA RESPOSTA =====
-            # Usa Chamado.data_primeira_resposta (fonte confiável)
-            tempos_primeira_resposta = []
-            for chamado in chamados_30dias:
-                if chamado.data_primeira_resposta and chamado.data_abertura:
-                    # Usa horas de NEGÓCIO (não desconta nada para primeira resposta)
-                    horas = SLACalculator.calculate_business_hours(
-                        chamado.data_abertura,
-                        chamado.data_primeira_resposta,
-                        db
-                    )
-                    # Filtro de sanidade: máximo 72h
-                    if 0 <= horas <= 72:
-                        tempos_primeira_resposta.append(horas)
-
-            tempo_primeira_resposta_medio = sum(tempos_primeira_resposta) / len(tempos_primeira_resposta) if tempos_primeira_resposta else 0
+            # Horas de negócio até Chamado.data_primeira_resposta, gravadas na primeira resposta
+            tempo_primeira_resposta_medio = db.query(func.avg(Chamado.tempo_primeira_resposta_horas)).filter(
+                filtro_30dias,
+                Chamado.data_primeira_resposta.isnot(None),
+                # Filtro de sanidade: máximo 72h
+                Chamado.tempo_primeira_resposta_horas.between(0, 72),
+            ).scalar()
+            tempo_primeira_resposta_medio = float(tempo_primeira_resposta_medio or 0)
 
             # Formata corretamente: horas e minutos
             if tempo_primeira_resposta_medio > 0:
@@ -715,21 +671,14 @@ class MetricsCalculator:
             # ===== TAXA DE REABERTURAS =====
             # Calcula % de chamados que foram reaberlos (status != Concluído em algum momento)
             # Para simplificar: verifica chamados com múltiplas transições
-            chamados_reaberlos = 0
-            for chamado in chamados_30dias:
-                historicos = db.query(HistoricoStatus).filter(
-                    HistoricoStatus.chamado_id == chamado.id
-                ).count()
-                # Se tem mais de 5 históricos, provavelmente foi reaberto
-                if historicos > 5:
-                    chamados_reaberlos += 1
-
-            total_com_historico = sum(
-                1 for c in chamados_30dias
-                if db.query(HistoricoStatus).filter(
-                    HistoricoStatus.chamado_id == c.id
-                ).count() > 0
-            )
+            # (uma query agrupada com a contagem de históricos por chamado)
+            contagens = db.query(func.count(HistoricoStatus.id)).join(
+                Chamado, Chamado.id == HistoricoStatus.chamado_id
+            ).filter(filtro_30dias).group_by(HistoricoStatus.chamado_id).all()
+
+            # Se tem mais de 5 históricos, provavelmente foi reaberto
+            chamados_reaberlos = sum(1 for (total,) in contagens if total > 5)
+            total_com_historico = len(contagens)
             taxa_reaberturas = int((chamados_reaberlos / total_com_historico * 100)) if total_com_historico > 0 else 0
 
             # ===== CHAMADOS EM BACKLOG =====
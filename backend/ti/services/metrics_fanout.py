@@ -0,0 +1,167 @@
+"""
+Cálculo paralelo das métricas do dashboard, com orçamento de tempo por métrica.
+
+/metrics/dashboard e /metrics/dashboard/sla chamavam uma dúzia de métodos do
+MetricsCalculator em sequência, na mesma sessão: um cálculo de SLA lento
+atrasava até os contadores baratos. Agora:
+
+- Cada métrica roda em paralelo (pool METRICS_FANOUT_WORKERS), com uma
+  sessão própria do pool de conexões
+- Cada métrica tem um orçamento (ms). Ao fim do orçamento, a resposta usa o
+  último valor calculado com sucesso (stale) ou o valor padrão, e o cálculo
+  continua em segundo plano para atualizar o último valor
+- Single-flight: uma métrica já em cálculo não é disparada de novo; as
+  requisições seguintes esperam o mesmo cálculo (limita as conexões usadas
+  ao número de métricas, por worker)
+- A resposta informa, por métrica, se o valor é novo ("ok"), antigo
+  ("stale") ou padrão ("padrao"), e quando foi calculado
+
+Uso:
+    metricas = [MetricaPainel("abertos_agora", MetricsCalculator.get_abertos_agora, 1000, 0)]
+    valores, frescor = calcular_em_paralelo(metricas)
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable
+
+from sqlalchemy.orm import Session
+
+from core.db import SessionLocal
+from core.utils import now_brazil_naive
+
+logger = logging.getLogger(__name__)
+
+FANOUT_WORKERS = int(os.getenv("METRICS_FANOUT_WORKERS", "8"))
+# Orçamentos padrão: contadores simples e métricas de SLA (mais pesadas)
+ORCAMENTO_RAPIDO_MS = int(os.getenv("METRICS_ORCAMENTO_RAPIDO_MS", "1000"))
+ORCAMENTO_SLA_MS = int(os.getenv("METRICS_ORCAMENTO_SLA_MS", "2500"))
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="metrics-fanout")
+
+
+class MetricaPainel:
+    """Uma métrica do painel: função de cálculo, orçamento e valor padrão"""
+
+    def __init__(
+        self,
+        nome: str,
+        calcular: Callable[[Session], Any],
+        orcamento_ms: int,
+        padrao: Any,
+    ):
+        self.nome = nome
+        self.calcular = calcular
+        self.orcamento_ms = orcamento_ms
+        self.padrao = padrao
+
+
+class _UltimosValores:
+    """Último valor calculado com sucesso por métrica e cálculos em andamento (por worker)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores: dict[str, tuple[Any, datetime]] = {}
+        self._em_andamento: dict[str, Future] = {}
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def ultimo(self, nome: str) -> tuple[Any, datetime] | None:
+        with self._lock:
+            return self._valores.get(nome)
+
+    def contar(self, nome: str, status: str) -> None:
+        with self._lock:
+            por_metrica = self._stats.setdefault(nome, {})
+            por_metrica[status] = por_metrica.get(status, 0) + 1
+
+    def disparar(self, metrica: MetricaPainel) -> Future:
+        """Future do cálculo da métrica (reaproveita um cálculo em andamento)"""
+        with self._lock:
+            futuro = self._em_andamento.get(metrica.nome)
+            if futuro is not None:
+                return futuro
+            futuro = _executor.submit(self._executar, metrica)
+            self._em_andamento[metrica.nome] = futuro
+            return futuro
+
+    def _executar(self, metrica: MetricaPainel) -> Any:
+        db = SessionLocal()
+        try:
+            valor = metrica.calcular(db)
+            with self._lock:
+                self._valores[metrica.nome] = (valor, now_brazil_naive())
+            return valor
+        finally:
+            db.close()
+            with self._lock:
+                self._em_andamento.pop(metrica.nome, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "em_andamento": sorted(self._em_andamento.keys()),
+                "metricas": {
+                    nome: {
+                        **contagens,
+                        "calculado_em": self._valores[nome][1].isoformat() if nome in self._valores else None,
+                    }
+                    for nome, contagens in self._stats.items()
+                },
+            }
+
+
+ultimos_valores = _UltimosValores()
+
+
+def calcular_em_paralelo(metricas: list[MetricaPainel]) -> tuple[dict[str, Any], dict[str, dict]]:
+    """
+    Calcula as métricas em paralelo respeitando o orçamento de cada uma.
+
+    Retorna (valores, frescor): valores[nome] é o valor a exibir e
+    frescor[nome] = {"status", "calculado_em", "duracao_ms"}.
+    """
+    inicio = time.perf_counter()
+    futuros = {m.nome: ultimos_valores.disparar(m) for m in metricas}
+
+    valores: dict[str, Any] = {}
+    frescor: dict[str, dict] = {}
+
+    # Espera primeiro as de menor orçamento; o prazo de cada uma conta do início
+    for metrica in sorted(metricas, key=lambda m: m.orcamento_ms):
+        futuro = futuros[metrica.nome]
+        restante = metrica.orcamento_ms / 1000 - (time.perf_counter() - inicio)
+        status = "ok"
+        try:
+            valores[metrica.nome] = futuro.result(timeout=max(0.0, restante))
+            ultimo = ultimos_valores.ultimo(metrica.nome)
+            calculado_em = ultimo[1] if ultimo else now_brazil_naive()
+        except Exception:
+            # Estourou o orçamento (o cálculo continua em segundo plano) ou falhou
+            if futuro.done():
+                logger.warning(f"[METRICS] Falha ao calcular {metrica.nome}: {futuro.exception()}")
+                status_falha = "erro"
+            else:
+                status_falha = "timeout"
+            ultimos_valores.contar(metrica.nome, status_falha)
+
+            ultimo = ultimos_valores.ultimo(metrica.nome)
+            if ultimo is not None:
+                valores[metrica.nome], calculado_em = ultimo
+                status = "stale"
+            else:
+                valores[metrica.nome], calculado_em = metrica.padrao, None
+                status = "padrao"
+
+        ultimos_valores.contar(metrica.nome, status)
+        frescor[metrica.nome] = {
+            "status": status,
+            "calculado_em": calculado_em.isoformat() if calculado_em else None,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        }
+
+    return valores, frescor
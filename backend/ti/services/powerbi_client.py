@@ -0,0 +1,476 @@
+"""
+Cliente HTTP compartilhado e cache de embed tokens do proxy Power BI.
+
+Cada handler de ti/api/powerbi.py abria um httpx.AsyncClient novo (novo
+handshake TLS com api.powerbi.com), e /embed-token gerava um embed token a
+cada visualização. Agora:
+
+- Um único httpx.AsyncClient por worker, durante toda a vida da aplicação,
+  com pool de conexões keep-alive e HTTP/2 (quando o pacote h2 está
+  instalado). Fechado no shutdown (fechar_powerbi_client)
+- Embed tokens em cache por (relatório, dataset, identidade RLS) até
+  POWERBI_EMBED_MARGEM_SEGUNDOS antes de expirar, com single-flight por
+  chave (aberturas simultâneas do mesmo relatório geram um único token)
+- Relatórios muito vistos (POWERBI_EMBED_POPULAR_MIN_ACESSOS acessos na
+  última hora) têm o token renovado antes do vencimento, em segundo plano
+  (POWERBI_EMBED_RENOVAR_ANTES_SEGUNDOS), sem atrasar quem está abrindo
+
+Resiliência das chamadas de saída (chamar_powerbi):
+
+- Circuit breaker por endpoint: após POWERBI_BREAKER_FALHAS falhas seguidas
+  o circuito abre e as chamadas falham na hora (PowerBIIndisponivel → 503 com
+  Retry-After) por POWERBI_BREAKER_ABERTO_SEGUNDOS; depois uma única chamada
+  de teste decide se fecha de novo
+- Timeout por tentativa de POWERBI_TIMEOUT_SEGUNDOS e até
+  POWERBI_RETRY_TENTATIVAS novas tentativas (timeout, erro de rede, 429/5xx)
+  com backoff exponencial e jitter (respeita Retry-After do Power BI)
+- Hedging opcional (POWERBI_HEDGE=1): se a resposta passar do p95 de latência
+  do endpoint, dispara uma segunda requisição e usa a que chegar primeiro
+- Se a geração do embed token falhar por indisponibilidade e ainda houver um
+  token em cache que não expirou, ele é entregue (fallback)
+
+ti/scripts/powerbi_mock_server.py simula latência e falhas do Power BI para
+exercitar esse comportamento localmente.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (habilita HTTP/2 no httpx)
+    HTTP2_DISPONIVEL = True
+except ImportError:
+    HTTP2_DISPONIVEL = False
+
+MAX_CONEXOES = int(os.getenv("POWERBI_HTTP_MAX_CONEXOES", "50"))
+MAX_KEEPALIVE = int(os.getenv("POWERBI_HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_SEGUNDOS = float(os.getenv("POWERBI_HTTP_KEEPALIVE_SEGUNDOS", "120"))
+
+EMBED_MARGEM_SEGUNDOS = int(os.getenv("POWERBI_EMBED_MARGEM_SEGUNDOS", "300"))
+EMBED_RENOVAR_ANTES_SEGUNDOS = int(os.getenv("POWERBI_EMBED_RENOVAR_ANTES_SEGUNDOS", "900"))
+EMBED_POPULAR_MIN_ACESSOS = int(os.getenv("POWERBI_EMBED_POPULAR_MIN_ACESSOS", "3"))
+EMBED_MAX_ENTRADAS = int(os.getenv("POWERBI_EMBED_MAX_ENTRADAS", "500"))
+EMBED_FALLBACK_MARGEM_SEGUNDOS = 60
+# Janela usada para decidir se um relatório é "muito visto"
+JANELA_POPULARIDADE_SEGUNDOS = 3600
+VERIFICAR_INTERVALO_SEGUNDOS = 60
+
+TIMEOUT_SEGUNDOS = float(os.getenv("POWERBI_TIMEOUT_SEGUNDOS", "15"))
+RETRY_TENTATIVAS = int(os.getenv("POWERBI_RETRY_TENTATIVAS", "2"))
+RETRY_BASE_SEGUNDOS = 0.5
+RETRY_MAX_SEGUNDOS = 5.0
+BREAKER_FALHAS = int(os.getenv("POWERBI_BREAKER_FALHAS", "5"))
+BREAKER_ABERTO_SEGUNDOS = float(os.getenv("POWERBI_BREAKER_ABERTO_SEGUNDOS", "30"))
+HEDGE_ATIVO = os.getenv("POWERBI_HEDGE", "0").lower() in ("1", "true", "sim")
+HEDGE_PERCENTIL = 0.95
+# Sem amostras suficientes o p95 não é confiável: não faz hedging
+HEDGE_MIN_AMOSTRAS = 20
+HEDGE_MIN_SEGUNDOS = 0.5
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_powerbi_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartilhado (pool keep-alive, HTTP/2 se disponível)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_DISPONIVEL,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=MAX_CONEXOES,
+                max_keepalive_connections=MAX_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_SEGUNDOS,
+            ),
+        )
+        print(f"[POWERBI] 🔌 Cliente HTTP compartilhado criado (HTTP/2: {'sim' if HTTP2_DISPONIVEL else 'não'})")
+    return _client
+
+
+async def fechar_powerbi_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+class PowerBIIndisponivel(Exception):
+    """Circuito aberto: o endpoint do Power BI está falhando e não será chamado agora"""
+
+    def __init__(self, endpoint: str, retry_after: int):
+        super().__init__(f"Power BI indisponível ({endpoint}); nova tentativa em {retry_after}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuito de um endpoint do Power BI: fechado → aberto → meio-aberto → fechado"""
+
+    FECHADO = "fechado"
+    ABERTO = "aberto"
+    MEIO_ABERTO = "meio_aberto"
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.estado = self.FECHADO
+        self.falhas_seguidas = 0
+        self.aberto_em = 0.0
+        self.teste_em_andamento = False
+        self.latencias: deque[float] = deque(maxlen=200)
+        self.stats = {"chamadas": 0, "falhas": 0, "retries": 0, "rejeitadas": 0, "hedges": 0, "hedges_vencedores": 0}
+
+    def permitir(self) -> bool:
+        if self.estado == self.FECHADO:
+            return True
+        if self.estado == self.ABERTO and time.monotonic() - self.aberto_em >= BREAKER_ABERTO_SEGUNDOS:
+            self.estado = self.MEIO_ABERTO
+            self.teste_em_andamento = False
+        if self.estado == self.MEIO_ABERTO and not self.teste_em_andamento:
+            # Uma única chamada de teste; as demais seguem rejeitadas até ela terminar
+            self.teste_em_andamento = True
+            return True
+        self.stats["rejeitadas"] += 1
+        return False
+
+    def retry_after(self) -> int:
+        restante = BREAKER_ABERTO_SEGUNDOS - (time.monotonic() - self.aberto_em)
+        return max(1, int(restante + 0.999))
+
+    def registrar_sucesso(self, duracao: float) -> None:
+        self.stats["chamadas"] += 1
+        self.latencias.append(duracao)
+        self.falhas_seguidas = 0
+        self.teste_em_andamento = False
+        if self.estado != self.FECHADO:
+            print(f"[POWERBI] ✅ Circuito '{self.endpoint}' fechado novamente")
+        self.estado = self.FECHADO
+
+    def registrar_falha(self) -> None:
+        self.stats["chamadas"] += 1
+        self.stats["falhas"] += 1
+        self.falhas_seguidas += 1
+        self.teste_em_andamento = False
+        if self.estado == self.MEIO_ABERTO or (
+            self.estado == self.FECHADO and self.falhas_seguidas >= BREAKER_FALHAS
+        ):
+            self.estado = self.ABERTO
+            self.aberto_em = time.monotonic()
+            print(f"[POWERBI] ⚠️ Circuito '{self.endpoint}' aberto após {self.falhas_seguidas} falha(s) seguida(s)")
+
+    def limiar_hedge(self) -> float | None:
+        """Segundos de espera antes da requisição de hedge (p95 do endpoint)"""
+        if len(self.latencias) < HEDGE_MIN_AMOSTRAS:
+            return None
+        ordenadas = sorted(self.latencias)
+        p95 = ordenadas[min(len(ordenadas) - 1, int(HEDGE_PERCENTIL * len(ordenadas)))]
+        return max(HEDGE_MIN_SEGUNDOS, p95)
+
+    def status(self) -> dict:
+        limiar = self.limiar_hedge()
+        return {
+            **self.stats,
+            "estado": self.estado,
+            "falhas_seguidas": self.falhas_seguidas,
+            "retry_after_segundos": self.retry_after() if self.estado == self.ABERTO else None,
+            "p95_ms": round(limiar * 1000) if limiar is not None else None,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+
+def status_circuitos() -> dict:
+    return {nome: breaker.status() for nome, breaker in _breakers.items()}
+
+
+def _espera_retry(tentativa: int, response: httpx.Response | None) -> float:
+    """Backoff exponencial com jitter completo; respeita Retry-After do Power BI"""
+    if response is not None:
+        try:
+            return min(RETRY_MAX_SEGUNDOS, float(response.headers.get("Retry-After", "")))
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX_SEGUNDOS, RETRY_BASE_SEGUNDOS * 2 ** tentativa))
+
+
+async def _enviar(breaker: CircuitBreaker, metodo: str, url: str, hedge: bool, kwargs: dict) -> httpx.Response:
+    """Uma tentativa; com hedging, dispara uma segunda requisição se a primeira passar do p95"""
+    client = get_powerbi_client()
+    limiar = breaker.limiar_hedge() if hedge and HEDGE_ATIVO else None
+    if limiar is None:
+        return await client.request(metodo, url, **kwargs)
+
+    primeira = asyncio.ensure_future(client.request(metodo, url, **kwargs))
+    pendentes = {primeira}
+    try:
+        feitas, _ = await asyncio.wait(pendentes, timeout=limiar)
+        if not feitas:
+            breaker.stats["hedges"] += 1
+            pendentes.add(asyncio.ensure_future(client.request(metodo, url, **kwargs)))
+
+        erro: BaseException | None = None
+        while pendentes:
+            feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for task in feitas:
+                if task.exception() is None:
+                    if task is not primeira:
+                        breaker.stats["hedges_vencedores"] += 1
+                    return task.result()
+                erro = task.exception()
+        raise erro
+    finally:
+        for task in pendentes:
+            task.cancel()
+
+
+async def chamar_powerbi(
+    endpoint: str,
+    metodo: str,
+    url: str,
+    hedge: bool = False,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Requisição ao Power BI com circuit breaker, retries com jitter e hedging opcional.
+
+    Retorna a resposta (inclusive 4xx, que não contam como falha do circuito).
+    Se todas as tentativas falharem, retorna a última resposta 429/5xx ou
+    relança o último erro de rede/timeout. Circuito aberto → PowerBIIndisponivel.
+    """
+    breaker = get_breaker(endpoint)
+    kwargs.setdefault("timeout", TIMEOUT_SEGUNDOS)
+
+    for tentativa in range(RETRY_TENTATIVAS + 1):
+        if not breaker.permitir():
+            raise PowerBIIndisponivel(endpoint, breaker.retry_after())
+
+        inicio = time.monotonic()
+        response: httpx.Response | None = None
+        try:
+            response = await _enviar(breaker, metodo, url, hedge, kwargs)
+        except httpx.TransportError as e:
+            breaker.registrar_falha()
+            if tentativa == RETRY_TENTATIVAS:
+                raise
+            print(f"[POWERBI] ⚠️ {endpoint}: {type(e).__name__} na tentativa {tentativa + 1}")
+        except asyncio.CancelledError:
+            # Hedge perdedor ou cliente que desconectou: não diz nada sobre o
+            # Power BI; só libera a chamada de teste do meio-aberto
+            breaker.teste_em_andamento = False
+            raise
+        except Exception:
+            # DecodingError, TooManyRedirects...: sem retry, mas conta a falha
+            # e libera a chamada de teste do meio-aberto
+            breaker.registrar_falha()
+            raise
+        else:
+            if response.status_code not in STATUS_TRANSITORIOS:
+                breaker.registrar_sucesso(time.monotonic() - inicio)
+                return response
+            breaker.registrar_falha()
+            if tentativa == RETRY_TENTATIVAS:
+                return response
+            print(f"[POWERBI] ⚠️ {endpoint}: HTTP {response.status_code} na tentativa {tentativa + 1}")
+
+        breaker.stats["retries"] += 1
+        await asyncio.sleep(_espera_retry(tentativa, response))
+
+    raise AssertionError("inalcançável")
+
+
+def _expiracao_epoch(expiration: str | None) -> float:
+    """Converte o "expiration" do GenerateToken (ISO 8601, UTC) em epoch"""
+    if not expiration:
+        return 0.0
+    try:
+        dt = datetime.fromisoformat(expiration.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    except ValueError:
+        return 0.0
+
+
+class _EmbedEntrada:
+    """Embed token em cache e histórico recente de acessos da chave"""
+
+    def __init__(self, gerar: Callable[[], Awaitable[dict]]):
+        self.gerar = gerar
+        self.dados: dict | None = None
+        self.expira_em = 0.0
+        self.acessos: list[float] = []
+        self.em_andamento: asyncio.Task | None = None
+
+    def valido(self, agora: float) -> bool:
+        return self.dados is not None and agora < self.expira_em - EMBED_MARGEM_SEGUNDOS
+
+    def registrar_acesso(self, agora: float) -> None:
+        self.acessos.append(agora)
+        limite = agora - JANELA_POPULARIDADE_SEGUNDOS
+        if self.acessos[0] < limite:
+            self.acessos = [t for t in self.acessos if t >= limite]
+
+    def popular(self, agora: float) -> bool:
+        limite = agora - JANELA_POPULARIDADE_SEGUNDOS
+        return sum(1 for t in self.acessos if t >= limite) >= EMBED_POPULAR_MIN_ACESSOS
+
+
+class EmbedTokenCache:
+    """Embed tokens por (relatório, dataset, identidade RLS), com renovação antecipada"""
+
+    def __init__(self):
+        self._entradas: dict[tuple, _EmbedEntrada] = {}
+        self._stats = {"hits": 0, "misses": 0, "esperas": 0, "renovacoes_antecipadas": 0, "falhas": 0, "fallbacks": 0}
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def chave(report_id: str, dataset_id: str | None, identidades: list | None) -> tuple:
+        identidade = json.dumps(identidades, sort_keys=True) if identidades else ""
+        return (report_id, dataset_id or "", identidade)
+
+    async def obter(
+        self,
+        report_id: str,
+        dataset_id: str | None,
+        identidades: list | None,
+        gerar: Callable[[], Awaitable[dict]],
+    ) -> tuple[dict, bool]:
+        """Retorna (dados do embed token, veio_do_cache)"""
+        chave = self.chave(report_id, dataset_id, identidades)
+        agora = time.time()
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            self._descartar_excedentes()
+            entrada = self._entradas[chave] = _EmbedEntrada(gerar)
+        entrada.gerar = gerar
+        entrada.registrar_acesso(agora)
+
+        if entrada.valido(agora):
+            self._stats["hits"] += 1
+            if entrada.expira_em - agora < EMBED_RENOVAR_ANTES_SEGUNDOS and entrada.popular(agora):
+                self._renovar(chave, entrada, antecipada=True)
+            return entrada.dados, True
+
+        if entrada.em_andamento is not None:
+            self._stats["esperas"] += 1
+        else:
+            self._stats["misses"] += 1
+        try:
+            # shield: quem desistir (cliente desconectou) não cancela a geração dos demais
+            dados = await asyncio.shield(self._renovar(chave, entrada, antecipada=False))
+        except Exception as e:
+            # Indisponibilidade (circuito aberto, timeout, 5xx): entrega o token
+            # anterior se ele ainda não expirou; erros 4xx são repassados
+            if (
+                getattr(e, "status_code", 503) >= 500
+                and entrada.dados is not None
+                and agora < entrada.expira_em - EMBED_FALLBACK_MARGEM_SEGUNDOS
+            ):
+                self._stats["fallbacks"] += 1
+                print(f"[POWERBI] ⚠️ Falha ao renovar embed token do relatório {report_id}; usando o token em cache")
+                return entrada.dados, True
+            raise
+        return dados, False
+
+    def _renovar(self, chave: tuple, entrada: _EmbedEntrada, antecipada: bool) -> asyncio.Task:
+        """Task de geração do token da chave (reaproveita a que estiver em andamento)"""
+        if entrada.em_andamento is None:
+            entrada.em_andamento = asyncio.ensure_future(self._gerar(chave, entrada, antecipada))
+            if antecipada:
+                # Ninguém aguarda a renovação antecipada: a falha já é contada em
+                # _gerar e o token atual segue válido até a margem
+                entrada.em_andamento.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return entrada.em_andamento
+
+    async def _gerar(self, chave: tuple, entrada: _EmbedEntrada, antecipada: bool) -> dict:
+        try:
+            dados = await entrada.gerar()
+            entrada.dados = dados
+            entrada.expira_em = _expiracao_epoch(dados.get("expiration"))
+            if antecipada:
+                self._stats["renovacoes_antecipadas"] += 1
+                print(f"[POWERBI] 🔄 Embed token do relatório {chave[0]} renovado antecipadamente")
+            return dados
+        except Exception:
+            self._stats["falhas"] += 1
+            raise
+        finally:
+            entrada.em_andamento = None
+
+    def _descartar_excedentes(self) -> None:
+        """Mantém o cache limitado: descarta as chaves acessadas há mais tempo"""
+        if len(self._entradas) < EMBED_MAX_ENTRADAS:
+            return
+        por_ultimo_acesso = sorted(
+            self._entradas.items(), key=lambda item: item[1].acessos[-1] if item[1].acessos else 0.0
+        )
+        for chave, _ in por_ultimo_acesso[: len(self._entradas) - EMBED_MAX_ENTRADAS + 1]:
+            self._entradas.pop(chave, None)
+
+    def invalidar(self, report_id: str | None = None) -> int:
+        """Remove os tokens de um relatório (ou todos); retorna quantos foram removidos"""
+        chaves = [c for c in self._entradas if report_id is None or c[0] == report_id]
+        for chave in chaves:
+            self._entradas.pop(chave, None)
+        return len(chaves)
+
+    # ------------------------------------------------------------------
+    # Renovação antecipada em segundo plano
+    # ------------------------------------------------------------------
+
+    def iniciar(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def parar(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(VERIFICAR_INTERVALO_SEGUNDOS)
+            agora = time.time()
+            for chave, entrada in list(self._entradas.items()):
+                if (
+                    entrada.dados is not None
+                    and entrada.em_andamento is None
+                    and entrada.expira_em - agora < EMBED_RENOVAR_ANTES_SEGUNDOS
+                    and entrada.popular(agora)
+                ):
+                    self._renovar(chave, entrada, antecipada=True)
+
+    def stats(self) -> dict:
+        agora = time.time()
+        return {
+            **self._stats,
+            "http2": HTTP2_DISPONIVEL,
+            "entradas": len(self._entradas),
+            "validas": sum(1 for e in self._entradas.values() if e.valido(agora)),
+            "populares": sum(1 for e in self._entradas.values() if e.popular(agora)),
+            "hedge_ativo": HEDGE_ATIVO,
+            "circuitos": status_circuitos(),
+        }
+
+
+embed_token_cache = EmbedTokenCache()
@@ -0,0 +1,236 @@
+"""
+Cache em memória das listagens do Power BI (workspaces, relatórios, datasets).
+
+/powerbi/dashboards, /powerbi/reports e /powerbi/debug/* consultavam a API
+REST do Power BI a cada chamada, embora o conteúdo do workspace mude poucas
+vezes por mês. Agora cada listagem fica em memória (por worker):
+
+- Válida por POWERBI_METADADOS_TTL_SEGUNDOS; depois disso ainda é servida
+  enquanto uma atualização roda em segundo plano (quem chama não espera)
+- Um loop em segundo plano atualiza as listagens perto de vencer que foram
+  consultadas recentemente; as esquecidas há mais de
+  POWERBI_METADADOS_DESCARTAR_SEGUNDOS são descartadas
+- Falha ao atualizar mantém a listagem anterior (e registra o erro)
+- Só a primeira consulta de uma chave espera a API (single-flight)
+- POST /powerbi/cache/refresh força a atualização; as respostas trazem
+  "cache" com atualizado_em, expira_em e origem ("api" ou "cache")
+- O refresh manual vale para todos os workers: incrementa a tag
+  "powerbi_metadados" em cache_tag_geracao e cada leitura confere a geração
+  (relida no máximo a cada SLA_CACHE_GERACAO_TTL_SEGUNDOS); listagem de
+  geração antiga é recarregada antes de ser servida
+"""
+
+from __future__ import annotations
+import asyncio
+import os
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable
+
+from core.db import SessionLocal
+from core.utils import now_brazil_naive
+from ti.services import cache_geracao
+
+TTL_SEGUNDOS = int(os.getenv("POWERBI_METADADOS_TTL_SEGUNDOS", "3600"))
+DESCARTAR_SEGUNDOS = int(os.getenv("POWERBI_METADADOS_DESCARTAR_SEGUNDOS", "86400"))
+MAX_ENTRADAS = 200
+# O loop atualiza o que vence antes da próxima volta
+VERIFICAR_INTERVALO_SEGUNDOS = 60
+
+TAG_METADADOS = "powerbi_metadados"
+
+
+class _Entrada:
+    def __init__(self, carregar: Callable[[], Awaitable[Any]]):
+        self.carregar = carregar
+        self.dados: Any = None
+        self.carregado = False
+        self.atualizado_em = None
+        self.atualizado_em_ts = 0.0
+        self.ultimo_acesso = time.time()
+        self.ultimo_erro: str | None = None
+        self.em_andamento: asyncio.Task | None = None
+        self.geracao = 0
+
+    def idade(self, agora: float) -> float:
+        return agora - self.atualizado_em_ts
+
+    def meta(self, origem: str) -> dict:
+        return {
+            "origem": origem,
+            "atualizado_em": self.atualizado_em.isoformat() if self.atualizado_em else None,
+            "expira_em": (self.atualizado_em + timedelta(seconds=TTL_SEGUNDOS)).isoformat()
+            if self.atualizado_em else None,
+            "desatualizado": self.idade(time.time()) >= TTL_SEGUNDOS,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+
+class PowerBIMetadadosCache:
+    """Listagens do Power BI por chave ("reports", "workspace:{id}:datasets", ...)"""
+
+    def __init__(self):
+        self._entradas: dict[str, _Entrada] = {}
+        self._stats = {
+            "hits": 0, "misses": 0, "servidos_desatualizados": 0, "atualizacoes": 0, "falhas": 0,
+            "recargas_por_geracao": 0,
+        }
+        self._task: asyncio.Task | None = None
+        # Geração conhecida da tag TAG_METADADOS e quando foi lida
+        self._geracao = 0
+        self._geracao_lida_ts = 0.0
+
+    # ------------------------------------------------------------------
+    # Geração compartilhada (refresh manual em outro worker)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ler_geracao(incrementar: bool = False) -> int:
+        db = SessionLocal()
+        try:
+            if incrementar:
+                return cache_geracao.incrementar(db, TAG_METADADOS)
+            return cache_geracao.geracao(db, TAG_METADADOS)
+        finally:
+            db.close()
+
+    async def _geracao_atual(self) -> int:
+        if time.monotonic() - self._geracao_lida_ts >= cache_geracao.GERACAO_TTL_SEGUNDOS:
+            self._geracao = await asyncio.to_thread(self._ler_geracao)
+            self._geracao_lida_ts = time.monotonic()
+        return self._geracao
+
+    async def obter(self, chave: str, carregar: Callable[[], Awaitable[Any]]) -> tuple[Any, dict]:
+        """
+        Retorna (dados, meta). Sem dados em memória, espera o carregamento e
+        relança o erro dele; com dados vencidos, devolve-os e atualiza em segundo plano.
+        """
+        geracao = await self._geracao_atual()
+        agora = time.time()
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            self._descartar_excedentes()
+            entrada = self._entradas[chave] = _Entrada(carregar)
+        entrada.carregar = carregar
+        entrada.ultimo_acesso = agora
+
+        if not entrada.carregado:
+            self._stats["misses"] += 1
+            # shield: cliente que desconecta não cancela o carregamento dos demais
+            await asyncio.shield(self._atualizar(chave, entrada))
+            return entrada.dados, entrada.meta("api")
+
+        if entrada.geracao != geracao:
+            # Refresh manual feito em outro worker: espera a listagem nova
+            # (falhando, serve a anterior, como no carregamento em segundo plano)
+            self._stats["recargas_por_geracao"] += 1
+            try:
+                await asyncio.shield(self._atualizar(chave, entrada))
+                return entrada.dados, entrada.meta("api")
+            except Exception:
+                return entrada.dados, entrada.meta("cache")
+
+        if entrada.idade(agora) >= TTL_SEGUNDOS:
+            self._stats["servidos_desatualizados"] += 1
+            self._atualizar_em_segundo_plano(chave, entrada)
+        else:
+            self._stats["hits"] += 1
+        return entrada.dados, entrada.meta("cache")
+
+    def _atualizar(self, chave: str, entrada: _Entrada) -> asyncio.Task:
+        if entrada.em_andamento is None:
+            entrada.em_andamento = asyncio.ensure_future(self._carregar(chave, entrada))
+        return entrada.em_andamento
+
+    def _atualizar_em_segundo_plano(self, chave: str, entrada: _Entrada) -> None:
+        task = self._atualizar(chave, entrada)
+        # Ninguém aguarda: a falha já foi registrada em _carregar
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _carregar(self, chave: str, entrada: _Entrada) -> None:
+        geracao = self._geracao
+        try:
+            entrada.dados = await entrada.carregar()
+            entrada.geracao = geracao
+            entrada.carregado = True
+            entrada.atualizado_em = now_brazil_naive()
+            entrada.atualizado_em_ts = time.time()
+            entrada.ultimo_erro = None
+            self._stats["atualizacoes"] += 1
+        except Exception as e:
+            entrada.ultimo_erro = str(e) or type(e).__name__
+            self._stats["falhas"] += 1
+            print(f"[POWERBI] [CACHE] ⚠️ Falha ao atualizar '{chave}': {entrada.ultimo_erro}")
+            if not entrada.carregado:
+                # Nada para servir: não guarda a chave (evita acumular ids inválidos)
+                self._entradas.pop(chave, None)
+            raise
+        finally:
+            entrada.em_andamento = None
+
+    async def atualizar(self, chave: str | None = None) -> dict:
+        """
+        Atualização manual de uma chave (ou de todas); retorna o meta de cada uma.
+        Incrementa a geração compartilhada: os outros workers recarregam as
+        listagens na próxima leitura.
+        """
+        self._geracao = await asyncio.to_thread(self._ler_geracao, True)
+        self._geracao_lida_ts = time.monotonic()
+        chaves = [c for c in self._entradas if chave is None or c == chave]
+        entradas = [(c, self._entradas[c]) for c in chaves]
+        resultados = await asyncio.gather(
+            *(self._atualizar(c, e) for c, e in entradas), return_exceptions=True
+        )
+        return {
+            c: {**e.meta("api"), "ok": not isinstance(r, Exception)}
+            for (c, e), r in zip(entradas, resultados)
+        }
+
+    def _descartar_excedentes(self) -> None:
+        if len(self._entradas) < MAX_ENTRADAS:
+            return
+        por_acesso = sorted(self._entradas.items(), key=lambda item: item[1].ultimo_acesso)
+        for chave, _ in por_acesso[: len(self._entradas) - MAX_ENTRADAS + 1]:
+            self._entradas.pop(chave, None)
+
+    # ------------------------------------------------------------------
+    # Atualização em segundo plano
+    # ------------------------------------------------------------------
+
+    def iniciar(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def parar(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(VERIFICAR_INTERVALO_SEGUNDOS)
+            geracao = await self._geracao_atual()
+            agora = time.time()
+            for chave, entrada in list(self._entradas.items()):
+                if agora - entrada.ultimo_acesso > DESCARTAR_SEGUNDOS:
+                    self._entradas.pop(chave, None)
+                elif (
+                    entrada.carregado
+                    and entrada.em_andamento is None
+                    and (
+                        entrada.geracao != geracao
+                        or entrada.idade(agora) >= TTL_SEGUNDOS - VERIFICAR_INTERVALO_SEGUNDOS
+                    )
+                ):
+                    self._atualizar_em_segundo_plano(chave, entrada)
+
+    def status(self) -> dict:
+        return {
+            **self._stats,
+            "ttl_segundos": TTL_SEGUNDOS,
+            "geracao": self._geracao,
+            "entradas": {chave: entrada.meta("cache") for chave, entrada in self._entradas.items()},
+        }
+
+
+metadados_cache = PowerBIMetadadosCache()
@@ -0,0 +1,180 @@
+"""
+Sketch de quantis mesclável (t-digest) para métricas de SLA.
+
+Mantém um resumo de tamanho limitado (≈ compressão centróides) de uma
+distribuição de tempos, permitindo:
+- Inserção O(1) amortizada por valor
+- Mescla de vários sketches (ex: 30 sketches diários → janela de 30 dias)
+- Serialização binária compacta para persistência em metrics_cache_db
+
+Referência: Dunning & Ertl, "Computing Extremely Accurate Quantiles Using t-Digests".
+"""
+
+from __future__ import annotations
+import base64
+import math
+import struct
+from typing import Iterable
+
+
+class TDigest:
+    """t-digest (variante "merging") com função de escala k1."""
+
+    _FORMAT_VERSION = 1
+    _HEADER = struct.Struct("<BfIdd")  # versão, compressão, nº centróides, min, max
+    _CENTROID = struct.Struct("<ff")  # média, peso
+
+    def __init__(self, compression: float = 100.0):
+        self.compression = float(compression)
+        self._means: list[float] = []
+        self._weights: list[float] = []
+        self._buffer: list[tuple[float, float]] = []
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self) -> float:
+        """Total de valores (peso) representados pelo sketch"""
+        return sum(self._weights) + sum(w for _, w in self._buffer)
+
+    def add(self, valor: float, peso: float = 1.0) -> None:
+        """Adiciona um valor ao sketch"""
+        if peso <= 0 or valor is None or math.isnan(valor):
+            return
+        valor = float(valor)
+        self._buffer.append((valor, float(peso)))
+        self.min = min(self.min, valor)
+        self.max = max(self.max, valor)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def add_many(self, valores: Iterable[float]) -> None:
+        for valor in valores:
+            self.add(valor)
+
+    def merge(self, other: "TDigest") -> None:
+        """Mescla outro sketch neste (o outro não é alterado)"""
+        if other.count == 0:
+            return
+        # Centroides e buffer do outro entram no buffer deste: o outro fica intacto
+        self._buffer.extend(zip(other._means, other._weights))
+        self._buffer.extend(other._buffer)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    @classmethod
+    def merge_all(cls, sketches: Iterable["TDigest"], compression: float = 100.0) -> "TDigest":
+        resultado = cls(compression)
+        for sketch in sketches:
+            resultado.merge(sketch)
+        return resultado
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inv(self, k: float) -> float:
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+
+        itens = sorted(list(zip(self._means, self._weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in itens)
+
+        means: list[float] = []
+        weights: list[float] = []
+        peso_acumulado = 0.0
+        q_limite = self._k_inv(self._k(0.0) + 1)
+        atual_media, atual_peso = itens[0]
+
+        for media, peso in itens[1:]:
+            if (peso_acumulado + atual_peso + peso) / total <= q_limite:
+                atual_peso += peso
+                atual_media += (media - atual_media) * peso / atual_peso
+            else:
+                means.append(atual_media)
+                weights.append(atual_peso)
+                peso_acumulado += atual_peso
+                q_limite = self._k_inv(self._k(peso_acumulado / total) + 1)
+                atual_media, atual_peso = media, peso
+
+        means.append(atual_media)
+        weights.append(atual_peso)
+        self._means = means
+        self._weights = weights
+
+    def quantile(self, q: float) -> float:
+        """Estima o quantil q (0..1) interpolando entre centróides"""
+        self._compress()
+        if not self._means:
+            return 0.0
+        if len(self._means) == 1:
+            return float(self._means[0])
+
+        q = min(max(q, 0.0), 1.0)
+        total = sum(self._weights)
+        alvo = q * total
+
+        # Cauda inferior: entre min e o centro do primeiro centróide
+        primeiro_centro = self._weights[0] / 2
+        if alvo < primeiro_centro:
+            fracao = alvo / primeiro_centro if primeiro_centro else 0.0
+            return self.min + (self._means[0] - self.min) * fracao
+
+        acumulado = 0.0
+        for i in range(len(self._means) - 1):
+            centro = acumulado + self._weights[i] / 2
+            proximo_centro = acumulado + self._weights[i] + self._weights[i + 1] / 2
+            if alvo < proximo_centro:
+                fracao = (alvo - centro) / (proximo_centro - centro)
+                return self._means[i] + (self._means[i + 1] - self._means[i]) * fracao
+            acumulado += self._weights[i]
+
+        # Cauda superior: entre o centro do último centróide e max
+        ultimo_centro = total - self._weights[-1] / 2
+        restante = total - ultimo_centro
+        fracao = (alvo - ultimo_centro) / restante if restante else 1.0
+        return self._means[-1] + (self.max - self._means[-1]) * min(fracao, 1.0)
+
+    def to_bytes(self) -> bytes:
+        self._compress()
+        partes = [
+            self._HEADER.pack(
+                self._FORMAT_VERSION,
+                self.compression,
+                len(self._means),
+                self.min if self._means else 0.0,
+                self.max if self._means else 0.0,
+            )
+        ]
+        partes.extend(self._CENTROID.pack(m, w) for m, w in zip(self._means, self._weights))
+        return b"".join(partes)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        versao, compression, n, minimo, maximo = cls._HEADER.unpack_from(data, 0)
+        if versao != cls._FORMAT_VERSION:
+            raise ValueError(f"Versão de sketch não suportada: {versao}")
+        sketch = cls(compression)
+        offset = cls._HEADER.size
+        for _ in range(n):
+            media, peso = cls._CENTROID.unpack_from(data, offset)
+            sketch._means.append(media)
+            sketch._weights.append(peso)
+            offset += cls._CENTROID.size
+        if n:
+            sketch.min = minimo
+            sketch.max = maximo
+        return sketch
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, value: str) -> "TDigest":
+        return cls.from_bytes(base64.b64decode(value))
@@ -0,0 +1,232 @@
+"""
+Registro em memória dos dados de referência: unidades, problemas,
+configurações de SLA, horários comerciais e feriados.
+
+São tabelas pequenas que mudam raramente, mas eram lidas a cada abertura do
+formulário de chamado (unidades/problemas, com as tabelas legadas
+`unidade`/`problema_reportado`) e a cada chamado avaliado pelo SLA
+(get_sla_config_by_priority, BusinessCalendar.load). Agora:
+
+- Cada conjunto é carregado uma vez por worker e servido da memória
+- Versão por tag em cache_tag_geracao ("unidades", "problemas",
+  "sla_referencia"): os endpoints de escrita chamam invalidar(), que
+  incrementa a tag e descarta a cópia local; os outros workers percebem a
+  nova geração em até SLA_CACHE_GERACAO_TTL_SEGUNDOS
+- REFERENCIAS_TTL_SEGUNDOS limita a idade de cada cópia (edições feitas
+  direto no banco, fora da API)
+- Cada conjunto tem um ETag (hash do conteúdo, igual em todos os workers)
+  para os GETs responderem 304
+- Configurações/horários/feriados são cópias transitórias (fora de sessão):
+  somente leitura
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from core.db import engine
+from core.utils import now_brazil_naive
+from ti.models.sla_config import SLAConfiguration, SLABusinessHours, SLAFeriado
+from ti.services.sla_cache import SLACacheManager
+
+TTL_SEGUNDOS = int(os.getenv("REFERENCIAS_TTL_SEGUNDOS", "300"))
+
+TAG_UNIDADES = "unidades"
+TAG_PROBLEMAS = "problemas"
+# Configurações de SLA, horários comerciais e feriados mudam juntos (tela de SLA)
+TAG_SLA = "sla_referencia"
+
+
+def _copia(obj):
+    """Cópia transitória (sem sessão) com as colunas já carregadas"""
+    cls = type(obj)
+    return cls(**{attr.key: getattr(obj, attr.key) for attr in sa_inspect(cls).column_attrs})
+
+
+def _para_json(valor):
+    if hasattr(valor, "__table__"):
+        return {attr.key: getattr(valor, attr.key) for attr in sa_inspect(type(valor)).column_attrs}
+    return valor
+
+
+def _carregar_sla_config(db: Session) -> list[SLAConfiguration]:
+    try:
+        SLAConfiguration.__table__.create(bind=engine, checkfirst=True)
+    except Exception:
+        pass
+    return [_copia(c) for c in db.query(SLAConfiguration).order_by(SLAConfiguration.prioridade.asc()).all()]
+
+
+def _carregar_business_hours(db: Session) -> list[SLABusinessHours]:
+    try:
+        SLABusinessHours.__table__.create(bind=engine, checkfirst=True)
+    except Exception:
+        pass
+    # Ordem por id: vale o primeiro registro ativo de cada dia (BusinessCalendar)
+    return [_copia(bh) for bh in db.query(SLABusinessHours).order_by(SLABusinessHours.id.asc()).all()]
+
+
+def _carregar_feriados(db: Session) -> list[SLAFeriado]:
+    try:
+        SLAFeriado.__table__.create(bind=engine, checkfirst=True)
+    except Exception:
+        pass
+    return [_copia(f) for f in db.query(SLAFeriado).order_by(SLAFeriado.data.asc()).all()]
+
+
+def _carregar_unidades(db: Session) -> list[dict]:
+    from ti.services.unidades import listar_unidades
+    return listar_unidades(db)
+
+
+def _carregar_problemas(db: Session) -> list[dict]:
+    from ti.services.problemas import listar_problemas
+    return listar_problemas(db)
+
+
+class _Entrada:
+    def __init__(self, geracao: int, dados: Any):
+        self.geracao = geracao
+        self.dados = dados
+        self.carregado_em = now_brazil_naive()
+        self.carregado_em_ts = time.monotonic()
+        digest = hashlib.sha1(
+            json.dumps([_para_json(d) for d in dados], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        self.etag = f'W/"ref-{digest[:20]}"'
+
+
+class RegistroReferencias:
+    """Conjuntos de referência por nome ("unidades", "sla_config", ...)"""
+
+    def __init__(self):
+        self._carregadores: dict[str, tuple[str, Callable[[Session], list]]] = {}
+        self._entradas: dict[str, _Entrada] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._calendario: tuple[tuple[str, str], Any] | None = None
+        self._stats = {"hits": 0, "cargas": 0, "invalidacoes": 0, "falhas": 0, "servidos_desatualizados": 0}
+
+    def registrar(self, nome: str, tag: str, carregar: Callable[[Session], list]) -> None:
+        self._carregadores[nome] = (tag, carregar)
+        self._locks[nome] = threading.Lock()
+
+    def obter(self, db: Session, nome: str) -> tuple[list, str]:
+        """(dados, etag) do conjunto; recarrega se a geração da tag mudou ou a cópia venceu"""
+        tag, carregar = self._carregadores[nome]
+        geracao = SLACacheManager.geracao(db, tag)
+        entrada = self._entradas.get(nome)
+        if self._valida(entrada, geracao):
+            self._stats["hits"] += 1
+            return entrada.dados, entrada.etag
+
+        with self._locks[nome]:
+            entrada = self._entradas.get(nome)
+            if self._valida(entrada, geracao):
+                self._stats["hits"] += 1
+                return entrada.dados, entrada.etag
+            try:
+                entrada = _Entrada(geracao, carregar(db))
+            except Exception as e:
+                self._stats["falhas"] += 1
+                print(f"[REFERENCIAS] ⚠️ Falha ao carregar '{nome}': {e}")
+                anterior = self._entradas.get(nome)
+                if anterior is None:
+                    raise
+                self._stats["servidos_desatualizados"] += 1
+                return anterior.dados, anterior.etag
+            self._entradas[nome] = entrada
+            self._stats["cargas"] += 1
+            return entrada.dados, entrada.etag
+
+    @staticmethod
+    def _valida(entrada: _Entrada | None, geracao: int) -> bool:
+        return (
+            entrada is not None
+            and entrada.geracao == geracao
+            and time.monotonic() - entrada.carregado_em_ts < TTL_SEGUNDOS
+        )
+
+    def invalidar(self, db: Session, tag: str) -> None:
+        """Nova versão da tag (todos os workers) e descarte imediato neste worker"""
+        SLACacheManager.invalidate_tag(db, tag)
+        for nome, (tag_nome, _) in self._carregadores.items():
+            if tag_nome == tag:
+                self._entradas.pop(nome, None)
+        self._stats["invalidacoes"] += 1
+
+    # ------------------------------------------------------------------
+    # Acessos derivados usados pelo cálculo de SLA
+    # ------------------------------------------------------------------
+
+    def configs_ativas(self, db: Session) -> dict[str, SLAConfiguration]:
+        configs, _ = self.obter(db, "sla_config")
+        return {config.prioridade: config for config in configs if config.ativo}
+
+    def calendario(self, db: Session):
+        """BusinessCalendar montado a partir dos horários e feriados em memória"""
+        from ti.services.sla import BusinessCalendar
+
+        horarios, etag_horarios = self.obter(db, "business_hours")
+        feriados, etag_feriados = self.obter(db, "feriados")
+        chave = (etag_horarios, etag_feriados)
+        atual = self._calendario
+        if atual is not None and atual[0] == chave:
+            return atual[1]
+        calendario = BusinessCalendar.from_registros(horarios, feriados)
+        self._calendario = (chave, calendario)
+        return calendario
+
+    def status(self) -> dict:
+        return {
+            **self._stats,
+            "ttl_segundos": TTL_SEGUNDOS,
+            "conjuntos": {
+                nome: {
+                    "tag": tag,
+                    "itens": len(entrada.dados) if entrada else None,
+                    "geracao": entrada.geracao if entrada else None,
+                    "carregado_em": entrada.carregado_em.isoformat() if entrada else None,
+                    "etag": entrada.etag if entrada else None,
+                }
+                for nome, (tag, _) in self._carregadores.items()
+                for entrada in [self._entradas.get(nome)]
+            },
+        }
+
+
+registro = RegistroReferencias()
+registro.registrar("unidades", TAG_UNIDADES, _carregar_unidades)
+registro.registrar("problemas", TAG_PROBLEMAS, _carregar_problemas)
+registro.registrar("sla_config", TAG_SLA, _carregar_sla_config)
+registro.registrar("business_hours", TAG_SLA, _carregar_business_hours)
+registro.registrar("feriados", TAG_SLA, _carregar_feriados)
+
+
+def invalidar_unidades(db: Session) -> None:
+    registro.invalidar(db, TAG_UNIDADES)
+
+
+def invalidar_problemas(db: Session) -> None:
+    registro.invalidar(db, TAG_PROBLEMAS)
+
+
+def invalidar_sla(db: Session) -> None:
+    registro.invalidar(db, TAG_SLA)
+
+
+def resposta_referencia(request, conteudo: list, etag: str):
+    """GET de referência com ETag: If-None-Match igual responde 304 sem corpo"""
+    from fastapi import Response
+    from fastapi.responses import JSONResponse
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=conteudo, headers=headers)
@@ -1,10 +1,11 @@
 from __future__ import annotations
-from datetime import datetime, time, timedelta
+from datetime import date, datetime, time, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
-from ti.models.sla_config import SLAConfiguration, SLABusinessHours, HistoricoSLA
+from ti.models.sla_config import SLAConfiguration, SLABusinessHours, SLAFeriado, HistoricoSLA
 from ti.models.historico_status import HistoricoStatus
 from ti.models.chamado import Chamado
+from ti.services.referencias import registro
 from core.utils import now_brazil_naive
 
 
@@ -20,14 +21,9 @@ class SLACalculator:
     @staticmethod
     def get_business_hours(db: Session, dia_semana: int) -> tuple[str, str] | None:
         try:
-            bh = db.query(SLABusinessHours).filter(
-                and_(
-                    SLABusinessHours.dia_semana == dia_semana,
-                    SLABusinessHours.ativo == True
-                )
-            ).first()
+            bh = BusinessCalendar.load(db).horarios.get(dia_semana)
             if bh:
-                return (bh.hora_inicio, bh.hora_fim)
+                return (bh[0].strftime("%H:%M"), bh[1].strftime("%H:%M"))
         except Exception:
             pass
         return SLACalculator.DEFAULT_BUSINESS_HOURS.get(dia_semana)
@@ -60,7 +56,8 @@ class SLACalculator:
         start: datetime,
         end: datetime,
         db: Session,
-        historicos_cache: dict | None = None
+        historicos_cache: dict | None = None,
+        calendario: "BusinessCalendar | None" = None,
     ) -> float:
         """
         Calcula horas de NEGÓCIO excluindo períodos em "Em análise".
@@ -73,18 +70,24 @@ class SLACalculator:
         Parâmetro historicos_cache: dict {chamado_id: [historicos]}
         Se fornecido, evita queries ao banco (otimização para bulk)
 
+        Parâmetro calendario: BusinessCalendar já carregado
+        Se fornecido, evita a query de horários comerciais (otimização para bulk)
+
         Retorna: horas de negócio SEM contar pausa
         """
         if start >= end:
             return 0.0
 
+        if calendario is None:
+            calendario = BusinessCalendar.load(db)
+
         # 1. Calcula tempo total em horas de negócio
-        tempo_total = SLACalculator.calculate_business_hours(start, end, db)
+        tempo_total = calendario.business_hours(start, end)
 
         # 2. Busca períodos em "Em análise"
         from ti.models.historico_status import HistoricoStatus
 
-        if historicos_cache and chamado_id in historicos_cache:
+        if historicos_cache is not None and chamado_id in historicos_cache:
             # Usa cache se disponível (bulk operation)
             historicos_analise = [
                 h for h in historicos_cache[chamado_id]
@@ -110,10 +113,9 @@ class SLACalculator:
         tempo_analise_total = 0.0
         for hist in historicos_analise:
             if hist.data_inicio and hist.data_fim:
-                tempo_analise = SLACalculator.calculate_business_hours(
+                tempo_analise = calendario.business_hours(
                     hist.data_inicio,
-                    hist.data_fim,
-                    db
+                    hist.data_fim
                 )
                 tempo_analise_total += tempo_analise
 
@@ -126,53 +128,37 @@ class SLACalculator:
         if start >= end:
             return 0.0
 
-        total_minutes = 0
-        current = start
-
-        while current < end:
-            next_day = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-
-            if not SLACalculator.is_business_day(current):
-                current = next_day
-                continue
-
-            bh = None
-            if db:
-                bh = SLACalculator.get_business_hours(db, current.weekday())
-            else:
-                bh = SLACalculator.DEFAULT_BUSINESS_HOURS.get(current.weekday())
-
-            if not bh:
-                current = next_day
-                continue
+        calendario = BusinessCalendar.load(db) if db else BusinessCalendar.default()
+        return calendario.business_hours(start, end)
 
-            hora_inicio = datetime.strptime(bh[0], "%H:%M").time()
-            hora_fim = datetime.strptime(bh[1], "%H:%M").time()
+    @staticmethod
+    def load_active_configs(db: Session) -> dict[str, SLAConfiguration]:
+        """Configurações de SLA ativas indexadas por prioridade (registro em memória)"""
+        return registro.configs_ativas(db)
 
-            day_start = current.replace(hour=hora_inicio.hour, minute=hora_inicio.minute, second=0, microsecond=0)
-            day_end = current.replace(hour=hora_fim.hour, minute=hora_fim.minute, second=0, microsecond=0)
+    @staticmethod
+    def load_historicos_by_chamado(db: Session, chamado_ids: list[int]) -> dict[int, list[HistoricoStatus]]:
+        """
+        Carrega o histórico de status de vários chamados em UMA query,
+        agrupado em memória por chamado_id (ordenado por data_inicio).
 
-            if current < day_start:
-                current = day_start
+        O dict resultante serve como historicos_cache para os cálculos em lote.
+        """
+        historicos: dict[int, list[HistoricoStatus]] = {chamado_id: [] for chamado_id in chamado_ids}
+        if not chamado_ids:
+            return historicos
 
-            if end <= day_end:
-                total_minutes += int((end - current).total_seconds() / 60)
-                break
-            else:
-                total_minutes += int((day_end - current).total_seconds() / 60)
-                current = next_day
+        for h in db.query(HistoricoStatus).filter(
+            HistoricoStatus.chamado_id.in_(chamado_ids)
+        ).order_by(HistoricoStatus.chamado_id.asc(), HistoricoStatus.data_inicio.asc()).all():
+            historicos[h.chamado_id].append(h)
 
-        return total_minutes / 60.0
+        return historicos
 
     @staticmethod
     def get_sla_config_by_priority(db: Session, prioridade: str) -> SLAConfiguration | None:
         try:
-            return db.query(SLAConfiguration).filter(
-                and_(
-                    SLAConfiguration.prioridade == prioridade,
-                    SLAConfiguration.ativo == True
-                )
-            ).first()
+            return registro.configs_ativas(db).get(prioridade)
         except Exception:
             return None
 
@@ -247,7 +233,13 @@ class SLACalculator:
         return False
 
     @staticmethod
-    def get_sla_status(db: Session, chamado: Chamado) -> dict:
+    def get_sla_status(
+        db: Session,
+        chamado: Chamado,
+        sla_configs: dict | None = None,
+        historicos_cache: dict | None = None,
+        calendario: "BusinessCalendar | None" = None,
+    ) -> dict:
         """
         Calcula o status de SLA de um chamado com estados claros e mutuamente exclusivos.
 
@@ -256,11 +248,19 @@ class SLACalculator:
         - Chamado.data_conclusao para data de conclusão
         - Histórico de status para verificar se está pausado
 
+        Para operações em lote, aceita dados pré-carregados (nenhuma query por chamado):
+        - sla_configs: dict {prioridade: SLAConfiguration} das configurações ativas
+        - historicos_cache: dict {chamado_id: [HistoricoStatus]}
+        - calendario: BusinessCalendar
+
         Retorna status com novo sistema de estados.
         """
         from ti.services.sla_status import SLAStatus, SLAStatusDeterminer, SLAResponseMetric, SLAResolutionMetric
 
-        sla_config = SLACalculator.get_sla_config_by_priority(db, chamado.prioridade)
+        if sla_configs is not None:
+            sla_config = sla_configs.get(chamado.prioridade)
+        else:
+            sla_config = SLACalculator.get_sla_config_by_priority(db, chamado.prioridade)
 
         if not sla_config:
             return {
@@ -275,6 +275,9 @@ class SLACalculator:
                 "data_conclusao": None,
             }
 
+        if calendario is None:
+            calendario = BusinessCalendar.load(db)
+
         data_abertura = chamado.data_abertura
         if not data_abertura:
             data_abertura = now_brazil_naive()
@@ -288,13 +291,13 @@ class SLACalculator:
 
         if data_primeira_resposta:
             # Já houve resposta
-            tempo_resposta_horas = SLACalculator.calculate_business_hours(
-                data_abertura, data_primeira_resposta, db
+            tempo_resposta_horas = calendario.business_hours(
+                data_abertura, data_primeira_resposta
             )
         elif chamado.status not in SLAStatusDeterminer.CLOSED_STATUSES:
             # Ainda não respondeu, calcular até agora
-            tempo_resposta_horas = SLACalculator.calculate_business_hours(
-                data_abertura, agora, db
+            tempo_resposta_horas = calendario.business_hours(
+                data_abertura, agora
             )
 
         resposta_status = SLAStatusDeterminer.determine_status(
@@ -321,12 +324,12 @@ class SLACalculator:
         if chamado.status not in SLAStatusDeterminer.PAUSED_STATUSES:
             data_final = data_conclusao if data_conclusao else agora
             tempo_resolucao_horas = SLACalculator.calculate_business_hours_excluding_paused(
-                chamado.id, data_abertura, data_final, db
+                chamado.id, data_abertura, data_final, db, historicos_cache, calendario
             )
         else:
             # Pausado: não conta tempo desde abertura até agora
             tempo_resolucao_horas = SLACalculator.calculate_business_hours_excluding_paused(
-                chamado.id, data_abertura, agora, db
+                chamado.id, data_abertura, agora, db, historicos_cache, calendario
             )
 
         resolucao_status = SLAStatusDeterminer.determine_status(
@@ -373,6 +376,30 @@ class SLACalculator:
             "data_conclusao": data_conclusao,
         }
 
+    @staticmethod
+    def get_sla_status_many(db: Session, chamados: list[Chamado]) -> dict[int, dict]:
+        """
+        Calcula o status de SLA de vários chamados de uma vez.
+
+        Configurações ativas e calendário vêm do registro em memória; os
+        históricos de status de todos os chamados, de uma query. Calcula tudo em memória.
+
+        Retorna: dict {chamado_id: status} no mesmo formato de get_sla_status
+        """
+        if not chamados:
+            return {}
+
+        sla_configs = SLACalculator.load_active_configs(db)
+        calendario = BusinessCalendar.load(db)
+        historicos_cache = SLACalculator.load_historicos_by_chamado(db, [c.id for c in chamados])
+
+        return {
+            chamado.id: SLACalculator.get_sla_status(
+                db, chamado, sla_configs, historicos_cache, calendario
+            )
+            for chamado in chamados
+        }
+
     @staticmethod
     def record_sla_history(
         db: Session,
@@ -385,22 +412,171 @@ class SLACalculator:
         limite_sla_horas: float | None = None,
         status_sla: str | None = None,
     ) -> HistoricoSLA:
+        from ti.services.sla_historico import HistoricoSLAWriter
+
         try:
-            historico = HistoricoSLA(
-                chamado_id=chamado_id,
-                usuario_id=usuario_id,
-                acao=acao,
-                status_anterior=status_anterior,
-                status_novo=status_novo,
-                tempo_resolucao_horas=tempo_resolucao_horas,
-                limite_sla_horas=limite_sla_horas,
-                status_sla=status_sla,
-                criado_em=now_brazil_naive(),
-            )
-            db.add(historico)
+            # historico_sla tem chave única em chamado_id: atualiza o snapshot existente
+            HistoricoSLAWriter.upsert_many(db, [{
+                "chamado_id": chamado_id,
+                "usuario_id": usuario_id,
+                "acao": acao,
+                "status_anterior": status_anterior,
+                "status_novo": status_novo,
+                "tempo_resposta_horas": None,
+                "limite_sla_resposta_horas": None,
+                "tempo_resolucao_horas": tempo_resolucao_horas,
+                "limite_sla_horas": limite_sla_horas,
+                "status_sla": status_sla,
+                "criado_em": now_brazil_naive(),
+            }])
             db.commit()
-            db.refresh(historico)
-            return historico
+            return db.query(HistoricoSLA).filter(HistoricoSLA.chamado_id == chamado_id).first()
         except Exception as e:
             db.rollback()
             raise e
+
+
+class BusinessCalendar:
+    """
+    Calendário comercial pré-carregado para cálculos em lote.
+
+    Carrega horários comerciais (sla_business_hours) e feriados ativos
+    (sla_feriados) uma única vez, em vez de consultar o banco a cada dia
+    percorrido. Dias de feriado não contam horas de negócio.
+    """
+
+    def __init__(self, horarios: dict[int, tuple[time, time]], feriados: set[date] | None = None):
+        self.horarios = horarios
+        self.feriados = feriados or set()
+
+    @staticmethod
+    def _parse(bh: tuple[str, str]) -> tuple[time, time]:
+        return (
+            datetime.strptime(bh[0], "%H:%M").time(),
+            datetime.strptime(bh[1], "%H:%M").time(),
+        )
+
+    @classmethod
+    def default(cls) -> "BusinessCalendar":
+        return cls({
+            dia: cls._parse(bh) for dia, bh in SLACalculator.DEFAULT_BUSINESS_HOURS.items()
+        })
+
+    @classmethod
+    def load(cls, db: Session) -> "BusinessCalendar":
+        """Calendário do registro de referências (ti/services/referencias.py)"""
+        try:
+            return registro.calendario(db)
+        except Exception as e:
+            print(f"[SLA] Erro ao carregar calendário comercial: {e}")
+            return cls.default()
+
+    @classmethod
+    def from_registros(
+        cls, business_hours: list[SLABusinessHours], feriados_cadastrados: list[SLAFeriado]
+    ) -> "BusinessCalendar":
+        horarios = dict(SLACalculator.DEFAULT_BUSINESS_HOURS)
+        configurados: dict[int, tuple[str, str]] = {}
+        for bh in business_hours:
+            # Primeiro registro ativo do dia (business_hours vem ordenado por id)
+            if bh.ativo:
+                configurados.setdefault(bh.dia_semana, (bh.hora_inicio, bh.hora_fim))
+        horarios.update(configurados)
+
+        feriados: set[date] = set()
+        for feriado in feriados_cadastrados:
+            if not feriado.ativo:
+                continue
+            try:
+                feriados.add(datetime.strptime(feriado.data, "%Y-%m-%d").date())
+            except Exception:
+                continue
+
+        calendario: dict[int, tuple[time, time]] = {}
+        for dia, bh in horarios.items():
+            try:
+                calendario[dia] = cls._parse(bh)
+            except Exception:
+                continue
+        return cls(calendario, feriados)
+
+    def _expediente(self, dia: datetime) -> tuple[datetime, datetime] | None:
+        """Início e fim do expediente no dia, ou None se não for dia útil"""
+        if not SLACalculator.is_business_day(dia) or dia.date() in self.feriados:
+            return None
+
+        bh = self.horarios.get(dia.weekday())
+        if not bh:
+            return None
+
+        hora_inicio, hora_fim = bh
+        day_start = dia.replace(hour=hora_inicio.hour, minute=hora_inicio.minute, second=0, microsecond=0)
+        day_end = dia.replace(hour=hora_fim.hour, minute=hora_fim.minute, second=0, microsecond=0)
+        return day_start, day_end
+
+    def business_hours(self, start: datetime, end: datetime) -> float:
+        if start >= end:
+            return 0.0
+
+        total_minutes = 0
+        current = start
+
+        while current < end:
+            next_day = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+            expediente = self._expediente(current)
+            if not expediente:
+                current = next_day
+                continue
+
+            day_start, day_end = expediente
+
+            if current < day_start:
+                current = day_start
+
+            # Fora do expediente (antes do início ou após o fim) não conta tempo negativo
+            if end <= day_end:
+                total_minutes += max(0, int((end - current).total_seconds() / 60))
+                break
+            else:
+                total_minutes += max(0, int((day_end - current).total_seconds() / 60))
+                current = next_day
+
+        return total_minutes / 60.0
+
+    def add_business_hours(self, start: datetime, horas: float) -> datetime:
+        """
+        Data/hora absoluta em que 'horas' de negócio terão decorrido a partir de start.
+        Inverso de business_hours: business_hours(start, resultado) == horas.
+        """
+        if horas <= 0:
+            return start
+
+        restante = horas * 60.0  # minutos
+        current = start
+
+        # Limite de segurança: 10 anos sem expediente configurado
+        for _ in range(3650):
+            next_day = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+            expediente = self._expediente(current)
+            if not expediente:
+                current = next_day
+                continue
+
+            day_start, day_end = expediente
+
+            if current < day_start:
+                current = day_start
+            if current >= day_end:
+                current = next_day
+                continue
+
+            disponivel = (day_end - current).total_seconds() / 60
+            if restante <= disponivel:
+                return current + timedelta(minutes=restante)
+
+            restante -= disponivel
+            current = next_day
+
+        raise ValueError("Calendário comercial sem expediente configurado")
@@ -0,0 +1,312 @@
+"""
+Tarefas administrativas de SLA executadas pela fila de jobs (ti.services.job_queue).
+
+Os endpoints correspondentes em ti/api/sla.py e ti/api/metrics.py apenas
+enfileiram a tarefa e respondem 202 com o id da execução; o resultado que
+antes voltava na resposta fica em job_run.resultado
+(GET /jobs/execucoes/{run_id}).
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from core.db import engine
+from core.deadline import verificar_prazo
+from core.utils import now_brazil_naive
+from ti.models.chamado import Chamado
+from ti.models.sla_config import SLAConfiguration, HistoricoSLA
+from ti.services.job_scheduler import JobContext
+from ti.services.sla import SLACalculator, BusinessCalendar
+from ti.services.sla_cache import SLACacheManager
+from ti.services.sla_historico import HistoricoSLAWriter
+from ti.services.referencias import invalidar_sla
+
+TAREFA_SYNC_TODOS = "sla.sync_todos_chamados"
+TAREFA_RECALCULAR_PAINEL = "sla.recalcular_painel"
+TAREFA_RESET = "sla.reset_and_recalculate"
+TAREFA_P90 = "sla.recalcular_p90"
+TAREFA_P90_INCREMENTAL = "sla.recalcular_p90_incremental"
+TAREFA_METRICAS_SLA = "metrics.recalculate_sla"
+TAREFA_RECALCULAR_PRAZOS = "sla.recalcular_prazos"
+
+
+def _garantir_tabelas() -> None:
+    try:
+        HistoricoSLA.__table__.create(bind=engine, checkfirst=True)
+        Chamado.__table__.create(bind=engine, checkfirst=True)
+    except Exception:
+        pass
+
+
+def _executar_com_lock(db: Session, operacao) -> dict:
+    """Executa a operação com o lock de historico_sla (tudo ou nada); erro vira exceção do job"""
+    from ti.services.sla_transaction_manager import SLATransactionManager
+
+    result = SLATransactionManager.execute_with_lock(db, "historico_sla", operacao)
+    if not result.success:
+        raise RuntimeError(result.error)
+    return result.data
+
+
+def _atualizar_prazos_sla(db: Session) -> None:
+    """Recalcula os prazos absolutos dos chamados abertos após mudar as configurações de SLA"""
+    from ti.services.sla_deadlines import SLADeadlines
+    invalidar_sla(db)
+    SLADeadlines.recalcular_seguro(db)
+
+
+def sincronizar_todos_chamados_job(db: Session, ctx: JobContext) -> dict:
+    """Sincroniza todos os chamados com a tabela de histórico de SLA (lotes com upsert em massa)"""
+    _garantir_tabelas()
+
+    def _sincronizar_impl(db_session: Session) -> dict:
+        stats = {
+            "total_chamados": 0,
+            "sincronizados": 0,
+            "atualizados": 0,
+            "erros": 0,
+        }
+
+        sla_configs = SLACalculator.load_active_configs(db_session)
+        calendario = BusinessCalendar.load(db_session)
+        agora = now_brazil_naive()
+
+        ids = [row[0] for row in db_session.query(Chamado.id).order_by(Chamado.id.asc()).all()]
+        stats["total_chamados"] = len(ids)
+        ctx.progresso(0, len(ids), forcar=True)
+        processados = 0
+
+        for lote_ids in HistoricoSLAWriter.lotes(ids):
+            verificar_prazo()
+            chamados = db_session.query(Chamado).filter(Chamado.id.in_(lote_ids)).all()
+            historicos_cache = SLACalculator.load_historicos_by_chamado(db_session, lote_ids)
+            existentes = HistoricoSLAWriter.chamados_com_historico(db_session, lote_ids)
+
+            registros = []
+            for chamado in chamados:
+                sla_status = SLACalculator.get_sla_status(
+                    db_session, chamado, sla_configs, historicos_cache, calendario
+                )
+                registros.append(HistoricoSLAWriter.montar_registro(
+                    chamado,
+                    sla_status,
+                    acao="sincronizacao",
+                    criado_em=chamado.data_abertura or agora,
+                ))
+
+                if chamado.id in existentes:
+                    stats["atualizados"] += 1
+                else:
+                    stats["sincronizados"] += 1
+
+            HistoricoSLAWriter.upsert_many(db_session, registros)
+            processados += len(lote_ids)
+            ctx.progresso(processados, len(ids))
+
+        return stats
+
+    stats = _executar_com_lock(db, _sincronizar_impl)
+    stats["linhas_processadas"] = stats["total_chamados"]
+    return stats
+
+
+def recalcular_painel_job(db: Session, ctx: JobContext) -> dict:
+    """Recalcula o SLA dos chamados abertos (lotes com upsert em massa)"""
+    _garantir_tabelas()
+
+    def _recalcular_impl(db_session: Session) -> dict:
+        stats = {
+            "total_recalculados": 0,
+            "em_dia": 0,
+            "vencidos": 0,
+            "em_andamento": 0,
+            "congelados": 0,
+            "erros": 0,
+        }
+
+        sla_configs = SLACalculator.load_active_configs(db_session)
+        calendario = BusinessCalendar.load(db_session)
+
+        ids = [
+            row[0] for row in db_session.query(Chamado.id).filter(
+                and_(
+                    Chamado.status != "Cancelado",
+                    Chamado.status != "Concluído"
+                )
+            ).order_by(Chamado.id.asc()).all()
+        ]
+        ctx.progresso(0, len(ids), forcar=True)
+
+        for lote_ids in HistoricoSLAWriter.lotes(ids):
+            verificar_prazo()
+            chamados = db_session.query(Chamado).filter(Chamado.id.in_(lote_ids)).all()
+            historicos_cache = SLACalculator.load_historicos_by_chamado(db_session, lote_ids)
+
+            registros = []
+            for chamado in chamados:
+                sla_status = SLACalculator.get_sla_status(
+                    db_session, chamado, sla_configs, historicos_cache, calendario
+                )
+
+                # Atualiza ou cria histórico com cálculo atual
+                registros.append(HistoricoSLAWriter.montar_registro(
+                    chamado,
+                    sla_status,
+                    acao="recalculo_painel",
+                    criado_em=now_brazil_naive(),
+                ))
+
+                stats["total_recalculados"] += 1
+
+                status_sla = sla_status.get("status_geral", "sem_sla")
+                if status_sla in ["cumprido", "dentro_prazo"]:
+                    stats["em_dia"] += 1
+                elif status_sla in ["violado", "vencido_ativo"]:
+                    stats["vencidos"] += 1
+                elif status_sla == "proximo_vencer":
+                    stats["em_andamento"] += 1
+                elif status_sla == "pausado":
+                    stats["congelados"] += 1
+
+            HistoricoSLAWriter.upsert_many(db_session, registros)
+            ctx.progresso(stats["total_recalculados"], len(ids))
+
+        return stats
+
+    stats = _executar_com_lock(db, _recalcular_impl)
+    stats["linhas_processadas"] = stats["total_recalculados"]
+    return stats
+
+
+def resetar_sla_job(db: Session, ctx: JobContext) -> dict:
+    """
+    Reseta COMPLETAMENTE o SLA: limpa o cache de métricas (memória + banco) e
+    registra a data de reset em cada configuração. Próximos cálculos P90
+    ignoram chamados anteriores ao reset.
+    """
+    from ti.models.metrics_cache import MetricsCacheDB
+
+    agora = now_brazil_naive()
+    ctx.progresso(0, 3, forcar=True)
+
+    print("\n[SLA RESET] Iniciando reset completo do sistema SLA")
+
+    # 1. Invalida TUDO em memória primeiro
+    print("[SLA RESET] Invalidando cache em memória...")
+    SLACacheManager.invalidate_all_sla(db)
+    ctx.progresso(1, 3)
+
+    # 2. Limpa TUDO do banco de dados
+    print("[SLA RESET] Limpando banco de dados...")
+    db.query(MetricsCacheDB).delete()
+    ctx.progresso(2, 3)
+
+    # 3. Registra o reset em todas as configurações de SLA
+    print("[SLA RESET] Registrando data de reset nas configurações...")
+    configs = db.query(SLAConfiguration).all()
+    for config in configs:
+        config.ultimo_reset_em = agora
+        config.atualizado_em = agora
+        print(f"  - {config.prioridade}: reset em {agora.isoformat()}")
+        db.add(config)
+
+    # 4. Commit de tudo atomicamente
+    db.commit()
+    invalidar_sla(db)
+    ctx.progresso(3, 3, forcar=True)
+
+    print("[SLA RESET] ✅ Reset concluído com sucesso!")
+
+    return {
+        "ok": True,
+        "message": "Sistema de SLA foi completamente resetado",
+        "reset_em": agora.isoformat(),
+        "proximos_calculos": "Apenas chamados posteriores a este reset serão considerados",
+        "configuracoes_atualizadas": len(configs),
+        "cache_limpo": True,
+        "memoria_limpa": True
+    }
+
+
+def recalcular_p90_job(db: Session, ctx: JobContext, dry_run: bool = False) -> dict:
+    """Recalcula o SLA de cada prioridade pelo P90 dos últimos 30 dias"""
+    from ti.services.sla_p90_calculator import SLAP90Calculator
+
+    ctx.progresso(0, 2, forcar=True)
+    resultado = SLAP90Calculator.recalcular_sla_por_prioridade(db, dry_run=dry_run)
+    ctx.progresso(1, 2)
+
+    if not dry_run and resultado.get("prioridades_atualizadas"):
+        _atualizar_prazos_sla(db)
+    ctx.progresso(2, 2, forcar=True)
+
+    return resultado
+
+
+def recalcular_p90_incremental_job(db: Session, ctx: JobContext) -> dict:
+    """Recalcula o SLA pelo P90 de forma incremental (só chamados novos)"""
+    from ti.services.sla_p90_incremental import SLAP90Incremental
+
+    ctx.progresso(0, 2, forcar=True)
+    resultado = SLAP90Incremental.recalcular_incremental(db)
+    ctx.progresso(1, 2)
+
+    if any(p.get("sucesso") for p in resultado.get("prioridades", {}).values()):
+        _atualizar_prazos_sla(db)
+    ctx.progresso(2, 2, forcar=True)
+
+    return resultado
+
+
+def recalcular_metricas_sla_job(db: Session, ctx: JobContext) -> dict:
+    """Invalida todo o cache de SLA e recalcula as métricas de SLA do dashboard"""
+    from ti.services.metrics import MetricsCalculator
+
+    ctx.progresso(0, 4, forcar=True)
+    SLACacheManager.invalidate_all_sla(db)
+    ctx.progresso(1, 4)
+
+    sla_24h = MetricsCalculator.get_sla_compliance_24h(db)
+    ctx.progresso(2, 4)
+    sla_mes = MetricsCalculator.get_sla_compliance_mes(db)
+    ctx.progresso(3, 4)
+    sla_dist = MetricsCalculator.get_sla_distribution(db)
+    ctx.progresso(4, 4, forcar=True)
+
+    return {
+        "status": "ok",
+        "sla_compliance_24h": sla_24h,
+        "sla_compliance_mes": sla_mes,
+        "sla_distribution": sla_dist,
+        "timestamp": now_brazil_naive().isoformat()
+    }
+
+
+def recalcular_prazos_job(db: Session, ctx: JobContext, prioridade: str | None = None) -> dict:
+    """Recalcula os prazos absolutos dos chamados abertos (retomado da requisição que esgotou o prazo)"""
+    from ti.services.sla_deadlines import SLADeadlines
+
+    ctx.progresso(0, 1, forcar=True)
+    total = SLADeadlines.recalcular(db, prioridade=prioridade)
+    ctx.progresso(1, 1, forcar=True)
+    return {"status": "ok", "chamados": total, "prioridade": prioridade}
+
+
+def registrar_tarefas_sla(fila) -> None:
+    """Registra as tarefas administrativas de SLA na fila de jobs"""
+    fila.register(TAREFA_SYNC_TODOS, sincronizar_todos_chamados_job,
+                  descricao="Sincroniza todos os chamados com o histórico de SLA")
+    fila.register(TAREFA_RECALCULAR_PAINEL, recalcular_painel_job,
+                  descricao="Recalcula o SLA dos chamados abertos")
+    fila.register(TAREFA_RESET, resetar_sla_job,
+                  descricao="Reseta o cache de SLA e registra a data de reset")
+    fila.register(TAREFA_P90, recalcular_p90_job,
+                  descricao="Recalcula o SLA por prioridade pelo P90 (30 dias)")
+    fila.register(TAREFA_P90_INCREMENTAL, recalcular_p90_incremental_job,
+                  descricao="Recalcula o SLA pelo P90 de forma incremental")
+    fila.register(TAREFA_METRICAS_SLA, recalcular_metricas_sla_job,
+                  descricao="Invalida o cache e recalcula as métricas de SLA")
+    fila.register(TAREFA_RECALCULAR_PRAZOS, recalcular_prazos_job,
+                  descricao="Recalcula os prazos absolutos de SLA dos chamados abertos")
@@ -1,19 +1,23 @@
 from __future__ import annotations
 from datetime import datetime, timedelta
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 import json
+import os
 import threading
+import time
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from core.utils import now_brazil_naive
+from ti.services import cache_geracao
 import hashlib
 
 
 class SLACacheEntry:
     """Representa uma entrada de cache com TTL e metadata"""
-    def __init__(self, key: str, value: Any, ttl_seconds: int = 3600):
+    def __init__(self, key: str, value: Any, ttl_seconds: int = 3600, geracao: int = 0):
         self.key = key
         self.value = value
+        self.geracao = geracao
         self.created_at = datetime.now()
         self.ttl_seconds = ttl_seconds
         self.access_count = 0
@@ -30,6 +34,14 @@ class SLACacheEntry:
         self.access_count += 1
 
 
+class _CalculoEmAndamento:
+    """Cálculo de uma chave em andamento (single-flight): quem chega depois espera o resultado"""
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor: Any = None
+        self.erro: Optional[BaseException] = None
+
+
 class SLACacheManager:
     """
     Gerenciador de cache robusto para SLA com:
@@ -39,6 +51,16 @@ class SLACacheManager:
     - Invalidação inteligente por padrão
     - Batch operations
 
+    - get_or_compute: single-flight por chave (um único cálculo por vez em
+      cada worker; as demais threads esperam o resultado) e
+      stale-while-revalidate (após uma invalidação, o valor anterior é
+      servido enquanto um único refresh roda em segundo plano)
+    - Invalidação por geração: cada chave pertence a uma tag e a chave
+      física no banco carrega a geração da tag ("{tag}:g{geracao}:{chave}").
+      Invalidar é incrementar a geração (uma linha em cache_tag_geracao);
+      entradas de gerações antigas são ignoradas na leitura e removidas
+      depois pelo clear_expired
+
     Garantias:
     1. Uma única fonte de verdade para cada métrica
     2. Consistência entre réplicas (TTL sincronizado)
@@ -49,6 +71,33 @@ class SLACacheManager:
     _memory_cache: dict[str, SLACacheEntry] = {}
     _lock = threading.Lock()
 
+    # Valores invalidados/expirados ainda servíveis: key -> (valor, invalidado_em monotônico)
+    _stale: dict[str, tuple[Any, float]] = {}
+    # Cálculos em andamento por chave (single-flight)
+    _em_andamento: dict[str, _CalculoEmAndamento] = {}
+    # Métricas de stampede por chave
+    _stampede: dict[str, dict[str, float]] = {}
+
+    # Idade máxima de um valor stale servido (além disso, espera o cálculo)
+    STALE_MAX_SEGUNDOS = int(os.getenv("SLA_CACHE_STALE_MAX_SEGUNDOS", "900"))
+    # Quanto uma thread espera pelo cálculo de outra antes de calcular sozinha
+    SINGLE_FLIGHT_TIMEOUT_SEGUNDOS = int(os.getenv("SLA_CACHE_SINGLE_FLIGHT_TIMEOUT", "60"))
+    # Chaves por chamado não guardam valor stale (seriam uma por chamado)
+    _PREFIXOS_SEM_STALE = ("chamado_sla_status:",)
+
+    # Tags de invalidação. "sla": métricas agregadas (invalidada a cada mudança
+    # de chamado). "sla_incremental": estado do IncrementalMetricsCache
+    # (métricas do mês + status de referência por chamado), invalidada só
+    # quando o SLA inteiro muda (config, reset)
+    TAG_SLA = "sla"
+    TAG_SLA_INCREMENTAL = "sla_incremental"
+    TAGS_POR_PREFIXO = {
+        "chamado_sla_status": TAG_SLA_INCREMENTAL,
+        "sla_metrics_mes": TAG_SLA_INCREMENTAL,
+    }
+    # Por quanto tempo a geração lida do banco vale neste worker (ti.services.cache_geracao)
+    GERACAO_TTL_SEGUNDOS = cache_geracao.GERACAO_TTL_SEGUNDOS
+
     # Configurações de TTL por tipo de métrica
     # IMPORTANTE: TTL muito longo (24 horas) - cache persiste até mudança de status
     # Cache é invalidado APENAS quando há mudança de chamados, não por tempo
@@ -87,24 +136,27 @@ class SLACacheManager:
         Obtém valor do cache (memória -> banco de dados)
 
         Estratégia:
-        1. Tenta memória (rápido)
-        2. Se expirado, tenta banco de dados
+        1. Tenta memória (rápido), se a entrada for da geração atual da tag
+        2. Se expirado, tenta banco de dados (chave física da geração atual)
         3. Se não encontrado, retorna None
         """
+        geracao = cls.geracao(db, cls.tag_da_chave(key))
         with cls._lock:
             if key in cls._memory_cache:
                 entry = cls._memory_cache[key]
-                if not entry.is_expired():
+                if entry.geracao == geracao and not entry.is_expired():
                     entry.touch()
                     return entry.value
                 else:
+                    # Expirada ou de uma geração invalidada
                     del cls._memory_cache[key]
+                    cls._guardar_stale(key, entry.value)
 
         # Tenta banco de dados
         try:
             from ti.models.metrics_cache import MetricsCacheDB
             cached = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == key
+                MetricsCacheDB.cache_key == cls.chave_fisica(key, geracao)
             ).first()
 
             if cached:
@@ -115,7 +167,7 @@ class SLACacheManager:
                     # Carrega em memória também
                     ttl = cls._get_ttl_for_key(key)
                     with cls._lock:
-                        cls._memory_cache[key] = SLACacheEntry(key, value, ttl)
+                        cls._memory_cache[key] = SLACacheEntry(key, value, ttl, geracao)
                     return value
                 else:
                     # Expirou no banco, deleta
@@ -137,10 +189,12 @@ class SLACacheManager:
         """
         if ttl_seconds is None:
             ttl_seconds = cls._get_ttl_for_key(key)
+        geracao = cls.geracao(db, cls.tag_da_chave(key))
+        chave_fisica = cls.chave_fisica(key, geracao)
 
         # Em memória
         with cls._lock:
-            cls._memory_cache[key] = SLACacheEntry(key, value, ttl_seconds)
+            cls._memory_cache[key] = SLACacheEntry(key, value, ttl_seconds, geracao)
 
         # No banco de dados
         try:
@@ -151,7 +205,7 @@ class SLACacheManager:
 
             # Tenta buscar cache existente
             existing = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == key
+                MetricsCacheDB.cache_key == chave_fisica
             ).first()
 
             if existing:
@@ -161,7 +215,7 @@ class SLACacheManager:
                 db.add(existing)
             else:
                 new_cache = MetricsCacheDB(
-                    cache_key=key,
+                    cache_key=chave_fisica,
                     cache_value=cache_value,
                     calculated_at=calculated_at,
                     expires_at=expires_at,
@@ -179,21 +233,20 @@ class SLACacheManager:
     @classmethod
     def invalidate(cls, db: Session, keys: list[str]) -> None:
         """
-        Invalida múltiplas chaves de cache
+        Invalida múltiplas chaves de cache (chaves avulsas; para grupos de
+        chaves prefira invalidate_tag)
 
         Estratégia:
-        1. Remove da memória imediatamente
+        1. Remove da memória imediatamente (o valor anterior fica como stale)
         2. Remove do banco de dados
         """
-        with cls._lock:
-            for key in keys:
-                if key in cls._memory_cache:
-                    del cls._memory_cache[key]
+        cls._invalidar_memoria(keys)
 
         try:
             from ti.models.metrics_cache import MetricsCacheDB
+            chaves_fisicas = [cls.chave_fisica(k, cls.geracao(db, cls.tag_da_chave(k))) for k in keys]
             db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key.in_(keys)
+                MetricsCacheDB.cache_key.in_(chaves_fisicas)
             ).delete()
             db.commit()
         except Exception as e:
@@ -206,56 +259,260 @@ class SLACacheManager:
     @classmethod
     def invalidate_by_chamado(cls, db: Session, chamado_id: int) -> None:
         """
-        Invalida todos os caches relacionados a um chamado específico
+        Invalida os caches afetados pela mudança de um chamado: um único
+        incremento da geração da tag "sla" (métricas agregadas).
 
-        Quando um chamado muda, é mais inteligente que invalidar tudo.
+        O status de referência do chamado (chamado_sla_status:{id}) não é
+        apagado: ele é do IncrementalMetricsCache, que o substitui em
+        update_for_chamado e precisa do valor anterior para descontá-lo.
         """
-        keys_to_invalidate = [
-            f"chamado_sla_status:{chamado_id}",
-            "sla_compliance_24h",
-            "sla_compliance_mes",
-            "sla_distribution",
-            "tempo_resposta_24h",
-            "tempo_resposta_mes",
-            "metrics_basic",
-        ]
+        cls.invalidate_tag(db, cls.TAG_SLA)
 
-        cls.invalidate(db, keys_to_invalidate)
+    @classmethod
+    def invalidate_memory_by_chamado(cls, chamado_id: int) -> None:
+        """
+        Faz este worker reler a geração da tag "sla" na próxima leitura, sem
+        esperar GERACAO_TTL_SEGUNDOS (o incremento foi feito por outro worker
+        via invalidate_by_chamado)
+        """
+        cache_geracao.esquecer(cls.TAG_SLA)
+
+    # ------------------------------------------------------------------
+    # Gerações por tag
+    # ------------------------------------------------------------------
 
     @classmethod
-    def invalidate_all_sla(cls, db: Session) -> None:
+    def tag_da_chave(cls, key: str) -> str:
+        return cls.TAGS_POR_PREFIXO.get(key.split(":", 1)[0], cls.TAG_SLA)
+
+    @classmethod
+    def chave_fisica(cls, key: str, geracao: int) -> str:
+        """Chave gravada em metrics_cache_db: "{tag}:g{geracao}:{chave}" """
+        return f"{cls.tag_da_chave(key)}:g{geracao}:{key}"
+
+    @classmethod
+    def chave_fisica_atual(cls, db: Session, key: str) -> str:
+        """Chave física da geração atual (para quem grava em metrics_cache_db direto)"""
+        return cls.chave_fisica(key, cls.geracao(db, cls.tag_da_chave(key)))
+
+    @classmethod
+    def geracao(cls, db: Session, tag: str, forcar: bool = False) -> int:
+        """Geração atual da tag (lida do banco no máximo a cada GERACAO_TTL_SEGUNDOS)"""
+        return cache_geracao.geracao(db, tag, forcar=forcar)
+
+    @classmethod
+    def invalidate_tag(cls, db: Session, tag: str) -> int:
         """
-        Invalida todos os caches de SLA (chamados quando config muda)
+        Invalida todas as chaves da tag incrementando a sua geração
+        (um UPDATE de uma linha; sem DELETE nem varredura de chaves)
         """
-        keys_to_invalidate = [
-            "sla_compliance_24h",
-            "sla_compliance_mes",
-            "sla_distribution",
-            "tempo_resposta_24h",
-            "tempo_resposta_mes",
-            "metrics_basic",
-        ]
+        geracao = cache_geracao.incrementar(db, tag)
+        cls._contar(tag, "invalidacoes")
+        return geracao
+
+    @classmethod
+    def _invalidar_memoria(cls, keys: list[str]) -> None:
+        with cls._lock:
+            for key in keys:
+                entry = cls._memory_cache.pop(key, None)
+                if entry is not None:
+                    cls._guardar_stale(key, entry.value)
+
+    @classmethod
+    def _guardar_stale(cls, key: str, value: Any) -> None:
+        """Guarda o valor anterior para stale-while-revalidate (chamar com _lock)"""
+        if key.startswith(cls._PREFIXOS_SEM_STALE):
+            return
+        if key in cls._stale:
+            # Mantém o instante da primeira invalidação (idade real do valor)
+            cls._stale[key] = (value, cls._stale[key][1])
+        else:
+            cls._stale[key] = (value, time.monotonic())
+
+    # ------------------------------------------------------------------
+    # Single-flight / stale-while-revalidate
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def get_or_compute(
+        cls,
+        db: Session,
+        key: str,
+        compute: Callable[[Session], Any],
+        ttl_seconds: Optional[int] = None,
+        stale_while_revalidate: bool = True,
+    ) -> Any:
+        """
+        Obtém a chave do cache ou calcula com compute(db).
+
+        - Hit: retorna o valor em cache
+        - Miss com valor stale recente (e stale_while_revalidate): retorna o
+          valor anterior e dispara UM refresh em segundo plano
+        - Miss sem stale: apenas uma thread calcula; as demais esperam o
+          resultado em vez de repetir o cálculo (single-flight)
+        """
+        value = cls.get(db, key)
+        if value is not None:
+            cls._contar(key, "hits")
+            return value
 
-        cls.invalidate(db, keys_to_invalidate)
+        if stale_while_revalidate:
+            stale = cls._obter_stale(key)
+            if stale is not None:
+                cls._contar(key, "stale_servidos")
+                cls._revalidar_em_background(key, compute, ttl_seconds)
+                return stale
 
-        # Também remove todas as chaves de chamado
+        cls._contar(key, "misses")
+        return cls._calcular_single_flight(db, key, compute, ttl_seconds)
+
+    @classmethod
+    def _obter_stale(cls, key: str) -> Any:
+        with cls._lock:
+            item = cls._stale.get(key)
+            if item is None:
+                return None
+            value, desde = item
+            if time.monotonic() - desde > cls.STALE_MAX_SEGUNDOS:
+                del cls._stale[key]
+                return None
+            return value
+
+    @classmethod
+    def _calcular_single_flight(
+        cls,
+        db: Session,
+        key: str,
+        compute: Callable[[Session], Any],
+        ttl_seconds: Optional[int],
+    ) -> Any:
         with cls._lock:
-            keys_to_delete = [k for k in cls._memory_cache.keys() if k.startswith("chamado_sla_status:")]
-            for k in keys_to_delete:
-                del cls._memory_cache[k]
+            calculo = cls._em_andamento.get(key)
+            lider = calculo is None
+            if lider:
+                calculo = _CalculoEmAndamento()
+                cls._em_andamento[key] = calculo
+
+        if not lider:
+            cls._contar(key, "aguardaram")
+            if calculo.evento.wait(cls.SINGLE_FLIGHT_TIMEOUT_SEGUNDOS) and calculo.erro is None:
+                return calculo.valor
+            # Líder falhou ou demorou demais: calcula por conta própria
+            cls._contar(key, "espera_sem_resultado")
+            return cls._calcular(db, key, compute, ttl_seconds)
 
         try:
-            from ti.models.metrics_cache import MetricsCacheDB
-            db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key.like("chamado_sla_status:%")
-            ).delete()
-            db.commit()
-        except Exception as e:
-            print(f"[CACHE] Erro ao invalidar caches de SLA: {e}")
+            calculo.valor = cls._calcular(db, key, compute, ttl_seconds)
+            return calculo.valor
+        except BaseException as e:
+            calculo.erro = e
+            raise
+        finally:
+            with cls._lock:
+                cls._em_andamento.pop(key, None)
+            calculo.evento.set()
+
+    @classmethod
+    def _revalidar_em_background(
+        cls,
+        key: str,
+        compute: Callable[[Session], Any],
+        ttl_seconds: Optional[int],
+    ) -> None:
+        """Dispara um refresh da chave em segundo plano, se ainda não houver um"""
+        with cls._lock:
+            if key in cls._em_andamento:
+                return
+            calculo = _CalculoEmAndamento()
+            cls._em_andamento[key] = calculo
+
+        def _executar():
+            from core.db import SessionLocal
+            db_refresh = SessionLocal()
             try:
-                db.rollback()
-            except:
-                pass
+                calculo.valor = cls._calcular(db_refresh, key, compute, ttl_seconds)
+                cls._contar(key, "refresh_background")
+            except Exception as e:
+                calculo.erro = e
+                cls._contar(key, "refresh_com_erro")
+                print(f"[CACHE] Erro ao revalidar {key} em background: {e}")
+            finally:
+                db_refresh.close()
+                with cls._lock:
+                    cls._em_andamento.pop(key, None)
+                calculo.evento.set()
+
+        threading.Thread(target=_executar, daemon=True, name=f"SLACacheRefresh-{key}").start()
+
+    @classmethod
+    def _calcular(
+        cls,
+        db: Session,
+        key: str,
+        compute: Callable[[Session], Any],
+        ttl_seconds: Optional[int],
+    ) -> Any:
+        tag = cls.tag_da_chave(key)
+        geracao_inicio = cls.geracao(db, tag, forcar=True)
+
+        inicio = time.perf_counter()
+        value = compute(db)
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        cls._contar(key, "calculos")
+        cls._contar(key, "calculo_ms_total", duracao_ms)
+
+        if cls.geracao(db, tag, forcar=True) != geracao_inicio:
+            # O valor pode não refletir a mudança que invalidou a chave: não vira cache
+            cls._contar(key, "descartados_por_invalidacao")
+            return value
+
+        cls.set(db, key, value, ttl_seconds)
+        with cls._lock:
+            cls._stale.pop(key, None)
+        return value
+
+    @classmethod
+    def _contar(cls, key: str, metrica: str, valor: float = 1) -> None:
+        with cls._lock:
+            por_chave = cls._stampede.setdefault(key.split(":", 1)[0], {})
+            por_chave[metrica] = por_chave.get(metrica, 0) + valor
+
+    @classmethod
+    def get_stampede_stats(cls) -> dict:
+        """Métricas de single-flight / stale-while-revalidate por tipo de chave (este worker)"""
+        with cls._lock:
+            resultado = {}
+            for tipo, m in cls._stampede.items():
+                calculos = m.get("calculos", 0)
+                resultado[tipo] = {
+                    "hits": int(m.get("hits", 0)),
+                    "misses": int(m.get("misses", 0)),
+                    "stale_servidos": int(m.get("stale_servidos", 0)),
+                    # Requisições que esperaram o cálculo de outra thread (stampede evitado)
+                    "aguardaram": int(m.get("aguardaram", 0)),
+                    "espera_sem_resultado": int(m.get("espera_sem_resultado", 0)),
+                    "calculos": int(calculos),
+                    "refresh_background": int(m.get("refresh_background", 0)),
+                    "refresh_com_erro": int(m.get("refresh_com_erro", 0)),
+                    "descartados_por_invalidacao": int(m.get("descartados_por_invalidacao", 0)),
+                    "invalidacoes": int(m.get("invalidacoes", 0)),
+                    "calculo_ms_medio": round(m.get("calculo_ms_total", 0) / calculos, 2) if calculos else None,
+                }
+            return {
+                "em_andamento": sorted(cls._em_andamento.keys()),
+                "stale_disponiveis": len(cls._stale),
+                "stale_max_segundos": cls.STALE_MAX_SEGUNDOS,
+                "por_chave": resultado,
+            }
+
+    @classmethod
+    def invalidate_all_sla(cls, db: Session) -> None:
+        """
+        Invalida todos os caches de SLA (chamados quando config muda):
+        métricas agregadas e o estado do IncrementalMetricsCache
+        """
+        cls.invalidate_tag(db, cls.TAG_SLA)
+        cls.invalidate_tag(db, cls.TAG_SLA_INCREMENTAL)
 
     @classmethod
     def _get_ttl_for_key(cls, key: str) -> int:
@@ -268,7 +525,8 @@ class SLACacheManager:
     @classmethod
     def clear_expired(cls, db: Session) -> int:
         """
-        Limpa caches expirados do banco de dados.
+        Limpa caches expirados do banco de dados e as entradas de gerações
+        já invalidadas (coleta preguiçosa da invalidação por tag).
         Deve ser executado periodicamente (ex: job agendado).
 
         Retorna: quantidade de entradas removidas
@@ -279,6 +537,7 @@ class SLACacheManager:
                 MetricsCacheDB.expires_at <= now_brazil_naive()
             ).delete()
             db.commit()
+            count += cls._coletar_geracoes_antigas(db)
             return count
         except Exception as e:
             print(f"[CACHE] Erro ao limpar cache expirado: {e}")
@@ -288,6 +547,41 @@ class SLACacheManager:
                 pass
             return 0
 
+    @classmethod
+    def _coletar_geracoes_antigas(cls, db: Session) -> int:
+        """Remove linhas de gerações anteriores à atual de cada tag (memória + banco)"""
+        from ti.models.metrics_cache import MetricsCacheDB
+
+        tags = set(cls.TAGS_POR_PREFIXO.values()) | {cls.TAG_SLA}
+        geracoes = {tag: cls.geracao(db, tag, forcar=True) for tag in tags}
+
+        with cls._lock:
+            for key in [
+                k for k, entry in cls._memory_cache.items()
+                if entry.geracao != geracoes[cls.tag_da_chave(k)]
+            ]:
+                del cls._memory_cache[key]
+            agora = time.monotonic()
+            for key in [k for k, (_, desde) in cls._stale.items() if agora - desde > cls.STALE_MAX_SEGUNDOS]:
+                del cls._stale[key]
+
+        removidas = 0
+        try:
+            for tag, geracao in geracoes.items():
+                # Prefixo "{tag}:g" usa o índice de cache_key (faixa), fora do caminho das requisições
+                removidas += db.query(MetricsCacheDB).filter(
+                    MetricsCacheDB.cache_key.like(f"{tag}:g%"),
+                    ~MetricsCacheDB.cache_key.like(f"{tag}:g{geracao}:%"),
+                ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            print(f"[CACHE] Erro ao coletar gerações antigas: {e}")
+            try:
+                db.rollback()
+            except:
+                pass
+        return removidas
+
     @classmethod
     def get_stats(cls, db: Session) -> dict:
         """Retorna estatísticas do cache"""
@@ -303,10 +597,14 @@ class SLACacheManager:
             db_count = 0
             db_expired = 0
 
+        tags = set(cls.TAGS_POR_PREFIXO.values()) | {cls.TAG_SLA}
+
         return {
             "memory_entries": memory_count,
             "database_entries": db_count,
             "expired_in_db": db_expired,
+            "geracoes": {tag: cls.geracao(db, tag) for tag in sorted(tags)},
+            "stampede": cls.get_stampede_stats(),
         }
 
     @classmethod
@@ -327,17 +625,23 @@ class SLACacheManager:
             from ti.models.metrics_cache import MetricsCacheDB
 
             agora = now_brazil_naive()
+            tags = set(cls.TAGS_POR_PREFIXO.values()) | {cls.TAG_SLA}
+            prefixos = {f"{tag}:g{cls.geracao(db, tag, forcar=True)}:": tag for tag in tags}
             cached_entries = db.query(MetricsCacheDB).all()
 
             for cached in cached_entries:
                 try:
                     if cached.expires_at and cached.expires_at > agora:
+                        # Só chaves da geração atual da sua tag (as demais são lixo a coletar)
+                        tag, geracao_str, key = (cached.cache_key.split(":", 2) + ["", ""])[:3]
+                        if f"{tag}:{geracao_str}:" not in prefixos or cls.tag_da_chave(key) != tag:
+                            continue
                         # Cache ainda é válido, carrega em memória
                         value = json.loads(cached.cache_value) if isinstance(cached.cache_value, str) else cached.cache_value
-                        ttl = cls._get_ttl_for_key(cached.cache_key)
+                        ttl = cls._get_ttl_for_key(key)
                         with cls._lock:
-                            cls._memory_cache[cached.cache_key] = SLACacheEntry(
-                                cached.cache_key, value, ttl
+                            cls._memory_cache[key] = SLACacheEntry(
+                                key, value, ttl, int(geracao_str[1:])
                             )
                         stats["carregados"] += 1
                     else:
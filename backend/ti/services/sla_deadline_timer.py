@@ -0,0 +1,485 @@
+"""
+Temporizador de prazos de SLA (min-heap) com alertas em tempo real.
+
+Cada worker mantém em memória um heap com os próximos eventos de prazo dos
+chamados abertos, a partir de chamado.prazo_resposta_em / prazo_resolucao_em
+(ver ti/services/sla_deadlines.py):
+
+- "proximo_vencer": prazo - SLA_AVISO_ANTECEDENCIA_MINUTOS
+- "violado": no instante do prazo
+
+Uma thread dorme até o próximo evento do heap (sem varrer os chamados) e,
+no disparo, emite "sla:proximo_vencer" / "sla:violado" via Socket.IO e grava
+uma notificação.
+
+- O heap é carregado na startup e atualizado quando um chamado é criado,
+  muda de status ou é excluído. Entradas antigas são descartadas por versão
+  (remoção preguiçosa), sem reorganizar o heap.
+- Antes de disparar, o chamado é relido do banco: se foi encerrado, pausado
+  ou teve o prazo alterado (ex: por outro worker), o evento é reagendado ou
+  descartado.
+- Uma recarga periódica (SLA_TIMER_RESYNC_SEGUNDOS) traz chamados criados
+  ou alterados em outros workers.
+- Todos os workers emitem para os seus próprios clientes Socket.IO; a
+  notificação é gravada uma única vez (lock nomeado + verificação).
+- Cada evento dispara uma vez por worker: as chaves já disparadas
+  (chamado, tipo, evento, prazo) não voltam ao heap na recarga/reagendamento,
+  e se a notificação já existia antes deste disparo (ex: worker reiniciado)
+  nada é emitido de novo.
+
+Uso:
+    from ti.services.sla_deadline_timer import get_deadline_timer
+
+    get_deadline_timer().start()              # startup
+    get_deadline_timer().agendar_chamado(ch)  # após alterar status/prazos
+"""
+
+from __future__ import annotations
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from core.db import SessionLocal, engine
+from core.realtime import emit_threadsafe
+from core.utils import now_brazil_naive
+from ti.models.chamado import Chamado
+from ti.models.notification import Notification
+from ti.services.db_lock import MySQLNamedLock
+from ti.services.sla_status import SLAStatusDeterminer
+
+logger = logging.getLogger(__name__)
+
+EVENTO_PROXIMO_VENCER = "proximo_vencer"
+EVENTO_VIOLADO = "violado"
+
+TIPO_RESPOSTA = "resposta"
+TIPO_RESOLUCAO = "resolucao"
+
+
+class SLADeadlineTimer:
+    """Heap de eventos de prazo de SLA com disparo no instante exato"""
+
+    AVISO_ANTECEDENCIA_MINUTOS = int(os.getenv("SLA_AVISO_ANTECEDENCIA_MINUTOS", "60"))
+    RESYNC_SEGUNDOS = int(os.getenv("SLA_TIMER_RESYNC_SEGUNDOS", "300"))
+    # Eventos que já passaram há mais que isso (ex: servidor desligado) não são disparados
+    TOLERANCIA_ATRASO_MINUTOS = int(os.getenv("SLA_TIMER_TOLERANCIA_ATRASO_MINUTOS", "15"))
+    # Notificação gravada por outro worker há menos que isso é o mesmo disparo
+    # (todos disparam no mesmo instante): este worker ainda emite aos seus clientes
+    JANELA_DISPARO_SEGUNDOS = int(os.getenv("SLA_TIMER_JANELA_DISPARO_SEGUNDOS", "60"))
+
+    def __init__(self):
+        # (quando, seq, chamado_id, versao, tipo, evento, prazo)
+        self._heap: list[tuple] = []
+        self._versoes: dict[int, int] = {}
+        # (chamado_id, tipo, evento, prazo) já disparados neste worker
+        self._disparados: set[tuple] = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._recarga_pendente = True
+        self._ultima_carga: datetime | None = None
+        self.running = False
+        self.thread: threading.Thread | None = None
+        self.stats = {
+            "disparos": {EVENTO_PROXIMO_VENCER: 0, EVENTO_VIOLADO: 0},
+            "descartados": 0,
+            "reagendados": 0,
+            "notificacoes_criadas": 0,
+            "repetidos": 0,
+            "erros": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+            self._recarga_pendente = True
+            self.thread = threading.Thread(
+                target=self._run,
+                daemon=True,
+                name="SLADeadlineTimerThread",
+            )
+            self.thread.start()
+        logger.info("Temporizador de prazos de SLA iniciado")
+
+    def stop(self) -> None:
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        logger.info("Temporizador de prazos de SLA parado")
+
+    # ------------------------------------------------------------------
+    # Manutenção do heap
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ativo(status: str | None) -> bool:
+        return (
+            status not in SLAStatusDeterminer.CLOSED_STATUSES
+            and status not in SLAStatusDeterminer.PAUSED_STATUSES
+        )
+
+    def _eventos(
+        self,
+        chamado_id: int,
+        status: str | None,
+        respondido: bool,
+        prazo_resposta: datetime | None,
+        prazo_resolucao: datetime | None,
+        agora: datetime,
+    ) -> list[tuple]:
+        if not self._ativo(status):
+            return []
+
+        antecedencia = timedelta(minutes=self.AVISO_ANTECEDENCIA_MINUTOS)
+        tolerancia = timedelta(minutes=self.TOLERANCIA_ATRASO_MINUTOS)
+        prazos = []
+        if prazo_resposta and not respondido:
+            prazos.append((TIPO_RESPOSTA, prazo_resposta))
+        if prazo_resolucao:
+            prazos.append((TIPO_RESOLUCAO, prazo_resolucao))
+
+        eventos = []
+        for tipo, prazo in prazos:
+            if prazo >= agora - tolerancia:
+                eventos.append((prazo, tipo, EVENTO_VIOLADO, prazo))
+            aviso = prazo - antecedencia
+            # Aviso só faz sentido enquanto o prazo não venceu
+            if prazo > agora and aviso >= agora - tolerancia:
+                eventos.append((max(aviso, agora), tipo, EVENTO_PROXIMO_VENCER, prazo))
+        return [
+            e for e in eventos
+            if (chamado_id, e[1], e[2], e[3]) not in self._disparados
+        ]
+
+    def _agendar(self, chamado_id: int, eventos: list[tuple]) -> None:
+        """Substitui os eventos do chamado (chamar com self._cond adquirido)"""
+        versao = self._versoes.get(chamado_id, 0) + 1
+        self._versoes[chamado_id] = versao
+        for quando, tipo, evento, prazo in eventos:
+            heapq.heappush(self._heap, (quando, next(self._seq), chamado_id, versao, tipo, evento, prazo))
+        if not eventos:
+            self._versoes.pop(chamado_id, None)
+
+    def agendar_chamado(self, chamado: Chamado) -> None:
+        """(Re)agenda os eventos de prazo de um chamado após criação ou mudança de status"""
+        if not self.running:
+            return
+        try:
+            eventos = self._eventos(
+                chamado.id,
+                chamado.status,
+                chamado.data_primeira_resposta is not None,
+                chamado.prazo_resposta_em,
+                chamado.prazo_resolucao_em,
+                now_brazil_naive(),
+            )
+            if chamado.deletado_em is not None:
+                eventos = []
+        except Exception as e:
+            logger.warning(f"[SLA TIMER] Erro ao agendar chamado: {e}")
+            return
+        with self._cond:
+            self._agendar(chamado.id, eventos)
+            self._cond.notify_all()
+
+    def remover_chamado(self, chamado_id: int) -> None:
+        if not self.running:
+            return
+        with self._cond:
+            self._agendar(chamado_id, [])
+
+    def solicitar_recarga(self) -> None:
+        """Recarrega todos os prazos do banco (ex: após recálculo em lote)"""
+        with self._cond:
+            self._recarga_pendente = True
+            self._cond.notify_all()
+
+    def carregar(self, db: Session) -> int:
+        """Reconstrói o heap a partir dos chamados abertos com prazo definido"""
+        agora = now_brazil_naive()
+        rows = db.query(
+            Chamado.id,
+            Chamado.status,
+            Chamado.data_primeira_resposta,
+            Chamado.prazo_resposta_em,
+            Chamado.prazo_resolucao_em,
+        ).filter(
+            Chamado.deletado_em.is_(None),
+            Chamado.status.notin_(
+                SLAStatusDeterminer.CLOSED_STATUSES | SLAStatusDeterminer.PAUSED_STATUSES
+            ),
+            Chamado.prazo_resolucao_em.isnot(None),
+        ).all()
+
+        # Chaves cujo prazo já saiu da tolerância nunca voltariam ao heap
+        limite = agora - timedelta(minutes=self.TOLERANCIA_ATRASO_MINUTOS)
+        with self._cond:
+            self._disparados = {k for k in self._disparados if k[3] >= limite}
+
+        heap = []
+        versoes = {}
+        for chamado_id, status, primeira_resposta, prazo_resposta, prazo_resolucao in rows:
+            eventos = self._eventos(
+                chamado_id, status, primeira_resposta is not None,
+                prazo_resposta, prazo_resolucao, agora,
+            )
+            if not eventos:
+                continue
+            versoes[chamado_id] = 1
+            for quando, tipo, evento, prazo in eventos:
+                heap.append((quando, next(self._seq), chamado_id, 1, tipo, evento, prazo))
+        heapq.heapify(heap)
+
+        with self._cond:
+            self._heap = heap
+            self._versoes = versoes
+            self._ultima_carga = agora
+
+        return len(heap)
+
+    # ------------------------------------------------------------------
+    # Loop
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self.running:
+                    return
+                resync_em = (
+                    self._ultima_carga + timedelta(seconds=self.RESYNC_SEGUNDOS)
+                    if self._ultima_carga else None
+                )
+                if self._recarga_pendente or resync_em is None or now_brazil_naive() >= resync_em:
+                    self._recarga_pendente = False
+                    precisa_carregar = True
+                else:
+                    precisa_carregar = False
+
+            if precisa_carregar:
+                self._recarregar()
+                continue
+
+            with self._cond:
+                agora = now_brazil_naive()
+                vencidos = []
+                while self._heap and self._heap[0][0] <= agora:
+                    entrada = heapq.heappop(self._heap)
+                    if self._versoes.get(entrada[2]) == entrada[3]:
+                        vencidos.append(entrada)
+
+                if not vencidos:
+                    proximo = self._heap[0][0] if self._heap else resync_em
+                    espera = min(proximo, resync_em) - agora
+                    self._cond.wait(timeout=max(espera.total_seconds(), 0.05))
+                    continue
+
+            self._disparar(vencidos)
+
+    def _recarregar(self) -> None:
+        db = SessionLocal()
+        try:
+            total = self.carregar(db)
+            logger.debug(f"[SLA TIMER] {total} eventos de prazo carregados")
+        except Exception as e:
+            self.stats["erros"] += 1
+            logger.warning(f"[SLA TIMER] Erro ao carregar prazos: {e}")
+            with self._cond:
+                # Evita recarregar em loop apertado quando o banco está fora
+                self._ultima_carga = now_brazil_naive()
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # Disparo
+    # ------------------------------------------------------------------
+
+    def _disparar(self, entradas: list[tuple]) -> None:
+        db = SessionLocal()
+        try:
+            chamados = {
+                ch.id: ch for ch in db.query(Chamado).filter(
+                    Chamado.id.in_({entrada[2] for entrada in entradas})
+                ).all()
+            }
+            for _, _, chamado_id, _, tipo, evento, prazo in entradas:
+                chamado = chamados.get(chamado_id)
+                try:
+                    if not self._ainda_valido(chamado, tipo, prazo):
+                        continue
+                    novo = self._alertar(db, chamado, tipo, evento, prazo)
+                    with self._cond:
+                        self._disparados.add((chamado_id, tipo, evento, prazo))
+                    if novo:
+                        self.stats["disparos"][evento] += 1
+                    else:
+                        self.stats["repetidos"] += 1
+                except Exception as e:
+                    db.rollback()
+                    self.stats["erros"] += 1
+                    logger.warning(f"[SLA TIMER] Erro ao disparar {evento} do chamado {chamado_id}: {e}")
+        except Exception as e:
+            self.stats["erros"] += 1
+            logger.warning(f"[SLA TIMER] Erro ao disparar eventos: {e}")
+        finally:
+            db.close()
+
+    def _ainda_valido(self, chamado: Chamado | None, tipo: str, prazo: datetime) -> bool:
+        """Confere no banco se o evento continua valendo; reagenda se o prazo mudou"""
+        if chamado is None or chamado.deletado_em is not None or not self._ativo(chamado.status):
+            self.stats["descartados"] += 1
+            return False
+        if tipo == TIPO_RESPOSTA and chamado.data_primeira_resposta is not None:
+            self.stats["descartados"] += 1
+            return False
+
+        prazo_atual = chamado.prazo_resposta_em if tipo == TIPO_RESPOSTA else chamado.prazo_resolucao_em
+        if prazo_atual != prazo:
+            self.stats["reagendados"] += 1
+            self.agendar_chamado(chamado)
+            return False
+        return True
+
+    def _alertar(self, db: Session, chamado: Chamado, tipo: str, evento: str, prazo: datetime) -> bool:
+        """Grava e emite o alerta; False (sem emitir) se ele já tinha sido disparado antes"""
+        agora = now_brazil_naive()
+        payload = {
+            "id": chamado.id,
+            "codigo": chamado.codigo,
+            "protocolo": chamado.protocolo,
+            "prioridade": chamado.prioridade,
+            "status": chamado.status,
+            "tipo": tipo,
+            "prazo": prazo.isoformat(),
+            "minutos_restantes": round((prazo - agora).total_seconds() / 60, 1),
+        }
+
+        n, novo = self._registrar_notificacao(db, chamado, tipo, evento, prazo, payload)
+        if not novo:
+            return False
+
+        self._emitir(f"sla:{evento}", payload)
+        if n is not None:
+            self._emitir("notification:new", {
+                "id": n.id,
+                "tipo": n.tipo,
+                "titulo": n.titulo,
+                "mensagem": n.mensagem,
+                "recurso": n.recurso,
+                "recurso_id": n.recurso_id,
+                "acao": n.acao,
+                "dados": n.dados,
+                "lido": n.lido,
+                "criado_em": n.criado_em.isoformat() if n.criado_em else None,
+            })
+        return True
+
+    def _registrar_notificacao(
+        self, db: Session, chamado: Chamado, tipo: str, evento: str, prazo: datetime, payload: dict
+    ) -> tuple[Notification | None, bool]:
+        """
+        Grava a notificação uma única vez por (chamado, tipo, evento, prazo) entre todos os workers.
+
+        Retorna (notificação, novo): novo=False quando ela já existia antes
+        deste disparo, ou seja, o alerta já foi entregue e não deve ser
+        emitido de novo.
+        """
+        acao = f"sla_{evento}"
+        dados = json.dumps(payload, ensure_ascii=False)
+        marca_prazo = f'"prazo": "{payload["prazo"]}"'
+        marca_tipo = f'"tipo": "{tipo}"'
+
+        lock = MySQLNamedLock(f"evoque_sla_alerta:{chamado.id}")
+        if not lock.adquirir(5):
+            # Sem como conferir: mantém o alerta em tempo real, sem gravar
+            return None, True
+        try:
+            Notification.__table__.create(bind=engine, checkfirst=True)
+            existente = db.query(Notification).filter(
+                Notification.recurso == "chamado",
+                Notification.recurso_id == chamado.id,
+                Notification.acao == acao,
+                Notification.dados.contains(marca_tipo),
+                Notification.dados.contains(marca_prazo),
+            ).first()
+            if existente:
+                agora = now_brazil_naive()
+                janela = timedelta(seconds=self.JANELA_DISPARO_SEGUNDOS)
+                mesmo_disparo = existente.criado_em is not None and existente.criado_em >= agora - janela
+                return existente, mesmo_disparo
+
+            rotulo = "resposta" if tipo == TIPO_RESPOSTA else "resolução"
+            if evento == EVENTO_VIOLADO:
+                titulo = f"SLA de {rotulo} violado: {chamado.codigo}"
+                mensagem = f"O prazo de {rotulo} do chamado {chamado.protocolo} venceu em {prazo.strftime('%d/%m/%Y %H:%M')}"
+            else:
+                titulo = f"SLA de {rotulo} próximo de vencer: {chamado.codigo}"
+                mensagem = f"O prazo de {rotulo} do chamado {chamado.protocolo} vence em {prazo.strftime('%d/%m/%Y %H:%M')}"
+
+            n = Notification(
+                tipo="sla",
+                titulo=titulo,
+                mensagem=mensagem,
+                recurso="chamado",
+                recurso_id=chamado.id,
+                acao=acao,
+                dados=dados,
+            )
+            db.add(n)
+            db.commit()
+            db.refresh(n)
+            self.stats["notificacoes_criadas"] += 1
+            return n, True
+        finally:
+            lock.liberar()
+
+    def _emitir(self, evento: str, dados: dict) -> None:
+        if not emit_threadsafe(evento, dados):
+            logger.warning(f"[SLA TIMER] Evento {evento} não emitido (loop indisponível)")
+
+    # ------------------------------------------------------------------
+    # Status
+    # ------------------------------------------------------------------
+
+    def status(self) -> dict:
+        with self._cond:
+            ativos = [e for e in self._heap if self._versoes.get(e[2]) == e[3]]
+            proximo = min(ativos) if ativos else None
+            return {
+                "ativo": self.running,
+                "eventos_agendados": len(ativos),
+                "chamados_monitorados": len(self._versoes),
+                "tamanho_heap": len(self._heap),
+                "proximo_evento": {
+                    "chamado_id": proximo[2],
+                    "tipo": proximo[4],
+                    "evento": proximo[5],
+                    "quando": proximo[0].isoformat(),
+                } if proximo else None,
+                "ultima_carga": self._ultima_carga.isoformat() if self._ultima_carga else None,
+                "aviso_antecedencia_minutos": self.AVISO_ANTECEDENCIA_MINUTOS,
+                "stats": {**self.stats, "disparos": dict(self.stats["disparos"])},
+            }
+
+
+# Instância global singleton (uma por worker)
+_deadline_timer_instance: SLADeadlineTimer | None = None
+
+
+def get_deadline_timer() -> SLADeadlineTimer:
+    """Obtém a instância global do temporizador de prazos"""
+    global _deadline_timer_instance
+    if _deadline_timer_instance is None:
+        _deadline_timer_instance = SLADeadlineTimer()
+    return _deadline_timer_instance
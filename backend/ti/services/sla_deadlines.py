@@ -0,0 +1,227 @@
+"""
+Prazos absolutos de SLA gravados no chamado (prazo_resposta_em, prazo_resolucao_em).
+
+Em vez de recalcular horas de negócio em Python para saber se um chamado
+está vencido, o prazo é convertido em data/hora absoluta usando o
+calendário comercial (horários + feriados) e gravado no chamado:
+
+- prazo_resposta_em  = abertura + tempo_resposta_horas (horas de negócio)
+- prazo_resolucao_em = abertura + tempo_resolucao_horas + pausas concluídas
+  (períodos "Em análise" já encerrados empurram o prazo, exatamente como
+  SLACalculator.calculate_business_hours_excluding_paused desconta esse tempo)
+
+Os prazos são atualizados na criação e mudança de status do chamado, e em
+lote quando configurações de SLA, horários comerciais ou feriados mudam.
+Contagens e listas de vencidos viram uma consulta por intervalo indexada.
+"""
+
+from __future__ import annotations
+from datetime import datetime, timedelta
+from sqlalchemy import and_
+from sqlalchemy.orm import Session, Query
+
+from ti.models.chamado import Chamado
+from ti.models.historico_status import HistoricoStatus
+from ti.models.sla_config import SLAConfiguration
+from ti.services.sla import SLACalculator, BusinessCalendar
+from ti.services.sla_status import SLAStatusDeterminer
+from core.deadline import DeadlineExceeded, prazo_atual, sem_prazo
+from core.utils import now_brazil_naive
+
+
+class SLADeadlines:
+    """Cálculo, manutenção e consulta dos prazos absolutos de SLA"""
+
+    BATCH_SIZE = 500
+
+    # Status que pausam o relógio de resolução (mesma regra de calculate_business_hours_excluding_paused)
+    PAUSE_STATUSES = ("em análise", "em analise")
+
+    @staticmethod
+    def calcular(
+        chamado: Chamado,
+        sla_config: SLAConfiguration | None,
+        calendario: BusinessCalendar,
+        historicos: list[HistoricoStatus],
+    ) -> tuple[datetime | None, datetime | None]:
+        """Retorna (prazo_resposta_em, prazo_resolucao_em) do chamado"""
+        if not sla_config or not chamado.data_abertura:
+            return None, None
+
+        abertura = chamado.data_abertura
+
+        prazo_resposta = calendario.add_business_hours(abertura, sla_config.tempo_resposta_horas)
+
+        horas_pausadas = 0.0
+        for hist in historicos:
+            if (
+                (hist.status or "").lower() in SLADeadlines.PAUSE_STATUSES
+                and hist.data_inicio and hist.data_fim
+                and hist.data_inicio >= abertura
+            ):
+                horas_pausadas += calendario.business_hours(hist.data_inicio, hist.data_fim)
+
+        prazo_resolucao = calendario.add_business_hours(
+            abertura, sla_config.tempo_resolucao_horas + horas_pausadas
+        )
+
+        return prazo_resposta, prazo_resolucao
+
+    @staticmethod
+    def atualizar_chamado(
+        db: Session,
+        chamado: Chamado,
+        sla_configs: dict | None = None,
+        calendario: BusinessCalendar | None = None,
+        historicos: list[HistoricoStatus] | None = None,
+    ) -> None:
+        """Recalcula os prazos de um chamado (não faz commit)"""
+        if sla_configs is None:
+            sla_configs = SLACalculator.load_active_configs(db)
+        if calendario is None:
+            calendario = BusinessCalendar.load(db)
+        if historicos is None:
+            historicos = SLACalculator.load_historicos_by_chamado(db, [chamado.id])[chamado.id]
+
+        prazo_resposta, prazo_resolucao = SLADeadlines.calcular(
+            chamado, sla_configs.get(chamado.prioridade), calendario, historicos
+        )
+        chamado.prazo_resposta_em = prazo_resposta
+        chamado.prazo_resolucao_em = prazo_resolucao
+        db.add(chamado)
+
+    @staticmethod
+    def recalcular(db: Session, prioridade: str | None = None, apenas_abertos: bool = True) -> int:
+        """
+        Recalcula os prazos em lote (usado quando configuração de SLA,
+        horário comercial ou feriado muda).
+
+        apenas_abertos: chamados encerrados mantêm o prazo vigente quando fecharam.
+        Retorna a quantidade de chamados atualizados.
+        """
+        sla_configs = SLACalculator.load_active_configs(db)
+        calendario = BusinessCalendar.load(db)
+
+        query = db.query(Chamado.id).filter(Chamado.deletado_em.is_(None))
+        if prioridade:
+            query = query.filter(Chamado.prioridade == prioridade)
+        if apenas_abertos:
+            query = query.filter(Chamado.status.notin_(SLAStatusDeterminer.CLOSED_STATUSES))
+
+        ids = [row[0] for row in query.order_by(Chamado.id.asc()).all()]
+        total = 0
+
+        for i in range(0, len(ids), SLADeadlines.BATCH_SIZE):
+            lote_ids = ids[i:i + SLADeadlines.BATCH_SIZE]
+            chamados = db.query(Chamado).filter(Chamado.id.in_(lote_ids)).all()
+            historicos_cache = SLACalculator.load_historicos_by_chamado(db, lote_ids)
+
+            mapeamentos = []
+            for chamado in chamados:
+                prazo_resposta, prazo_resolucao = SLADeadlines.calcular(
+                    chamado,
+                    sla_configs.get(chamado.prioridade),
+                    calendario,
+                    historicos_cache.get(chamado.id, []),
+                )
+                mapeamentos.append({
+                    "id": chamado.id,
+                    "prazo_resposta_em": prazo_resposta,
+                    "prazo_resolucao_em": prazo_resolucao,
+                })
+
+            db.bulk_update_mappings(Chamado, mapeamentos)
+            db.commit()
+            total += len(mapeamentos)
+
+        # Os eventos do temporizador de prazos precisam refletir os novos valores
+        from ti.services.sla_deadline_timer import get_deadline_timer
+        get_deadline_timer().solicitar_recarga()
+
+        print(f"[SLA PRAZOS] {total} chamados com prazos recalculados" + (f" (prioridade {prioridade})" if prioridade else ""))
+        return total
+
+    @staticmethod
+    def recalcular_seguro(db: Session, prioridade: str | None = None) -> None:
+        """
+        recalcular() para hooks de escrita: erros não interrompem a requisição.
+        Se o prazo da requisição esgotar, o recálculo é enfileirado na fila de jobs.
+        """
+        try:
+            SLADeadlines.recalcular(db, prioridade=prioridade)
+        except Exception as e:
+            db.rollback()
+            prazo = prazo_atual()
+            if not isinstance(e, DeadlineExceeded) and not (prazo and prazo.estourado):
+                print(f"[SLA PRAZOS] Erro ao recalcular prazos: {e}")
+                return
+            # Prazo da requisição acabou no meio do recálculo: a fila de jobs termina (sem prazo)
+            from ti.services.job_queue import get_job_queue
+            from ti.services.sla_admin_jobs import TAREFA_RECALCULAR_PRAZOS
+            try:
+                with sem_prazo():
+                    run_id, _ = get_job_queue().submit(
+                        TAREFA_RECALCULAR_PRAZOS, {"prioridade": prioridade} if prioridade else None
+                    )
+                print(f"[SLA PRAZOS] ⚠️ Prazo da requisição esgotado; recálculo enfileirado (execução #{run_id})")
+            except Exception as erro_fila:
+                print(f"[SLA PRAZOS] ❌ Prazo da requisição esgotado e falha ao enfileirar o recálculo: {erro_fila}")
+
+    # ------------------------------------------------------------------
+    # Consultas indexadas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _query_ativos(db: Session) -> Query:
+        """Chamados com relógio de SLA correndo (não encerrados, não pausados)"""
+        return db.query(Chamado).filter(
+            and_(
+                Chamado.deletado_em.is_(None),
+                Chamado.status.notin_(
+                    SLAStatusDeterminer.CLOSED_STATUSES | SLAStatusDeterminer.PAUSED_STATUSES
+                ),
+            )
+        )
+
+    @staticmethod
+    def query_vencidos(db: Session, tipo: str = "resolucao", agora: datetime | None = None) -> Query:
+        """Chamados com prazo de resposta ou resolução já ultrapassado"""
+        agora = agora or now_brazil_naive()
+        query = SLADeadlines._query_ativos(db)
+        if tipo == "resposta":
+            return query.filter(
+                Chamado.data_primeira_resposta.is_(None),
+                Chamado.prazo_resposta_em < agora,
+            )
+        return query.filter(Chamado.prazo_resolucao_em < agora)
+
+    @staticmethod
+    def query_proximos_vencer(
+        db: Session, tipo: str = "resolucao", horas: float = 4, agora: datetime | None = None
+    ) -> Query:
+        """Chamados cujo prazo vence nas próximas 'horas' (relógio de parede)"""
+        agora = agora or now_brazil_naive()
+        limite = agora + timedelta(hours=horas)
+        query = SLADeadlines._query_ativos(db)
+        if tipo == "resposta":
+            return query.filter(
+                Chamado.data_primeira_resposta.is_(None),
+                Chamado.prazo_resposta_em >= agora,
+                Chamado.prazo_resposta_em < limite,
+            )
+        return query.filter(
+            Chamado.prazo_resolucao_em >= agora,
+            Chamado.prazo_resolucao_em < limite,
+        )
+
+    @staticmethod
+    def contagem(db: Session, horas_proximo: float = 4) -> dict:
+        agora = now_brazil_naive()
+        return {
+            "resposta_vencidos": SLADeadlines.query_vencidos(db, "resposta", agora).count(),
+            "resolucao_vencidos": SLADeadlines.query_vencidos(db, "resolucao", agora).count(),
+            "resposta_proximos_vencer": SLADeadlines.query_proximos_vencer(db, "resposta", horas_proximo, agora).count(),
+            "resolucao_proximos_vencer": SLADeadlines.query_proximos_vencer(db, "resolucao", horas_proximo, agora).count(),
+            "janela_proximo_horas": horas_proximo,
+            "calculado_em": agora.isoformat(),
+        }
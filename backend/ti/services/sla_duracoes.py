@@ -0,0 +1,158 @@
+"""
+Durações de SLA congeladas no chamado.
+
+Um chamado concluído/cancelado nunca muda de tempo de resolução, mas as
+análises (médias, P90) recalculavam horas de negócio de cada chamado a cada
+requisição. As durações passam a ser gravadas no próprio chamado:
+
+- tempo_primeira_resposta_horas: abertura → data_primeira_resposta (horas
+  de negócio), gravado assim que a primeira resposta acontece
+- tempo_resolucao_horas: abertura → conclusão/cancelamento, descontando
+  "Em análise" (mesma regra de calculate_business_hours_excluding_paused)
+- tempo_pausado_horas: horas de negócio descontadas por "Em análise"
+- tempos_congelados_em: quando as durações de encerramento foram gravadas
+
+Médias e percentis sobre chamados encerrados viram agregações SQL simples.
+Se o chamado for reaberto, as durações de encerramento são apagadas e
+gravadas de novo no próximo encerramento. O job agendado
+JOB_CONGELAR_DURACOES preenche chamados antigos ou que falharam no hook.
+"""
+
+from __future__ import annotations
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from ti.models.chamado import Chamado
+from ti.models.historico_status import HistoricoStatus
+from ti.services.sla import SLACalculator, BusinessCalendar
+from ti.services.sla_status import SLAStatusDeterminer
+from core.utils import now_brazil_naive
+from core.deadline import verificar_prazo
+
+
+class SLADuracoes:
+    """Cálculo e gravação das durações de SLA congeladas no chamado"""
+
+    BATCH_SIZE = 500
+
+    @staticmethod
+    def calcular(
+        chamado: Chamado,
+        calendario: BusinessCalendar,
+        historicos: list[HistoricoStatus],
+    ) -> dict:
+        """Retorna os valores das colunas de duração para o estado atual do chamado"""
+        valores = {
+            "tempo_primeira_resposta_horas": None,
+            "tempo_resolucao_horas": None,
+            "tempo_pausado_horas": None,
+            "tempos_congelados_em": None,
+        }
+        abertura = chamado.data_abertura
+        if not abertura:
+            return valores
+
+        if chamado.data_primeira_resposta:
+            valores["tempo_primeira_resposta_horas"] = calendario.business_hours(
+                abertura, chamado.data_primeira_resposta
+            )
+
+        if chamado.status not in SLAStatusDeterminer.CLOSED_STATUSES:
+            return valores
+
+        valores["tempos_congelados_em"] = now_brazil_naive()
+        fim = chamado.data_conclusao or chamado.cancelado_em
+        if not fim:
+            return valores
+
+        resolucao = SLACalculator.calculate_business_hours_excluding_paused(
+            chamado.id, abertura, fim, None,
+            historicos_cache={chamado.id: historicos},
+            calendario=calendario,
+        )
+        valores["tempo_resolucao_horas"] = resolucao
+        valores["tempo_pausado_horas"] = max(0.0, calendario.business_hours(abertura, fim) - resolucao)
+        return valores
+
+    @staticmethod
+    def atualizar_chamado(
+        db: Session,
+        chamado: Chamado,
+        calendario: BusinessCalendar | None = None,
+        historicos: list[HistoricoStatus] | None = None,
+    ) -> None:
+        """
+        Grava/limpa as durações conforme o status atual (não faz commit).
+        Deve rodar depois do fechamento do período anterior em historico_status,
+        para que uma análise encerrada junto com o chamado seja descontada.
+        """
+        if calendario is None:
+            calendario = BusinessCalendar.load(db)
+        if historicos is None:
+            historicos = SLACalculator.load_historicos_by_chamado(db, [chamado.id])[chamado.id]
+
+        for coluna, valor in SLADuracoes.calcular(chamado, calendario, historicos).items():
+            setattr(chamado, coluna, valor)
+        db.add(chamado)
+
+    @staticmethod
+    def query_pendentes(db: Session):
+        """Chamados sem durações gravadas (encerrados não congelados ou primeira resposta pendente)"""
+        return db.query(Chamado.id).filter(
+            and_(
+                Chamado.deletado_em.is_(None),
+                or_(
+                    and_(
+                        Chamado.status.in_(SLAStatusDeterminer.CLOSED_STATUSES),
+                        Chamado.tempos_congelados_em.is_(None),
+                    ),
+                    and_(
+                        Chamado.data_primeira_resposta.isnot(None),
+                        Chamado.tempo_primeira_resposta_horas.is_(None),
+                    ),
+                ),
+            )
+        )
+
+    @staticmethod
+    def backfill(db: Session, ctx=None, todos: bool = False) -> int:
+        """
+        Preenche as durações em lotes (commit por lote).
+
+        todos=True recalcula todos os chamados (ex: após mudar feriados que
+        devem valer retroativamente); por padrão apenas os pendentes.
+        """
+        if todos:
+            query = db.query(Chamado.id).filter(Chamado.deletado_em.is_(None))
+        else:
+            query = SLADuracoes.query_pendentes(db)
+
+        ids = [row[0] for row in query.order_by(Chamado.id.asc()).all()]
+        calendario = BusinessCalendar.load(db)
+        total = 0
+
+        if ctx is not None:
+            ctx.progresso(0, len(ids), forcar=True)
+
+        for i in range(0, len(ids), SLADuracoes.BATCH_SIZE):
+            # Dentro de uma requisição, para entre lotes se o prazo acabou (lotes já gravados ficam)
+            verificar_prazo()
+            lote_ids = ids[i:i + SLADuracoes.BATCH_SIZE]
+            chamados = db.query(Chamado).filter(Chamado.id.in_(lote_ids)).all()
+            historicos_cache = SLACalculator.load_historicos_by_chamado(db, lote_ids)
+
+            mapeamentos = []
+            for chamado in chamados:
+                valores = SLADuracoes.calcular(chamado, calendario, historicos_cache.get(chamado.id, []))
+                valores["id"] = chamado.id
+                mapeamentos.append(valores)
+
+            db.bulk_update_mappings(Chamado, mapeamentos)
+            db.commit()
+            total += len(mapeamentos)
+
+            if ctx is not None:
+                ctx.progresso(total, len(ids))
+
+        print(f"[SLA DURAÇÕES] {total} chamados com durações gravadas")
+        return total
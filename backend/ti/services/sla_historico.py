@@ -0,0 +1,130 @@
+"""
+Gravação em lote do snapshot de SLA de cada chamado (tabela historico_sla).
+
+historico_sla tem chave única em chamado_id (ver
+ti/scripts/add_historico_sla_unique_key.py), então a gravação é um único
+INSERT ... ON DUPLICATE KEY UPDATE por lote, em vez de SELECT + UPDATE/INSERT
+por chamado.
+
+Em um registro já existente, acao e criado_em são preservados; métricas,
+status_novo e status_sla são sobrescritos, e status_anterior só é trocado
+quando um novo valor é informado.
+"""
+
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from ti.models.chamado import Chamado
+from ti.models.sla_config import HistoricoSLA
+from core.utils import now_brazil_naive
+
+
+class HistoricoSLAWriter:
+    """Upsert em lote de registros de historico_sla"""
+
+    BATCH_SIZE = 500
+
+    CAMPOS_ATUALIZADOS = (
+        "status_novo",
+        "tempo_resposta_horas",
+        "limite_sla_resposta_horas",
+        "tempo_resolucao_horas",
+        "limite_sla_horas",
+        "status_sla",
+    )
+
+    @staticmethod
+    def lotes(itens: list, tamanho: int | None = None):
+        """Divide uma lista em lotes de até BATCH_SIZE itens"""
+        tamanho = tamanho or HistoricoSLAWriter.BATCH_SIZE
+        for i in range(0, len(itens), tamanho):
+            yield itens[i:i + tamanho]
+
+    @staticmethod
+    def montar_registro(
+        chamado: Chamado,
+        sla_status: dict,
+        acao: str,
+        criado_em: datetime | None = None,
+        status_anterior: str | None = None,
+    ) -> dict:
+        """Monta a linha de historico_sla a partir do resultado de SLACalculator.get_sla_status"""
+        resposta_metric = sla_status.get("resposta_metric")
+        resolucao_metric = sla_status.get("resolucao_metric")
+
+        return {
+            "chamado_id": chamado.id,
+            "usuario_id": None,
+            "acao": acao,
+            "status_anterior": status_anterior,
+            "status_novo": chamado.status,
+            "tempo_resposta_horas": resposta_metric.get("tempo_decorrido_horas") if resposta_metric else None,
+            "limite_sla_resposta_horas": resposta_metric.get("tempo_limite_horas") if resposta_metric else None,
+            "tempo_resolucao_horas": resolucao_metric.get("tempo_decorrido_horas") if resolucao_metric else None,
+            "limite_sla_horas": resolucao_metric.get("tempo_limite_horas") if resolucao_metric else None,
+            "status_sla": sla_status.get("status_geral"),
+            "criado_em": criado_em or now_brazil_naive(),
+        }
+
+    @staticmethod
+    def chamados_com_historico(db: Session, chamado_ids: list[int]) -> set[int]:
+        """Ids (do lote) que já têm registro em historico_sla — uma query"""
+        if not chamado_ids:
+            return set()
+        return {
+            row[0] for row in db.query(HistoricoSLA.chamado_id).filter(
+                HistoricoSLA.chamado_id.in_(chamado_ids)
+            ).all()
+        }
+
+    @staticmethod
+    def upsert_many(db: Session, registros: list[dict]) -> int:
+        """
+        Grava os registros com INSERT ... ON DUPLICATE KEY UPDATE em lotes.
+        Não faz commit (participa da transação do chamador).
+
+        Retorna o rowcount acumulado informado pelo MySQL.
+        """
+        if not registros:
+            return 0
+
+        if db.get_bind().dialect.name != "mysql":
+            return HistoricoSLAWriter._upsert_orm(db, registros)
+
+        tabela = HistoricoSLA.__table__
+        total = 0
+        for lote in HistoricoSLAWriter.lotes(registros):
+            stmt = mysql_insert(tabela).values(lote)
+            atualizacoes = {campo: stmt.inserted[campo] for campo in HistoricoSLAWriter.CAMPOS_ATUALIZADOS}
+            atualizacoes["status_anterior"] = func.coalesce(
+                stmt.inserted.status_anterior, tabela.c.status_anterior
+            )
+            total += db.execute(stmt.on_duplicate_key_update(**atualizacoes)).rowcount or 0
+
+        return total
+
+    @staticmethod
+    def _upsert_orm(db: Session, registros: list[dict]) -> int:
+        """Fallback para bancos sem ON DUPLICATE KEY (uma query de leitura por lote)"""
+        total = 0
+        for lote in HistoricoSLAWriter.lotes(registros):
+            existentes = {
+                h.chamado_id: h for h in db.query(HistoricoSLA).filter(
+                    HistoricoSLA.chamado_id.in_([r["chamado_id"] for r in lote])
+                ).all()
+            }
+            for registro in lote:
+                existing = existentes.get(registro["chamado_id"])
+                if existing:
+                    for campo in HistoricoSLAWriter.CAMPOS_ATUALIZADOS:
+                        setattr(existing, campo, registro[campo])
+                    if registro["status_anterior"]:
+                        existing.status_anterior = registro["status_anterior"]
+                else:
+                    db.add(HistoricoSLA(**registro))
+                total += 1
+        db.flush()
+        return total
@@ -1,12 +1,13 @@
 from __future__ import annotations
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, or_
 from ti.models.chamado import Chamado
 from ti.models.historico_status import HistoricoStatus
 from ti.models.sla_config import SLAConfiguration
-from ti.services.sla import SLACalculator
+from ti.services.sla import SLACalculator, BusinessCalendar
 from core.utils import now_brazil_naive
+from core.deadline import verificar_prazo
 import statistics
 
 
@@ -32,21 +33,36 @@ class SLAP90Calculator:
         return float(valores_ordenados[indice])
 
     @staticmethod
-    def obter_tempo_primeira_resposta(chamado: Chamado, db: Session) -> float:
+    def carregar_historicos(db: Session, chamado_ids: list[int]) -> dict[int, list[HistoricoStatus]]:
+        """Históricos de status de vários chamados em uma query, agrupados por chamado_id"""
+        return SLACalculator.load_historicos_by_chamado(db, chamado_ids)
+
+    @staticmethod
+    def obter_tempo_primeira_resposta(
+        chamado: Chamado,
+        db: Session,
+        historicos_cache: dict | None = None,
+        calendario: BusinessCalendar | None = None,
+    ) -> float:
         """
         Obtém o tempo de primeira resposta em horas.
         
         Primeira resposta = tempo de abertura até a primeira mudança de status
         (excluindo "Em análise" que fica em pausa).
+
+        historicos_cache / calendario: dados pré-carregados (operação em lote)
         
         Retorna: horas (float)
         """
         if not chamado.data_abertura:
             return 0.0
 
-        historicos = db.query(HistoricoStatus).filter(
-            HistoricoStatus.chamado_id == chamado.id
-        ).order_by(HistoricoStatus.data_inicio.asc()).all()
+        if historicos_cache is not None and chamado.id in historicos_cache:
+            historicos = historicos_cache[chamado.id]
+        else:
+            historicos = db.query(HistoricoStatus).filter(
+                HistoricoStatus.chamado_id == chamado.id
+            ).order_by(HistoricoStatus.data_inicio.asc()).all()
 
         if not historicos or not historicos[0].data_inicio:
             return 0.0
@@ -57,24 +73,38 @@ class SLAP90Calculator:
             chamado.id,
             chamado.data_abertura,
             primeira_mudanca,
-            db
+            db,
+            historicos_cache=historicos_cache,
+            calendario=calendario,
         )
         
         return tempo_horas
 
     @staticmethod
-    def obter_tempo_resolucao(chamado: Chamado, db: Session) -> float:
+    def obter_tempo_resolucao(
+        chamado: Chamado,
+        db: Session,
+        historicos_cache: dict | None = None,
+        calendario: BusinessCalendar | None = None,
+    ) -> float:
         """
         Obtém o tempo de resolução em horas.
         
         Resolução = tempo de abertura até concluído/cancelado
         (excluindo "Em análise" que fica em pausa).
+        Usa a duração congelada no encerramento quando existir
+        (ver ti.services.sla_duracoes).
+
+        historicos_cache / calendario: dados pré-carregados (operação em lote)
         
         Retorna: horas (float)
         """
         if not chamado.data_abertura:
             return 0.0
 
+        if chamado.tempo_resolucao_horas is not None:
+            return chamado.tempo_resolucao_horas
+
         data_conclusao = chamado.data_conclusao or chamado.cancelado_em
         if not data_conclusao:
             return 0.0
@@ -83,27 +113,32 @@ class SLAP90Calculator:
             chamado.id,
             chamado.data_abertura,
             data_conclusao,
-            db
+            db,
+            historicos_cache=historicos_cache,
+            calendario=calendario,
         )
         
         return tempo_horas
 
     @staticmethod
-    def recalcular_sla_por_prioridade(db: Session) -> dict:
+    def recalcular_sla_por_prioridade(db: Session, dry_run: bool = False) -> dict:
         """
         Recalcula SLA para cada prioridade baseado em P90 dos últimos 30 dias.
         
         Processo:
         1. Busca chamados dos últimos 30 dias (status concluído/cancelado)
-        2. Agrupa por prioridade
-        3. Calcula P90 para tempo de resposta e resolução
-        4. Atualiza configurações de SLA
-        5. Invalida cache
+        2. Carrega históricos de todos eles em uma query e o calendário comercial uma vez
+        3. Agrupa por prioridade
+        4. Calcula P90 para tempo de resposta e resolução
+        5. Atualiza configurações de SLA (exceto em dry_run)
+        6. Invalida cache
+
+        dry_run=True: apenas retorna as configurações propostas, sem gravar nada.
         """
         agora = now_brazil_naive()
         data_inicio = agora - timedelta(days=30)
         
-        print(f"[P90] Iniciando recálculo de SLA de {data_inicio} a {agora}")
+        print(f"[P90] Iniciando recálculo de SLA de {data_inicio} a {agora}" + (" (dry-run)" if dry_run else ""))
 
         chamados = db.query(Chamado).filter(
             and_(
@@ -116,6 +151,10 @@ class SLAP90Calculator:
 
         print(f"[P90] Encontrados {len(chamados)} chamados nos últimos 30 dias")
 
+        historicos_cache = SLAP90Calculator.carregar_historicos(db, [c.id for c in chamados])
+        calendario = BusinessCalendar.load(db)
+        configs = {c.prioridade: c for c in db.query(SLAConfiguration).all()}
+
         dados_por_prioridade = {}
         
         for chamado in chamados:
@@ -128,8 +167,12 @@ class SLAP90Calculator:
                     "total": 0
                 }
 
-            tempo_resposta = SLAP90Calculator.obter_tempo_primeira_resposta(chamado, db)
-            tempo_resolucao = SLAP90Calculator.obter_tempo_resolucao(chamado, db)
+            tempo_resposta = SLAP90Calculator.obter_tempo_primeira_resposta(
+                chamado, db, historicos_cache, calendario
+            )
+            tempo_resolucao = SLAP90Calculator.obter_tempo_resolucao(
+                chamado, db, historicos_cache, calendario
+            )
 
             dados_por_prioridade[prioridade]["tempos_resposta"].append(tempo_resposta)
             dados_por_prioridade[prioridade]["tempos_resolucao"].append(tempo_resolucao)
@@ -137,10 +180,12 @@ class SLAP90Calculator:
 
         resultado = {
             "sucesso": True,
+            "dry_run": dry_run,
             "data_inicio": data_inicio.isoformat(),
             "data_fim": agora.isoformat(),
             "total_chamados": len(chamados),
             "prioridades_atualizadas": [],
+            "configuracoes_propostas": {},
             "detalhes": {}
         }
 
@@ -163,9 +208,7 @@ class SLAP90Calculator:
                 tempo_resposta_horas = round(tempo_resposta_final)
                 tempo_resolucao_horas = round(tempo_resolucao_final)
 
-                config = db.query(SLAConfiguration).filter(
-                    SLAConfiguration.prioridade == prioridade
-                ).first()
+                config = configs.get(prioridade)
 
                 if not config:
                     print(f"[P90] Prioridade '{prioridade}' não tem configuração, pulando")
@@ -176,11 +219,21 @@ class SLAP90Calculator:
                 print(f"  - P90 Resposta: {p90_resposta:.2f}h → {tempo_resposta_horas}h (com margem)")
                 print(f"  - P90 Resolução: {p90_resolucao:.2f}h → {tempo_resolucao_horas}h (com margem)")
 
-                config.tempo_resposta_horas = tempo_resposta_horas
-                config.tempo_resolucao_horas = tempo_resolucao_horas
-                config.atualizado_em = agora
+                resultado["configuracoes_propostas"][prioridade] = {
+                    "id": config.id,
+                    "prioridade": prioridade,
+                    "tempo_resposta_horas": tempo_resposta_horas,
+                    "tempo_resolucao_horas": tempo_resolucao_horas,
+                    "tempo_resposta_atual": config.tempo_resposta_horas,
+                    "tempo_resolucao_atual": config.tempo_resolucao_horas,
+                }
+
+                if not dry_run:
+                    config.tempo_resposta_horas = tempo_resposta_horas
+                    config.tempo_resolucao_horas = tempo_resolucao_horas
+                    config.atualizado_em = agora
 
-                db.add(config)
+                    db.add(config)
 
                 resultado["detalhes"][prioridade] = {
                     "total_chamados": total,
@@ -190,7 +243,8 @@ class SLAP90Calculator:
                     "tempo_resolucao_novo": tempo_resolucao_horas,
                     "margem_seguranca": margem_seguranca
                 }
-                resultado["prioridades_atualizadas"].append(prioridade)
+                if not dry_run:
+                    resultado["prioridades_atualizadas"].append(prioridade)
 
             except Exception as e:
                 print(f"[P90] Erro ao processar prioridade '{prioridade}': {e}")
@@ -198,6 +252,10 @@ class SLAP90Calculator:
                     "erro": str(e)
                 }
 
+        if dry_run:
+            print(f"[P90] Dry-run concluído. {len(resultado['configuracoes_propostas'])} configurações propostas")
+            return resultado
+
         db.commit()
 
         from ti.services.sla_cache import SLACacheManager
@@ -206,3 +264,130 @@ class SLAP90Calculator:
         print(f"[P90] Recálculo concluído. Atualizadas {len(resultado['prioridades_atualizadas'])} prioridades")
 
         return resultado
+
+    @staticmethod
+    def analisar_p90(db: Session) -> dict:
+        """
+        Analisa o P90 recomendado para cada prioridade ativa.
+        Mostra quanto a conformidade melhoraria se usar P90 + 15% ao invés do SLA fixo.
+
+        Usa uma query para as configurações, uma para os chamados de todas as
+        prioridades e uma para os históricos (agrupados em memória).
+        """
+        agora = now_brazil_naive()
+        data_inicio = agora - timedelta(days=30)
+
+        configs = db.query(SLAConfiguration).filter(
+            SLAConfiguration.ativo == True
+        ).order_by(SLAConfiguration.prioridade.asc()).all()
+
+        analise = {
+            "data_analise": agora.isoformat(),
+            "periodo": f"{data_inicio.isoformat()} a {agora.isoformat()}",
+            "prioridades": {}
+        }
+
+        if not configs:
+            return analise
+
+        # Busca APENAS chamados concluídos/cancelados das prioridades configuradas
+        chamados = db.query(Chamado).filter(
+            and_(
+                Chamado.prioridade.in_([c.prioridade for c in configs]),
+                Chamado.data_abertura >= data_inicio,
+                Chamado.data_abertura <= agora,
+                Chamado.deletado_em.is_(None),
+                Chamado.status.in_(["Concluído", "Cancelado"]),
+                or_(Chamado.data_conclusao.isnot(None), Chamado.cancelado_em.isnot(None))
+            )
+        ).all()
+
+        chamados_por_prioridade: dict[str, list[Chamado]] = {}
+        for chamado in chamados:
+            chamados_por_prioridade.setdefault(chamado.prioridade, []).append(chamado)
+
+        # Só chamados sem duração congelada precisam de histórico/calendário
+        historicos_cache = SLAP90Calculator.carregar_historicos(
+            db, [c.id for c in chamados if c.tempo_resolucao_horas is None]
+        )
+        calendario = BusinessCalendar.load(db)
+
+        for config in configs:
+            verificar_prazo()
+            prioridade = config.prioridade
+
+            print(f"\n[P90 ANALYSIS] Analisando prioridade: {prioridade}")
+            print(f"  - SLA configurado: {config.tempo_resolucao_horas}h")
+
+            chamados_prioridade = chamados_por_prioridade.get(prioridade, [])
+
+            # Se houve reset, ignora chamados abertos antes do reset
+            if config.ultimo_reset_em:
+                print(f"  - Filtrando apenas chamados posteriores ao reset ({config.ultimo_reset_em})")
+                chamados_prioridade = [
+                    c for c in chamados_prioridade if c.data_abertura >= config.ultimo_reset_em
+                ]
+
+            print(f"  - Chamados encontrados: {len(chamados_prioridade)}")
+
+            if len(chamados_prioridade) < 2:
+                print(f"  - ⚠️ Chamados insuficientes, pulando...")
+                continue
+
+            # Calcula tempos de resolução
+            tempos = []
+            for chamado in chamados_prioridade:
+                try:
+                    tempo = SLAP90Calculator.obter_tempo_resolucao(
+                        chamado, db, historicos_cache, calendario
+                    )
+                    # Sanidade: 0-720 horas (30 dias)
+                    if 0 < tempo < 720:
+                        tempos.append(tempo)
+                except Exception as e:
+                    print(f"    Erro ao processar chamado {chamado.id}: {e}")
+
+            print(f"  - Tempos válidos: {len(tempos)}")
+
+            if len(tempos) < 2:
+                print(f"  - ⚠️ Tempos insuficientes, pulando...")
+                continue
+
+            p90 = SLAP90Calculator.calcular_percentil_90(tempos)
+            margem = 1.15
+            p90_com_margem = p90 * margem
+            media = sum(tempos) / len(tempos)
+            minimo = min(tempos)
+            maximo = max(tempos)
+
+            print(f"  - Mínimo: {minimo:.1f}h")
+            print(f"  - Média: {media:.1f}h")
+            print(f"  - P90: {p90:.1f}h")
+            print(f"  - Máximo: {maximo:.1f}h")
+
+            # Calcula conformidade com SLA atual
+            dentro_atual = sum(1 for t in tempos if t <= config.tempo_resolucao_horas)
+            conformidade_atual = int((dentro_atual / len(tempos)) * 100)
+
+            # Calcula conformidade com P90
+            dentro_p90 = sum(1 for t in tempos if t <= p90_com_margem)
+            conformidade_p90 = int((dentro_p90 / len(tempos)) * 100)
+
+            print(f"  - Conformidade SLA atual ({config.tempo_resolucao_horas}h): {conformidade_atual}%")
+            print(f"  - Conformidade P90 ({int(p90_com_margem)}h): {conformidade_p90}%")
+            print(f"  - Melhoria: +{conformidade_p90 - conformidade_atual}%")
+
+            analise["prioridades"][prioridade] = {
+                "sla_atual": int(config.tempo_resolucao_horas),
+                "conformidade_atual": conformidade_atual,
+                "chamados_analisados": len(tempos),
+                "tempo_minimo": round(minimo, 2),
+                "tempo_medio": round(media, 2),
+                "tempo_maximo": round(maximo, 2),
+                "p90": round(p90, 2),
+                "p90_recomendado": int(p90_com_margem),
+                "conformidade_com_p90": conformidade_p90,
+                "melhoria": conformidade_p90 - conformidade_atual
+            }
+
+        return analise
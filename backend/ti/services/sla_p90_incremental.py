@@ -1,5 +1,5 @@
 from __future__ import annotations
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from ti.models.chamado import Chamado
@@ -8,26 +8,35 @@ from ti.models.sla_config import SLAConfiguration
 from ti.models.metrics_cache import MetricsCacheDB
 from ti.services.sla import SLACalculator
 from ti.services.sla_cache import SLACacheManager
+from ti.services.quantile_sketch import TDigest
 from core.utils import now_brazil_naive
+from core.deadline import verificar_prazo
 import json
 
 
 class SLAP90Incremental:
     """
     Sistema incremental de cálculo de SLA com P90.
-    
+
     Funciona armazenando em cache:
-    1. Lista de tempos já processados
+    1. Um sketch de quantis (t-digest) por prioridade, métrica e dia de abertura
     2. ID do último chamado processado
-    
-    Na próxima atualização, busca apenas chamados novos.
+
+    Na próxima atualização, busca apenas chamados novos e atualiza somente os
+    sketches dos dias afetados. O P90 da janela de 30 dias é obtido mesclando
+    os sketches diários - o tamanho armazenado não cresce com o volume.
     """
 
-    CACHE_KEY_TEMPOS_RESPOSTA = "sla_p90_tempos_resposta"
-    CACHE_KEY_TEMPOS_RESOLUCAO = "sla_p90_tempos_resolucao"
+    CACHE_KEY_SKETCH = "sla_p90_sketch"
     CACHE_KEY_ULTIMO_ID = "sla_p90_ultimo_chamado_id"
     CACHE_KEY_TIMESTAMP = "sla_p90_timestamp"
 
+    # Chaves antigas (listas JSON completas), removidas na primeira execução
+    LEGACY_CACHE_KEYS = ("sla_p90_tempos_resposta", "sla_p90_tempos_resolucao")
+
+    METRICAS = ("resposta", "resolucao")
+    JANELA_DIAS = 30
+
     @staticmethod
     def calcular_percentil_90(valores: list[float]) -> float:
         """Calcula o 90º percentil de uma lista de valores."""
@@ -72,6 +81,10 @@ class SLAP90Incremental:
         if not chamado.data_abertura:
             return 0.0
 
+        # Duração congelada no encerramento (ver ti.services.sla_duracoes)
+        if chamado.tempo_resolucao_horas is not None:
+            return chamado.tempo_resolucao_horas
+
         data_conclusao = chamado.data_conclusao or chamado.cancelado_em
         if not data_conclusao:
             return 0.0
@@ -86,136 +99,108 @@ class SLAP90Incremental:
         return tempo_horas
 
     @staticmethod
-    def carregar_cache_prioridade(db: Session, prioridade: str) -> dict:
+    def _sketch_key(prioridade: str, metrica: str, dia: date) -> str:
+        return f"{SLAP90Incremental.CACHE_KEY_SKETCH}:{prioridade}:{metrica}:{dia.isoformat()}"
+
+    @staticmethod
+    def _dias_janela(inicio: date, fim: date) -> list[date]:
+        return [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+
+    @staticmethod
+    def carregar_sketches(db: Session, prioridade: str, dias: list[date]) -> dict[tuple[str, date], TDigest]:
         """
-        Carrega dados do cache para uma prioridade.
-        Retorna dict com tempos anteriores e último ID processado.
+        Carrega, em uma única query, os sketches diários de uma prioridade.
+        Retorna dict {(metrica, dia): TDigest} apenas com os dias existentes.
         """
-        cache_key_resposta = f"{SLAP90Incremental.CACHE_KEY_TEMPOS_RESPOSTA}:{prioridade}"
-        cache_key_resolucao = f"{SLAP90Incremental.CACHE_KEY_TEMPOS_RESOLUCAO}:{prioridade}"
-        cache_key_ultimo_id = f"{SLAP90Incremental.CACHE_KEY_ULTIMO_ID}:{prioridade}"
+        chaves = {
+            SLAP90Incremental._sketch_key(prioridade, metrica, dia): (metrica, dia)
+            for metrica in SLAP90Incremental.METRICAS
+            for dia in dias
+        }
+        if not chaves:
+            return {}
 
+        sketches: dict[tuple[str, date], TDigest] = {}
         try:
-            cache_resposta = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == cache_key_resposta
-            ).first()
-
-            cache_resolucao = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == cache_key_resolucao
-            ).first()
+            rows = db.query(MetricsCacheDB).filter(
+                MetricsCacheDB.cache_key.in_(list(chaves.keys()))
+            ).all()
+            for row in rows:
+                try:
+                    sketches[chaves[row.cache_key]] = TDigest.from_base64(json.loads(row.cache_value))
+                except Exception as e:
+                    print(f"[P90 INCREMENTAL] Sketch inválido em {row.cache_key}: {e}")
+        except Exception as e:
+            print(f"[P90 INCREMENTAL] Erro ao carregar sketches: {e}")
+        return sketches
 
+    @staticmethod
+    def carregar_ultimo_id(db: Session, prioridade: str) -> int:
+        try:
             cache_ultimo_id = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == cache_key_ultimo_id
+                MetricsCacheDB.cache_key == f"{SLAP90Incremental.CACHE_KEY_ULTIMO_ID}:{prioridade}"
             ).first()
-
-            tempos_resposta = []
-            tempos_resolucao = []
-            ultimo_id = 0
-
-            if cache_resposta and cache_resposta.cache_value:
-                try:
-                    tempos_resposta = json.loads(cache_resposta.cache_value)
-                except:
-                    tempos_resposta = []
-
-            if cache_resolucao and cache_resolucao.cache_value:
-                try:
-                    tempos_resolucao = json.loads(cache_resolucao.cache_value)
-                except:
-                    tempos_resolucao = []
-
             if cache_ultimo_id and cache_ultimo_id.cache_value:
-                try:
-                    ultimo_id = int(cache_ultimo_id.cache_value)
-                except:
-                    ultimo_id = 0
-
-            return {
-                "tempos_resposta": tempos_resposta,
-                "tempos_resolucao": tempos_resolucao,
-                "ultimo_id": ultimo_id,
-                "total_anterior": len(tempos_resposta)
-            }
+                return int(cache_ultimo_id.cache_value)
         except Exception as e:
-            print(f"[P90 INCREMENTAL] Erro ao carregar cache: {e}")
-            return {
-                "tempos_resposta": [],
-                "tempos_resolucao": [],
-                "ultimo_id": 0,
-                "total_anterior": 0
-            }
+            print(f"[P90 INCREMENTAL] Erro ao carregar último ID: {e}")
+        return 0
 
     @staticmethod
     def salvar_cache_prioridade(
         db: Session,
         prioridade: str,
-        tempos_resposta: list[float],
-        tempos_resolucao: list[float],
+        sketches: dict[tuple[str, date], TDigest],
         ultimo_id: int
     ) -> bool:
-        """Salva dados no cache para uma prioridade."""
+        """
+        Salva os sketches diários alterados e o último ID processado.
+
+        Cada sketch expira ao sair da janela de 30 dias, então o sweeper
+        de cache expirado remove os dias antigos sem tratamento especial.
+        """
         try:
             agora = now_brazil_naive()
-            ttl_segundos = 30 * 24 * 60 * 60
-            expira_em = agora + timedelta(seconds=ttl_segundos)
-
-            cache_key_resposta = f"{SLAP90Incremental.CACHE_KEY_TEMPOS_RESPOSTA}:{prioridade}"
-            cache_key_resolucao = f"{SLAP90Incremental.CACHE_KEY_TEMPOS_RESOLUCAO}:{prioridade}"
-            cache_key_ultimo_id = f"{SLAP90Incremental.CACHE_KEY_ULTIMO_ID}:{prioridade}"
-
-            # Resposta
-            cache_resposta = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == cache_key_resposta
-            ).first()
-
-            if cache_resposta:
-                cache_resposta.cache_value = json.dumps(tempos_resposta)
-                cache_resposta.calculated_at = agora
-                cache_resposta.expires_at = expira_em
-            else:
-                cache_resposta = MetricsCacheDB(
-                    cache_key=cache_key_resposta,
-                    cache_value=json.dumps(tempos_resposta),
-                    calculated_at=agora,
-                    expires_at=expira_em,
-                )
-            db.add(cache_resposta)
-
-            # Resolução
-            cache_resolucao = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == cache_key_resolucao
-            ).first()
-
-            if cache_resolucao:
-                cache_resolucao.cache_value = json.dumps(tempos_resolucao)
-                cache_resolucao.calculated_at = agora
-                cache_resolucao.expires_at = expira_em
-            else:
-                cache_resolucao = MetricsCacheDB(
-                    cache_key=cache_key_resolucao,
-                    cache_value=json.dumps(tempos_resolucao),
-                    calculated_at=agora,
-                    expires_at=expira_em,
-                )
-            db.add(cache_resolucao)
 
-            # Último ID
-            cache_ultimo_id = db.query(MetricsCacheDB).filter(
-                MetricsCacheDB.cache_key == cache_key_ultimo_id
-            ).first()
+            valores: dict[str, tuple[str, datetime]] = {}
+            for (metrica, dia), sketch in sketches.items():
+                chave = SLAP90Incremental._sketch_key(prioridade, metrica, dia)
+                expira_em = datetime.combine(dia, datetime.min.time()) + timedelta(days=SLAP90Incremental.JANELA_DIAS + 1)
+                valores[chave] = (json.dumps(sketch.to_base64()), expira_em)
+
+            valores[f"{SLAP90Incremental.CACHE_KEY_ULTIMO_ID}:{prioridade}"] = (
+                str(ultimo_id),
+                agora + timedelta(days=SLAP90Incremental.JANELA_DIAS),
+            )
+
+            existentes = {
+                row.cache_key: row
+                for row in db.query(MetricsCacheDB).filter(
+                    MetricsCacheDB.cache_key.in_(list(valores.keys()))
+                ).all()
+            }
 
-            if cache_ultimo_id:
-                cache_ultimo_id.cache_value = str(ultimo_id)
-                cache_ultimo_id.calculated_at = agora
-                cache_ultimo_id.expires_at = expira_em
-            else:
-                cache_ultimo_id = MetricsCacheDB(
-                    cache_key=cache_key_ultimo_id,
-                    cache_value=str(ultimo_id),
-                    calculated_at=agora,
-                    expires_at=expira_em,
-                )
-            db.add(cache_ultimo_id)
+            for chave, (cache_value, expira_em) in valores.items():
+                row = existentes.get(chave)
+                if row:
+                    row.cache_value = cache_value
+                    row.calculated_at = agora
+                    row.expires_at = expira_em
+                else:
+                    row = MetricsCacheDB(
+                        cache_key=chave,
+                        cache_value=cache_value,
+                        calculated_at=agora,
+                        expires_at=expira_em,
+                    )
+                db.add(row)
+
+            # Remove listas JSON do formato antigo (crescimento ilimitado)
+            db.query(MetricsCacheDB).filter(
+                MetricsCacheDB.cache_key.in_([
+                    f"{legacy}:{prioridade}" for legacy in SLAP90Incremental.LEGACY_CACHE_KEYS
+                ])
+            ).delete(synchronize_session=False)
 
             db.commit()
             return True
@@ -229,12 +214,13 @@ class SLAP90Incremental:
         """
         Recalcula SLA de forma INCREMENTAL.
 
-        Busca apenas chamados posteriores ao último processado.
+        Busca apenas chamados posteriores ao último processado e adiciona
+        seus tempos ao sketch do dia de abertura.
         Ignora chamados anteriores ao último reset (se houver).
-        Combina com dados anteriores para calcular P90.
+        O P90 é calculado mesclando os sketches diários da janela de 30 dias.
         """
         agora = now_brazil_naive()
-        data_inicio = agora - timedelta(days=30)
+        data_inicio = agora - timedelta(days=SLAP90Incremental.JANELA_DIAS)
 
         print(f"[P90 INCREMENTAL] Iniciando recálculo incremental")
 
@@ -250,39 +236,33 @@ class SLAP90Incremental:
         }
 
         for config in configs:
+            verificar_prazo()
             prioridade = config.prioridade
 
             print(f"\n[P90 INCREMENTAL] Processando prioridade: {prioridade}")
 
-            cache_anterior = SLAP90Incremental.carregar_cache_prioridade(db, prioridade)
-            ultimo_id = cache_anterior["ultimo_id"]
-
-            print(f"  - Total anterior em cache: {cache_anterior['total_anterior']}")
-            print(f"  - Último ID processado: {ultimo_id}")
-
-            if config.ultimo_reset_em:
+            # O reset apaga todo o metrics_cache_db, então os sketches existentes
+            # já contêm apenas chamados posteriores a ele
+            inicio_janela = data_inicio
+            if config.ultimo_reset_em and config.ultimo_reset_em > inicio_janela:
                 print(f"  - Último reset em: {config.ultimo_reset_em.isoformat()}")
+                inicio_janela = config.ultimo_reset_em
 
-            tempos_resposta = cache_anterior["tempos_resposta"].copy()
-            tempos_resolucao = cache_anterior["tempos_resolucao"].copy()
+            dias_janela = SLAP90Incremental._dias_janela(inicio_janela.date(), agora.date())
+            sketches = SLAP90Incremental.carregar_sketches(db, prioridade, dias_janela)
+            ultimo_id = SLAP90Incremental.carregar_ultimo_id(db, prioridade)
 
-            # Se houver reset, ignora dados anteriores e começa do zero
-            if config.ultimo_reset_em:
-                print(f"  - Sistema foi resetado! Iniciando cálculos do zero a partir de {config.ultimo_reset_em}")
-                tempos_resposta = []
-                tempos_resolucao = []
-                ultimo_id = 0
+            print(f"  - Sketches diários em cache: {len(sketches)}")
+            print(f"  - Último ID processado: {ultimo_id}")
 
             chamados_novos = db.query(Chamado).filter(
                 and_(
                     Chamado.prioridade == prioridade,
-                    Chamado.data_abertura >= data_inicio,
+                    Chamado.data_abertura >= inicio_janela,
                     Chamado.data_abertura <= agora,
                     Chamado.deletado_em.is_(None),
                     Chamado.status.in_(["Concluído", "Cancelado"]),
                     Chamado.id > ultimo_id,
-                    # Se houver reset, apenas chamados APÓS o reset
-                    Chamado.data_abertura >= (config.ultimo_reset_em if config.ultimo_reset_em else data_inicio)
                 )
             ).order_by(Chamado.id.asc()).all()
 
@@ -290,17 +270,19 @@ class SLAP90Incremental:
 
             novo_maximo_id = ultimo_id
             chamados_processados = 0
+            alterados: dict[tuple[str, date], TDigest] = {}
 
             for chamado in chamados_novos:
                 try:
                     tempo_resposta = SLAP90Incremental.obter_tempo_primeira_resposta(chamado, db)
                     tempo_resolucao = SLAP90Incremental.obter_tempo_resolucao(chamado, db)
+                    dia = chamado.data_abertura.date()
 
-                    if tempo_resposta > 0:
-                        tempos_resposta.append(tempo_resposta)
-
-                    if tempo_resolucao > 0:
-                        tempos_resolucao.append(tempo_resolucao)
+                    for metrica, tempo in (("resposta", tempo_resposta), ("resolucao", tempo_resolucao)):
+                        if tempo > 0:
+                            sketch = sketches.setdefault((metrica, dia), TDigest())
+                            sketch.add(tempo)
+                            alterados[(metrica, dia)] = sketch
 
                     novo_maximo_id = max(novo_maximo_id, chamado.id)
                     chamados_processados += 1
@@ -310,9 +292,26 @@ class SLAP90Incremental:
 
             print(f"  - Chamados processados com sucesso: {chamados_processados}")
 
-            if len(tempos_resposta) > 0 and len(tempos_resolucao) > 0:
-                p90_resposta = SLAP90Incremental.calcular_percentil_90(tempos_resposta)
-                p90_resolucao = SLAP90Incremental.calcular_percentil_90(tempos_resolucao)
+            if chamados_processados:
+                SLAP90Incremental.salvar_cache_prioridade(
+                    db,
+                    prioridade,
+                    alterados,
+                    novo_maximo_id
+                )
+
+            sketch_resposta = TDigest.merge_all(
+                s for (metrica, _), s in sketches.items() if metrica == "resposta"
+            )
+            sketch_resolucao = TDigest.merge_all(
+                s for (metrica, _), s in sketches.items() if metrica == "resolucao"
+            )
+            total_resposta = int(sketch_resposta.count)
+            total_resolucao = int(sketch_resolucao.count)
+
+            if total_resposta >= 2 and total_resolucao >= 2:
+                p90_resposta = sketch_resposta.quantile(0.9)
+                p90_resolucao = sketch_resolucao.quantile(0.9)
 
                 margem_seguranca = 1.15
                 tempo_resposta_final = p90_resposta * margem_seguranca
@@ -328,22 +327,14 @@ class SLAP90Incremental:
                 db.add(config)
                 db.commit()
 
-                SLAP90Incremental.salvar_cache_prioridade(
-                    db,
-                    prioridade,
-                    tempos_resposta,
-                    tempos_resolucao,
-                    novo_maximo_id
-                )
-
                 print(f"  ✅ SLA Atualizado!")
-                print(f"     - Total de tempos: {len(tempos_resposta)}")
+                print(f"     - Total de tempos: {total_resposta}")
                 print(f"     - P90 Resposta: {p90_resposta:.2f}h → {tempo_resposta_horas}h")
                 print(f"     - P90 Resolução: {p90_resolucao:.2f}h → {tempo_resolucao_horas}h")
 
                 resultado["prioridades"][prioridade] = {
                     "sucesso": True,
-                    "total_tempos_acumulados": len(tempos_resposta),
+                    "total_tempos_acumulados": total_resposta,
                     "novos_chamados": chamados_processados,
                     "p90_resposta_horas": round(p90_resposta, 2),
                     "p90_resolucao_horas": round(p90_resolucao, 2),
@@ -356,7 +347,7 @@ class SLAP90Incremental:
                 resultado["prioridades"][prioridade] = {
                     "sucesso": False,
                     "motivo": "Dados insuficientes para calcular P90",
-                    "total_tempos": len(tempos_resposta)
+                    "total_tempos": total_resposta
                 }
 
         SLACacheManager.invalidate_all_sla(db)
@@ -7,7 +7,6 @@ No partial updates allowed.
 
 from typing import Callable, TypeVar, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from core.utils import now_brazil_naive
 
 T = TypeVar("T")
@@ -138,32 +137,40 @@ class SLATransactionManager:
         table_name: str,
         operation: Callable[..., T],
         *args,
+        lock_timeout: int = 30,
         **kwargs
     ) -> TransactionResult:
         """
-        Executa operação com lock exclusivo na tabela.
+        Executa operação com lock exclusivo nomeado para a tabela.
         
-        Impede concorrência durante a operação crítica.
+        Impede que duas execuções da mesma operação crítica rodem ao mesmo
+        tempo (em qualquer worker). Usa GET_LOCK do MySQL em vez de
+        LOCK TABLE, que no MySQL faz commit implícito e exige travar todas
+        as tabelas usadas na transação. Leituras e escritas de outros
+        fluxos na tabela continuam liberadas; a consistência linha a linha
+        vem da chave única + upsert.
         
         Args:
             db: Sessão do banco
-            table_name: Nome da tabela a fazer lock
+            table_name: Nome da tabela (define o nome do lock)
             operation: Função a executar
             *args: Argumentos para operation
+            lock_timeout: Segundos aguardando o lock antes de desistir
             **kwargs: Argumentos nomeados para operation
             
         Returns:
             TransactionResult
         """
+        from ti.services.db_lock import MySQLNamedLock
+
+        lock = MySQLNamedLock(f"sla_lock:{table_name}")
+        if not lock.adquirir(lock_timeout):
+            return TransactionResult(
+                success=False,
+                error=f"Outra operação em {table_name} está em andamento. Tente novamente em instantes."
+            )
+
         try:
-            # Lock exclusivo na tabela (PostgreSQL/MySQL)
-            # Isso previne que outros acessem enquanto estamos aqui
-            try:
-                db.execute(text(f"LOCK TABLE {table_name} IN EXCLUSIVE MODE"))
-            except Exception:
-                # Alguns bancos não suportam LOCK, continua mesmo assim
-                pass
-            
             # Executa operação
             result = operation(db, *args, **kwargs)
             
@@ -185,6 +192,8 @@ class SLATransactionManager:
                 success=False,
                 error=str(e)
             )
+        finally:
+            lock.liberar()
 
 
 class SLATransactionValidator:
@@ -3,6 +3,89 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import Any, Dict
 from ti.schemas.unidade import UnidadeCreate
+from ti.services.referencias import invalidar_unidades
+
+
+def listar_unidades(db: Session) -> list[Dict[str, Any]]:
+    """
+    Unidades das tabelas legadas (unidade/unidades), do ORM ou, em último
+    caso, derivadas dos chamados. Carregador do registro de referências.
+    """
+    from ti.models import Unidade, Chamado
+    from core.db import engine
+
+    try:
+        Unidade.__table__.create(bind=engine, checkfirst=True)
+    except Exception:
+        pass
+
+    # Tenta esquemas legados/plurais com e sem coluna cidade
+    queries = [
+        "SELECT id, nome, cidade FROM unidade ORDER BY nome",
+        "SELECT id, nome FROM unidade ORDER BY nome",
+        "SELECT id, unidade AS nome, cidade FROM unidade ORDER BY nome",
+        "SELECT id, unidade AS nome FROM unidade ORDER BY nome",
+        "SELECT id, nome, cidade FROM unidades ORDER BY nome",
+        "SELECT id, nome FROM unidades ORDER BY nome",
+        "SELECT id, unidade AS nome, cidade FROM unidades ORDER BY nome",
+        "SELECT id, unidade AS nome FROM unidades ORDER BY nome",
+    ]
+
+    for sql in queries:
+        try:
+            res = db.execute(text(sql))
+            fetched = res.fetchall()
+            if fetched and len(fetched) > 0:
+                print(f"✅ Unidades query succeeded: {sql[:80]}")
+                return [
+                    {
+                        "id": r[0] or 0,
+                        "nome": str(r[1]).strip() if r[1] else "Sem nome",
+                        "cidade": str(r[2]).strip() if len(r) >= 3 and r[2] else "",
+                    }
+                    for r in fetched
+                ]
+        except Exception as e:
+            print(f"⚠️  Query failed: {sql[:80]} - Error: {e}")
+            continue
+
+    print("⚠️  No results from unidade/unidades tables, trying ORM...")
+
+    # ORM padrão (caso exista classe/tabela com cidade)
+    try:
+        rows_orm = db.query(Unidade).order_by(Unidade.nome.asc()).all()
+        if rows_orm:
+            print(f"✅ Found {len(rows_orm)} unidades in ORM")
+            return [
+                {
+                    "id": r.id,
+                    "nome": r.nome,
+                    "cidade": getattr(r, "cidade", "") or ""
+                }
+                for r in rows_orm
+            ]
+    except Exception as e:
+        print(f"⚠️  ORM query failed: {e}")
+
+    # Fallback: derivar de chamados existentes
+    print("⚠️  Using fallback: extracting unidades from existing chamados...")
+    try:
+        distinct = [r[0] for r in db.query(Chamado.unidade).distinct().all() if r[0]]
+        if distinct:
+            print(f"✅ Extracted {len(distinct)} unique unidades from chamados")
+            return [
+                {
+                    "id": idx,
+                    "nome": str(nome).strip(),
+                    "cidade": ""
+                }
+                for idx, nome in enumerate(sorted(distinct), 1)
+            ]
+    except Exception as e:
+        print(f"⚠️  Could not extract from chamados: {e}")
+
+    print("❌ No unidades found anywhere")
+    return []
 
 
 def criar_unidade(db: Session, payload: UnidadeCreate) -> Dict[str, Any]:
@@ -78,6 +161,7 @@ def criar_unidade(db: Session, payload: UnidadeCreate) -> Dict[str, Any]:
                 except Exception:
                     inserted_id = 0
         db.commit()
+        invalidar_unidades(db)
         return {"id": int(inserted_id or 0), "nome": nome, "cidade": ""}
     except Exception as e:
         db.rollback()
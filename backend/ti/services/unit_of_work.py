@@ -0,0 +1,208 @@
+"""
+Unidade de trabalho: todas as escritas de uma operação em uma única
+transação, com hooks executados só depois do commit.
+
+Antes, operações como a mudança de status de um chamado faziam vários
+commits (status, histórico, SLA, notificação) intercalados com invalidação
+de cache, eventos Socket.IO e e-mail. Cada commit é uma ida ao banco (e um
+fsync no MySQL) e uma falha no meio deixava o chamado em estado parcial.
+
+Com a UnitOfWork:
+- As escritas usam a sessão normalmente (db.add / db.flush) e são
+  confirmadas uma única vez ao sair do bloco; qualquer exceção faz rollback
+- Efeitos colaterais são registrados com after_commit() e só rodam se o
+  commit der certo, fora do caminho da requisição, em um pool de threads
+  limitado (UOW_HOOK_WORKERS). Os hooks de uma unidade rodam em ordem, com
+  uma sessão própria (a sessão da requisição já terá sido fechada)
+- Eventos de domínio publicados com publicar() são gravados no outbox
+  (domain_event) na mesma transação e entregues aos consumidores pelo
+  EventDispatcher (ver ti/services/domain_events.py)
+- A latência de cada operação (transação, commit e hooks) é medida e
+  exposta em GET /api/metrics/unit-of-work
+
+Uso:
+    uow = UnitOfWork(db, "chamado.atualizar_status")
+    with uow:
+        chamado.status = "Concluído"
+        db.add(HistoricoStatus(...))
+        uow.publicar("chamado.status_alterado", "chamado", chamado.id, {"status": "Concluído"})
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from core.db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+HOOK_WORKERS = int(os.getenv("UOW_HOOK_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=HOOK_WORKERS, thread_name_prefix="uow-hook")
+
+
+class UnitOfWorkStats:
+    """Latências recentes por operação (janela deslizante em memória, por worker)"""
+
+    JANELA = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operacoes: dict[str, dict] = {}
+
+    def _operacao(self, nome: str) -> dict:
+        op = self._operacoes.get(nome)
+        if op is None:
+            op = {
+                "total": 0,
+                "rollbacks": 0,
+                "hooks_executados": 0,
+                "hooks_com_erro": 0,
+                "transacao_ms": deque(maxlen=self.JANELA),
+                "commit_ms": deque(maxlen=self.JANELA),
+                "hooks_ms": deque(maxlen=self.JANELA),
+            }
+            self._operacoes[nome] = op
+        return op
+
+    def registrar_commit(self, nome: str, transacao_ms: float, commit_ms: float) -> None:
+        with self._lock:
+            op = self._operacao(nome)
+            op["total"] += 1
+            op["transacao_ms"].append(transacao_ms)
+            op["commit_ms"].append(commit_ms)
+
+    def registrar_rollback(self, nome: str) -> None:
+        with self._lock:
+            self._operacao(nome)["rollbacks"] += 1
+
+    def registrar_hooks(self, nome: str, duracao_ms: float, executados: int, com_erro: int) -> None:
+        with self._lock:
+            op = self._operacao(nome)
+            op["hooks_ms"].append(duracao_ms)
+            op["hooks_executados"] += executados
+            op["hooks_com_erro"] += com_erro
+
+    @staticmethod
+    def _resumo(valores) -> dict:
+        if not valores:
+            return {"amostras": 0}
+        ordenados = sorted(valores)
+
+        def _p(q: float) -> float:
+            return round(ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))], 2)
+
+        return {
+            "amostras": len(ordenados),
+            "media": round(sum(ordenados) / len(ordenados), 2),
+            "p50": _p(0.50),
+            "p95": _p(0.95),
+            "max": round(ordenados[-1], 2),
+        }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                nome: {
+                    "total": op["total"],
+                    "rollbacks": op["rollbacks"],
+                    "hooks_executados": op["hooks_executados"],
+                    "hooks_com_erro": op["hooks_com_erro"],
+                    "transacao_ms": self._resumo(op["transacao_ms"]),
+                    "commit_ms": self._resumo(op["commit_ms"]),
+                    "hooks_ms": self._resumo(op["hooks_ms"]),
+                }
+                for nome, op in self._operacoes.items()
+            }
+
+
+stats = UnitOfWorkStats()
+
+
+class UnitOfWork:
+    """Transação única sobre a sessão da requisição + hooks pós-commit"""
+
+    def __init__(self, db: Session, nome: str):
+        self.db = db
+        self.nome = nome
+        self._hooks: list[tuple[Callable[[Session], None], str]] = []
+        self._inicio: float | None = None
+        self._eventos_publicados = 0
+
+    def after_commit(self, hook: Callable[[Session], None], descricao: str = "") -> None:
+        """Registra um efeito colateral para depois do commit (recebe uma sessão própria)"""
+        self._hooks.append((hook, descricao or getattr(hook, "__name__", "hook")))
+
+    def publicar(self, tipo: str, agregado: str, agregado_id: int | None, dados: dict | None = None):
+        """Grava um evento de domínio no outbox dentro desta transação"""
+        from ti.services.domain_events import DomainEvents
+        self._eventos_publicados += 1
+        return DomainEvents.publicar(self.db, tipo, agregado, agregado_id, dados)
+
+    def __enter__(self) -> "UnitOfWork":
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            self.rollback()
+            return False
+        self.commit()
+        return False
+
+    def commit(self) -> None:
+        inicio_commit = time.perf_counter()
+        try:
+            self.db.commit()
+        except Exception:
+            self.rollback()
+            raise
+        fim = time.perf_counter()
+
+        stats.registrar_commit(
+            self.nome,
+            transacao_ms=(fim - (self._inicio or inicio_commit)) * 1000,
+            commit_ms=(fim - inicio_commit) * 1000,
+        )
+
+        if self._eventos_publicados:
+            self._eventos_publicados = 0
+            from ti.services.domain_events import get_event_dispatcher
+            get_event_dispatcher().notificar()
+
+        hooks, self._hooks = self._hooks, []
+        if hooks:
+            _executor.submit(_executar_hooks, self.nome, hooks)
+
+    def rollback(self) -> None:
+        self._hooks = []
+        self._eventos_publicados = 0
+        try:
+            self.db.rollback()
+        finally:
+            stats.registrar_rollback(self.nome)
+
+
+def _executar_hooks(nome: str, hooks: list[tuple[Callable[[Session], None], str]]) -> None:
+    """Roda os hooks de uma unidade em ordem; a falha de um não impede os seguintes"""
+    inicio = time.perf_counter()
+    com_erro = 0
+    db = SessionLocal()
+    try:
+        for hook, descricao in hooks:
+            try:
+                hook(db)
+            except Exception as e:
+                com_erro += 1
+                db.rollback()
+                logger.warning(f"[UOW] Hook '{descricao}' de {nome} falhou: {e}")
+    finally:
+        db.close()
+        stats.registrar_hooks(nome, (time.perf_counter() - inicio) * 1000, len(hooks), com_erro)
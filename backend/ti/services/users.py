@@ -1,11 +1,20 @@
 from __future__ import annotations
+import hashlib
 import json
 import os
 import secrets
 import string
+import threading
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import literal, select, union_all
 from sqlalchemy.orm import Session
-from werkzeug.security import generate_password_hash
+from core.senhas import (
+    gerar_hash_senha, gerar_hash_senha_async, verificar_senha, verificar_senha_async,
+    precisa_rehash, registrar_tentativa, pool as pool_senhas,
+)
 from ti.models import User
+from ti.models.user_vinculos import UserSetor, UserBISubcategory
+from ti.services import cache_geracao
 from core.db import engine
 from core.utils import now_brazil_naive
 from ti.schemas.user import UserCreate, UserCreatedOut, UserAvailability
@@ -77,7 +86,7 @@ def criar_usuario(db: Session, payload: UserCreate) -> UserCreatedOut:
         sobrenome=payload.sobrenome,
         usuario=payload.usuario,
         email=str(payload.email),
-        senha_hash=generate_password_hash(generated_password),
+        senha_hash=gerar_hash_senha(generated_password),
         alterar_senha_primeiro_acesso=payload.alterar_senha_primeiro_acesso,
         nivel_acesso=payload.nivel_acesso,
         setor=setor,
@@ -86,8 +95,11 @@ def criar_usuario(db: Session, payload: UserCreate) -> UserCreatedOut:
         bloqueado=payload.bloqueado,
     )
     db.add(novo)
+    db.flush()
+    gravar_vinculos(db, novo)
     db.commit()
     db.refresh(novo)
+    invalidar_listagem(db)
 
     return UserCreatedOut(
         id=novo.id,
@@ -173,9 +185,12 @@ def update_user(db: Session, user_id: int, data: dict) -> User:
         _set_setores(user, data["setores"])  # type: ignore
     if "bi_subcategories" in data:
         _set_bi_subcategories(user, data["bi_subcategories"])  # type: ignore
+    if "setores" in data or "bi_subcategories" in data:
+        gravar_vinculos(db, user)
 
     db.commit()
     db.refresh(user)
+    invalidar_listagem(db)
     return user
 
 
@@ -192,7 +207,7 @@ def regenerate_password(db: Session, user_id: int, length: int = 6) -> str:
     if not user:
         raise ValueError("Usuário não encontrado")
     new_pwd = _generate_password(length)
-    user.senha_hash = generate_password_hash(new_pwd)
+    user.senha_hash = gerar_hash_senha(new_pwd)
     user.alterar_senha_primeiro_acesso = True
     db.commit()
     return new_pwd
@@ -212,6 +227,7 @@ def set_block_status(db: Session, user_id: int, blocked: bool) -> User:
         user.bloqueado_ate = None
     db.commit()
     db.refresh(user)
+    invalidar_listagem(db)
     return user
 
 
@@ -223,8 +239,11 @@ def delete_user(db: Session, user_id: int) -> None:
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         return
+    db.query(UserSetor).filter(UserSetor.user_id == user.id).delete(synchronize_session=False)
+    db.query(UserBISubcategory).filter(UserBISubcategory.user_id == user.id).delete(synchronize_session=False)
     db.delete(user)
     db.commit()
+    invalidar_listagem(db)
 
 
 def list_blocked_users(db: Session) -> list[User]:
@@ -235,36 +254,46 @@ def list_blocked_users(db: Session) -> list[User]:
     return db.query(User).filter(User.bloqueado == True).order_by(User.id.desc()).all()
 
 
-def authenticate_user(db: Session, identifier: str, senha: str) -> dict:
-    """Authenticate by email or usuario. Returns dict with user info on success."""
+def _usuario_para_login(db: Session, identifier: str):
+    """Limite por identificador, busca e bloqueio (antes de verificar a senha)"""
+    registrar_tentativa(identifier)
     try:
         User.__table__.create(bind=engine, checkfirst=True)
     except Exception:
         pass
     user = db.query(User).filter((User.email == identifier) | (User.usuario == identifier)).first()
-    from werkzeug.security import check_password_hash
     if not user:
         raise ValueError("Usuário não encontrado")
     if user.bloqueado:
         raise PermissionError("Usuário bloqueado")
+    return user
+
+
+def _registrar_senha_invalida(db: Session, user: User) -> None:
+    # increment attempts
+    try:
+        user.tentativas_login = (user.tentativas_login or 0) + 1
+        max_attempts = int(os.getenv("MAX_LOGIN_ATTEMPTS", "5"))
+        bloqueou = user.tentativas_login >= max_attempts
+        if bloqueou:
+            user.bloqueado = True
+        db.commit()
+        if bloqueou:
+            invalidar_listagem(db)
+    except Exception:
+        db.rollback()
 
-    if not check_password_hash(user.senha_hash, senha):
-        # increment attempts
-        try:
-            user.tentativas_login = (user.tentativas_login or 0) + 1
-            max_attempts = int(os.getenv("MAX_LOGIN_ATTEMPTS", "5"))
-            if user.tentativas_login >= max_attempts:
-                user.bloqueado = True
-            db.commit()
-        except Exception:
-            db.rollback()
-        raise ValueError("Senha inválida")
 
+def _concluir_login(db: Session, user: User, novo_hash: str | None) -> dict:
     # Successful login: reset attempts and update ultimo_acesso
     try:
         user.tentativas_login = 0
         user.bloqueado = False
         user.ultimo_acesso = now_brazil_naive()
+        # Hash com método/custo antigo: regrava com o configurado (SENHA_HASH_METODO)
+        if novo_hash:
+            user.senha_hash = novo_hash
+            pool_senhas.stats["rehashes"] += 1
         db.commit()
     except Exception:
         db.rollback()
@@ -308,48 +337,251 @@ def authenticate_user(db: Session, identifier: str, senha: str) -> dict:
         "session_revoked_at": user.session_revoked_at.isoformat() if getattr(user, 'session_revoked_at', None) else None,
     }
 
+
+def authenticate_user(db: Session, identifier: str, senha: str) -> dict:
+    """
+    Authenticate by email or usuario. Returns dict with user info on success.
+
+    O hash roda no pool de processos de core/senhas.py; tentativas demais para o
+    mesmo identificador levantam LimiteTentativasError antes de consultar o banco.
+    """
+    user = _usuario_para_login(db, identifier)
+    if not verificar_senha(user.senha_hash, senha):
+        _registrar_senha_invalida(db, user)
+        raise ValueError("Senha inválida")
+    novo_hash = gerar_hash_senha(senha) if precisa_rehash(user.senha_hash) else None
+    return _concluir_login(db, user, novo_hash)
+
+
+async def authenticate_user_async(db: Session, identifier: str, senha: str) -> dict:
+    """
+    authenticate_user() para o endpoint assíncrono de login: o acesso ao banco
+    vai para o pool de threads e o hash é aguardado no event loop, sem prender
+    uma thread enquanto o processo de core/senhas.py calcula.
+    """
+    user = await run_in_threadpool(_usuario_para_login, db, identifier)
+    if not await verificar_senha_async(user.senha_hash, senha):
+        await run_in_threadpool(_registrar_senha_invalida, db, user)
+        raise ValueError("Senha inválida")
+    novo_hash = None
+    if await run_in_threadpool(precisa_rehash, user.senha_hash):
+        novo_hash = await gerar_hash_senha_async(senha)
+    return await run_in_threadpool(_concluir_login, db, user, novo_hash)
+
 # Migration script to normalize setores in DB
 def normalize_user_setores(db: Session) -> int:
-    """Normalize setor and _setores for all users. Returns number of updated users."""
-    updated = 0
+    """
+    Normalize setor and _setores for all users. Returns number of updated users.
+
+    Trabalha sobre os valores distintos de user.setor e user_setor.setor: só os
+    usuários que têm algum setor fora do padrão são carregados e têm o JSON
+    (_setores) regravado a partir das linhas de user_setor.
+    """
+    updated_ids: set[int] = set()
     try:
-        users = db.query(User).all()
-        for u in users:
-            changed = False
-            # normalize single setor
-            if u.setor:
-                norm = _normalize_str(u.setor)
-                if norm != (u.setor or ""):
-                    u.setor = norm
-                    changed = True
-            # normalize _setores JSON
-            if u._setores:
-                try:
-                    arr = json.loads(u._setores)
-                    norm_arr = [ _normalize_str(str(s)) for s in arr ]
-                    if json.dumps(norm_arr, ensure_ascii=False) != u._setores:
-                        u._setores = json.dumps(norm_arr, ensure_ascii=False)
-                        changed = True
-                except Exception:
-                    # try to coerce single string
-                    try:
-                        norm = _normalize_str(str(u._setores))
-                        u._setores = json.dumps([norm], ensure_ascii=False)
-                        changed = True
-                    except Exception:
-                        pass
-            if changed:
-                db.add(u)
-                updated += 1
-        if updated:
+        # setor principal (coluna simples)
+        for (valor,) in db.query(User.setor).filter(User.setor.isnot(None)).distinct().all():
+            norm = _normalize_str(valor)
+            if norm != valor:
+                ids = [row[0] for row in db.query(User.id).filter(User.setor == valor).all()]
+                db.query(User).filter(User.id.in_(ids)).update({"setor": norm}, synchronize_session=False)
+                updated_ids.update(ids)
+
+        # setores da tabela normalizada
+        for (valor,) in db.query(UserSetor.setor).distinct().all():
+            norm = _normalize_str(valor)
+            if norm == valor:
+                continue
+            linhas = db.query(UserSetor).filter(UserSetor.setor == valor).all()
+            ja_normalizados = {
+                row[0] for row in db.query(UserSetor.user_id).filter(
+                    UserSetor.setor == norm,
+                    UserSetor.user_id.in_([l.user_id for l in linhas]),
+                ).all()
+            }
+            for linha in linhas:
+                if linha.user_id in ja_normalizados:
+                    # O usuário já tem o setor normalizado: a variante vira duplicata
+                    db.delete(linha)
+                else:
+                    linha.setor = norm
+                updated_ids.add(linha.user_id)
+
+        if updated_ids:
+            db.flush()
+            # Escrita dupla: JSON dos usuários afetados regravado a partir das linhas
+            setores_por_user: dict[int, list[str]] = {}
+            for user_id, setor in db.query(UserSetor.user_id, UserSetor.setor).filter(
+                UserSetor.user_id.in_(updated_ids)
+            ).order_by(UserSetor.user_id, UserSetor.posicao).all():
+                setores_por_user.setdefault(user_id, []).append(setor)
+            for u in db.query(User).filter(User.id.in_(updated_ids)).all():
+                if u.id in setores_por_user:
+                    u._setores = json.dumps(setores_por_user[u.id], ensure_ascii=False)
             db.commit()
+            invalidar_listagem(db)
     except Exception as e:
         try:
             db.rollback()
         except:
             pass
         raise
-    return updated
+    return len(updated_ids)
+
+
+# ------------------------------------------------------------------
+# Tabelas normalizadas user_setor / user_bi_subcategory
+# ------------------------------------------------------------------
+
+TAG_USUARIOS = "usuarios"
+
+_listagem: tuple[int, list[dict], str] | None = None
+_listagem_lock = threading.Lock()
+
+
+def _lista_json(valor) -> list[str]:
+    """Lista (sem repetição, na ordem) de uma coluna JSON legada"""
+    if not valor:
+        return []
+    try:
+        raw = json.loads(valor)
+    except (TypeError, ValueError):
+        raw = [valor]
+    if not isinstance(raw, list):
+        raw = [raw]
+    return list(dict.fromkeys(str(x) for x in raw if x is not None))
+
+
+def gravar_vinculos(db: Session, user: User) -> None:
+    """
+    Escrita dupla: regrava as linhas de user_setor/user_bi_subcategory do
+    usuário a partir de _setores/_bi_subcategories (sem commit).
+    """
+    db.query(UserSetor).filter(UserSetor.user_id == user.id).delete(synchronize_session=False)
+    db.query(UserBISubcategory).filter(UserBISubcategory.user_id == user.id).delete(synchronize_session=False)
+    # Usuários antigos só têm a coluna simples user.setor
+    setores = _lista_json(user._setores) or ([user.setor] if user.setor else [])
+    db.add_all([
+        UserSetor(user_id=user.id, setor=setor, posicao=posicao)
+        for posicao, setor in enumerate(setores)
+    ])
+    db.add_all([
+        UserBISubcategory(user_id=user.id, subcategory=sub, posicao=posicao)
+        for posicao, sub in enumerate(_lista_json(user._bi_subcategories))
+    ])
+
+
+def invalidar_listagem(db: Session) -> None:
+    """Nova versão da listagem de usuários (ETag muda em todos os workers)"""
+    global _listagem
+    cache_geracao.incrementar(db, TAG_USUARIOS)
+    with _listagem_lock:
+        _listagem = None
+
+
+def listar_usuarios_com_vinculos(db: Session) -> list[dict]:
+    """
+    Todos os usuários com setores e subcategorias de BI numa única consulta:
+    user LEFT JOIN (user_setor UNION ALL user_bi_subcategory), uma linha por
+    vínculo (sem produto cartesiano entre setores e subcategorias).
+    """
+    vinculos = union_all(
+        select(
+            UserSetor.user_id.label("user_id"),
+            literal("setor").label("tipo"),
+            UserSetor.setor.label("valor"),
+            UserSetor.posicao.label("posicao"),
+        ),
+        select(
+            UserBISubcategory.user_id,
+            literal("bi"),
+            UserBISubcategory.subcategory,
+            UserBISubcategory.posicao,
+        ),
+    ).subquery()
+
+    linhas = db.query(
+        User.id,
+        User.nome,
+        User.sobrenome,
+        User.usuario,
+        User.email,
+        User.nivel_acesso,
+        User.setor,
+        User.bloqueado,
+        User.session_revoked_at,
+        vinculos.c.tipo,
+        vinculos.c.valor,
+    ).outerjoin(
+        vinculos, vinculos.c.user_id == User.id
+    ).order_by(
+        User.id.desc(), vinculos.c.tipo, vinculos.c.posicao
+    ).all()
+
+    rows: list[dict] = []
+    atual: dict | None = None
+    for linha in linhas:
+        if atual is None or atual["id"] != linha.id:
+            atual = {
+                "id": linha.id,
+                "nome": linha.nome,
+                "sobrenome": linha.sobrenome,
+                "usuario": linha.usuario,
+                "email": linha.email,
+                "nivel_acesso": linha.nivel_acesso,
+                "setor": linha.setor,
+                "setores": [],
+                "bi_subcategories": None,
+                "bloqueado": bool(linha.bloqueado),
+                "session_revoked_at": linha.session_revoked_at.isoformat() if linha.session_revoked_at else None,
+            }
+            rows.append(atual)
+        if linha.tipo == "setor":
+            atual["setores"].append(linha.valor)
+        elif linha.tipo == "bi":
+            if atual["bi_subcategories"] is None:
+                atual["bi_subcategories"] = []
+            atual["bi_subcategories"].append(linha.valor)
+
+    for row in rows:
+        if row["setores"]:
+            row["setor"] = row["setores"][0]
+        elif row["setor"]:
+            row["setores"] = [row["setor"]]
+    return rows
+
+
+def listar_usuarios_cache(db: Session) -> tuple[list[dict], str]:
+    """
+    Listagem de usuários em cache por versão (tag "usuarios" em
+    cache_tag_geracao) e seu ETag (hash do conteúdo).
+    """
+    global _listagem
+    geracao = cache_geracao.geracao(db, TAG_USUARIOS)
+    atual = _listagem
+    if atual is not None and atual[0] == geracao:
+        return atual[1], atual[2]
+
+    with _listagem_lock:
+        if _listagem is None or _listagem[0] != geracao:
+            rows = listar_usuarios_com_vinculos(db)
+            digest = hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+            _listagem = (geracao, rows, f'W/"usuarios-{digest[:20]}"')
+        return _listagem[1], _listagem[2]
+
+
+def usuarios_por_setor(db: Session, setor: str) -> list[User]:
+    """Usuários de um setor (índice idx_user_setor_setor)"""
+    return db.query(User).join(UserSetor, UserSetor.user_id == User.id).filter(
+        UserSetor.setor == _normalize_str(setor)
+    ).order_by(User.id.desc()).all()
+
+
+def usuarios_por_bi_subcategory(db: Session, subcategory: str) -> list[User]:
+    """Usuários com acesso a uma subcategoria de BI (índice idx_user_bi_subcategory_subcategory)"""
+    return db.query(User).join(UserBISubcategory, UserBISubcategory.user_id == User.id).filter(
+        UserBISubcategory.subcategory == subcategory
+    ).order_by(User.id.desc()).all()
 
 
 def change_user_password(db: Session, user_id: int, new_password: str, require_change: bool = False) -> None:
@@ -360,6 +592,6 @@ def change_user_password(db: Session, user_id: int, new_password: str, require_c
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise ValueError("Usuário não encontrado")
-    user.senha_hash = generate_password_hash(new_password)
+    user.senha_hash = gerar_hash_senha(new_password)
     user.alterar_senha_primeiro_acesso = bool(require_change)
     db.commit()
@@ -1,6 +1,6 @@
 import { useEffect } from "react";
 import { useMutation, useQueryClient } from "@tanstack/react-query";
-import { api } from "@/lib/api";
+import { executarJob } from "@/lib/jobs";
 import { useSLACacheManager } from "./useSLACacheManager";
 
 interface RecalculateStats {
@@ -32,9 +32,9 @@ export function useAutoRecalculateSLA() {
         console.log("[SLA] Cache pré-aquecido com sucesso");
       } catch (warmupError) {
         console.log("[SLA] Warmup falhou, forçando recálculo...");
-        // Se warmup falha, força recalcular completo
-        const response = await api.post("/sla/recalcular/painel");
-        return response.data as RecalculateStats;
+        // Se warmup falha, força recalcular completo (em segundo plano no
+        // backend; aberturas simultâneas do painel compartilham a execução)
+        return executarJob<RecalculateStats>("/sla/recalcular/painel");
       }
 
       // Se warmup foi bem-sucedido, retorna stats vazios
@@ -1,6 +1,6 @@
 import { useCallback } from "react";
 import { useMutation, useQueryClient } from "@tanstack/react-query";
-import { api } from "@/lib/api";
+import { executarJob } from "@/lib/jobs";
 
 interface SLASyncStats {
   total_recalculados: number;
@@ -24,8 +24,7 @@ export function useSLASync() {
     data: stats,
   } = useMutation({
     mutationFn: async () => {
-      const response = await api.post("/sla/recalcular/painel");
-      return response.data as SLASyncStats;
+      return executarJob<SLASyncStats>("/sla/recalcular/painel");
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ["sla-sync"] });
@@ -56,8 +55,7 @@ export function useSLASyncAll() {
     data: stats,
   } = useMutation({
     mutationFn: async () => {
-      const response = await api.post("/sla/sync/todos-chamados");
-      return response.data;
+      return executarJob("/sla/sync/todos-chamados");
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ["sla-sync-all"] });
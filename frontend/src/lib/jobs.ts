@@ -0,0 +1,73 @@
+import { api } from "@/lib/api";
+
+/**
+ * Resposta 202 dos endpoints que enfileiram operações pesadas
+ * (ex: /sla/recalcular/painel, /sla/sync/todos-chamados).
+ */
+export interface JobEnfileirado {
+  ok: boolean;
+  job: string;
+  run_id: number;
+  deduplicado: boolean;
+  status_url: string;
+}
+
+export interface JobExecucao<T = any> {
+  id: number;
+  job_name: string;
+  status: "pendente" | "executando" | "sucesso" | "erro" | "ignorado";
+  linhas_processadas: number | null;
+  linhas_total: number | null;
+  percentual: number | null;
+  resultado: T | null;
+  erro: string | null;
+}
+
+const INTERVALO_POLLING_MS = 1500;
+const TEMPO_MAXIMO_MS = 15 * 60 * 1000;
+
+/**
+ * Acompanha uma execução da fila de jobs até terminar e retorna o resultado.
+ * Lança erro (no formato error.response.data.detail) se a execução falhar.
+ */
+export async function aguardarJob<T = any>(
+  runId: number,
+  onProgresso?: (execucao: JobExecucao<T>) => void,
+): Promise<T> {
+  const inicio = Date.now();
+
+  while (Date.now() - inicio < TEMPO_MAXIMO_MS) {
+    const { data } = await api.get<JobExecucao<T>>(`/jobs/execucoes/${runId}`);
+    onProgresso?.(data);
+
+    if (data.status === "sucesso") {
+      return data.resultado as T;
+    }
+    if (data.status === "erro" || data.status === "ignorado") {
+      const error = new Error("Job Error") as any;
+      error.response = {
+        status: 500,
+        data: { detail: (data.erro || "Falha na execução").split("\n")[0] },
+      };
+      throw error;
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, INTERVALO_POLLING_MS));
+  }
+
+  const error = new Error("Job Timeout") as any;
+  error.response = {
+    status: 504,
+    data: { detail: "A operação ainda está em andamento. Verifique mais tarde." },
+  };
+  throw error;
+}
+
+/** Enfileira uma operação (POST que responde 202) e aguarda o resultado */
+export async function executarJob<T = any>(
+  path: string,
+  onProgresso?: (execucao: JobExecucao<T>) => void,
+): Promise<T> {
+  const { data } = await api.post<JobEnfileirado>(path);
+  return aguardarJob<T>(data.run_id, onProgresso);
+}
@@ -11,6 +11,7 @@ import {
 } from "lucide-react";
 import { useQuery, useQueryClient, useMutation } from "@tanstack/react-query";
 import { api } from "@/lib/api";
+import { executarJob } from "@/lib/jobs";
 import { useSLACacheManager } from "@/hooks/useSLACacheManager";
 import { Button } from "@/components/ui/button";
 import { toast } from "sonner";
@@ -233,8 +234,7 @@ export default function Overview() {
 
   const atualizarMetricasMutation = useMutation({
     mutationFn: async () => {
-      const response = await api.post("/sla/recalcular/p90-incremental");
-      return response.data;
+      return executarJob("/sla/recalcular/p90-incremental");
     },
     onSuccess: (data: any) => {
       queryClient.invalidateQueries({ queryKey: ["metrics-basic"] });
@@ -30,6 +30,7 @@ import {
 } from "lucide-react";
 import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import { api } from "@/lib/api";
+import { executarJob } from "@/lib/jobs";
 import { toast } from "sonner";
 
 interface SLAConfig {
@@ -391,8 +392,7 @@ export function SLA() {
 
   const zerarCacheMutation = useMutation({
     mutationFn: async () => {
-      const response = await api.post("/sla/reset-and-recalculate");
-      return response.data;
+      return executarJob("/sla/reset-and-recalculate");
     },
     onSuccess: (data: any) => {
       queryClient.invalidateQueries({ queryKey: ["sla-config"] });
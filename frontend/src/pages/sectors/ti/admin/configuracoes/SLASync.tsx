@@ -2,7 +2,7 @@ import { useState } from "react";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
 import { AlertCircle, CheckCircle2, RefreshCw, Loader } from "lucide-react";
-import { api } from "@/lib/api";
+import { executarJob, type JobExecucao } from "@/lib/jobs";
 import { toast } from "sonner";
 
 interface SyncStats {
@@ -20,12 +20,22 @@ interface SyncStats {
 export function SLASync() {
   const [loading, setLoading] = useState(false);
   const [stats, setStats] = useState<SyncStats | null>(null);
+  const [progresso, setProgresso] = useState<number | null>(null);
+
+  const acompanharProgresso = (execucao: JobExecucao) =>
+    setProgresso(execucao.percentual);
+
+  const rotuloProgresso = progresso !== null ? ` ${Math.round(progresso)}%` : "";
 
   const handleSyncAll = async () => {
     setLoading(true);
+    setProgresso(null);
     try {
-      const response = await api.post("/sla/sync/todos-chamados");
-      setStats(response.data);
+      const resultado = await executarJob<SyncStats>(
+        "/sla/sync/todos-chamados",
+        acompanharProgresso,
+      );
+      setStats(resultado);
       toast.success("Sincronização concluída com sucesso!");
     } catch (error: any) {
       toast.error(
@@ -38,9 +48,13 @@ export function SLASync() {
 
   const handleRecalculate = async () => {
     setLoading(true);
+    setProgresso(null);
     try {
-      const response = await api.post("/sla/recalcular/painel");
-      setStats(response.data);
+      const resultado = await executarJob<SyncStats>(
+        "/sla/recalcular/painel",
+        acompanharProgresso,
+      );
+      setStats(resultado);
       toast.success("Recálculo de SLAs concluído com sucesso!");
     } catch (error: any) {
       toast.error(error.response?.data?.detail || "Erro ao recalcular SLAs");
@@ -96,7 +110,7 @@ export function SLASync() {
             {loading ? (
               <>
                 <Loader className="w-4 h-4 animate-spin" />
-                Sincronizando...
+                Sincronizando...{rotuloProgresso}
               </>
             ) : (
               <>
@@ -137,7 +151,7 @@ export function SLASync() {
             {loading ? (
               <>
                 <Loader className="w-4 h-4 animate-spin" />
-                Recalculando...
+                Recalculando...{rotuloProgresso}
               </>
             ) : (
               <>